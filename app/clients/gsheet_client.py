@@ -3,17 +3,24 @@ Google Sheets クライアント
 Note_Logsシートへのデータ保存・取得
 """
 import os
+import re
 import json
 import base64
-from typing import List, Dict, Optional
+import threading
+from typing import List, Dict, Optional, Set
 from google.oauth2 import service_account
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from app.config import get_config
 from app.models.note_models import NoteLogEntry
+from app.clients.token_counter import MonthlyTokenCounter, month_key
+from app.clients.log_store import get_log_store
 
 config = get_config()
 
+# 履歴一覧で読み込む列（raw_json の J列は転送しない）
+RECENT_LOG_COLUMN_RANGES = ('A:I', 'K:L')
+
 
 class GoogleSheetsClient:
     """Google Sheets API クライアント"""
@@ -24,6 +31,19 @@ class GoogleSheetsClient:
         self.sheet_name = config.GSHEET_NOTE_LOGS_SHEET
         self.service = None
         self._initialize_service()
+        # ヘッダー行の確認結果（プロセス内で1度だけ確認する）
+        self._header_lock = threading.Lock()
+        self._header_verified = False
+        self.header_drift: List[Dict] = []
+        # 最終データ行の行番号（追記レスポンス・A列の読み込みから把握する）
+        self._last_row: Optional[int] = None
+        self.token_counter = MonthlyTokenCounter(
+            loader=self._load_monthly_token_totals,
+            reconcile_interval=config.TOKEN_COUNTER_RECONCILE_SECONDS,
+            find_loaded=self._find_loaded_note_ids
+        )
+        # 直前の集計に含まれる最後の行（ローカルストアのrowid）
+        self._token_totals_rowid = 0
 
     def _initialize_service(self):
         """Google Sheets APIサービスの初期化"""
@@ -97,52 +117,231 @@ class GoogleSheetsClient:
                 insertDataOption='INSERT_ROWS',
                 body=body
             ).execute()
+            self._record_last_row(result)
+
+            # 月次トークン集計に反映
+            self.token_counter.add(log_entry.created_at, int(log_entry.total_tokens or 0), log_entry.note_id)
 
             print(f"✅ Google Sheets に保存: {log_entry.note_id}")
             return True
 
         except HttpError as e:
             print(f"❌ Google Sheets エラー: {e}")
+            self._invalidate_header_on_layout_error(e)
             return False
         except Exception as e:
             print(f"❌ 予期しないエラー: {e}")
             return False
 
-    def _ensure_header_row(self):
-        """ヘッダー行の確認・作成"""
+    def append_rows(self, log_entries: List[NoteLogEntry]) -> bool:
+        """
+        Note_Logsシートに複数行をまとめて追加（1回のAPI呼び出し）
+
+        月次トークン集計への反映は呼び出し側で行う
+
+        Args:
+            log_entries: ログエントリのリスト
+
+        Returns:
+            bool: 成功/失敗
+        """
+        if not log_entries:
+            return True
+
+        if not self.service:
+            return False
+
         try:
-            # シートの最初の行を取得
-            range_name = f'{self.sheet_name}!A1:L1'
-            result = self.service.spreadsheets().values().get(
+            self._ensure_header_row()
+
+            result = self.service.spreadsheets().values().append(
                 spreadsheetId=self.spreadsheet_id,
-                range=range_name
+                range=f'{self.sheet_name}!A:L',
+                valueInputOption='RAW',
+                insertDataOption='INSERT_ROWS',
+                body={'values': [log_entry.to_row() for log_entry in log_entries]}
             ).execute()
+            self._record_last_row(result)
 
-            values = result.get('values', [])
+            print(f"✅ Google Sheets に {len(log_entries)} 行を保存")
+            return True
 
-            # ヘッダー行が存在しない場合は作成
-            if not values:
-                header_row = NoteLogEntry.get_header_row()
-                body = {
-                    'values': [header_row]
-                }
+        except HttpError as e:
+            print(f"❌ Google Sheets エラー: {e}")
+            self._invalidate_header_on_layout_error(e)
+            return False
+        except Exception as e:
+            print(f"❌ 予期しないエラー: {e}")
+            return False
 
-                self.service.spreadsheets().values().update(
+    def _ensure_header_row(self):
+        """
+        ヘッダー行の確認・作成
+
+        確認はプロセス内で初回の書き込み時に1度だけ行い、結果を保持する。
+        既存のヘッダーが NoteLogEntry.get_header_row() と異なる場合は列ずれとして記録する
+        """
+        if self._header_verified:
+            return
+
+        with self._header_lock:
+            if self._header_verified:
+                return
+
+            try:
+                # シートの最初の行を取得
+                range_name = f'{self.sheet_name}!A1:L1'
+                result = self.service.spreadsheets().values().get(
                     spreadsheetId=self.spreadsheet_id,
-                    range=range_name,
-                    valueInputOption='RAW',
-                    body=body
+                    range=range_name
                 ).execute()
 
-                print("✅ ヘッダー行を作成しました")
+                values = result.get('values', [])
+                expected = NoteLogEntry.get_header_row()
 
-        except Exception as e:
-            print(f"⚠️  ヘッダー行の確認エラー: {e}")
+                # ヘッダー行が存在しない場合は作成
+                if not values:
+                    body = {
+                        'values': [expected]
+                    }
+
+                    self.service.spreadsheets().values().update(
+                        spreadsheetId=self.spreadsheet_id,
+                        range=range_name,
+                        valueInputOption='RAW',
+                        body=body
+                    ).execute()
+
+                    print("✅ ヘッダー行を作成しました")
+                    self.header_drift = []
+                else:
+                    self.header_drift = self._detect_header_drift(values[0], expected)
+                    if self.header_drift:
+                        print(f"⚠️  Note_Logsのヘッダーが想定と異なります（列ずれ）: {self.header_drift}")
+
+                self._header_verified = True
+
+            except Exception as e:
+                # 確認できなかった場合は次回の書き込み時に再確認する
+                print(f"⚠️  ヘッダー行の確認エラー: {e}")
+
+    @staticmethod
+    def _detect_header_drift(actual: List[str], expected: List[str]) -> List[Dict]:
+        """
+        既存ヘッダーと想定ヘッダーの差分を列ごとに取得
+
+        Args:
+            actual: シート上のヘッダー
+            expected: 想定するヘッダー
+
+        Returns:
+            List[Dict]: 差分（column: 列名, expected: 想定値, actual: 実際の値）
+        """
+        drift = []
+        for index in range(max(len(actual), len(expected))):
+            actual_name = actual[index] if index < len(actual) else ''
+            expected_name = expected[index] if index < len(expected) else ''
+            if actual_name != expected_name:
+                drift.append({
+                    'column': chr(ord('A') + index) if index < 26 else str(index + 1),
+                    'expected': expected_name,
+                    'actual': actual_name
+                })
+        return drift
+
+    def _invalidate_header_on_layout_error(self, error: HttpError):
+        """
+        シート構成の変更が疑われるエラーの場合、ヘッダー確認結果を破棄する
+
+        範囲指定の解釈エラー（400）やシート未検出（404）はシート名変更・削除などで発生する
+        """
+        status = getattr(getattr(error, 'resp', None), 'status', None)
+        if status in (400, 404):
+            with self._header_lock:
+                self._header_verified = False
+            self._last_row = None
+
+    def get_header_status(self) -> dict:
+        """
+        ヘッダー行の確認状況を取得
+
+        Returns:
+            dict: verified（確認済みか）, drift（列ずれの内容）
+        """
+        return {
+            'verified': self._header_verified,
+            'drift': list(self.header_drift)
+        }
+
+    def get_last_row(self) -> int:
+        """
+        最終データ行の行番号を取得
+
+        追記時に把握した行番号があればそれを使い、無い場合はA列（note_id）だけを読み込んで数える
+
+        Returns:
+            int: 行番号（ヘッダー行のみの場合は1、空のシートの場合は0）
+        """
+        if self._last_row is None:
+            result = self.service.spreadsheets().values().get(
+                spreadsheetId=self.spreadsheet_id,
+                range=f'{self.sheet_name}!A:A'
+            ).execute()
+            self._last_row = len(result.get('values', []))
+        return self._last_row
+
+    def read_rows(self, start_row: int, end_row: Optional[int] = None,
+                  column_ranges=('A:L',)) -> List[List[str]]:
+        """
+        行範囲を指定した列だけ読み込む（1回のbatchGet）
+
+        Args:
+            start_row: 開始行番号
+            end_row: 終了行番号（省略時はシートの最後まで）
+            column_ranges: 読み込む列の範囲（例: ('A:I', 'K:L')）
+
+        Returns:
+            List[List[str]]: A〜L列の行データ（読み込まなかった列・空のセルは空文字）
+        """
+        ranges = []
+        offsets = []
+        for column_range in column_ranges:
+            first, last = column_range.split(':')
+            ranges.append(f'{self.sheet_name}!{first}{start_row}:{last}{end_row or ""}')
+            offsets.append(ord(first) - ord('A'))
+
+        result = self.service.spreadsheets().values().batchGet(
+            spreadsheetId=self.spreadsheet_id,
+            ranges=ranges
+        ).execute()
+
+        width = len(NoteLogEntry.get_header_row())
+        rows: List[List[str]] = []
+        for offset, value_range in zip(offsets, result.get('valueRanges', [])):
+            for index, values in enumerate(value_range.get('values', [])):
+                while len(rows) <= index:
+                    rows.append([''] * width)
+                rows[index][offset:offset + len(values)] = values
+        return rows
+
+    def _record_last_row(self, append_result: dict):
+        """
+        追記レスポンスの更新範囲（例: Note_Logs!A12:L14）から最終データ行を記録
+
+        Args:
+            append_result: values.append のレスポンス
+        """
+        updated_range = (append_result or {}).get('updates', {}).get('updatedRange', '')
+        match = re.search(r'(\d+)$', updated_range) if isinstance(updated_range, str) else None
+        if match:
+            self._last_row = max(self._last_row or 0, int(match.group(1)))
 
     def get_recent_logs(self, limit: int = 20) -> List[Dict]:
         """
         最新のログを取得
 
+        末尾のlimit行だけを、raw_json（J列）を除いた列で読み込む
+
         Args:
             limit: 取得件数
 
@@ -154,41 +353,42 @@ class GoogleSheetsClient:
             return []
 
         try:
-            # シート全体を取得
-            range_name = f'{self.sheet_name}!A:L'
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
-
-            values = result.get('values', [])
-
-            if len(values) <= 1:
+            cached = self._last_row is not None
+            last_row = self.get_last_row()
+            if last_row <= 1:
                 # ヘッダー行のみ、またはデータなし
                 return []
 
-            # ヘッダー行を除外
-            header = values[0]
-            data_rows = values[1:]
+            # 終端は指定せず、他のワーカーが追記した行も含めて読み込む
+            start_row = max(2, last_row - limit + 1)
+            rows = self.read_rows(start_row, column_ranges=RECENT_LOG_COLUMN_RANGES)
+
+            if cached and len(rows) < min(limit, last_row - 1):
+                # 行が削除されて保持していた行番号がずれている場合はA列から数え直す
+                self._last_row = None
+                last_row = self.get_last_row()
+                if last_row <= 1:
+                    return []
+                start_row = max(2, last_row - limit + 1)
+                rows = self.read_rows(start_row, column_ranges=RECENT_LOG_COLUMN_RANGES)
+
+            if rows:
+                self._last_row = max(self._last_row or 0, start_row + len(rows) - 1)
 
             # 最新limit件を取得（逆順）
-            recent_rows = data_rows[-limit:][::-1]
+            recent_rows = rows[-limit:][::-1]
 
             # 辞書形式に変換
             logs = []
             for row in recent_rows:
-                # 行の長さが足りない場合は空文字で埋める
-                while len(row) < len(header):
-                    row.append('')
-
                 log_dict = {
-                    'note_id': row[0] if len(row) > 0 else '',
-                    'topic': row[1] if len(row) > 1 else '',
-                    'title': row[8] if len(row) > 8 else '',
-                    'created_at': row[11] if len(row) > 11 else '',
-                    'article_type': row[4] if len(row) > 4 else '',
-                    'intensity_level': int(row[7]) if len(row) > 7 and row[7] else 0,
-                    'total_tokens': int(row[10]) if len(row) > 10 and row[10] else 0
+                    'note_id': row[0],
+                    'topic': row[1],
+                    'title': row[8],
+                    'created_at': row[11],
+                    'article_type': row[4],
+                    'intensity_level': int(row[7]) if row[7] else 0,
+                    'total_tokens': int(row[10]) if row[10] else 0
                 }
                 logs.append(log_dict)
 
@@ -201,60 +401,94 @@ class GoogleSheetsClient:
             print(f"❌ 予期しないエラー: {e}")
             return []
 
-    def get_total_tokens_this_month(self) -> int:
+    def get_all_log_entries(self) -> List[NoteLogEntry]:
         """
-        今月の総トークン使用量を取得
+        シートの全行をNoteLogEntryとして取得（ローカルストアへのバックフィル用）
 
         Returns:
-            int: 総トークン数
+            List[NoteLogEntry]: ログエントリ（note_id・created_atが無い行は除外）
         """
         if not self.service:
-            return 0
+            return []
 
-        try:
-            from datetime import datetime
+        result = self.service.spreadsheets().values().get(
+            spreadsheetId=self.spreadsheet_id,
+            range=f'{self.sheet_name}!A:L'
+        ).execute()
+
+        log_entries = []
+        for row in result.get('values', [])[1:]:
+            row = row + [''] * (12 - len(row))
+            if not row[0] or not row[11]:
+                continue
+
+            log_entries.append(NoteLogEntry(
+                note_id=row[0],
+                topic=row[1],
+                audience=row[2],
+                goal=row[3],
+                article_type=row[4],
+                length_class=row[5],
+                temperature=_to_number(row[6], float),
+                intensity_level=_to_number(row[7], int),
+                title=row[8],
+                raw_json=row[9],
+                total_tokens=_to_number(row[10], int),
+                created_at=row[11]
+            ))
+
+        return log_entries
 
-            # 今月の開始日
-            now = datetime.now()
-            month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            month_start_str = month_start.isoformat()
+    def get_total_tokens_this_month(self) -> int:
+        """
+        今月の総トークン使用量を取得
 
-            # 全データ取得
-            range_name = f'{self.sheet_name}!A:L'
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=range_name
-            ).execute()
+        初回のみローカルストアから集計し、以降は書き込み時に加算したランニングトータルを返す
+        （TOKEN_COUNTER_RECONCILE_SECONDS ごとにバックグラウンドでローカルストアと突き合わせる）
+
+        Returns:
+            int: 総トークン数
+        """
+        try:
+            return self.token_counter.get(month_key())
+        except Exception as e:
+            print(f"⚠️  トークン集計エラー: {e}")
+            return 0
 
-            values = result.get('values', [])
+    def _load_monthly_token_totals(self) -> Dict[str, int]:
+        """
+        月ごとのトークン使用量を集計
 
-            if len(values) <= 1:
-                return 0
+        ローカルストアが未バックフィルの場合は、先にシートの全行を取り込む（初回のみ）
 
-            # ヘッダー行を除外
-            data_rows = values[1:]
+        Returns:
+            Dict[str, int]: 月キー（YYYY-MM）→ トークン数
+        """
+        log_store = get_log_store()
+        if self.service and not log_store.is_backfilled():
+            log_store.backfill_from_sheet(self)
+        totals, self._token_totals_rowid = log_store.get_monthly_token_snapshot()
+        return totals
 
-            # 今月のデータのみ集計
-            total_tokens = 0
-            for row in data_rows:
-                if len(row) < 12:
-                    continue
+    def _find_loaded_note_ids(self, note_ids: List[str]) -> Set[str]:
+        """
+        直前の _load_monthly_token_totals の集計に含まれるnote_idを取得
 
-                created_at = row[11]  # created_at列
-                total_tokens_str = row[10]  # total_tokens列
+        Args:
+            note_ids: 確認するnote_id
 
-                try:
-                    # 日付比較
-                    if created_at >= month_start_str:
-                        total_tokens += int(total_tokens_str)
-                except (ValueError, TypeError):
-                    continue
+        Returns:
+            Set[str]: 集計に含まれるnote_id
+        """
+        return get_log_store().find_note_ids(note_ids, up_to_rowid=self._token_totals_rowid)
 
-            return total_tokens
 
-        except Exception as e:
-            print(f"⚠️  トークン集計エラー: {e}")
-            return 0
+def _to_number(value, cast):
+    """シートのセル値を数値に変換（変換できない場合は0）"""
+    try:
+        return cast(value)
+    except (ValueError, TypeError):
+        return 0
 
 
 # シングルトンインスタンス
@@ -267,3 +501,16 @@ def get_gsheet_client() -> GoogleSheetsClient:
     if _gsheet_client_instance is None:
         _gsheet_client_instance = GoogleSheetsClient()
     return _gsheet_client_instance
+
+
+def get_gsheet_header_status() -> Optional[dict]:
+    """
+    Note_Logsシートのヘッダー検証結果を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: GoogleSheetsClient.get_header_status() の内容（未作成の場合はNone）
+    """
+    instance = _gsheet_client_instance
+    if instance is None:
+        return None
+    return instance.get_header_status()
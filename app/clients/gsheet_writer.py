@@ -0,0 +1,356 @@
+"""
+Google Sheets 書き込みキュー（write-behind）
+Note_Logsへの行追加をバックグラウンドでまとめて行い、レスポンスを待たせない
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import queue
+import random
+import threading
+import time
+from dataclasses import asdict
+from typing import List, Optional
+from app.config import get_config
+from app.models.note_models import NoteLogEntry
+from app.clients.gsheet_client import GoogleSheetsClient, get_gsheet_client
+from app.clients.process_utils import is_process_alive
+
+config = get_config()
+
+
+class GSheetWriteBehindLogger:
+    """NoteLogEntryをキューに溜めてバッチでGoogle Sheetsに書き込むロガー"""
+
+    def __init__(self, gsheet_client: GoogleSheetsClient, batch_size: Optional[int] = None,
+                 flush_interval: Optional[float] = None, max_retries: Optional[int] = None,
+                 spool_path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            gsheet_client: 書き込み先のGoogle Sheetsクライアント
+            batch_size: この件数が溜まったら書き込む
+            flush_interval: 最初の1件を受けてからこの秒数で書き込む
+            max_retries: 書き込み失敗時の再試行回数
+            spool_path: 書き込めなかった行の退避ファイル
+        """
+        self.gsheet_client = gsheet_client
+        self.batch_size = batch_size or config.GSHEET_WRITE_BATCH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else config.GSHEET_WRITE_FLUSH_SECONDS
+        self.max_retries = max_retries if max_retries is not None else config.GSHEET_WRITE_MAX_RETRIES
+        self.spool_path = spool_path or os.path.join(config.LOCAL_DATA_DIR, 'gsheet_spool.jsonl')
+
+        self._queue: "queue.Queue[NoteLogEntry]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # 書き込みスレッドがキューから取り出し、書き込み（または退避）を終えていないバッチ
+        self._in_flight: Optional[List[NoteLogEntry]] = None
+        # 終了処理が退避のために引き取ったバッチと、終了処理の開始後か
+        self._claimed: Optional[List[NoteLogEntry]] = None
+        self._closing = False
+        self._stats = {
+            'enqueued': 0,
+            'skipped': 0,
+            'written': 0,
+            'batches': 0,
+            'retries': 0,
+            'spilled': 0,
+            'replayed': 0
+        }
+
+    def enqueue(self, log_entry: NoteLogEntry):
+        """
+        行をキューに追加（即座に戻る）
+
+        月次トークン集計にはこの時点で反映する。Google Sheetsが未設定の場合はキューに積まない
+        （書き込めない行を再試行・退避し続けないため。ログはローカルログストアに保存済み）
+
+        Args:
+            log_entry: ログエントリ
+        """
+        self.gsheet_client.token_counter.add(log_entry.created_at, int(log_entry.total_tokens or 0), log_entry.note_id)
+        if self.gsheet_client.service is None:
+            with self._lock:
+                self._stats['skipped'] += 1
+            return
+        self._queue.put(log_entry)
+        with self._lock:
+            self._stats['enqueued'] += 1
+        self._ensure_worker()
+
+    def flush(self):
+        """
+        キューに残っている行を同期的に書き込む（終了時用）
+
+        書き込みスレッドが取り出したまま書き込みを終えていないバッチは、完了を待たずに退避ファイルに書き出す
+        （append_rows が終了後に成功した場合は書き戻しで行が重複するが、欠落よりも重複を許容する）。
+        以降に書き込みスレッドが取り出した行は、書き込まずに退避する
+        """
+        with self._lock:
+            self._closing = True
+            in_flight, self._in_flight = self._in_flight, None
+            if in_flight:
+                self._claimed = in_flight
+                in_flight = list(in_flight)
+        if in_flight:
+            self._spill(in_flight)
+
+        batch = self._drain(block=False)
+        if batch:
+            self._write_batch(batch, max_retries=0)
+
+    def get_stats(self) -> dict:
+        """
+        書き込み状況の統計を取得
+
+        Returns:
+            dict: 統計情報
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        return stats
+
+    def _ensure_worker(self):
+        """書き込みスレッドを起動（プロセスごとに1つ）"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='gsheet-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """書き込みスレッドのメインループ"""
+        while True:
+            batch = self._drain(block=True)
+            if not batch:
+                continue
+            try:
+                self._write_batch(batch, max_retries=self.max_retries)
+            except Exception as e:
+                print(f"❌ Google Sheets 書き込みキューのエラー: {e}")
+                self._spill_unclaimed(batch)
+            finally:
+                with self._lock:
+                    if self._in_flight is batch:
+                        self._in_flight = None
+
+    def _drain(self, block: bool) -> List[NoteLogEntry]:
+        """
+        キューから1バッチ分を取り出す
+
+        block=True の場合（書き込みスレッド）は最初の1件を待ち、件数または経過時間のどちらかに達するまで集める。
+        集めている間から書き込み中のバッチとして登録し、終了処理が引き取った場合は空のバッチを返す
+        """
+        batch = []
+        if block:
+            with self._lock:
+                self._in_flight = batch
+        try:
+            if block:
+                entry = self._queue.get()
+            else:
+                entry = self._queue.get_nowait()
+        except queue.Empty:
+            return batch
+        if not self._hold(batch, entry, block):
+            return []
+
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.time()
+            try:
+                if block and remaining > 0:
+                    entry = self._queue.get(timeout=remaining)
+                else:
+                    entry = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not self._hold(batch, entry, block):
+                return []
+
+        return batch
+
+    def _hold(self, batch: List[NoteLogEntry], entry: NoteLogEntry, in_flight: bool) -> bool:
+        """
+        取り出した行をバッチに加える
+
+        書き込み中のバッチを終了処理が引き取った後（または終了処理の開始後）に取り出した行は、加えずに退避する
+
+        Returns:
+            bool: バッチに加えた場合True
+        """
+        if in_flight:
+            with self._lock:
+                held = self._in_flight is batch and not self._closing
+                if held:
+                    batch.append(entry)
+            if not held:
+                self._spill([entry])
+            return held
+        batch.append(entry)
+        return True
+
+    def _write_batch(self, batch: List[NoteLogEntry], max_retries: int):
+        """バッチを書き込み、失敗し続けた場合は退避ファイルに書き出す"""
+        for attempt in range(max_retries + 1):
+            if self.gsheet_client.append_rows(batch):
+                with self._lock:
+                    self._stats['written'] += len(batch)
+                    self._stats['batches'] += 1
+                # 書き込みできる状態になったので退避分も戻す
+                # （書き戻しの失敗でこのバッチを退避すると行が重複するため、結果は分けて扱う）
+                try:
+                    self._replay_spool()
+                except Exception as e:
+                    print(f"⚠️  退避した行の書き戻しエラー: {e}")
+                return
+
+            if attempt < max_retries:
+                with self._lock:
+                    self._stats['retries'] += 1
+                time.sleep(self._backoff(attempt))
+
+        self._spill_unclaimed(batch)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        """ジッター付き指数バックオフ（秒）"""
+        return min(30.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _spill_unclaimed(self, batch: List[NoteLogEntry]):
+        """書き込めなかったバッチを退避（終了処理が引き取って退避済みの場合は何もしない）"""
+        with self._lock:
+            claimed = batch is self._claimed
+        if not claimed:
+            self._spill(batch)
+
+    def _spill(self, batch: List[NoteLogEntry]):
+        """書き込めなかった行を退避ファイルに追記"""
+        try:
+            directory = os.path.dirname(self.spool_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with self._open_locked_spool() as f:
+                for log_entry in batch:
+                    f.write(json.dumps(asdict(log_entry), ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            with self._lock:
+                self._stats['spilled'] += len(batch)
+            print(f"⚠️  Google Sheets に書き込めなかった {len(batch)} 行を退避しました: {self.spool_path}")
+        except Exception as e:
+            print(f"❌ ログ行の退避エラー: {e}")
+
+    def _open_locked_spool(self):
+        """
+        退避ファイルを排他ロック付きで開く
+
+        ロック待ちの間に他のワーカーが書き戻しのためにファイルを移動した場合は開き直す
+        """
+        while True:
+            f = open(self.spool_path, 'a', encoding='utf-8')
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.spool_path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            f.close()
+
+    def _replay_spool(self):
+        """
+        退避ファイルの行をGoogle Sheetsに書き戻す
+
+        書き戻し中に終了したワーカー（またはこのプロセスの前回の書き戻し）が残した *.replay ファイルも引き取る
+        """
+        with self._replay_lock:
+            for replay_path in self._claim_replay_files():
+                self._replay_file(replay_path)
+
+            if not os.path.exists(self.spool_path):
+                return
+
+            # 他のワーカーと同時に書き戻さないよう、退避ファイルを自分専用の名前に移してから処理する
+            replay_path = self._replay_path()
+            with self._open_locked_spool():
+                os.replace(self.spool_path, replay_path)
+            self._replay_file(replay_path)
+
+    def _replay_path(self) -> str:
+        """このプロセス用の書き戻しファイル名（<退避ファイル>.<PID>.<連番>.replay）"""
+        return f'{self.spool_path}.{os.getpid()}.{time.time_ns()}.replay'
+
+    def _claim_replay_files(self) -> List[str]:
+        """
+        書き戻しが中断された *.replay ファイルを引き取る
+
+        このプロセスのもの（書き戻しは _replay_lock で直列化しているため処理中ではない）と、
+        終了したワーカーのものを対象とし、後者は自分の名前に移してから処理する（移せなかった場合は他のワーカーが引き取った）
+        """
+        claimed = []
+        prefix = f'{self.spool_path}.'
+        for path in sorted(glob.glob(glob.escape(self.spool_path) + '.*.replay')):
+            try:
+                pid = int(path[len(prefix):].split('.', 1)[0])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                claimed.append(path)
+            elif not is_process_alive(pid):
+                replay_path = self._replay_path()
+                try:
+                    os.rename(path, replay_path)
+                except FileNotFoundError:
+                    continue
+                claimed.append(replay_path)
+        return claimed
+
+    def _replay_file(self, replay_path: str):
+        """書き戻しファイルの行を書き込み、失敗分は退避ファイルに戻してから削除する"""
+        with open(replay_path, encoding='utf-8') as f:
+            entries = [NoteLogEntry(**json.loads(line)) for line in f if line.strip()]
+
+        for start in range(0, len(entries), self.batch_size):
+            batch = entries[start:start + self.batch_size]
+            if self.gsheet_client.append_rows(batch):
+                with self._lock:
+                    self._stats['replayed'] += len(batch)
+            else:
+                self._spill(entries[start:])
+                break
+
+        os.remove(replay_path)
+
+
+# シングルトンインスタンス
+_gsheet_writer_instance: Optional[GSheetWriteBehindLogger] = None
+_gsheet_writer_lock = threading.Lock()
+
+
+def get_gsheet_writer() -> GSheetWriteBehindLogger:
+    """書き込みキューのシングルトンインスタンスを取得"""
+    global _gsheet_writer_instance
+    if _gsheet_writer_instance is None:
+        with _gsheet_writer_lock:
+            if _gsheet_writer_instance is None:
+                _gsheet_writer_instance = GSheetWriteBehindLogger(get_gsheet_client())
+                atexit.register(_gsheet_writer_instance.flush)
+    return _gsheet_writer_instance
+
+
+def get_gsheet_writer_stats() -> Optional[dict]:
+    """
+    書き込みキューの統計を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: GSheetWriteBehindLogger.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _gsheet_writer_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
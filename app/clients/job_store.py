@@ -0,0 +1,206 @@
+"""
+ジョブストア
+非同期記事生成ジョブの状態をローカルのSQLiteに保存する
+（ワーカー再起動後もジョブの状態を参照できる）
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+from app.config import get_config
+from app.clients.process_utils import is_process_alive
+
+config = get_config()
+
+# ジョブのステータス
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_SUCCEEDED = 'succeeded'
+JOB_STATUS_FAILED = 'failed'
+
+
+class JobStore:
+    """SQLiteベースのジョブストア"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス（省略時は JOB_STORE_PATH）
+        """
+        self.path = path or config.JOB_STORE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+
+    @contextmanager
+    def _connect(self):
+        """コネクションを開き、コミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        """テーブルの作成"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    stage TEXT,
+                    request_json TEXT NOT NULL,
+                    result_json TEXT,
+                    error_json TEXT,
+                    owner_pid INTEGER,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status)')
+
+    def create(self, job_id: str, request_data: dict, owner_pid: int) -> Dict:
+        """
+        ジョブを登録
+
+        Args:
+            job_id: ジョブID
+            request_data: 記事生成リクエスト
+            owner_pid: 実行を担当するワーカーのPID
+
+        Returns:
+            Dict: 登録したジョブ
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO jobs (job_id, status, stage, request_json, owner_pid, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (job_id, JOB_STATUS_QUEUED, None, json.dumps(request_data, ensure_ascii=False),
+                 owner_pid, now, now)
+            )
+        return self.get(job_id)
+
+    def update(self, job_id: str, status: Optional[str] = None, stage: Optional[str] = None,
+               result: Optional[dict] = None, error: Optional[dict] = None):
+        """
+        ジョブの状態を更新（指定した項目のみ）
+
+        Args:
+            job_id: ジョブID
+            status: ステータス
+            stage: 現在の処理段階
+            result: 生成結果（GenerateNoteResponse.to_dict()）
+            error: エラー内容（APIError.to_dict()）
+        """
+        fields = {'updated_at': datetime.now().isoformat()}
+        if status is not None:
+            fields['status'] = status
+        if stage is not None:
+            fields['stage'] = stage
+        if result is not None:
+            fields['result_json'] = json.dumps(result, ensure_ascii=False)
+        if error is not None:
+            fields['error_json'] = json.dumps(error, ensure_ascii=False)
+
+        assignments = ', '.join(f'{name} = ?' for name in fields)
+        with self._connect() as conn:
+            conn.execute(
+                f'UPDATE jobs SET {assignments} WHERE job_id = ?',
+                (*fields.values(), job_id)
+            )
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """
+        ジョブを取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            Optional[Dict]: ジョブ（存在しない場合はNone）
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+
+        if row is None:
+            return None
+        return self._row_to_job(row)
+
+    def claim_orphaned(self, owner_pid: int, active_job_ids: set) -> List[Dict]:
+        """
+        担当ワーカーが存在しない未完了ジョブを引き取る
+
+        Args:
+            owner_pid: 引き取るワーカーのPID
+            active_job_ids: 引き取り側で実行中のジョブID（PID再利用時の誤判定防止）
+
+        Returns:
+            List[Dict]: 引き取ったジョブ（queued に戻した状態）
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT job_id, owner_pid FROM jobs WHERE status IN (?, ?)',
+                (JOB_STATUS_QUEUED, JOB_STATUS_RUNNING)
+            ).fetchall()
+
+        orphaned = [
+            (row['job_id'], row['owner_pid']) for row in rows
+            if row['job_id'] not in active_job_ids
+            and (row['owner_pid'] == owner_pid or not is_process_alive(row['owner_pid']))
+        ]
+
+        claimed = []
+        now = datetime.now().isoformat()
+        for job_id, previous_owner in orphaned:
+            with self._connect() as conn:
+                # 他のワーカーと同時に引き取らないよう、担当者が変わっていない場合のみ更新
+                cursor = conn.execute(
+                    'UPDATE jobs SET owner_pid = ?, status = ?, stage = NULL, updated_at = ? '
+                    'WHERE job_id = ? AND status IN (?, ?) AND owner_pid IS ?',
+                    (owner_pid, JOB_STATUS_QUEUED, now, job_id,
+                     JOB_STATUS_QUEUED, JOB_STATUS_RUNNING, previous_owner)
+                )
+                claimed_now = cursor.rowcount == 1
+            if claimed_now:
+                claimed.append(self.get(job_id))
+
+        return claimed
+
+    @staticmethod
+    def _row_to_job(row) -> Dict:
+        """DBの行をジョブ辞書に変換"""
+        return {
+            'job_id': row['job_id'],
+            'status': row['status'],
+            'stage': row['stage'],
+            'request': json.loads(row['request_json']),
+            'result': json.loads(row['result_json']) if row['result_json'] else None,
+            'error': json.loads(row['error_json']) if row['error_json'] else None,
+            'created_at': row['created_at'],
+            'updated_at': row['updated_at']
+        }
+
+
+# シングルトンインスタンス
+_job_store_instance: Optional[JobStore] = None
+_job_store_lock = threading.Lock()
+
+
+def get_job_store() -> JobStore:
+    """ジョブストアのシングルトンインスタンスを取得"""
+    global _job_store_instance
+    if _job_store_instance is None:
+        with _job_store_lock:
+            if _job_store_instance is None:
+                _job_store_instance = JobStore()
+    return _job_store_instance
@@ -0,0 +1,228 @@
+"""
+LLM応答のJSON抽出（逐次解析）
+ストリーミングの途中テキストを受け取りながらJSONを1回の走査で解析し、
+title / lead / sections[i] などの値が確定した時点でイベントとして返す。
+前後の説明文やコードブロックは読み飛ばし、max_tokens で途切れた応答は閉じられる所まで補って復元する
+"""
+import json
+from typing import List, Optional
+
+
+class _Frame:
+    """解析中のオブジェクト／配列"""
+
+    __slots__ = ('kind', 'expect', 'key', 'value_start', 'index')
+
+    def __init__(self, kind: str):
+        self.kind = kind  # '{' / '['
+        self.expect = 'key' if kind == '{' else 'value'  # key / colon / value / comma
+        self.key: Optional[str] = None
+        self.value_start: Optional[int] = None
+        self.index = 0
+
+
+class StreamingJSONExtractor:
+    """
+    LLM応答から最初のJSONオブジェクトを逐次抽出する
+
+    feed() で受け取ったテキストだけを走査するため、応答全体の再解析は行わない。
+    ルート直下の値が確定すると field イベント、ルート直下の配列の要素（sections の各セクションなど）が
+    確定すると item イベントを返す
+    """
+
+    def __init__(self):
+        """初期化"""
+        # 受け取ったテキスト（値を取り出す時にまとめて連結する）
+        self._chunks: List[str] = []
+        self._length = 0
+        self._pos = 0
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._stack: List[_Frame] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._string_is_key = False
+        self._scalar_start: Optional[int] = None
+        # 直近に値が確定した位置と、そこで閉じる場合の閉じ括弧（途切れた応答の復元用）
+        self._safe_end = 0
+        self._safe_closers = ''
+        self.repaired = False
+
+    @property
+    def _text(self) -> str:
+        """受け取ったテキスト全体（連結結果を保持し、次の feed まで再連結しない）"""
+        if len(self._chunks) > 1:
+            self._chunks = [''.join(self._chunks)]
+        return self._chunks[0] if self._chunks else ''
+
+    @property
+    def complete(self) -> bool:
+        """ルートのJSONオブジェクトが閉じたか"""
+        return self._root_end is not None
+
+    def feed(self, text: str) -> List[dict]:
+        """
+        途中テキストを追加して解析
+
+        Args:
+            text: 追加のテキスト
+
+        Returns:
+            List[dict]: 新たに確定した値のイベント
+                - {"type": "field", "key": str, "value": object} - ルート直下の値
+                - {"type": "item", "key": str, "index": int, "value": object} - ルート直下の配列の要素
+        """
+        # 追加分だけを走査する（受け取るたびに全体を連結し直さない）
+        offset = self._length
+        self._chunks.append(text)
+        self._length += len(text)
+        events = []
+        end = self._length
+
+        i = self._pos
+        while i < end and self._root_end is None:
+            c = text[i - offset]
+
+            if self._root_start is None:
+                if c == '{':
+                    self._root_start = i
+                    self._stack.append(_Frame('{'))
+                    self._mark_safe(i + 1)
+                i += 1
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    frame = self._stack[-1]
+                    if self._string_is_key:
+                        frame.key = self._loads(self._string_start, i + 1)
+                        frame.expect = 'colon'
+                    else:
+                        self._value_done(i + 1, events)
+                i += 1
+                continue
+
+            if self._scalar_start is not None:
+                if c not in ',}] \t\r\n':
+                    i += 1
+                    continue
+                self._scalar_start = None
+                self._value_done(i, events)
+
+            frame = self._stack[-1]
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+                self._string_is_key = frame.kind == '{' and frame.expect == 'key'
+                if not self._string_is_key:
+                    frame.value_start = i
+            elif c == '{' or c == '[':
+                frame.value_start = i
+                self._stack.append(_Frame(c))
+                self._mark_safe(i + 1)
+            elif c == '}' or c == ']':
+                self._stack.pop()
+                if self._stack:
+                    self._value_done(i + 1, events)
+                else:
+                    self._root_end = i + 1
+            elif c == ':':
+                frame.expect = 'value'
+            elif c == ',':
+                frame.expect = 'key' if frame.kind == '{' else 'value'
+            elif not c.isspace():
+                self._scalar_start = i
+                frame.value_start = i
+            i += 1
+
+        self._pos = i
+        return events
+
+    def finish(self) -> dict:
+        """
+        解析を終了して結果を返す
+
+        ルートのオブジェクトが閉じていない場合は、途中の文字列値を閉じるか、
+        直近に値が確定した位置まで戻して括弧を補う（repaired が True になる）
+
+        Returns:
+            dict: 抽出したJSON
+
+        Raises:
+            ValueError: JSONオブジェクトが見つからない、または復元できない場合
+        """
+        if self._root_start is None:
+            raise ValueError('LLMの応答からJSONを抽出できませんでした')
+
+        if self._root_end is not None:
+            try:
+                return json.loads(self._text[self._root_start:self._root_end])
+            except json.JSONDecodeError as e:
+                raise ValueError(f'LLMの応答からJSONを抽出できませんでした: {e}')
+
+        closers = self._closers(self._stack)
+        candidates = []
+        if self._in_string and not self._string_is_key:
+            # 途中の文字列値（最後のセクション本文など）は閉じて残す
+            text = self._text[self._root_start:]
+            if self._escape:
+                text = text[:-1]
+            candidates.append(text + '"' + closers)
+        if self._scalar_start is not None:
+            candidates.append(self._text[self._root_start:] + closers)
+        candidates.append(self._text[self._root_start:self._safe_end] + self._safe_closers)
+
+        for candidate in candidates:
+            try:
+                result = json.loads(candidate)
+            except json.JSONDecodeError:
+                continue
+            self.repaired = True
+            return result
+
+        raise ValueError('LLMの応答からJSONを抽出できませんでした（途中で途切れています）')
+
+    def _value_done(self, end: int, events: List[dict]):
+        """値が確定した（end はその直後の位置）"""
+        frame = self._stack[-1]
+        depth = len(self._stack)
+
+        if depth == 1:
+            value = self._loads(frame.value_start, end)
+            if value is not _INVALID:
+                events.append({'type': 'field', 'key': frame.key, 'value': value})
+        elif depth == 2 and frame.kind == '[':
+            value = self._loads(frame.value_start, end)
+            if value is not _INVALID:
+                events.append({'type': 'item', 'key': self._stack[0].key, 'index': frame.index, 'value': value})
+            frame.index += 1
+        elif frame.kind == '[':
+            frame.index += 1
+
+        frame.expect = 'comma'
+        self._mark_safe(end)
+
+    def _mark_safe(self, end: int):
+        self._safe_end = end
+        self._safe_closers = self._closers(self._stack)
+
+    def _loads(self, start: int, end: int):
+        try:
+            return json.loads(self._text[start:end])
+        except json.JSONDecodeError:
+            return _INVALID
+
+    @staticmethod
+    def _closers(stack: List[_Frame]) -> str:
+        return ''.join('}' if frame.kind == '{' else ']' for frame in reversed(stack))
+
+
+# 解析できなかった値（None と区別するための番兵）
+_INVALID = object()
+
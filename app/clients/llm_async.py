@@ -0,0 +1,411 @@
+"""
+LLMクライアント（asyncio版）
+専用スレッドで常駐するイベントループ上で AsyncAnthropic / AsyncOpenAI を呼び出す。
+呼び出し中にスレッドを占有しないため、1ワーカーで多数の生成を同時に進められる
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Awaitable, Dict, List, Optional, Tuple
+from app.config import get_config
+from app.clients.llm_retry import acall_with_retry
+from app.clients.llm_router import get_llm_router
+from app.clients.llm_client import (
+    assemble_fanout,
+    build_claude_system,
+    claude_token_usage,
+    continuation_steps,
+    extract_json_from_response,
+    get_article_part,
+    merge_article_parts,
+    merge_token_usage,
+    openai_message_content,
+    openai_messages,
+    openai_token_usage,
+    part_max_tokens
+)
+from app.clients.llm_prompts import (
+    AGENT1_SYSTEM_PROMPT,
+    AGENT2_SYSTEM_PROMPT,
+    AGENT2_PART_SYSTEM_PROMPT,
+    build_agent1_user_prompt,
+    build_agent1_outline_user_prompt,
+    build_agent1_section_user_prompt,
+    build_agent1_cta_user_prompt,
+    build_agent2_user_prompt,
+    build_agent2_part_user_prompt
+)
+
+config = get_config()
+
+
+class LLMEventLoop:
+    """LLM呼び出し専用のイベントループ（専用スレッドで常駐し、非同期クライアントのコネクションプールを保持する）"""
+
+    def __init__(self):
+        """初期化（イベントループのスレッドを起動）"""
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name='llm-event-loop', daemon=True)
+        # 非同期クライアントはイベントループに紐づくため、ループ内からのみ生成・利用する
+        self._clients: Dict[Tuple[str, str], Tuple[object, object]] = {}
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._total_submitted = 0
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+
+    def submit(self, coro: Awaitable) -> concurrent.futures.Future:
+        """
+        コルーチンをイベントループで実行
+
+        呼び出し元のcontextvars（再試行スコープなど）は実行されるタスクに引き継がれる
+
+        Args:
+            coro: 実行するコルーチン
+
+        Returns:
+            concurrent.futures.Future: 実行結果
+        """
+        with self._stats_lock:
+            self._in_flight += 1
+            self._total_submitted += 1
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        future.add_done_callback(self._on_done)
+        return future
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None):
+        """
+        コルーチンをイベントループで実行し、完了を待つ
+
+        Args:
+            coro: 実行するコルーチン
+            timeout: 待ち時間の上限（秒）
+
+        Returns:
+            コルーチンの戻り値
+        """
+        return self.submit(coro).result(timeout)
+
+    def _on_done(self, _future):
+        with self._stats_lock:
+            self._in_flight -= 1
+
+    def get_client(self, provider: str, api_key: Optional[str] = None):
+        """
+        プロバイダ／APIキーに対応する非同期クライアントを取得（イベントループ内から呼ぶ）
+
+        Args:
+            provider: claude / openai
+            api_key: APIキー（省略時は LLM_API_KEY）
+
+        Returns:
+            AsyncAnthropic または AsyncOpenAI クライアント
+        """
+        api_key = api_key or config.LLM_API_KEY
+        key = (provider, api_key)
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = self._build_client(provider, api_key)
+            self._clients[key] = entry
+        return entry[0]
+
+    @staticmethod
+    def _build_client(provider: str, api_key: str):
+        """keep-alive付きのhttpx.AsyncClientを使う非同期クライアントを生成"""
+        import httpx
+
+        timeout = httpx.Timeout(config.LLM_HTTP_READ_TIMEOUT, connect=config.LLM_HTTP_CONNECT_TIMEOUT)
+        limits = httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY
+        )
+        http_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+
+        if provider == 'claude':
+            from anthropic import AsyncAnthropic
+            # 再試行は llm_retry で行う（デッドラインを共有するため）
+            client = AsyncAnthropic(api_key=api_key, http_client=http_client, timeout=timeout, max_retries=0)
+        elif provider == 'openai':
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=api_key, http_client=http_client, timeout=timeout, max_retries=0)
+        else:
+            raise ValueError(f'Unsupported LLM provider: {provider}')
+
+        return client, http_client
+
+    def get_stats(self) -> dict:
+        """
+        イベントループの利用状況を取得
+
+        Returns:
+            dict: in_flight（実行中のコルーチン数）, total_submitted, clients（生成済みクライアント数）
+        """
+        with self._stats_lock:
+            return {
+                'in_flight': self._in_flight,
+                'total_submitted': self._total_submitted,
+                'clients': len(self._clients)
+            }
+
+    def close(self):
+        """クライアントを閉じてイベントループを停止"""
+        async def close_clients():
+            for _, http_client in list(self._clients.values()):
+                try:
+                    await http_client.aclose()
+                except Exception as e:
+                    print(f"⚠️  HTTPクライアントのクローズエラー: {e}")
+            self._clients.clear()
+
+        if self._loop.is_running():
+            try:
+                asyncio.run_coroutine_threadsafe(close_clients(), self._loop).result(5)
+            except Exception as e:
+                print(f"⚠️  イベントループの停止エラー: {e}")
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(5)
+
+
+async def acall_agent1(payload: dict) -> dict:
+    """
+    構成＋ドラフト生成用のLLM呼び出し（asyncio版、戻り値は call_agent1 と同じ）
+
+    Args:
+        payload: リクエストパラメータ（topic, audience, goal, etc.）
+
+    Returns:
+        dict: 生成結果（title, lead, sections, cta, token_usage）
+    """
+    result, token_usage = await _acall_json(
+        'agent1',
+        config.LLM_MODEL_AGENT1,
+        AGENT1_SYSTEM_PROMPT,
+        build_agent1_user_prompt(payload),
+        config.LLM_AGENT1_MAX_TOKENS,
+        float(payload.get('temperature', 0.7))
+    )
+    result['token_usage'] = token_usage
+    return result
+
+
+async def acall_agent1_fanout(payload: dict) -> dict:
+    """
+    構成＋ドラフト生成を分割して実行（asyncio版、戻り値は call_agent1_fanout と同じ）
+
+    Args:
+        payload: リクエストパラメータ
+
+    Returns:
+        dict: 生成結果（token_usageは全呼び出しの合算）
+    """
+    temperature = float(payload.get('temperature', 0.7))
+
+    outline, token_usage = await _acall_json(
+        'agent1', config.LLM_MODEL_AGENT1, AGENT1_SYSTEM_PROMPT,
+        build_agent1_outline_user_prompt(payload), config.LLM_AGENT1_OUTLINE_MAX_TOKENS, temperature
+    )
+    sections = outline.get('sections') or []
+    if not sections:
+        raise ValueError('構成にセクションがありません')
+
+    keys = list(range(len(sections))) + ['cta']
+    prompts = [build_agent1_section_user_prompt(payload, outline, index) for index in range(len(sections))]
+    prompts.append(build_agent1_cta_user_prompt(payload, outline))
+    results = await _gather_limited([
+        _acall_json(
+            'agent1', config.LLM_MODEL_AGENT1, AGENT1_SYSTEM_PROMPT,
+            prompt, config.LLM_AGENT1_SECTION_MAX_TOKENS, temperature
+        )
+        for prompt in prompts
+    ], config.AGENT1_FANOUT_CONCURRENCY)
+
+    return assemble_fanout(outline, token_usage, dict(zip(keys, results)))
+
+
+async def acall_agent2(payload: dict) -> dict:
+    """
+    文体調整のLLM呼び出し（asyncio版、戻り値は call_agent2 と同じ）
+
+    Args:
+        payload: Agent1の出力結果
+
+    Returns:
+        dict: 調整後の結果（token_usageはAgent1と合算）
+    """
+    result, token_usage = await _acall_json(
+        'agent2',
+        config.LLM_MODEL_AGENT2,
+        AGENT2_SYSTEM_PROMPT,
+        build_agent2_user_prompt(payload),
+        config.LLM_AGENT2_MAX_TOKENS,
+        0.3
+    )
+    if 'token_usage' in payload:
+        token_usage = merge_token_usage(payload['token_usage'], token_usage)
+    result['token_usage'] = token_usage
+    return result
+
+
+async def acall_agent2_parts(payload: dict, targets: dict) -> dict:
+    """
+    違反のある部分だけをAgent2で同時に調整（asyncio版、戻り値は call_agent2_parts と同じ）
+
+    Args:
+        payload: Agent1の出力
+        targets: 調整する部分 → 違反箇所の抜粋のリスト
+
+    Returns:
+        dict: 調整後の結果
+    """
+    keys = list(targets)
+    parts = [get_article_part(payload, key) for key in keys]
+    results = await _gather_limited([
+        _acall_json(
+            'agent2', config.LLM_MODEL_AGENT2, AGENT2_PART_SYSTEM_PROMPT,
+            build_agent2_part_user_prompt(part, targets[key]), part_max_tokens(part), 0.3
+        )
+        for key, part in zip(keys, parts)
+    ], config.AGENT2_PART_CONCURRENCY)
+    return merge_article_parts(payload, dict(zip(keys, results)))
+
+
+async def _gather_limited(coros: List[Awaitable], limit: int) -> list:
+    """
+    コルーチンを同時に最大 limit 件まで実行する（同期版の _run_in_parallel と同じ同時実行数の制限）
+
+    Args:
+        coros: 実行するコルーチン
+        limit: 同時実行数
+
+    Returns:
+        list: 戻り値（coros と同じ順序）
+    """
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[run(coro) for coro in coros])
+
+
+async def _acall_json(agent: str, model: str, system_prompt: str, user_prompt: str,
+                      max_tokens: int, temperature: float):
+    """
+    ルーター経由で呼び出し（途切れた場合は続きを生成してつなげる）、JSONを抽出
+
+    Returns:
+        tuple[dict, dict]: (抽出したJSON, トークン使用量)
+    """
+    if config.LLM_PROVIDER not in ('claude', 'openai'):
+        raise ValueError(f'Unsupported LLM provider: {config.LLM_PROVIDER}')
+
+    async def call(partial_output=None):
+        return await get_llm_router().acall(
+            agent,
+            (config.LLM_PROVIDER, model),
+            lambda provider, model, api_key: _acall_llm_api(
+                provider,
+                system_prompt=system_prompt,
+                user_prompt=user_prompt,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                model=model,
+                api_key=api_key,
+                partial_output=partial_output
+            )
+        )
+
+    steps = continuation_steps(await call())
+    try:
+        partial_output = next(steps)
+        while True:
+            partial_output = steps.send(await call(partial_output))
+    except StopIteration as done:
+        response = done.value
+
+    return extract_json_from_response(response['content']), response['token_usage']
+
+
+async def _acall_llm_api(provider: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                         temperature: float, model: str, api_key: str = None, partial_output: str = None) -> dict:
+    """
+    プロバイダに応じて非同期APIを呼び出す（partial_output 指定時はその続きを生成する）
+
+    Returns:
+        dict: API応答（content, token_usage, truncated）
+    """
+    client = get_llm_event_loop().get_client(provider, api_key)
+
+    if provider == 'claude':
+        messages = [{"role": "user", "content": user_prompt}]
+        if partial_output:
+            messages.append({"role": "assistant", "content": partial_output})
+
+        async def attempt(timeout):
+            return await client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=build_claude_system(system_prompt, config.LLM_PROMPT_CACHING),
+                messages=messages,
+                timeout=timeout
+            )
+
+        response = await acall_with_retry('claude', attempt)
+        return {
+            'content': response.content[0].text if response.content else '',
+            'token_usage': claude_token_usage(response.usage),
+            'truncated': response.stop_reason == 'max_tokens'
+        }
+
+    if provider == 'openai':
+        async def attempt(timeout):
+            return await client.chat.completions.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=openai_messages(system_prompt, user_prompt, partial_output),
+                timeout=timeout
+            )
+
+        response = await acall_with_retry('openai', attempt)
+        return {
+            'content': openai_message_content(response.choices[0]),
+            'token_usage': openai_token_usage(response.usage),
+            'truncated': response.choices[0].finish_reason == 'length'
+        }
+
+    raise ValueError(f'Unsupported LLM provider: {provider}')
+
+
+# シングルトンインスタンス
+_llm_event_loop_instance: Optional[LLMEventLoop] = None
+_llm_event_loop_lock = threading.Lock()
+
+
+def get_llm_event_loop() -> LLMEventLoop:
+    """LLM呼び出し用イベントループのシングルトンインスタンスを取得"""
+    global _llm_event_loop_instance
+    if _llm_event_loop_instance is None:
+        with _llm_event_loop_lock:
+            if _llm_event_loop_instance is None:
+                _llm_event_loop_instance = LLMEventLoop()
+    return _llm_event_loop_instance
+
+
+def get_llm_event_loop_stats() -> dict:
+    """
+    イベントループの利用状況を取得（未起動の場合は起動しない）
+
+    Returns:
+        dict: running（起動済みか）と LLMEventLoop.get_stats() の内容
+    """
+    loop = _llm_event_loop_instance
+    if loop is None:
+        return {'running': False}
+    return {'running': True, **loop.get_stats()}
@@ -2,25 +2,40 @@
 LLMクライアント
 Claude / OpenAI APIを呼び出して記事生成を行う
 """
+import contextvars
 import json
-import re
+from concurrent.futures import ThreadPoolExecutor
 from app.config import get_config
+from app.models.errors import LLMResponseError
+from app.clients.llm_client_registry import get_llm_client_registry
+from app.clients import llm_hedge
+from app.clients.json_stream import StreamingJSONExtractor
+from app.clients.llm_retry import call_with_retry, stream_with_retry, current_scope
+from app.clients.llm_router import get_llm_router
 from app.clients.llm_prompts import (
     AGENT1_SYSTEM_PROMPT,
     AGENT2_SYSTEM_PROMPT,
+    AGENT2_PART_SYSTEM_PROMPT,
+    CONTINUATION_USER_PROMPT,
     build_agent1_user_prompt,
-    build_agent2_user_prompt
+    build_agent1_outline_user_prompt,
+    build_agent1_section_user_prompt,
+    build_agent1_cta_user_prompt,
+    build_agent2_user_prompt,
+    build_agent2_part_user_prompt
 )
 
 config = get_config()
 
 
-def call_agent1(payload: dict) -> dict:
+def call_agent1(payload: dict, hedge: bool = False) -> dict:
     """
     構成＋ドラフト生成用のLLM呼び出し
 
     Args:
         payload: リクエストパラメータ（topic, audience, goal, etc.）
+        hedge: 最初のトークンが遅い場合に2本目のリクエストを送るか
+               （打ち切った方の推定トークン数は token_usage.hedge_tokens として total_tokens に含める）
 
     Returns:
         dict: 生成結果
@@ -39,28 +54,18 @@ def call_agent1(payload: dict) -> dict:
     # max_tokens設定
     max_tokens = config.LLM_AGENT1_MAX_TOKENS
 
-    # LLMプロバイダに応じてAPI呼び出し
-    if config.LLM_PROVIDER == 'claude':
-        response = _call_claude_api(
-            system_prompt=AGENT1_SYSTEM_PROMPT,
-            user_prompt=user_prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            model=config.LLM_MODEL_AGENT1
-        )
-    elif config.LLM_PROVIDER == 'openai':
-        response = _call_openai_api(
-            system_prompt=AGENT1_SYSTEM_PROMPT,
-            user_prompt=user_prompt,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            model=config.LLM_MODEL_AGENT1
-        )
-    else:
-        raise ValueError(f'Unsupported LLM provider: {config.LLM_PROVIDER}')
+    if hedge:
+        # 途切れた場合の続きの生成は各ストリーム（_stream_llm_api）の中で済んでいる
+        response = _call_agent1_hedged(user_prompt, max_tokens, temperature)
+        result = extract_json_from_response(response['content'])
+        result['token_usage'] = response['token_usage']
+        return result
+
+    # LLMプロバイダに応じてAPI呼び出し（障害時はフェイルオーバー先に切り替え、途切れた場合は続きを生成）
+    response = _call_llm('agent1', config.LLM_MODEL_AGENT1, AGENT1_SYSTEM_PROMPT, user_prompt, max_tokens, temperature)
 
     # レスポンスからJSON抽出
-    result = _extract_json_from_response(response['content'])
+    result = extract_json_from_response(response['content'])
 
     # token_usage情報を追加
     result['token_usage'] = response['token_usage']
@@ -68,6 +73,132 @@ def call_agent1(payload: dict) -> dict:
     return result
 
 
+def call_agent1_fanout(payload: dict) -> dict:
+    """
+    構成＋ドラフト生成を分割して実行（長い記事向け）
+
+    短い呼び出しでタイトル・リード文・見出しを作成し、各セクションの本文とCTAを並列に生成して順に組み立てる。
+    所要時間は記事全体ではなく1セクション分の生成時間に近づく
+
+    Args:
+        payload: リクエストパラメータ（topic, audience, goal, etc.）
+
+    Returns:
+        dict: call_agent1と同じ形式（token_usageは全呼び出しの合算）
+    """
+    temperature = float(payload.get('temperature', 0.7))
+
+    # 1. 構成（タイトル・リード文・見出しと要点）
+    outline, token_usage = _call_agent1_json(
+        build_agent1_outline_user_prompt(payload),
+        config.LLM_AGENT1_OUTLINE_MAX_TOKENS,
+        temperature
+    )
+    sections = outline.get('sections') or []
+    if not sections:
+        raise ValueError('構成にセクションがありません')
+
+    # 2. 各セクションの本文とCTAを並列に生成
+    tasks = {
+        index: (lambda index=index: _call_agent1_json(
+            build_agent1_section_user_prompt(payload, outline, index),
+            config.LLM_AGENT1_SECTION_MAX_TOKENS,
+            temperature
+        ))
+        for index in range(len(sections))
+    }
+    tasks['cta'] = lambda: _call_agent1_json(
+        build_agent1_cta_user_prompt(payload, outline),
+        config.LLM_AGENT1_SECTION_MAX_TOKENS,
+        temperature
+    )
+    parts = _run_in_parallel(tasks, config.AGENT1_FANOUT_CONCURRENCY)
+
+    # 3. 順に組み立てる
+    return assemble_fanout(outline, token_usage, parts)
+
+
+def assemble_fanout(outline: dict, token_usage: dict, parts: dict) -> dict:
+    """
+    分割生成の結果を記事に組み立てる
+
+    Args:
+        outline: 構成（title, lead, sections[heading, points]）
+        token_usage: 構成の呼び出しのトークン使用量
+        parts: セクション番号 / "cta" → (生成結果, トークン使用量)
+
+    Returns:
+        dict: call_agent1と同じ形式
+    """
+    sections = outline.get('sections') or []
+    result = {
+        'title': outline.get('title', ''),
+        'lead': outline.get('lead', ''),
+        'sections': [],
+        'cta': ''
+    }
+    for index in range(len(sections)):
+        part, part_usage = parts[index]
+        result['sections'].append({'heading': sections[index].get('heading', ''), 'body': part.get('body', '')})
+        token_usage = merge_token_usage(token_usage, part_usage)
+
+    cta, cta_usage = parts['cta']
+    result['cta'] = cta.get('cta', '')
+    result['token_usage'] = merge_token_usage(token_usage, cta_usage)
+    return result
+
+
+def _call_agent1_json(user_prompt: str, max_tokens: int, temperature: float):
+    """
+    Agent1のシステムプロンプトで1回呼び出し、JSONを抽出
+
+    Returns:
+        tuple[dict, dict]: (抽出したJSON, トークン使用量)
+    """
+    response = _call_llm('agent1', config.LLM_MODEL_AGENT1, AGENT1_SYSTEM_PROMPT, user_prompt, max_tokens, temperature)
+
+    return extract_json_from_response(response['content']), response['token_usage']
+
+
+def _call_agent1_hedged(user_prompt: str, max_tokens: int, temperature: float) -> dict:
+    """
+    Agent1をヘッジ付きで呼び出す
+
+    最初のトークンまでの時間の分位点（LLM_HEDGE_PERCENTILE）を過ぎても応答が始まらなければ、
+    同じリクエストを LLM_HEDGE_MODEL_AGENT1（未設定時は同じモデル・別コネクション）に送り、先に完了した方を使う。
+    ヘッジの統計は再試行スコープに記録する
+
+    Returns:
+        dict: API応答（content, token_usage）
+    """
+    def open_stream(model):
+        return lambda: _stream_llm_api(
+            agent='agent1',
+            system_prompt=AGENT1_SYSTEM_PROMPT,
+            user_prompt=user_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            model=model
+        )
+
+    tracker = llm_hedge.get_first_token_tracker()
+    done, stats = llm_hedge.run_hedged(
+        open_stream(config.LLM_MODEL_AGENT1),
+        open_stream(config.LLM_HEDGE_MODEL_AGENT1 or config.LLM_MODEL_AGENT1),
+        delay=llm_hedge.hedge_delay(tracker),
+        tracker=tracker
+    )
+    current_scope().hedge = stats
+
+    token_usage = dict(done['token_usage'])
+    token_usage['hedge_tokens'] = stats['extra_tokens']
+    token_usage['total_tokens'] = token_usage.get('total_tokens', 0) + stats['extra_tokens']
+    return {
+        'content': done['content'],
+        'token_usage': token_usage
+    }
+
+
 def call_agent2(payload: dict) -> dict:
     """
     Agent1の結果を受け、文体調整・禁止表現チェックをした最終版を返す
@@ -87,44 +218,443 @@ def call_agent2(payload: dict) -> dict:
     # temperature は低めに設定（文体調整のため）
     temperature = 0.3
 
-    # LLMプロバイダに応じてAPI呼び出し
-    if config.LLM_PROVIDER == 'claude':
-        response = _call_claude_api(
-            system_prompt=AGENT2_SYSTEM_PROMPT,
+    # LLMプロバイダに応じてAPI呼び出し（障害時はフェイルオーバー先に切り替え、途切れた場合は続きを生成）
+    response = _call_llm('agent2', config.LLM_MODEL_AGENT2, AGENT2_SYSTEM_PROMPT, user_prompt, max_tokens, temperature)
+
+    # レスポンスからJSON抽出
+    result = extract_json_from_response(response['content'])
+
+    # token_usage情報を元の情報と合算
+    if 'token_usage' in payload:
+        result['token_usage'] = merge_token_usage(payload['token_usage'], response['token_usage'])
+    else:
+        result['token_usage'] = response['token_usage']
+
+    return result
+
+
+def call_agent2_parts(payload: dict, targets: dict) -> dict:
+    """
+    違反のある部分（タイトル・リード文・CTA・セクション）だけをAgent2で並列に調整し、記事に反映する
+
+    出力トークン数と所要時間は記事の長さではなく違反のある部分の数に比例する
+
+    Args:
+        payload: Agent1の出力
+        targets: 調整する部分 → 違反箇所の抜粋のリスト
+                 （キーは title / lead / cta / sections.<セクション番号>）
+
+    Returns:
+        dict: 調整後の結果（call_agent2と同じ形式、token_usageは全呼び出しの合算）
+    """
+    if not targets:
+        return merge_article_parts(payload, {})
+
+    responses = _run_in_parallel(
+        {
+            key: (lambda part=get_article_part(payload, key), excerpts=excerpts: _call_agent2_part(part, excerpts))
+            for key, excerpts in targets.items()
+        },
+        config.AGENT2_PART_CONCURRENCY
+    )
+
+    return merge_article_parts(payload, responses)
+
+
+def get_article_part(article: dict, key: str) -> dict:
+    """記事から部分調整の対象を取り出す（sections.<番号> は見出しと本文、それ以外は text）"""
+    if key.startswith('sections.'):
+        section = article['sections'][int(key.split('.', 1)[1])]
+        return {'heading': section.get('heading', ''), 'body': section.get('body', '')}
+    return {'text': article.get(key, '')}
+
+
+def merge_article_parts(payload: dict, responses: dict) -> dict:
+    """
+    部分調整の結果を記事に反映する
+
+    Args:
+        payload: 元の記事（変更しない）
+        responses: 部分のキー → (調整後の部分, トークン使用量)
+
+    Returns:
+        dict: 調整後の記事（token_usageは合算）
+    """
+    result = dict(payload)
+    result['sections'] = [dict(section) for section in payload.get('sections', [])]
+
+    token_usage = payload.get('token_usage')
+    for key, (part, part_usage) in responses.items():
+        if key.startswith('sections.'):
+            section = result['sections'][int(key.split('.', 1)[1])]
+            section['heading'] = part.get('heading', section.get('heading', ''))
+            section['body'] = part.get('body', section.get('body', ''))
+        else:
+            result[key] = part.get('text', result.get(key, ''))
+        token_usage = merge_token_usage(token_usage, part_usage) if token_usage else part_usage
+
+    if token_usage is not None:
+        result['token_usage'] = token_usage
+    return result
+
+
+def _run_in_parallel(tasks: dict, max_workers: int) -> dict:
+    """
+    複数のLLM呼び出しをスレッドプールで並列に実行
+
+    各呼び出しは呼び出し元の再試行スコープ（デッドライン）を共有する
+
+    Args:
+        tasks: キー → 引数なしの呼び出し
+        max_workers: 同時実行数
+
+    Returns:
+        dict: キー → 戻り値（tasks と同じ順序）
+
+    Raises:
+        いずれかの呼び出しが送出した例外（tasks の順で最初のもの）
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(len(tasks), max_workers))) as executor:
+        futures = {
+            key: executor.submit(contextvars.copy_context().run, task)
+            for key, task in tasks.items()
+        }
+
+    return {key: future.result() for key, future in futures.items()}
+
+
+def part_max_tokens(part: dict) -> int:
+    """部分調整の出力上限（出力は入力とほぼ同じ長さのため、入力の文字数に応じて決める）"""
+    part_chars = len(json.dumps(part, ensure_ascii=False))
+    return min(config.LLM_AGENT2_MAX_TOKENS, max(256, part_chars * 2))
+
+
+def _call_agent2_part(part: dict, excerpts: list):
+    """
+    記事の一部をAgent2で調整
+
+    Args:
+        part: 調整対象（{"text": str} または {"heading": str, "body": str}）
+        excerpts: 違反箇所の抜粋
+
+    Returns:
+        tuple[dict, dict]: (調整後の部分, トークン使用量)
+    """
+    user_prompt = build_agent2_part_user_prompt(part, excerpts)
+    max_tokens = part_max_tokens(part)
+
+    response = _call_llm('agent2', config.LLM_MODEL_AGENT2, AGENT2_PART_SYSTEM_PROMPT, user_prompt, max_tokens, 0.3)
+
+    return extract_json_from_response(response['content']), response['token_usage']
+
+
+def stream_agent1(payload: dict):
+    """
+    構成＋ドラフト生成をストリーミングで実行
+
+    Args:
+        payload: リクエストパラメータ（topic, audience, goal, etc.）
+
+    Yields:
+        dict: ストリームイベント
+            - {"type": "delta", "text": str} - 生成途中のテキスト
+            - {"type": "field", "key": str, "value": object} - 確定した title / lead / cta など
+            - {"type": "section", "index": int, "section": dict} - 確定したセクション
+            - {"type": "result", "result": dict} - call_agent1と同じ形式の最終結果
+    """
+    user_prompt = build_agent1_user_prompt(payload)
+    temperature = float(payload.get('temperature', 0.7))
+
+    stream = _stream_llm_api(
+        agent='agent1',
+        system_prompt=AGENT1_SYSTEM_PROMPT,
+        user_prompt=user_prompt,
+        max_tokens=config.LLM_AGENT1_MAX_TOKENS,
+        temperature=temperature,
+        model=config.LLM_MODEL_AGENT1
+    )
+
+    for event in _extract_stream(stream):
+        if event['type'] != 'done':
+            yield event
+            continue
+
+        result = event['result']
+        result['token_usage'] = event['token_usage']
+        yield {'type': 'result', 'result': result}
+
+
+def stream_agent2(payload: dict):
+    """
+    文体調整をストリーミングで実行
+
+    Args:
+        payload: Agent1の出力結果
+
+    Yields:
+        dict: ストリームイベント
+            - {"type": "delta", "text": str} - 生成途中のテキスト
+            - {"type": "field", "key": str, "value": object} - 確定した title / lead / cta など
+            - {"type": "section", "index": int, "section": dict} - 確定したセクション
+            - {"type": "result", "result": dict} - call_agent2と同じ形式の最終結果
+    """
+    user_prompt = build_agent2_user_prompt(payload)
+
+    stream = _stream_llm_api(
+        agent='agent2',
+        system_prompt=AGENT2_SYSTEM_PROMPT,
+        user_prompt=user_prompt,
+        max_tokens=config.LLM_AGENT2_MAX_TOKENS,
+        temperature=0.3,
+        model=config.LLM_MODEL_AGENT2
+    )
+
+    for event in _extract_stream(stream):
+        if event['type'] != 'done':
+            yield event
+            continue
+
+        result = event['result']
+        if 'token_usage' in payload:
+            result['token_usage'] = merge_token_usage(payload['token_usage'], event['token_usage'])
+        else:
+            result['token_usage'] = event['token_usage']
+        yield {'type': 'result', 'result': result}
+
+
+def _extract_stream(stream):
+    """
+    ストリームの途中テキストからJSONを逐次抽出し、確定した値をイベントとして挟む
+
+    Args:
+        stream: _stream_llm_api のストリーム
+
+    Yields:
+        dict: delta / field / section イベントと、抽出結果（result）を加えた done イベント
+    """
+    extractor = StreamingJSONExtractor()
+    chunks = []
+    for event in stream:
+        if event['type'] == 'delta':
+            yield event
+            chunks.append(event['text'])
+            for value_event in extractor.feed(event['text']):
+                if value_event['type'] == 'item' and value_event['key'] == 'sections':
+                    yield {'type': 'section', 'index': value_event['index'], 'section': value_event['value']}
+                elif value_event['type'] == 'field' and value_event['key'] != 'sections':
+                    yield value_event
+            continue
+
+        if not chunks:
+            extractor.feed(event['content'])
+        yield dict(event, result=_finish_extraction(extractor, event['content']))
+
+
+def _call_llm(agent: str, model: str, system_prompt: str, user_prompt: str, max_tokens: int,
+              temperature: float) -> dict:
+    """
+    ルーター経由でLLMを呼び出し、max_tokens で途切れた場合は続きを生成してつなげる
+
+    Returns:
+        dict: API応答（content, token_usage, truncated）
+    """
+    def call(partial_output=None):
+        return _call_routed(agent, model, system_prompt, user_prompt, max_tokens, temperature, partial_output)
+
+    return _continue_if_truncated(call(), call)
+
+
+def _call_routed(agent: str, model: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                 temperature: float, partial_output: str = None) -> dict:
+    """ルーター経由でLLMを1回呼び出す（障害時はフェイルオーバー先に切り替え）"""
+    return get_llm_router().call(
+        agent,
+        (config.LLM_PROVIDER, model),
+        lambda provider, model, api_key: _call_llm_api(
+            provider,
+            system_prompt=system_prompt,
             user_prompt=user_prompt,
             max_tokens=max_tokens,
             temperature=temperature,
-            model=config.LLM_MODEL_AGENT2
+            model=model,
+            api_key=api_key,
+            partial_output=partial_output
         )
-    elif config.LLM_PROVIDER == 'openai':
-        response = _call_openai_api(
-            system_prompt=AGENT2_SYSTEM_PROMPT,
+    )
+
+
+def _continue_if_truncated(response: dict, call_continuation) -> dict:
+    """
+    max_tokens で途切れた応答の続きを生成してつなげる（手順は continuation_steps）
+
+    Args:
+        response: API応答（content, token_usage, truncated）
+        call_continuation: 途中出力を受け取って続きを生成する関数
+
+    Returns:
+        dict: つなげた後のAPI応答
+    """
+    steps = continuation_steps(response)
+    try:
+        partial_output = next(steps)
+        while True:
+            partial_output = steps.send(call_continuation(partial_output))
+    except StopIteration as done:
+        return done.value
+
+
+def continuation_steps(response: dict):
+    """
+    max_tokens で途切れた応答の続きを生成する手順（同期版・asyncio版で共有する）
+
+    生成済みの部分は捨てずにアシスタントの途中出力として渡し、続きだけを生成させる（最大 LLM_MAX_CONTINUATIONS 回）。
+    続きの呼び出しのトークンは token_usage に合算し、内訳を continuation_tokens として返す
+
+    続きの生成に渡す途中出力を返すので、呼び出し元は続きを生成して send() で渡す
+
+    Args:
+        response: API応答（content, token_usage, truncated）
+
+    Yields:
+        str: 続きの生成に渡す途中出力
+
+    Returns:
+        dict: つなげた後のAPI応答（StopIteration.value）
+    """
+    continuations = 0
+    while response.get('truncated') and continuations < config.LLM_MAX_CONTINUATIONS:
+        continuations += 1
+        print(f"⚠️  出力が max_tokens で途切れたため続きを生成します（{continuations}回目）")
+        continuation = yield _continuation_prefix(response['content'])
+        response = _stitch_continuation(response, continuation)
+        current_scope().record_continuation()
+    return response
+
+
+def _continuation_prefix(content: str) -> str:
+    """続きの生成に渡す途中出力（Claudeは末尾が空白の途中出力を受け付けないため除く）"""
+    return content.rstrip()
+
+
+# 続きの先頭が途中出力の末尾の繰り返しとみなす最小・最大の文字数
+_MIN_OVERLAP_CHARS = 8
+_MAX_OVERLAP_CHARS = 200
+
+
+def _stitch_continuation(response: dict, continuation: dict) -> dict:
+    """
+    途中までの応答と続きの応答をつなげる
+
+    続きの先頭が途中出力の末尾を繰り返している場合は重複を除く
+
+    Args:
+        response: 途中までのAPI応答
+        continuation: 続きのAPI応答
+
+    Returns:
+        dict: つなげた後のAPI応答（content, token_usage, truncated）
+    """
+    prefix = _continuation_prefix(response['content'])
+    text = continuation['content'] or ''
+    for size in range(min(len(prefix), len(text), _MAX_OVERLAP_CHARS), _MIN_OVERLAP_CHARS - 1, -1):
+        if prefix.endswith(text[:size]):
+            text = text[size:]
+            break
+
+    continuation_usage = dict(
+        continuation['token_usage'],
+        continuation_tokens=continuation['token_usage'].get('total_tokens', 0)
+    )
+    return {
+        'content': prefix + text,
+        'token_usage': merge_token_usage(response['token_usage'], continuation_usage),
+        'truncated': bool(continuation.get('truncated'))
+    }
+
+
+def _call_llm_api(provider: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                  temperature: float, model: str, api_key: str = None, partial_output: str = None) -> dict:
+    """プロバイダに応じてAPIを呼び出す（partial_output 指定時はその続きを生成する）"""
+    if provider == 'claude':
+        return _call_claude_api(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            model=model,
+            api_key=api_key,
+            partial_output=partial_output
+        )
+    elif provider == 'openai':
+        return _call_openai_api(
+            system_prompt=system_prompt,
             user_prompt=user_prompt,
             max_tokens=max_tokens,
             temperature=temperature,
-            model=config.LLM_MODEL_AGENT2
+            model=model,
+            api_key=api_key,
+            partial_output=partial_output
         )
     else:
+        raise ValueError(f'Unsupported LLM provider: {provider}')
+
+
+def _stream_llm_api(agent: str, system_prompt: str, user_prompt: str, max_tokens: int,
+                    temperature: float, model: str):
+    """LLMプロバイダに応じてストリーミングAPIを呼び出す（障害時はフェイルオーバー先に切り替え）"""
+    if config.LLM_PROVIDER not in ('claude', 'openai'):
         raise ValueError(f'Unsupported LLM provider: {config.LLM_PROVIDER}')
 
-    # レスポンスからJSON抽出
-    result = _extract_json_from_response(response['content'])
+    def open_stream(provider, model, api_key):
+        stream_api = _stream_claude_api if provider == 'claude' else _stream_openai_api
+        return stream_api(
+            system_prompt=system_prompt,
+            user_prompt=user_prompt,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            model=model,
+            api_key=api_key
+        )
 
-    # token_usage情報を元の情報と合算
-    if 'token_usage' in payload:
-        result['token_usage'] = {
-            'prompt_tokens': payload['token_usage'].get('prompt_tokens', 0) + response['token_usage']['prompt_tokens'],
-            'completion_tokens': payload['token_usage'].get('completion_tokens', 0) + response['token_usage']['completion_tokens'],
-            'total_tokens': payload['token_usage'].get('total_tokens', 0) + response['token_usage']['total_tokens']
-        }
-    else:
-        result['token_usage'] = response['token_usage']
+    for event in get_llm_router().stream(agent, (config.LLM_PROVIDER, model), open_stream):
+        if event['type'] == 'delta' or not event.get('truncated'):
+            yield event
+            continue
 
-    return result
+        # 途切れた場合、続きは通常の呼び出しで生成し、1つの途中テキストとして返す
+        response = _continue_if_truncated(
+            event,
+            lambda partial_output: _call_routed(
+                agent, model, system_prompt, user_prompt, max_tokens, temperature, partial_output
+            )
+        )
+        prefix = _continuation_prefix(event['content'])
+        if len(response['content']) > len(prefix):
+            yield {'type': 'delta', 'text': response['content'][len(prefix):]}
+        yield dict(event, **response)
+
+
+def merge_token_usage(base: dict, addition: dict) -> dict:
+    """
+    2つのtoken_usageを項目ごとに合算する
+
+    Args:
+        base: 元のトークン使用量
+        addition: 加算するトークン使用量
+
+    Returns:
+        dict: 合算後のトークン使用量
+    """
+    merged = dict(base)
+    for key, value in addition.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
 
 
 def _call_claude_api(system_prompt: str, user_prompt: str, max_tokens: int,
-                     temperature: float = 0.7, model: str = None) -> dict:
+                     temperature: float = 0.7, model: str = None,
+                     cache_system_prompt: bool = None, api_key: str = None,
+                     partial_output: str = None) -> dict:
     """
     Claude APIを呼び出す
 
@@ -134,45 +664,54 @@ def _call_claude_api(system_prompt: str, user_prompt: str, max_tokens: int,
         max_tokens: 最大トークン数
         temperature: 温度パラメータ（0.0-2.0）
         model: モデル名
+        cache_system_prompt: システムプロンプトをキャッシュ対象にするか（省略時は LLM_PROMPT_CACHING）
+        api_key: APIキー（省略時は LLM_API_KEY）
+        partial_output: 途切れた出力（指定時はアシスタントの出力として前置きし、続きだけを生成する）
 
     Returns:
         dict: API応答
-            - content: str - 生成されたテキスト
+            - content: str - 生成されたテキスト（partial_output 指定時は続きの部分のみ）
             - token_usage: dict - トークン使用量
+            - truncated: bool - max_tokens で途切れたか
     """
-    from anthropic import Anthropic
-
-    client = Anthropic(api_key=config.LLM_API_KEY)
-
     if model is None:
         model = config.LLM_MODEL_AGENT1
 
+    if cache_system_prompt is None:
+        cache_system_prompt = config.LLM_PROMPT_CACHING
+
+    messages = [
+        {
+            "role": "user",
+            "content": user_prompt
+        }
+    ]
+    if partial_output:
+        messages.append({"role": "assistant", "content": partial_output})
+
+    def attempt(timeout):
+        with get_llm_client_registry().lease('claude', api_key) as client:
+            return client.messages.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=build_claude_system(system_prompt, cache_system_prompt),
+                messages=messages,
+                timeout=timeout
+            )
+
     try:
-        response = client.messages.create(
-            model=model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": "user",
-                    "content": user_prompt
-                }
-            ]
-        )
+        response = call_with_retry('claude', attempt)
 
         # レスポンスから必要な情報を抽出
-        content = response.content[0].text
+        content = response.content[0].text if response.content else ''
 
-        token_usage = {
-            'prompt_tokens': response.usage.input_tokens,
-            'completion_tokens': response.usage.output_tokens,
-            'total_tokens': response.usage.input_tokens + response.usage.output_tokens
-        }
+        token_usage = claude_token_usage(response.usage)
 
         return {
             'content': content,
-            'token_usage': token_usage
+            'token_usage': token_usage,
+            'truncated': response.stop_reason == 'max_tokens'
         }
 
     except Exception as e:
@@ -181,7 +720,8 @@ def _call_claude_api(system_prompt: str, user_prompt: str, max_tokens: int,
 
 
 def _call_openai_api(system_prompt: str, user_prompt: str, max_tokens: int,
-                     temperature: float = 0.7, model: str = None) -> dict:
+                     temperature: float = 0.7, model: str = None, api_key: str = None,
+                     partial_output: str = None) -> dict:
     """
     OpenAI APIを呼び出す
 
@@ -191,42 +731,42 @@ def _call_openai_api(system_prompt: str, user_prompt: str, max_tokens: int,
         max_tokens: 最大トークン数
         temperature: 温度パラメータ（0.0-2.0）
         model: モデル名
+        api_key: APIキー（省略時は LLM_API_KEY）
+        partial_output: 途切れた出力（指定時は続きだけを生成するよう指示する）
 
     Returns:
         dict: API応答
-            - content: str - 生成されたテキスト
+            - content: str - 生成されたテキスト（partial_output 指定時は続きの部分のみ）
             - token_usage: dict - トークン使用量
+            - truncated: bool - max_tokens で途切れたか
     """
-    from openai import OpenAI
-
-    client = OpenAI(api_key=config.LLM_API_KEY)
-
     if model is None:
         model = 'gpt-4'
 
+    messages = openai_messages(system_prompt, user_prompt, partial_output)
+
+    def attempt(timeout):
+        with get_llm_client_registry().lease('openai', api_key) as client:
+            return client.chat.completions.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=messages,
+                timeout=timeout
+            )
+
     try:
-        response = client.chat.completions.create(
-            model=model,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ]
-        )
+        response = call_with_retry('openai', attempt)
 
         # レスポンスから必要な情報を抽出
-        content = response.choices[0].message.content
+        content = openai_message_content(response.choices[0])
 
-        token_usage = {
-            'prompt_tokens': response.usage.prompt_tokens,
-            'completion_tokens': response.usage.completion_tokens,
-            'total_tokens': response.usage.total_tokens
-        }
+        token_usage = openai_token_usage(response.usage)
 
         return {
             'content': content,
-            'token_usage': token_usage
+            'token_usage': token_usage,
+            'truncated': response.choices[0].finish_reason == 'length'
         }
 
     except Exception as e:
@@ -234,10 +774,275 @@ def _call_openai_api(system_prompt: str, user_prompt: str, max_tokens: int,
         raise
 
 
-def _extract_json_from_response(content: str) -> dict:
+def openai_message_content(choice) -> str:
+    """
+    OpenAI APIの応答から本文を取得
+
+    拒否やツール呼び出しのみの応答では message.content が None になるため、エラーとして扱う
+
+    Args:
+        choice: レスポンスの choices[0]
+
+    Returns:
+        str: 生成されたテキスト
+
+    Raises:
+        LLMResponseError: 本文がない場合
+    """
+    content = choice.message.content
+    if content is None:
+        refusal = getattr(choice.message, 'refusal', None)
+        raise LLMResponseError(
+            message='LLMが記事の本文を返しませんでした（生成の拒否など）',
+            details={
+                'provider': 'openai',
+                'finish_reason': choice.finish_reason,
+                'refusal': refusal if isinstance(refusal, str) else None
+            }
+        )
+    return content
+
+
+def openai_messages(system_prompt: str, user_prompt: str, partial_output: str = None) -> list:
+    """
+    OpenAI APIのmessagesを構築
+
+    アシスタントの途中出力の続きを直接生成させられないため、途中出力の後に続きを指示する
+
+    Args:
+        system_prompt: システムプロンプト
+        user_prompt: ユーザープロンプト
+        partial_output: 途切れた出力（省略可）
+
+    Returns:
+        list[dict]: messages
+    """
+    messages = [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+    if partial_output:
+        messages.append({"role": "assistant", "content": partial_output})
+        messages.append({"role": "user", "content": CONTINUATION_USER_PROMPT})
+    return messages
+
+
+def _stream_claude_api(system_prompt: str, user_prompt: str, max_tokens: int,
+                       temperature: float = 0.7, model: str = None,
+                       cache_system_prompt: bool = None, api_key: str = None):
+    """
+    Claude APIをストリーミングで呼び出す
+
+    Args:
+        system_prompt: システムプロンプト
+        user_prompt: ユーザープロンプト
+        max_tokens: 最大トークン数
+        temperature: 温度パラメータ（0.0-2.0）
+        model: モデル名
+        cache_system_prompt: システムプロンプトをキャッシュ対象にするか（省略時は LLM_PROMPT_CACHING）
+        api_key: APIキー（省略時は LLM_API_KEY）
+
+    Yields:
+        dict: ストリームイベント
+            - {"type": "delta", "text": str}
+            - {"type": "done", "content": str, "token_usage": dict, "truncated": bool}
+    """
+    if model is None:
+        model = config.LLM_MODEL_AGENT1
+
+    if cache_system_prompt is None:
+        cache_system_prompt = config.LLM_PROMPT_CACHING
+
+    def attempt(timeout):
+        with get_llm_client_registry().lease('claude', api_key) as client:
+            with client.messages.stream(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                system=build_claude_system(system_prompt, cache_system_prompt),
+                messages=[
+                    {
+                        "role": "user",
+                        "content": user_prompt
+                    }
+                ],
+                timeout=timeout
+            ) as stream, llm_hedge.cancellable(stream):
+                chunks = []
+                for text in stream.text_stream:
+                    chunks.append(text)
+                    yield {'type': 'delta', 'text': text}
+
+                final_message = stream.get_final_message()
+
+        yield {
+            'type': 'done',
+            'content': ''.join(chunks),
+            'token_usage': claude_token_usage(final_message.usage),
+            'truncated': final_message.stop_reason == 'max_tokens'
+        }
+
+    try:
+        yield from stream_with_retry('claude', attempt)
+
+    except Exception as e:
+        print(f"❌ Claude APIストリーミングエラー: {e}")
+        raise
+
+
+def _stream_openai_api(system_prompt: str, user_prompt: str, max_tokens: int,
+                       temperature: float = 0.7, model: str = None, api_key: str = None):
+    """
+    OpenAI APIをストリーミングで呼び出す
+
+    Args:
+        system_prompt: システムプロンプト
+        user_prompt: ユーザープロンプト
+        max_tokens: 最大トークン数
+        temperature: 温度パラメータ（0.0-2.0）
+        model: モデル名
+        api_key: APIキー（省略時は LLM_API_KEY）
+
+    Yields:
+        dict: ストリームイベント
+            - {"type": "delta", "text": str}
+            - {"type": "done", "content": str, "token_usage": dict, "truncated": bool}
+    """
+    if model is None:
+        model = 'gpt-4'
+
+    def attempt(timeout):
+        with get_llm_client_registry().lease('openai', api_key) as client:
+            stream = client.chat.completions.create(
+                model=model,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt}
+                ],
+                stream=True,
+                stream_options={"include_usage": True},
+                timeout=timeout
+            )
+
+            chunks = []
+            usage = None
+            finish_reason = None
+            with llm_hedge.cancellable(stream):
+                for chunk in stream:
+                    # usageは最後のチャンク（choicesが空）に含まれる
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    text = chunk.choices[0].delta.content
+                    if text:
+                        chunks.append(text)
+                        yield {'type': 'delta', 'text': text}
+
+        yield {
+            'type': 'done',
+            'content': ''.join(chunks),
+            'token_usage': openai_token_usage(usage) if usage is not None else {
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_tokens': 0
+            },
+            'truncated': finish_reason == 'length'
+        }
+
+    try:
+        yield from stream_with_retry('openai', attempt)
+
+    except Exception as e:
+        print(f"❌ OpenAI APIストリーミングエラー: {e}")
+        raise
+
+
+def build_claude_system(system_prompt: str, cache_system_prompt: bool):
+    """
+    Claude APIのsystemパラメータを構築
+
+    キャッシュ有効時はシステムプロンプトをcache_control付きのブロックにする
+
+    Args:
+        system_prompt: システムプロンプト
+        cache_system_prompt: キャッシュ対象にするか
+
+    Returns:
+        str | list[dict]: systemパラメータ
+    """
+    if not cache_system_prompt:
+        return system_prompt
+
+    return [
+        {
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"}
+        }
+    ]
+
+
+def claude_token_usage(usage) -> dict:
+    """
+    Claude APIのusageをtoken_usage形式に変換
+
+    input_tokensはキャッシュ外の入力のみのため、キャッシュ作成・読み込み分を
+    prompt_tokensに含めた上で内訳を別項目として返す
+
+    Args:
+        usage: レスポンスのusage
+
+    Returns:
+        dict: トークン使用量
+    """
+    cache_creation = getattr(usage, 'cache_creation_input_tokens', None) or 0
+    cache_read = getattr(usage, 'cache_read_input_tokens', None) or 0
+    prompt_tokens = usage.input_tokens + cache_creation + cache_read
+
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': usage.output_tokens,
+        'total_tokens': prompt_tokens + usage.output_tokens,
+        'cache_creation_input_tokens': cache_creation,
+        'cache_read_input_tokens': cache_read
+    }
+
+
+def openai_token_usage(usage) -> dict:
+    """
+    OpenAI APIのusageをtoken_usage形式に変換
+
+    OpenAIは自動でプロンプトキャッシュを行うため、キャッシュヒット分を内訳として返す
+
+    Args:
+        usage: レスポンスのusage
+
+    Returns:
+        dict: トークン使用量
+    """
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cache_read = getattr(details, 'cached_tokens', None) or 0
+
+    return {
+        'prompt_tokens': usage.prompt_tokens,
+        'completion_tokens': usage.completion_tokens,
+        'total_tokens': usage.total_tokens,
+        'cache_creation_input_tokens': 0,
+        'cache_read_input_tokens': cache_read
+    }
+
+
+def extract_json_from_response(content: str) -> dict:
     """
     LLMの応答からJSON部分を抽出してパースする
 
+    前後の説明文・コードブロックは読み飛ばし、途中で途切れた応答は閉じられる所まで補って復元する
+
     Args:
         content: LLMの応答テキスト
 
@@ -247,39 +1052,18 @@ def _extract_json_from_response(content: str) -> dict:
     Raises:
         ValueError: JSON抽出・パースに失敗した場合
     """
-    # まずそのままJSONとしてパースを試みる
+    extractor = StreamingJSONExtractor()
+    extractor.feed(content)
+    return _finish_extraction(extractor, content)
+
+
+def _finish_extraction(extractor: StreamingJSONExtractor, content: str) -> dict:
+    """抽出を終了（失敗・復元した場合はログを出力）"""
     try:
-        return json.loads(content)
-    except json.JSONDecodeError:
-        pass
-
-    # ```json ... ``` のコードブロックから抽出を試みる
-    json_block_pattern = r'```json\s*([\s\S]*?)\s*```'
-    match = re.search(json_block_pattern, content)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
-
-    # ``` ... ``` のコードブロックから抽出を試みる
-    code_block_pattern = r'```\s*([\s\S]*?)\s*```'
-    match = re.search(code_block_pattern, content)
-    if match:
-        try:
-            return json.loads(match.group(1))
-        except json.JSONDecodeError:
-            pass
-
-    # { ... } の最初のJSON objectを抽出
-    json_object_pattern = r'\{[\s\S]*\}'
-    match = re.search(json_object_pattern, content)
-    if match:
-        try:
-            return json.loads(match.group(0))
-        except json.JSONDecodeError:
-            pass
-
-    # どの方法でも抽出できなかった場合はエラー
-    print(f"⚠️  JSONの抽出に失敗しました。レスポンス内容:\n{content[:500]}...")
-    raise ValueError('LLMの応答からJSONを抽出できませんでした')
+        result = extractor.finish()
+    except ValueError:
+        print(f"⚠️  JSONの抽出に失敗しました。レスポンス内容:\n{content[:500]}...")
+        raise
+    if extractor.repaired:
+        print("⚠️  LLMの応答が途中で途切れていたため、JSONを補って復元しました")
+    return result
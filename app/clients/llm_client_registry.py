@@ -0,0 +1,201 @@
+"""
+LLMクライアントレジストリ
+プロバイダ／APIキーごとにSDKクライアントを1つだけ生成し、
+ワーカープロセス内でHTTPコネクションプールを使い回す
+"""
+import atexit
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from app.config import get_config
+
+config = get_config()
+
+
+class _PooledClient:
+    """レジストリが保持するクライアントと利用統計"""
+
+    def __init__(self, provider: str, client, http_client):
+        self.provider = provider
+        self.client = client
+        self.http_client = http_client
+        self.created_at = time.time()
+        self.total_requests = 0
+        self.in_flight = 0
+
+
+class LLMClientRegistry:
+    """プロバイダ別SDKクライアントのレジストリ（スレッドセーフ）"""
+
+    def __init__(self):
+        """初期化"""
+        self._clients: Dict[Tuple[str, str], _PooledClient] = {}
+        self._lock = threading.Lock()
+
+    def get_client(self, provider: str, api_key: Optional[str] = None):
+        """
+        プロバイダ／APIキーに対応するSDKクライアントを取得（なければ生成）
+
+        Args:
+            provider: claude / openai
+            api_key: APIキー（省略時は LLM_API_KEY）
+
+        Returns:
+            Anthropic または OpenAI クライアント
+        """
+        return self._get_entry(provider, api_key).client
+
+    @contextmanager
+    def lease(self, provider: str, api_key: Optional[str] = None):
+        """
+        クライアントを借り出し、利用中リクエスト数を記録する
+
+        Args:
+            provider: claude / openai
+            api_key: APIキー（省略時は LLM_API_KEY）
+
+        Yields:
+            Anthropic または OpenAI クライアント
+        """
+        entry = self._get_entry(provider, api_key)
+        with self._lock:
+            entry.total_requests += 1
+            entry.in_flight += 1
+        try:
+            yield entry.client
+        finally:
+            with self._lock:
+                entry.in_flight -= 1
+
+    def get_stats(self) -> dict:
+        """
+        コネクションプールの利用状況を取得
+
+        Returns:
+            dict: プロバイダごとの統計情報
+        """
+        with self._lock:
+            entries = list(self._clients.values())
+
+        clients = [
+            {
+                'provider': entry.provider,
+                'created_at': entry.created_at,
+                'total_requests': entry.total_requests,
+                'in_flight': entry.in_flight,
+            }
+            for entry in entries
+        ]
+
+        return {
+            'max_connections': config.LLM_HTTP_MAX_CONNECTIONS,
+            'max_keepalive_connections': config.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            'clients': clients
+        }
+
+    def close(self):
+        """全クライアントのコネクションプールを閉じる"""
+        with self._lock:
+            entries = list(self._clients.values())
+            self._clients.clear()
+
+        for entry in entries:
+            try:
+                entry.http_client.close()
+            except Exception as e:
+                print(f"⚠️  HTTPクライアントのクローズエラー: {e}")
+
+    def _get_entry(self, provider: str, api_key: Optional[str]) -> _PooledClient:
+        """レジストリからエントリを取得（ダブルチェックロックで1度だけ生成）"""
+        api_key = api_key or config.LLM_API_KEY
+        key = (provider, api_key)
+
+        entry = self._clients.get(key)
+        if entry is not None:
+            return entry
+
+        with self._lock:
+            entry = self._clients.get(key)
+            if entry is None:
+                entry = self._build_entry(provider, api_key)
+                self._clients[key] = entry
+            return entry
+
+    def _build_entry(self, provider: str, api_key: str) -> _PooledClient:
+        """プロバイダに応じたSDKクライアントを生成"""
+        http_client = self._build_http_client()
+
+        if provider == 'claude':
+            from anthropic import Anthropic
+            client = Anthropic(
+                api_key=api_key,
+                http_client=http_client,
+                timeout=self._build_timeout(),
+                # 再試行は llm_retry で行う（デッドラインを共有するため）
+                max_retries=0
+            )
+        elif provider == 'openai':
+            from openai import OpenAI
+            client = OpenAI(
+                api_key=api_key,
+                http_client=http_client,
+                timeout=self._build_timeout(),
+                # 再試行は llm_retry で行う（デッドラインを共有するため）
+                max_retries=0
+            )
+        else:
+            http_client.close()
+            raise ValueError(f'Unsupported LLM provider: {provider}')
+
+        return _PooledClient(provider, client, http_client)
+
+    def _build_http_client(self):
+        """keep-alive付きのhttpxクライアントを生成"""
+        import httpx
+
+        limits = httpx.Limits(
+            max_connections=config.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=config.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=config.LLM_HTTP_KEEPALIVE_EXPIRY
+        )
+        return httpx.Client(limits=limits, timeout=self._build_timeout())
+
+    def _build_timeout(self):
+        """接続・読み取りタイムアウトの設定"""
+        import httpx
+
+        return httpx.Timeout(
+            config.LLM_HTTP_READ_TIMEOUT,
+            connect=config.LLM_HTTP_CONNECT_TIMEOUT
+        )
+
+
+# シングルトンインスタンス
+_registry_instance: Optional[LLMClientRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_llm_client_registry() -> LLMClientRegistry:
+    """LLMクライアントレジストリのシングルトンインスタンスを取得"""
+    global _registry_instance
+    if _registry_instance is None:
+        with _registry_lock:
+            if _registry_instance is None:
+                _registry_instance = LLMClientRegistry()
+                # ワーカー終了時にコネクションプールを閉じる
+                atexit.register(_registry_instance.close)
+    return _registry_instance
+
+
+def get_llm_client_registry_stats() -> Optional[dict]:
+    """
+    LLMクライアントのコネクションプールの利用状況を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: LLMClientRegistry.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _registry_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
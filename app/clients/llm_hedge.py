@@ -0,0 +1,369 @@
+"""
+LLM呼び出しのヘッジリクエスト
+最初のトークンが一定時間内に届かない場合に同じリクエストをもう1本送り、
+先に完了した方の結果を使う（もう一方はストリームを閉じて打ち切る）
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Optional, Tuple
+from app.config import get_config
+from app.clients import llm_retry
+from app.models.errors import LLMUnavailableError, DeadlineExceededError
+
+config = get_config()
+
+# 分位点を計算するのに必要な最小計測数（これ未満は LLM_HEDGE_DEFAULT_DELAY_SECONDS を使う）
+MIN_SAMPLES = 20
+
+# 保持する計測数
+MAX_SAMPLES = 200
+
+
+class LatencyTracker:
+    """直近の最初のトークンまでの時間（秒）を保持し、分位点を返す"""
+
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        """
+        初期化
+
+        Args:
+            max_samples: 保持する計測数
+        """
+        self._samples = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        """
+        計測値を追加
+
+        Args:
+            seconds: 最初のトークンまでの時間（秒）
+        """
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """
+        分位点を取得
+
+        Args:
+            q: 分位点（0.0〜1.0）
+
+        Returns:
+            Optional[float]: 分位点の値（計測数が MIN_SAMPLES 未満の場合はNone）
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < MIN_SAMPLES:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(q * (len(samples) - 1)))))
+        return samples[index]
+
+    def count(self) -> int:
+        """計測数"""
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeCancelledError(Exception):
+    """ヘッジで打ち切ったストリームのエラー（再試行・フェイルオーバーの対象にしない）"""
+
+
+class _Attempt:
+    """ヘッジ対象の1本分のストリーム"""
+
+    def __init__(self, name: str, open_stream: Callable[[], Iterator[dict]], on_change: threading.Condition):
+        self.name = name
+        self.open_stream = open_stream
+        self.on_change = on_change
+        self.cancelled = threading.Event()
+        self.started_at: Optional[float] = None
+        self.first_token_seconds: Optional[float] = None
+        self.received_chars = 0
+        # 受信中の応答（cancel で別スレッドから閉じる）
+        self._responses = []
+        self._responses_lock = threading.Lock()
+        self.result: Optional[dict] = None
+        self.error: Optional[Exception] = None
+        self.finished = False
+
+    def start(self):
+        """別スレッドで実行（再試行スコープなどのcontextvarsを引き継ぐ）"""
+        self.started_at = time.monotonic()
+        context = contextvars.copy_context()
+        thread = threading.Thread(target=context.run, args=(self._run,), daemon=True)
+        thread.start()
+
+    def cancel(self):
+        """打ち切る（受信中の応答を閉じ、受信待ちのスレッドをすぐに終わらせる）"""
+        self.cancelled.set()
+        with self._responses_lock:
+            responses = list(self._responses)
+        for response in responses:
+            _close_quietly(response)
+
+    def register(self, response):
+        """受信中の応答を登録（打ち切り済みの場合はすぐに閉じて HedgeCancelledError を送出）"""
+        with self._responses_lock:
+            if not self.cancelled.is_set():
+                self._responses.append(response)
+                return
+        _close_quietly(response)
+        raise HedgeCancelledError(f'{self.name} のストリームは打ち切り済みです')
+
+    def unregister(self, response):
+        """受信を終えた応答の登録を外す"""
+        with self._responses_lock:
+            if response in self._responses:
+                self._responses.remove(response)
+
+    def _run(self):
+        _current_attempt.set(self)
+        stream = None
+        try:
+            stream = self.open_stream()
+            for event in stream:
+                if self.cancelled.is_set():
+                    break
+                if event['type'] == 'delta':
+                    self.received_chars += len(event['text'])
+                    if self.first_token_seconds is None:
+                        self.first_token_seconds = time.monotonic() - self.started_at
+                        self._notify()
+                else:
+                    self.result = event
+        except Exception as e:
+            self.error = e
+        finally:
+            # 打ち切った場合もストリームを閉じてHTTP接続を解放する
+            if stream is not None:
+                _close_quietly(stream)
+            self.finished = True
+            self._notify()
+
+    def _notify(self):
+        with self.on_change:
+            self.on_change.notify_all()
+
+    @property
+    def has_first_token(self) -> bool:
+        return self.first_token_seconds is not None
+
+
+# 現在のスレッドで実行中のヘッジ対象（_Attempt._run がスレッドのコンテキストに設定する）
+_current_attempt: contextvars.ContextVar = contextvars.ContextVar('llm_hedge_attempt', default=None)
+
+
+def _close_quietly(closeable):
+    """close() を持つオブジェクトを閉じる（エラーは無視する）"""
+    if hasattr(closeable, 'close'):
+        try:
+            closeable.close()
+        except Exception:
+            pass
+
+
+@contextmanager
+def cancellable(response):
+    """
+    受信中の応答（SDKのストリーム）を、ヘッジで打ち切られた時に別スレッドから閉じられるよう登録する
+
+    ヘッジ対象のスレッド以外では何もしない。打ち切りによって受信が失敗した場合は
+    HedgeCancelledError を送出する（接続エラーとして再試行・フェイルオーバーしないため）
+
+    Args:
+        response: close() を持つ応答
+
+    Yields:
+        応答（そのまま）
+    """
+    attempt = _current_attempt.get()
+    if attempt is None:
+        yield response
+        return
+
+    attempt.register(response)
+    try:
+        yield response
+    except Exception as e:
+        if attempt.cancelled.is_set():
+            raise HedgeCancelledError(f'{attempt.name} のストリームを打ち切りました') from e
+        raise
+    finally:
+        attempt.unregister(response)
+
+
+def run_hedged(open_primary: Callable[[], Iterator[dict]], open_hedge: Callable[[], Iterator[dict]],
+               delay: float, tracker: Optional[LatencyTracker] = None) -> Tuple[dict, dict]:
+    """
+    ヘッジ付きでストリーミング呼び出しを実行
+
+    1本目が delay 秒以内に最初のトークンを返さなければ2本目を送り、先に完了した方を採用する。
+    打ち切った方は、cancellable で登録された応答をこのスレッドから閉じる（登録が無い場合は次のイベントの受信時に閉じる）
+
+    Args:
+        open_primary: 1本目のストリームを開く関数（delta / done イベントを返すイテレータ）
+        open_hedge: 2本目のストリームを開く関数
+        delay: 2本目を送るまでの待ち時間（秒）
+        tracker: 最初のトークンまでの時間の記録先（省略可）
+
+    Returns:
+        Tuple[dict, dict]: (採用したストリームの done イベント, ヘッジの統計)
+            統計: hedged（2本目を送ったか）, winner（primary / hedge）, delay_seconds,
+                  extra_tokens（打ち切った方の推定トークン数）
+
+    Raises:
+        すべてのストリームが失敗した場合は1本目の例外（2本目を送る前に失敗した場合も含む）。
+        1本目が例外なしで終わった場合は2本目の例外、どちらも完了イベントなしで終わった場合は LLMUnavailableError
+        DeadlineExceededError: リクエストのデッドラインまでに完了しなかった場合（両方のストリームを打ち切る）
+    """
+    # 待ち合わせはリクエストのデッドラインまで（過ぎた場合は両方を打ち切る）
+    deadline = llm_retry.current_scope().deadline
+    on_change = threading.Condition()
+    primary = _Attempt('primary', open_primary, on_change)
+    attempts: List[_Attempt] = [primary]
+    primary.start()
+
+    with on_change:
+        on_change.wait_for(
+            lambda: primary.has_first_token or primary.finished,
+            timeout=min(delay, deadline.remaining())
+        )
+
+    if not primary.has_first_token and not primary.finished:
+        hedge = _Attempt('hedge', open_hedge, on_change)
+        attempts.append(hedge)
+        hedge.start()
+        print(f"⚠️  最初のトークンが {delay:.1f}秒以内に届かないため、ヘッジリクエストを送ります")
+
+    def winner() -> Optional[_Attempt]:
+        for attempt in attempts:
+            if attempt.finished and attempt.result is not None:
+                return attempt
+        return None
+
+    with on_change:
+        done = on_change.wait_for(
+            lambda: winner() is not None or all(attempt.finished for attempt in attempts),
+            timeout=deadline.remaining()
+        )
+
+    if not done:
+        for attempt in attempts:
+            attempt.cancel()
+        raise DeadlineExceededError(details={
+            'reason': 'hedge', 'llm_retry': llm_retry.current_scope().to_metadata()
+        })
+
+    won = winner()
+    for attempt in attempts:
+        if attempt is not won:
+            attempt.cancel()
+        if tracker is not None:
+            _record_latency(tracker, attempt)
+
+    if won is None:
+        raise _failure(attempts)
+
+    stats = {
+        'hedged': len(attempts) > 1,
+        'winner': won.name,
+        'delay_seconds': round(delay, 3),
+        'extra_tokens': sum(
+            _estimate_spent_tokens(attempt, won.result)
+            for attempt in attempts if attempt is not won
+        )
+    }
+    return won.result, stats
+
+
+def _failure(attempts: List[_Attempt]) -> Exception:
+    """すべてのストリームが完了イベントを返さなかった場合に送出する例外"""
+    for attempt in attempts:
+        if attempt.error is not None:
+            return attempt.error
+    return LLMUnavailableError(
+        message='LLMの応答が完了する前にストリームが終了しました',
+        details={'reason': 'stream_incomplete'}
+    )
+
+
+def _record_latency(tracker: LatencyTracker, attempt: _Attempt):
+    """
+    最初のトークンまでの時間を記録
+
+    届く前に打ち切った方は記録しない（打ち切りまでの時間は採用した方以下になり、
+    記録すると分位点と待ち時間が下がり続けてヘッジが増えるため）
+    """
+    if attempt.has_first_token:
+        tracker.record(attempt.first_token_seconds)
+
+
+def _estimate_spent_tokens(attempt: _Attempt, winner_result: dict) -> int:
+    """
+    打ち切った方のトークン消費を推定
+
+    完了していればそのusage、途中の場合は入力は採用した方と同じ、
+    出力は受信した文字数を採用した方の出力トークン数／文字数の比で換算する
+    """
+    if attempt.result is not None:
+        return attempt.result['token_usage'].get('total_tokens', 0)
+    if attempt.error is not None and attempt.received_chars == 0:
+        return 0
+
+    winner_usage = winner_result['token_usage']
+    winner_chars = len(winner_result.get('content') or '')
+    if winner_chars:
+        completion_tokens = round(attempt.received_chars * winner_usage.get('completion_tokens', 0) / winner_chars)
+    else:
+        completion_tokens = attempt.received_chars
+    return winner_usage.get('prompt_tokens', 0) + completion_tokens
+
+
+def hedge_delay(tracker: LatencyTracker) -> float:
+    """
+    2本目を送るまでの待ち時間
+
+    Args:
+        tracker: 最初のトークンまでの時間の計測値
+
+    Returns:
+        float: 待ち時間（秒）
+    """
+    delay = tracker.percentile(config.LLM_HEDGE_PERCENTILE)
+    if delay is None:
+        delay = config.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    return max(config.LLM_HEDGE_MIN_DELAY_SECONDS, delay)
+
+
+def get_hedge_stats() -> dict:
+    """
+    ヘッジリクエストの設定と計測状況
+
+    Returns:
+        dict: enabled, first_token_samples（計測数）, delay_seconds（現在の待ち時間）
+    """
+    tracker = get_first_token_tracker()
+    return {
+        'enabled': config.LLM_HEDGE_AGENT1,
+        'first_token_samples': tracker.count(),
+        'delay_seconds': round(hedge_delay(tracker), 3)
+    }
+
+
+# シングルトンインスタンス
+_first_token_tracker_instance: Optional[LatencyTracker] = None
+_first_token_tracker_lock = threading.Lock()
+
+
+def get_first_token_tracker() -> LatencyTracker:
+    """Agent1の最初のトークンまでの時間の計測値（シングルトン）を取得"""
+    global _first_token_tracker_instance
+    if _first_token_tracker_instance is None:
+        with _first_token_tracker_lock:
+            if _first_token_tracker_instance is None:
+                _first_token_tracker_instance = LatencyTracker()
+    return _first_token_tracker_instance
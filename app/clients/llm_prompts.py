@@ -178,6 +178,31 @@ Agent1が生成した記事を受け取り、禁止事項違反のチェック
 重要: 内容の本質は変えず、表現のみを調整してください。"""
 
 
+# Agent2用システムプロンプト（部分調整）
+AGENT2_PART_SYSTEM_PROMPT = """あなたは「トミー式コラム」の文体調整・品質チェック担当です。
+記事の一部（タイトル・リード文・CTA、または1つのセクションの見出しと本文）を受け取り、
+指摘された禁止事項違反を言い換えます。
+
+## 禁止事項
+- 文字装飾（*、_、#、ハイフンのリスト、""、『』、【】）は使わない。見出しの■は残す
+- 「あなた」等の二人称は使わない（主語を省略するか「誰もが」「自分の」などに言い換える）
+- 「でしょう」「しましょう」「いかがでしょうか」「〜ということです」等のAI的表現は使わない
+  （「です」「ではないですか」「してください」「することです」などに言い換える）
+- 命令形（「○○せよ」「○○しろ」）は使わない
+
+## 調整の方針
+1. 指摘された違反箇所を言い換える
+2. 違反の無い文はそのまま残す
+3. 内容・文字数・断定調の文体は変えない
+
+出力は入力と同じキーのJSONのみで返してください。"""
+
+
+# 出力が max_tokens で途切れた場合の続きの指示（アシスタントの途中出力を前置きできないOpenAI用）
+CONTINUATION_USER_PROMPT = """出力が途中で途切れました。直前の出力の続きを、途切れた文字の直後からそのまま出力してください。
+前置き・説明・既に出力した部分の繰り返し・コードブロックは不要です。"""
+
+
 def build_agent1_user_prompt(payload: dict) -> str:
     """Agent1用のユーザープロンプトを構築"""
     topic = payload.get('topic', '')
@@ -223,6 +248,97 @@ JSON形式で出力してください。"""
     return prompt
 
 
+# 分割生成時のセクション本文・CTAの文字数（AGENT1_SYSTEM_PROMPT の文字数配分と同じ）
+SECTION_LENGTH = {
+    'short': '400-500字',
+    'middle': '700-1000字',
+    'long': '1000-1500字'
+}
+CTA_LENGTH = {
+    'short': '300字',
+    'middle': '400字',
+    'long': '600字'
+}
+
+
+def build_agent1_outline_user_prompt(payload: dict) -> str:
+    """Agent1（分割生成）の構成用ユーザープロンプトを構築（タイトル・リード文・見出しと要点のみ）"""
+    prompt = build_agent1_user_prompt(payload).replace('JSON形式で出力してください。', '')
+    prompt += """【今回の出力】
+今回は構成のみを作成してください。本文とCTAは後で見出しごとに別途生成します。
+- title: タイトル
+- lead: リード文（完成版）
+- sections: 見出し（■付き）と、その本文で書く要点（2〜3文）
+
+以下のJSON形式で出力してください:
+{
+  "title": "タイトル",
+  "lead": "リード文",
+  "sections": [
+    {"heading": "■見出し1", "points": "本文で書く要点"}
+  ]
+}"""
+
+    return prompt
+
+
+def build_agent1_section_user_prompt(payload: dict, outline: dict, index: int) -> str:
+    """Agent1（分割生成）のセクション本文用ユーザープロンプトを構築"""
+    section = outline['sections'][index]
+    length_class = payload.get('length_class', 'middle')
+
+    prompt = f"""以下の構成のトミー式コラムのうち、セクション{index + 1}の本文のみを書いてください:
+
+【構成】
+{_format_outline(outline)}
+
+【書くセクション】
+見出し: {section.get('heading', '')}
+要点: {section.get('points', '')}
+
+【条件】
+- ターゲット読者: {payload.get('audience', '')}
+- 記事の目的: {payload.get('goal', '')}
+- 訴求力の強度: {payload.get('intensity_level', 5)}/10
+- 文字数: {SECTION_LENGTH.get(length_class, length_class)}
+- 他のセクションと内容を重複させない
+- 絶対禁止事項を厳守する
+
+{{"body": "本文"}} のJSON形式で出力してください。"""
+
+    return prompt
+
+
+def build_agent1_cta_user_prompt(payload: dict, outline: dict) -> str:
+    """Agent1（分割生成）のCTA用ユーザープロンプトを構築"""
+    length_class = payload.get('length_class', 'middle')
+
+    prompt = f"""以下の構成のトミー式コラムの、記事下部のCTAのみを書いてください:
+
+【構成】
+{_format_outline(outline)}
+
+【条件】
+- ターゲット読者: {payload.get('audience', '')}
+- 記事の目的: {payload.get('goal', '')}
+- 訴求力の強度: {payload.get('intensity_level', 5)}/10
+- 文字数: {CTA_LENGTH.get(length_class, length_class)}
+- 「2つの選択肢」パターンで決断を迫る
+- 絶対禁止事項を厳守する
+
+{{"cta": "CTA文"}} のJSON形式で出力してください。"""
+
+    return prompt
+
+
+def _format_outline(outline: dict) -> str:
+    """構成をプロンプト用のテキストに変換"""
+    lines = [f"タイトル: {outline.get('title', '')}", f"リード文: {outline.get('lead', '')}"]
+    for section in outline.get('sections', []):
+        lines.append(f"{section.get('heading', '')}（要点: {section.get('points', '')}）")
+    return '\n'.join(lines)
+
+
 def build_agent2_user_prompt(agent1_result: dict) -> str:
     """Agent2用のユーザープロンプトを構築"""
     prompt = f"""以下のコラムをチェック・調整してください:
@@ -239,3 +355,18 @@ def build_agent2_user_prompt(agent1_result: dict) -> str:
 調整後のコラムを同じJSON形式で出力してください。"""
 
     return prompt
+
+
+def build_agent2_part_user_prompt(part: dict, excerpts: list) -> str:
+    """Agent2（部分調整）用のユーザープロンプトを構築（part は {"text"} または {"heading", "body"}）"""
+    violations = '\n'.join(f'- {excerpt}' for excerpt in excerpts)
+    prompt = f"""以下の文章の禁止事項違反を言い換えてください:
+
+{json.dumps(part, ensure_ascii=False)}
+
+【違反箇所】
+{violations}
+
+同じキーのJSON形式で出力してください。"""
+
+    return prompt
@@ -0,0 +1,418 @@
+"""
+LLM呼び出しの再試行
+エラーを再試行可能／不可に分類し、ジッター付き指数バックオフで再試行する。
+1リクエスト（Agent1〜Agent2）で共有する処理時間上限（デッドライン）の範囲内でのみ再試行する
+"""
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Iterator, Optional, Tuple
+from app.config import get_config
+from app.models.errors import APIError, LLMUnavailableError, DeadlineExceededError
+
+config = get_config()
+
+# 再試行するHTTPステータス（529: Anthropicの過負荷）
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+# 残り時間がこれ未満なら新たな試行を始めない（秒）
+MIN_ATTEMPT_SECONDS = 1.0
+
+
+class Deadline:
+    """処理時間上限"""
+
+    def __init__(self, seconds: float):
+        """
+        初期化
+
+        Args:
+            seconds: 現在からの制限時間（秒）
+        """
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """残り時間（秒）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """上限を過ぎたか"""
+        return self.remaining() <= 0
+
+
+class RetryScope:
+    """
+    1リクエスト分の再試行状況（デッドラインと統計）
+
+    並列呼び出し（Agent1のファンアウト・ヘッジ、Agent2の部分調整）のスレッドから更新されるため、
+    統計は record_* で更新する
+    """
+
+    def __init__(self, deadline: Deadline):
+        """
+        初期化
+
+        Args:
+            deadline: このリクエストの処理時間上限
+        """
+        self.deadline = deadline
+        self.started_at = time.monotonic()
+        self.attempts = 0
+        self.retries = 0
+        self.retry_wait_seconds = 0.0
+        # 実際に応答したプロバイダ・モデル（LLMRouterが記録）
+        self.routes = []
+        # Agent1のヘッジリクエストの統計（ヘッジ有効時のみ）
+        self.hedge = None
+        # max_tokens で途切れた出力の続きを生成した回数
+        self.continuations = 0
+        self._lock = threading.Lock()
+
+    def record_attempt(self):
+        """API呼び出しを1回数える"""
+        with self._lock:
+            self.attempts += 1
+
+    def record_retry(self, wait: float):
+        """
+        再試行を1回数える
+
+        Args:
+            wait: 再試行までに待った秒数
+        """
+        with self._lock:
+            self.retries += 1
+            self.retry_wait_seconds += wait
+
+    def record_continuation(self):
+        """途切れた出力の続きの生成を1回数える"""
+        with self._lock:
+            self.continuations += 1
+
+    def record_route(self, route: dict):
+        """
+        応答したプロバイダ・モデルを記録
+
+        Args:
+            route: agent, provider, model, fallback
+        """
+        with self._lock:
+            self.routes.append(route)
+
+    def to_metadata(self) -> dict:
+        """
+        レスポンスのmetadataに含める統計
+
+        Returns:
+            dict: attempts（API呼び出し回数）, retries（再試行回数）,
+                  retry_wait_seconds（再試行待ちの合計秒数）, elapsed_seconds（経過秒数）,
+                  routes（エージェントごとに応答したプロバイダ・モデル）,
+                  continuations（途切れた出力の続きを生成した回数）
+        """
+        with self._lock:
+            return {
+                'attempts': self.attempts,
+                'retries': self.retries,
+                'retry_wait_seconds': round(self.retry_wait_seconds, 3),
+                'elapsed_seconds': round(time.monotonic() - self.started_at, 3),
+                'routes': list(self.routes),
+                'continuations': self.continuations
+            }
+
+
+_current_scope: contextvars.ContextVar = contextvars.ContextVar('llm_retry_scope', default=None)
+
+
+@contextmanager
+def request_scope(deadline_seconds: Optional[float] = None):
+    """
+    1リクエスト分の再試行スコープを開始
+
+    スコープ内のLLM呼び出しは同じデッドラインを共有する
+
+    Args:
+        deadline_seconds: 処理時間上限（秒、省略時は LLM_REQUEST_DEADLINE_SECONDS）
+
+    Yields:
+        RetryScope: 再試行スコープ
+    """
+    if deadline_seconds is None:
+        deadline_seconds = config.LLM_REQUEST_DEADLINE_SECONDS
+    scope = RetryScope(Deadline(deadline_seconds))
+    previous = _current_scope.get()
+    _current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        # ジェネレータ内で使われた場合に別コンテキストで抜けることがあるため reset ではなく set で戻す
+        _current_scope.set(previous)
+
+
+_current_slice: contextvars.ContextVar = contextvars.ContextVar('llm_retry_slice', default=None)
+
+
+@contextmanager
+def time_slice(seconds: Optional[float]):
+    """
+    ブロック内の呼び出し（再試行を含む）をデッドラインの一部に制限する
+
+    フェイルオーバー先が残っている候補が、デッドラインを使い切らないようにするために使う。
+    使い切った場合はデッドライン超過ではなく LLMUnavailableError を送出する（次の候補に切り替えられる）
+
+    Args:
+        seconds: 制限時間（秒、Noneの場合は制限しない）
+    """
+    if seconds is None:
+        yield
+        return
+
+    token = _current_slice.set(Deadline(seconds))
+    try:
+        yield
+    finally:
+        _current_slice.reset(token)
+
+
+def _remaining(scope: RetryScope) -> float:
+    """デッドラインと time_slice の残り時間の短い方（秒）"""
+    remaining = scope.deadline.remaining()
+    current_slice = _current_slice.get()
+    if current_slice is not None:
+        remaining = min(remaining, current_slice.remaining())
+    return remaining
+
+
+def current_scope() -> RetryScope:
+    """
+    現在の再試行スコープを取得
+
+    Returns:
+        RetryScope: スコープ外の場合は呼び出しごとの新しいスコープ
+    """
+    scope = _current_scope.get()
+    if scope is None:
+        scope = RetryScope(Deadline(config.LLM_REQUEST_DEADLINE_SECONDS))
+    return scope
+
+
+def classify_error(error: Exception) -> Tuple[bool, Optional[float]]:
+    """
+    エラーが再試行可能か判定
+
+    Args:
+        error: LLM SDKが送出した例外
+
+    Returns:
+        Tuple[bool, Optional[float]]: (再試行可能か, retry-afterの秒数)
+    """
+    # アプリのエラー（status_code はクライアントに返すHTTPステータス）はSDKのエラーではないため再試行しない
+    if isinstance(error, APIError):
+        return False, None
+
+    status = getattr(error, 'status_code', None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES or status >= 500, _retry_after_seconds(error)
+
+    # 接続エラー・タイムアウト（anthropic / openai の APIConnectionError, APITimeoutError, httpxの例外）
+    import httpx
+    import anthropic
+    import openai
+    connection_errors = (
+        anthropic.APIConnectionError,
+        openai.APIConnectionError,
+        httpx.TimeoutException,
+        httpx.NetworkError
+    )
+    return isinstance(error, connection_errors), None
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """レスポンスヘッダー（retry-after-ms / retry-after）から待ち時間を取得"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get('retry-after-ms')
+        if retry_after_ms:
+            return float(retry_after_ms) / 1000
+
+        retry_after = headers.get('retry-after')
+        if not retry_after:
+            return None
+        try:
+            return float(retry_after)
+        except ValueError:
+            # HTTP-date形式
+            retry_at = parsedate_to_datetime(retry_after)
+            return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_seconds(retry: int) -> float:
+    """
+    ジッター付き指数バックオフの待ち時間（full jitter）
+
+    Args:
+        retry: 何回目の再試行か（0始まり）
+
+    Returns:
+        float: 待ち時間（秒）
+    """
+    return random.uniform(0, min(config.LLM_RETRY_MAX_SECONDS, config.LLM_RETRY_BASE_SECONDS * (2 ** retry)))
+
+
+def attempt_timeout(scope: RetryScope) -> float:
+    """
+    1回の呼び出しに使えるタイムアウト（読み取りタイムアウトとデッドライン・time_slice の残りの小さい方）
+
+    Args:
+        scope: 再試行スコープ
+
+    Returns:
+        float: タイムアウト（秒）
+
+    Raises:
+        DeadlineExceededError: 残り時間が無い場合
+        LLMUnavailableError: time_slice の残り時間が無い場合
+    """
+    if scope.deadline.remaining() < MIN_ATTEMPT_SECONDS:
+        raise DeadlineExceededError(details={'llm_retry': scope.to_metadata()})
+    remaining = _remaining(scope)
+    if remaining < MIN_ATTEMPT_SECONDS:
+        raise LLMUnavailableError(details={'reason': 'time_slice', 'llm_retry': scope.to_metadata()})
+    return min(config.LLM_HTTP_READ_TIMEOUT, remaining)
+
+
+def _next_wait(scope: RetryScope, provider: str, retry: int, error: Exception) -> float:
+    """
+    再試行までの待ち時間を決める（再試行しない場合は例外を送出）
+
+    Raises:
+        元の例外: 再試行不可のエラー
+        LLMUnavailableError: 再試行回数・デッドラインを使い切った場合
+    """
+    retryable, retry_after = classify_error(error)
+    if not retryable:
+        raise error
+
+    wait = retry_after if retry_after is not None else backoff_seconds(retry)
+    details = {'provider': provider, 'error': str(error), 'llm_retry': scope.to_metadata()}
+
+    if retry >= config.LLM_MAX_RETRIES:
+        raise LLMUnavailableError(details=details, retry_after=retry_after) from error
+
+    if wait + MIN_ATTEMPT_SECONDS > _remaining(scope):
+        # 待っている間にデッドラインを過ぎるため、呼び出し元に再試行時期を返して打ち切る
+        raise LLMUnavailableError(details=details, retry_after=retry_after if retry_after is not None else wait) from error
+
+    print(f"⚠️  {provider} API呼び出しを {wait:.1f}秒後に再試行します（{retry + 1}/{config.LLM_MAX_RETRIES}）: {error}")
+    return wait
+
+
+def call_with_retry(provider: str, fn: Callable[[float], object]):
+    """
+    LLM API呼び出しを再試行付きで実行
+
+    Args:
+        provider: プロバイダ名（ログ用）
+        fn: 1回分の呼び出し（タイムアウト秒数を受け取る）
+
+    Returns:
+        fn の戻り値
+
+    Raises:
+        元の例外: 再試行不可のエラー
+        LLMUnavailableError: 再試行回数・デッドラインを使い切った場合
+        DeadlineExceededError: 呼び出し前にデッドラインを過ぎている場合
+    """
+    scope = current_scope()
+    retry = 0
+    while True:
+        timeout = attempt_timeout(scope)
+        scope.record_attempt()
+        try:
+            return fn(timeout)
+        except Exception as e:
+            wait = _next_wait(scope, provider, retry, e)
+
+        time.sleep(wait)
+        scope.record_retry(wait)
+        retry += 1
+
+
+async def acall_with_retry(provider: str, fn: Callable[[float], Awaitable[object]]):
+    """
+    LLM API呼び出しを再試行付きで実行（asyncio版、再試行の規則は call_with_retry と同じ）
+
+    Args:
+        provider: プロバイダ名（ログ用）
+        fn: 1回分の呼び出し（タイムアウト秒数を受け取るコルーチン関数）
+
+    Returns:
+        fn の戻り値
+    """
+    scope = current_scope()
+    retry = 0
+    while True:
+        timeout = attempt_timeout(scope)
+        scope.record_attempt()
+        try:
+            return await fn(timeout)
+        except Exception as e:
+            wait = _next_wait(scope, provider, retry, e)
+
+        await asyncio.sleep(wait)
+        scope.record_retry(wait)
+        retry += 1
+
+
+def stream_with_retry(provider: str, open_stream: Callable[[float], Iterator[dict]]) -> Iterator[dict]:
+    """
+    ストリーミング呼び出しを再試行付きで実行
+
+    出力を1つでも返した後のエラーは再試行しない（同じ内容を二重に返さないため）。
+    タイムアウトは1回の読み取りごとのため、少しずつ届き続けるストリームもデッドラインで打ち切れるよう
+    イベントごとにデッドラインを確認する
+
+    Args:
+        provider: プロバイダ名（ログ用）
+        open_stream: 1回分のストリーム（タイムアウト秒数を受け取るジェネレータ関数）
+
+    Yields:
+        dict: open_stream が返すイベント
+
+    Raises:
+        DeadlineExceededError: 受信中にデッドラインを過ぎた場合
+    """
+    scope = current_scope()
+    retry = 0
+    while True:
+        timeout = attempt_timeout(scope)
+        scope.record_attempt()
+        started = False
+        stream = open_stream(timeout)
+        try:
+            for event in stream:
+                started = True
+                if scope.deadline.expired():
+                    raise DeadlineExceededError(details={'reason': 'stream', 'llm_retry': scope.to_metadata()})
+                yield event
+            return
+        except Exception as e:
+            if started:
+                raise
+            wait = _next_wait(scope, provider, retry, e)
+        finally:
+            # 打ち切った場合も接続を解放する
+            stream.close()
+
+        time.sleep(wait)
+        scope.record_retry(wait)
+        retry += 1
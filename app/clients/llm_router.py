@@ -0,0 +1,466 @@
+"""
+LLMプロバイダルーター
+プロバイダ・モデルごとのエラー率とレイテンシを集計するサーキットブレーカーを持ち、
+障害が続くプロバイダを遮断して設定済みのフェイルオーバー先に切り替える
+"""
+import threading
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from app.config import get_config
+from app.clients import llm_retry
+from app.models.errors import LLMUnavailableError, DeadlineExceededError
+
+config = get_config()
+
+SUPPORTED_PROVIDERS = ('claude', 'openai')
+
+# サーキットの状態
+CIRCUIT_CLOSED = 'closed'
+CIRCUIT_OPEN = 'open'
+CIRCUIT_HALF_OPEN = 'half_open'
+
+
+class CircuitBreaker:
+    """直近の呼び出し結果からエラー率を判定するサーキットブレーカー（スレッドセーフ）"""
+
+    def __init__(self, window_seconds: float, min_requests: int, failure_rate: float,
+                 slow_call_seconds: float, open_seconds: float):
+        """
+        初期化
+
+        Args:
+            window_seconds: エラー率・レイテンシの集計期間（秒）
+            min_requests: 判定に必要な最小リクエスト数
+            failure_rate: 遮断するエラー率（0.0〜1.0）
+            slow_call_seconds: これより遅い成功も失敗として数える
+            open_seconds: 遮断後、試行（half-open）を再開するまでの秒数
+        """
+        self.window_seconds = window_seconds
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.open_seconds = open_seconds
+
+        self.state = CIRCUIT_CLOSED
+        self._opened_at: Optional[float] = None
+        self._probe_in_flight = False
+        # (時刻, 成功したか, レイテンシ秒)
+        self._calls: Deque[Tuple[float, bool, float]] = deque()
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        呼び出してよいか判定
+
+        遮断中は open_seconds 経過後に1件だけ試行（half-open）を許可する
+
+        Returns:
+            bool: 呼び出してよいか
+        """
+        with self._lock:
+            if self.state == CIRCUIT_CLOSED:
+                return True
+
+            if self.state == CIRCUIT_OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self.state = CIRCUIT_HALF_OPEN
+
+            if self.state == CIRCUIT_HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+
+            return False
+
+    def record_success(self, latency: float):
+        """成功を記録（遅すぎる応答は失敗として扱う）"""
+        if latency > self.slow_call_seconds:
+            self.record_failure(latency)
+            return
+
+        with self._lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                # 試行が成功したので復帰する
+                self.state = CIRCUIT_CLOSED
+                self._probe_in_flight = False
+                self._calls.clear()
+            self._append(True, latency)
+
+    def record_failure(self, latency: float):
+        """失敗を記録し、必要に応じて遮断する"""
+        with self._lock:
+            if self.state == CIRCUIT_HALF_OPEN:
+                self._open()
+                return
+            self._append(False, latency)
+
+            total = len(self._calls)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            if self.state == CIRCUIT_CLOSED and total >= self.min_requests and failures / total >= self.failure_rate:
+                self._open()
+
+    def record_ignored(self):
+        """プロバイダの状態と無関係な結果（入力エラーなど）。試行枠だけ解放する"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def retry_after(self) -> Optional[float]:
+        """遮断中の場合、試行を再開するまでの秒数"""
+        with self._lock:
+            if self.state != CIRCUIT_OPEN:
+                return None
+            return max(0.0, self.open_seconds - (time.monotonic() - self._opened_at))
+
+    def get_stats(self) -> dict:
+        """
+        状態と集計期間内の統計を取得
+
+        Returns:
+            dict: state, requests, error_rate, latency_p50, latency_p95
+        """
+        with self._lock:
+            self._evict()
+            calls = list(self._calls)
+            state = self.state
+
+        latencies = sorted(latency for _, _, latency in calls)
+        failures = sum(1 for _, ok, _ in calls if not ok)
+        return {
+            'state': state,
+            'requests': len(calls),
+            'error_rate': round(failures / len(calls), 3) if calls else 0.0,
+            'latency_p50': round(_percentile(latencies, 0.50), 3) if latencies else None,
+            'latency_p95': round(_percentile(latencies, 0.95), 3) if latencies else None
+        }
+
+    def _append(self, ok: bool, latency: float):
+        """呼び出し結果を追加（ロック取得済みで呼ぶ）"""
+        self._calls.append((time.monotonic(), ok, latency))
+        self._evict()
+
+    def _evict(self):
+        """集計期間を過ぎた結果を削除（ロック取得済みで呼ぶ）"""
+        threshold = time.monotonic() - self.window_seconds
+        while self._calls and self._calls[0][0] < threshold:
+            self._calls.popleft()
+
+    def _open(self):
+        """遮断する（ロック取得済みで呼ぶ）"""
+        self.state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._calls.clear()
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    """ソート済みの値から分位点を取得（最近傍法）"""
+    index = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+class LLMRouter:
+    """サーキットブレーカー付きのプロバイダルーター"""
+
+    def __init__(self, fallback_provider: Optional[str] = None,
+                 fallback_models: Optional[Dict[str, str]] = None,
+                 fallback_api_key: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            fallback_provider: フェイルオーバー先のプロバイダ（省略時は LLM_FALLBACK_PROVIDER）
+            fallback_models: エージェント名（agent1 / agent2）→ フェイルオーバー先のモデル
+            fallback_api_key: フェイルオーバー先のAPIキー（省略時は LLM_FALLBACK_API_KEY）
+        """
+        self.fallback_provider = fallback_provider if fallback_provider is not None else config.LLM_FALLBACK_PROVIDER
+        self.fallback_models = fallback_models if fallback_models is not None else {
+            'agent1': config.LLM_FALLBACK_MODEL_AGENT1,
+            'agent2': config.LLM_FALLBACK_MODEL_AGENT2
+        }
+        self.fallback_api_key = fallback_api_key if fallback_api_key is not None else config.LLM_FALLBACK_API_KEY
+
+        # 設定値は生成時に読み込む
+        self._breaker_settings = {
+            'window_seconds': config.LLM_CIRCUIT_WINDOW_SECONDS,
+            'min_requests': config.LLM_CIRCUIT_MIN_REQUESTS,
+            'failure_rate': config.LLM_CIRCUIT_FAILURE_RATE,
+            'slow_call_seconds': config.LLM_CIRCUIT_SLOW_CALL_SECONDS,
+            'open_seconds': config.LLM_CIRCUIT_OPEN_SECONDS
+        }
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+        self._failovers = 0
+
+    def candidates(self, agent: str, primary: Tuple[str, str]) -> List[Tuple[str, str, Optional[str]]]:
+        """
+        呼び出し候補を優先順に取得
+
+        Args:
+            agent: agent1 / agent2
+            primary: (プロバイダ, モデル)
+
+        Returns:
+            List[Tuple[str, str, Optional[str]]]: (プロバイダ, モデル, APIキー) のリスト。
+                APIキーがNoneの場合は LLM_API_KEY を使う
+        """
+        result = [(primary[0], primary[1], None)]
+        fallback_model = self.fallback_models.get(agent)
+        if self.fallback_provider in SUPPORTED_PROVIDERS and fallback_model:
+            fallback = (self.fallback_provider, fallback_model, self.fallback_api_key)
+            if fallback[:2] != tuple(primary):
+                result.append(fallback)
+        return result
+
+    def call(self, agent: str, primary: Tuple[str, str], fn: Callable[[str, str, Optional[str]], dict]) -> dict:
+        """
+        候補のプロバイダを順に呼び出す
+
+        遮断中のプロバイダは飛ばし、障害（再試行しても応答が得られない・接続エラー等）の場合は
+        次の候補に切り替える。入力エラーなどプロバイダの状態と無関係なエラーはそのまま送出する。
+        フェイルオーバー先が残っている間は、1候補の再試行をデッドラインの残りの等分までに制限する
+
+        Args:
+            agent: agent1 / agent2
+            primary: (プロバイダ, モデル)
+            fn: 1候補分の呼び出し（プロバイダ, モデル, APIキー を受け取る）
+
+        Returns:
+            dict: fn の戻り値
+
+        Raises:
+            LLMUnavailableError: 全候補が遮断中・障害の場合
+        """
+        last_error = None
+        candidates = self.candidates(agent, primary)
+        for index, (provider, model, api_key) in enumerate(candidates):
+            breaker = self._breaker(provider, model)
+            if not breaker.allow_request():
+                continue
+
+            started = time.monotonic()
+            try:
+                with llm_retry.time_slice(self._time_slice(len(candidates) - index)):
+                    result = fn(provider, model, api_key)
+            except Exception as e:
+                if not self._on_error(breaker, provider, model, started, e):
+                    raise
+                last_error = e
+                continue
+
+            breaker.record_success(time.monotonic() - started)
+            self._record_route(agent, provider, model, primary)
+            return result
+
+        self._raise_unavailable(agent, primary, last_error)
+
+    async def acall(self, agent: str, primary: Tuple[str, str],
+                    fn: Callable[[str, str, Optional[str]], Awaitable[dict]]) -> dict:
+        """
+        候補のプロバイダを順に呼び出す（asyncio版、切り替えの規則は call と同じ）
+
+        Args:
+            agent: agent1 / agent2
+            primary: (プロバイダ, モデル)
+            fn: 1候補分の呼び出し（プロバイダ, モデル, APIキー を受け取るコルーチン関数）
+
+        Returns:
+            dict: fn の戻り値
+
+        Raises:
+            LLMUnavailableError: 全候補が遮断中・障害の場合
+        """
+        last_error = None
+        candidates = self.candidates(agent, primary)
+        for index, (provider, model, api_key) in enumerate(candidates):
+            breaker = self._breaker(provider, model)
+            if not breaker.allow_request():
+                continue
+
+            started = time.monotonic()
+            try:
+                with llm_retry.time_slice(self._time_slice(len(candidates) - index)):
+                    result = await fn(provider, model, api_key)
+            except Exception as e:
+                if not self._on_error(breaker, provider, model, started, e):
+                    raise
+                last_error = e
+                continue
+            except BaseException:
+                # キャンセルされた場合は試行枠だけ解放する
+                breaker.record_ignored()
+                raise
+
+            breaker.record_success(time.monotonic() - started)
+            self._record_route(agent, provider, model, primary)
+            return result
+
+        self._raise_unavailable(agent, primary, last_error)
+
+    def stream(self, agent: str, primary: Tuple[str, str],
+               open_stream: Callable[[str, str, Optional[str]], Iterator[dict]]) -> Iterator[dict]:
+        """
+        候補のプロバイダを順にストリーミングで呼び出す
+
+        出力を1つでも返した後のエラーは切り替えずに送出する
+
+        Args:
+            agent: agent1 / agent2
+            primary: (プロバイダ, モデル)
+            open_stream: 1候補分のストリーム（プロバイダ, モデル, APIキー を受け取る）
+
+        Yields:
+            dict: open_stream が返すイベント
+        """
+        last_error = None
+        for provider, model, api_key in self.candidates(agent, primary):
+            breaker = self._breaker(provider, model)
+            if not breaker.allow_request():
+                continue
+
+            started_at = time.monotonic()
+            started = False
+            recorded = False
+            try:
+                for event in open_stream(provider, model, api_key):
+                    if not started:
+                        started = True
+                        self._record_route(agent, provider, model, primary)
+                    yield event
+                recorded = True
+                breaker.record_success(time.monotonic() - started_at)
+                return
+            except Exception as e:
+                recorded = True
+                if not self._on_error(breaker, provider, model, started_at, e) or started:
+                    raise
+                last_error = e
+                continue
+            finally:
+                # 呼び出し元がストリームを途中で閉じた場合も試行枠を解放する
+                if not recorded:
+                    breaker.record_ignored()
+
+        self._raise_unavailable(agent, primary, last_error)
+
+    def get_stats(self) -> dict:
+        """
+        プロバイダ・モデルごとのサーキット状態と統計を取得
+
+        Returns:
+            dict: 統計情報
+        """
+        with self._lock:
+            breakers = dict(self._breakers)
+            failovers = self._failovers
+
+        return {
+            'fallback_provider': self.fallback_provider or None,
+            'failovers': failovers,
+            'circuits': [
+                dict(breaker.get_stats(), provider=provider, model=model)
+                for (provider, model), breaker in breakers.items()
+            ]
+        }
+
+    def _breaker(self, provider: str, model: str) -> CircuitBreaker:
+        """プロバイダ・モデルのサーキットブレーカーを取得（なければ生成）"""
+        key = (provider, model)
+        with self._lock:
+            breaker = self._breakers.get(key)
+            if breaker is None:
+                breaker = CircuitBreaker(**self._breaker_settings)
+                self._breakers[key] = breaker
+            return breaker
+
+    @staticmethod
+    def _time_slice(candidates_left: int) -> Optional[float]:
+        """
+        1候補に使わせる時間（秒）
+
+        後にフェイルオーバー先が残っている場合は、デッドラインの残りを残りの候補数で等分する
+        （応答しない候補が再試行でデッドラインを使い切り、切り替える時間が残らないのを防ぐ）。最後の候補は制限しない
+        """
+        if candidates_left <= 1:
+            return None
+        return llm_retry.current_scope().deadline.remaining() / candidates_left
+
+    @staticmethod
+    def _is_provider_failure(error: Exception) -> bool:
+        """プロバイダ側の障害とみなすエラーか"""
+        if isinstance(error, LLMUnavailableError):
+            return True
+        return llm_retry.classify_error(error)[0]
+
+    def _on_error(self, breaker: CircuitBreaker, provider: str, model: str,
+                  started: float, error: Exception) -> bool:
+        """
+        エラーを記録し、次の候補に切り替えるか判定
+
+        Returns:
+            bool: 次の候補に切り替える場合True（Falseの場合は呼び出し元で送出する）
+        """
+        if isinstance(error, DeadlineExceededError) or not self._is_provider_failure(error):
+            breaker.record_ignored()
+            return False
+
+        breaker.record_failure(time.monotonic() - started)
+        print(f"⚠️  {provider}/{model} の呼び出しに失敗しました。次の候補に切り替えます: {error}")
+        return True
+
+    def _record_route(self, agent: str, provider: str, model: str, primary: Tuple[str, str]):
+        """実際に使ったプロバイダを再試行スコープに記録"""
+        fallback = (provider, model) != tuple(primary)
+        if fallback:
+            with self._lock:
+                self._failovers += 1
+        llm_retry.current_scope().record_route({
+            'agent': agent,
+            'provider': provider,
+            'model': model,
+            'fallback': fallback
+        })
+
+    def _raise_unavailable(self, agent: str, primary: Tuple[str, str], last_error: Optional[Exception]):
+        """全候補が使えなかった場合のエラー"""
+        if isinstance(last_error, LLMUnavailableError):
+            raise last_error
+
+        retry_afters = [
+            self._breaker(provider, model).retry_after()
+            for provider, model, _ in self.candidates(agent, primary)
+        ]
+        retry_afters = [value for value in retry_afters if value is not None]
+        raise LLMUnavailableError(
+            details={
+                'agent': agent,
+                'error': str(last_error) if last_error else 'all providers are circuit-open'
+            },
+            retry_after=max(1.0, min(retry_afters)) if retry_afters else None
+        ) from last_error
+
+
+# シングルトンインスタンス
+_llm_router_instance: Optional[LLMRouter] = None
+_llm_router_lock = threading.Lock()
+
+
+def get_llm_router() -> LLMRouter:
+    """LLMルーターのシングルトンインスタンスを取得"""
+    global _llm_router_instance
+    if _llm_router_instance is None:
+        with _llm_router_lock:
+            if _llm_router_instance is None:
+                _llm_router_instance = LLMRouter()
+    return _llm_router_instance
+
+
+def get_llm_router_stats() -> Optional[dict]:
+    """
+    プロバイダ・モデルごとのサーキットの状態を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: LLMRouter.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _llm_router_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
@@ -0,0 +1,373 @@
+"""
+ローカルログストア
+Note_LogsのミラーをSQLiteに保持し、履歴・トークン集計の参照に使う
+（Google Sheetsは書き出し先として扱う）
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from app.config import get_config
+from app.models.note_models import NoteLogEntry
+
+config = get_config()
+
+# NoteLogEntryの列（Google Sheetsの列順と同じ）
+LOG_COLUMNS = NoteLogEntry.get_header_row()
+
+# 一覧取得で指定できる列（raw_jsonは一覧では読み込まない）
+LIST_COLUMNS = [column for column in LOG_COLUMNS if column != 'raw_json']
+
+
+class NoteLogStore:
+    """SQLiteベースのNote_Logsミラー"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス（省略時は LOG_STORE_PATH）
+        """
+        self.path = path or config.LOG_STORE_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+
+    @contextmanager
+    def _connect(self):
+        """コネクションを開き、コミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        """テーブル・インデックスの作成"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS note_logs (
+                    note_id TEXT PRIMARY KEY,
+                    topic TEXT,
+                    audience TEXT,
+                    goal TEXT,
+                    article_type TEXT,
+                    length_class TEXT,
+                    temperature REAL,
+                    intensity_level INTEGER,
+                    title TEXT,
+                    raw_json TEXT,
+                    total_tokens INTEGER,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_note_logs_created_at ON note_logs (created_at, note_id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_note_logs_article_type ON note_logs (article_type, created_at)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_note_logs_length_class ON note_logs (length_class, created_at)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS store_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                )
+            ''')
+
+    def insert(self, log_entry: NoteLogEntry):
+        """
+        ログを1件保存
+
+        Args:
+            log_entry: ログエントリ
+        """
+        self.insert_many([log_entry])
+
+    def insert_many(self, log_entries: Iterable[NoteLogEntry], replace: bool = True) -> int:
+        """
+        ログをまとめて保存
+
+        Args:
+            log_entries: ログエントリ
+            replace: 同じnote_idが存在する場合に上書きするか（Falseの場合は既存を優先）
+
+        Returns:
+            int: 保存した件数
+        """
+        rows = [self._entry_to_row(log_entry) for log_entry in log_entries]
+        if not rows:
+            return 0
+
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        placeholders = ', '.join('?' for _ in LOG_COLUMNS)
+        with self._connect() as conn:
+            cursor = conn.executemany(
+                f'{verb} INTO note_logs ({", ".join(LOG_COLUMNS)}) VALUES ({placeholders})',
+                rows
+            )
+            return cursor.rowcount
+
+    def count(self) -> int:
+        """保存件数を取得"""
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM note_logs').fetchone()[0]
+
+    def get_recent_logs(self, limit: int = 20) -> List[Dict]:
+        """
+        最新のログを取得（raw_jsonは読み込まない）
+
+        Args:
+            limit: 取得件数
+
+        Returns:
+            List[Dict]: ログデータ（GoogleSheetsClient.get_recent_logs と同じ形式）
+        """
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT note_id, topic, title, created_at, article_type, intensity_level, total_tokens '
+                'FROM note_logs ORDER BY created_at DESC, note_id DESC LIMIT ?',
+                (limit,)
+            ).fetchall()
+
+        return [
+            {
+                'note_id': row['note_id'],
+                'topic': row['topic'] or '',
+                'title': row['title'] or '',
+                'created_at': row['created_at'],
+                'article_type': row['article_type'] or '',
+                'intensity_level': row['intensity_level'] or 0,
+                'total_tokens': row['total_tokens'] or 0
+            }
+            for row in rows
+        ]
+
+    def list_logs(self, fields: List[str], limit: int, after: Optional[tuple] = None,
+                  article_type: Optional[str] = None, length_class: Optional[str] = None,
+                  created_from: Optional[str] = None, created_to: Optional[str] = None) -> List[Dict]:
+        """
+        ログを新しい順にキーセットページングで取得
+
+        Args:
+            fields: 取得する列（LIST_COLUMNS のいずれか）
+            limit: 取得件数
+            after: 前ページ最後の (created_at, note_id)。指定時はそれより古い行のみ取得
+            article_type: 記事タイプで絞り込み
+            length_class: 長さクラスで絞り込み
+            created_from: created_at の下限（以上）
+            created_to: created_at の上限（未満）
+
+        Returns:
+            List[Dict]: ログデータ（指定した列のみ）
+        """
+        unknown = [field for field in fields if field not in LIST_COLUMNS]
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+
+        # ページング用に created_at / note_id は常に取得する
+        columns = list(dict.fromkeys(list(fields) + ['created_at', 'note_id']))
+
+        conditions = []
+        params = []
+        if after is not None:
+            conditions.append('(created_at < ? OR (created_at = ? AND note_id < ?))')
+            params.extend([after[0], after[0], after[1]])
+        if article_type:
+            conditions.append('article_type = ?')
+            params.append(article_type)
+        if length_class:
+            conditions.append('length_class = ?')
+            params.append(length_class)
+        if created_from:
+            conditions.append('created_at >= ?')
+            params.append(created_from)
+        if created_to:
+            conditions.append('created_at < ?')
+            params.append(created_to)
+
+        where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+        with self._connect() as conn:
+            rows = conn.execute(
+                f'SELECT {", ".join(columns)} FROM note_logs {where} '
+                'ORDER BY created_at DESC, note_id DESC LIMIT ?',
+                (*params, limit)
+            ).fetchall()
+
+        return [{column: row[column] for column in columns} for row in rows]
+
+    def list_token_samples(self, after: Optional[Tuple[str, str]] = None, limit: int = 500) -> List[Dict]:
+        """
+        トークン推定の学習用にログを古い順に取得
+
+        Args:
+            after: 前回取得した最後の (created_at, note_id)。指定時はそれより新しい行のみ取得
+            limit: 取得件数
+
+        Returns:
+            List[Dict]: Agent1のプロンプトを組み立てる列と total_tokens、
+                        model（Agent1が応答したモデル、raw_jsonのmetadataから取得）
+        """
+        where = ''
+        params = []
+        if after is not None:
+            where = 'WHERE created_at > ? OR (created_at = ? AND note_id > ?)'
+            params.extend([after[0], after[0], after[1]])
+
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT created_at, note_id, topic, audience, goal, article_type, length_class, intensity_level, '
+                'total_tokens, CASE WHEN json_valid(raw_json) '
+                "THEN json_extract(raw_json, '$.metadata.llm_retry.routes[0].model') END AS model "
+                f'FROM note_logs {where} ORDER BY created_at, note_id LIMIT ?',
+                (*params, limit)
+            ).fetchall()
+
+        return [dict(row) for row in rows]
+
+    def get_monthly_token_totals(self) -> Dict[str, int]:
+        """
+        月ごとのトークン使用量を集計
+
+        Returns:
+            Dict[str, int]: 月キー（YYYY-MM）→ トークン数
+        """
+        return self.get_monthly_token_snapshot()[0]
+
+    def get_monthly_token_snapshot(self) -> Tuple[Dict[str, int], int]:
+        """
+        月ごとのトークン使用量と、集計に含まれる最後の行（rowid）を同じ読み取りで取得
+
+        Returns:
+            Tuple[Dict[str, int], int]: (月キー → トークン数, 集計に含まれる最大rowid)
+        """
+        with self._connect() as conn:
+            # 1つのSELECTで読むことで、集計とrowidが同じ時点のものになる
+            rows = conn.execute(
+                'SELECT substr(created_at, 1, 7) AS month, SUM(total_tokens) AS tokens, '
+                '(SELECT COALESCE(MAX(rowid), 0) FROM note_logs) AS last_rowid '
+                'FROM note_logs GROUP BY month'
+            ).fetchall()
+
+        totals = {row['month']: row['tokens'] or 0 for row in rows}
+        last_rowid = rows[0]['last_rowid'] if rows else 0
+        return totals, last_rowid
+
+    def find_note_ids(self, note_ids: Iterable[str], up_to_rowid: Optional[int] = None) -> Set[str]:
+        """
+        保存済みのnote_idを取得
+
+        Args:
+            note_ids: 確認するnote_id
+            up_to_rowid: 指定した場合はこのrowid以前に保存された行のみ（get_monthly_token_snapshot の集計に含まれる行）
+
+        Returns:
+            Set[str]: 保存済みのnote_id
+        """
+        note_ids = list(note_ids)
+        if not note_ids:
+            return set()
+
+        query = f'SELECT note_id FROM note_logs WHERE note_id IN ({", ".join("?" for _ in note_ids)})'
+        params = list(note_ids)
+        if up_to_rowid is not None:
+            query += ' AND rowid <= ?'
+            params.append(up_to_rowid)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        return {row['note_id'] for row in rows}
+
+    def add_to_counter(self, key: str, amount: int):
+        """
+        集計値（store_meta）に加算
+
+        Args:
+            key: 集計値のキー
+            amount: 加算する値
+        """
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT INTO store_meta (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + excluded.value',
+                (key, amount)
+            )
+
+    def get_counter(self, key: str) -> int:
+        """
+        集計値（store_meta）を取得
+
+        Args:
+            key: 集計値のキー
+
+        Returns:
+            int: 集計値（無い場合は0）
+        """
+        with self._connect() as conn:
+            row = conn.execute('SELECT value FROM store_meta WHERE key = ?', (key,)).fetchone()
+        return int(row['value']) if row is not None else 0
+
+    def is_backfilled(self) -> bool:
+        """シートからのバックフィルが完了しているか"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM store_meta WHERE key = 'backfilled_at'").fetchone()
+        return row is not None
+
+    def backfill_from_sheet(self, gsheet_client) -> int:
+        """
+        Google Sheetsの全行をストアに取り込む
+
+        既にストアにある行（アプリから直接保存した行）は上書きしない
+
+        Args:
+            gsheet_client: GoogleSheetsClient
+
+        Returns:
+            int: 取り込んだ件数
+        """
+        log_entries = gsheet_client.get_all_log_entries()
+        inserted = self.insert_many(log_entries, replace=False)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO store_meta (key, value) VALUES ('backfilled_at', ?)",
+                (datetime.now().isoformat(),)
+            )
+
+        print(f"✅ Note_Logs をローカルストアに取り込みました: {inserted} 件")
+        return inserted
+
+    @staticmethod
+    def _entry_to_row(log_entry: NoteLogEntry) -> tuple:
+        """NoteLogEntryをDBの行に変換"""
+        return (
+            log_entry.note_id,
+            log_entry.topic,
+            log_entry.audience,
+            log_entry.goal,
+            log_entry.article_type,
+            log_entry.length_class,
+            log_entry.temperature,
+            log_entry.intensity_level,
+            log_entry.title,
+            log_entry.raw_json,
+            log_entry.total_tokens,
+            log_entry.created_at
+        )
+
+
+# シングルトンインスタンス
+_log_store_instance: Optional[NoteLogStore] = None
+_log_store_lock = threading.Lock()
+
+
+def get_log_store() -> NoteLogStore:
+    """ローカルログストアのシングルトンインスタンスを取得"""
+    global _log_store_instance
+    if _log_store_instance is None:
+        with _log_store_lock:
+            if _log_store_instance is None:
+                _log_store_instance = NoteLogStore()
+    return _log_store_instance
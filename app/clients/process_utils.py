@@ -0,0 +1,27 @@
+"""
+プロセス関連のユーティリティ
+ワーカープロセス間で共有するローカルデータ（SQLite・退避ファイル）の持ち主が生存しているかの判定に使う
+"""
+import os
+from typing import Optional
+
+
+def is_process_alive(pid: Optional[int]) -> bool:
+    """
+    PIDのプロセスが生存しているか
+
+    Args:
+        pid: プロセスID
+
+    Returns:
+        bool: 生存しているか（PIDが無い場合はFalse）
+    """
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
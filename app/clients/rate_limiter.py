@@ -0,0 +1,131 @@
+"""
+リクエスト頻度の制限（トークンバケット）
+APIキーごとのバケットの残量をSQLiteに保持し、ワーカープロセス間で共有する。
+補充は取り出し時に経過時間から計算するため、定期的な更新処理は不要
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from app.config import get_config
+
+config = get_config()
+
+
+class TokenBucketLimiter:
+    """SQLiteベースのトークンバケット"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス（省略時は API_RATE_LIMIT_PATH）
+        """
+        self.path = path or config.API_RATE_LIMIT_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+
+    @contextmanager
+    def _connect(self):
+        """コネクションを開き、書き込みロックを取得してからコミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            # 残量の読み取りと更新の間に他のワーカーが割り込まないよう、最初に書き込みロックを取る
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        """テーブルの作成"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_buckets (
+                    bucket_key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def acquire(self, key: str, rate_per_second: float, burst: int, cost: int = 1) -> float:
+        """
+        バケットから cost 回分を取り出す
+
+        cost が容量を超える場合は、バケットが満杯の時に受け付けて残量を負にする（以降は補充されるまで待つ）
+
+        Args:
+            key: バケットのキー（APIキー名）
+            rate_per_second: 1秒あたりの補充量
+            burst: バケットの容量（連続で受け付けられる回数）
+            cost: 取り出す回数（一括生成の件数など）
+
+        Returns:
+            float: 0.0（受付可）、または受け付けられるまで補充を待つ秒数（受付不可）
+        """
+        now = time.time()
+        required = min(cost, burst)
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM token_buckets WHERE bucket_key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                tokens = float(burst)
+            else:
+                tokens = min(float(burst), row['tokens'] + max(0.0, now - row['updated_at']) * rate_per_second)
+
+            wait = 0.0
+            if tokens >= required:
+                tokens -= cost
+            elif rate_per_second > 0:
+                wait = (required - tokens) / rate_per_second
+            else:
+                wait = float('inf')
+
+            conn.execute(
+                'INSERT INTO token_buckets (bucket_key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(bucket_key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now)
+            )
+        return wait
+
+    def get_levels(self) -> Dict[str, float]:
+        """
+        各バケットの残量（最後に取り出した時点）
+
+        Returns:
+            Dict[str, float]: キー → 残量
+        """
+        with self._connect() as conn:
+            rows = conn.execute('SELECT bucket_key, tokens FROM token_buckets').fetchall()
+        return {row['bucket_key']: round(row['tokens'], 3) for row in rows}
+
+
+# シングルトンインスタンス
+_rate_limiter_instance: Optional[TokenBucketLimiter] = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> TokenBucketLimiter:
+    """トークンバケットのシングルトンインスタンスを取得"""
+    global _rate_limiter_instance
+    if _rate_limiter_instance is None:
+        with _rate_limiter_lock:
+            if _rate_limiter_instance is None:
+                _rate_limiter_instance = TokenBucketLimiter()
+    return _rate_limiter_instance
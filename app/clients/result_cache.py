@@ -0,0 +1,257 @@
+"""
+生成結果キャッシュ
+同一内容の記事生成リクエストの結果をローカルのSQLiteに保持し、再利用する
+（TTLで失効、件数上限を超えた分は最終利用が古い順に削除）
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+from app.config import get_config
+from app.models.note_models import GenerateNoteRequest
+
+config = get_config()
+
+
+def build_cache_key(request: GenerateNoteRequest) -> str:
+    """
+    リクエストを正規化してキャッシュキーを生成
+
+    文字列はNFKC正規化・前後の空白除去・連続空白の圧縮を行い、
+    利用するモデルもキーに含める（モデル変更後に古い結果を返さないため）。
+    認証したAPIキー名も含め、他のキーの生成結果をトークンを消費せずに返さない
+
+    Args:
+        request: バリデーション済みリクエスト
+
+    Returns:
+        str: キャッシュキー（SHA-256）
+    """
+    def normalize(text: str) -> str:
+        return ' '.join(unicodedata.normalize('NFKC', text or '').split())
+
+    key_source = {
+        'topic': normalize(request.topic),
+        'audience': normalize(request.audience),
+        'goal': normalize(request.goal),
+        'article_type': request.article_type,
+        'length_class': request.length_class,
+        'temperature': round(float(request.temperature), 2),
+        'intensity_level': int(request.intensity_level),
+        'provider': config.LLM_PROVIDER,
+        'models': [config.LLM_MODEL_AGENT1, config.LLM_MODEL_AGENT2],
+        'api_key': request.api_key
+    }
+    raw = json.dumps(key_source, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """SQLiteベースの生成結果キャッシュ（TTL + LRU）"""
+
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_entries: Optional[int] = None):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス（省略時は RESULT_CACHE_PATH）
+            ttl_seconds: 保持期間（秒）
+            max_entries: 保持件数の上限
+        """
+        self.path = path or config.RESULT_CACHE_PATH
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else config.RESULT_CACHE_TTL_SECONDS
+        self.max_entries = max_entries if max_entries is not None else config.RESULT_CACHE_MAX_ENTRIES
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+        self._stats_lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0}
+        # 同一キーの生成を同時に1つだけ実行する（プロセス内）
+        self.single_flight = SingleFlight()
+
+    @contextmanager
+    def _connect(self):
+        """コネクションを開き、コミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        """テーブル・インデックスの作成"""
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    response_json TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_result_cache_last_used ON result_cache (last_used_at)')
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """
+        キャッシュから結果を取得
+
+        Args:
+            cache_key: キャッシュキー
+
+        Returns:
+            Optional[Dict]: GenerateNoteResponse.to_dict() の内容（無い・失効している場合はNone）
+        """
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT response_json, created_at FROM result_cache WHERE cache_key = ?',
+                (cache_key,)
+            ).fetchone()
+
+            if row is not None and now - row['created_at'] >= self.ttl_seconds:
+                conn.execute('DELETE FROM result_cache WHERE cache_key = ?', (cache_key,))
+                row = None
+
+            if row is not None:
+                conn.execute(
+                    'UPDATE result_cache SET last_used_at = ? WHERE cache_key = ?',
+                    (now, cache_key)
+                )
+
+        with self._stats_lock:
+            self._stats['hits' if row is not None else 'misses'] += 1
+
+        return json.loads(row['response_json']) if row is not None else None
+
+    def put(self, cache_key: str, response: Dict):
+        """
+        結果をキャッシュに保存し、上限を超えた分を削除
+
+        Args:
+            cache_key: キャッシュキー
+            response: GenerateNoteResponse.to_dict() の内容
+        """
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO result_cache (cache_key, response_json, created_at, last_used_at) '
+                'VALUES (?, ?, ?, ?)',
+                (cache_key, json.dumps(response, ensure_ascii=False), now, now)
+            )
+            conn.execute('DELETE FROM result_cache WHERE created_at <= ?', (now - self.ttl_seconds,))
+            conn.execute(
+                'DELETE FROM result_cache WHERE cache_key IN ('
+                'SELECT cache_key FROM result_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?)',
+                (self.max_entries,)
+            )
+
+        with self._stats_lock:
+            self._stats['stores'] += 1
+
+    def get_stats(self) -> dict:
+        """
+        キャッシュの統計を取得
+
+        Returns:
+            dict: 統計情報
+        """
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['coalesced'] = self.single_flight.coalesced
+        with self._connect() as conn:
+            stats['entries'] = conn.execute('SELECT COUNT(*) FROM result_cache').fetchone()[0]
+        return stats
+
+
+class SingleFlight:
+    """同一キーの処理を同時に1つだけ実行し、待機中の呼び出し元にも同じ結果を返す（プロセス内）"""
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error: Optional[BaseException] = None
+
+    def __init__(self):
+        """初期化"""
+        self._lock = threading.Lock()
+        self._calls: Dict[str, 'SingleFlight._Call'] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable):
+        """
+        キーごとに fn を1回だけ実行
+
+        Args:
+            key: 重複判定のキー
+            fn: 実行する処理
+
+        Returns:
+            fn の戻り値（実行中の処理がある場合はその結果）
+
+        Raises:
+            fn が送出した例外（待機中の呼び出し元にも同じ例外を送出）
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+
+# シングルトンインスタンス
+_result_cache_instance: Optional[ResultCache] = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """生成結果キャッシュのシングルトンインスタンスを取得"""
+    global _result_cache_instance
+    if _result_cache_instance is None:
+        with _result_cache_lock:
+            if _result_cache_instance is None:
+                _result_cache_instance = ResultCache()
+    return _result_cache_instance
+
+
+def get_result_cache_stats() -> Optional[dict]:
+    """
+    生成結果キャッシュの統計を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: ResultCache.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _result_cache_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
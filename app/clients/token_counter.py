@@ -0,0 +1,164 @@
+"""
+月次トークンカウンタ
+月ごとのトークン使用量をプロセス内で保持し、定期的に集計元と突き合わせる
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+# 集計元のロードに失敗した後、次に試すまでの待ち時間（秒、失敗が続くと突き合わせ間隔まで倍にする）
+LOAD_RETRY_SECONDS = 5.0
+
+
+def month_key(timestamp: Optional[str] = None) -> str:
+    """
+    ISO形式の日時文字列から月キー（YYYY-MM）を取得
+
+    Args:
+        timestamp: ISO形式の日時（省略時は現在時刻）
+
+    Returns:
+        str: 月キー
+    """
+    if timestamp is None:
+        return datetime.now().strftime('%Y-%m')
+    return timestamp[:7]
+
+
+class MonthlyTokenCounter:
+    """月次トークン使用量のランニングトータル（スレッドセーフ）"""
+
+    def __init__(self, loader: Callable[[], Dict[str, int]], reconcile_interval: float,
+                 find_loaded: Optional[Callable[[List[str]], Set[str]]] = None):
+        """
+        初期化
+
+        Args:
+            loader: 月キー→トークン数の辞書を返す集計関数（初回ロード・突き合わせに使用）
+            reconcile_interval: 突き合わせ間隔（秒）
+            find_loaded: 指定したnote_idのうち、直前の loader の集計に含まれているものを返す関数（省略可）。
+                突き合わせ中に加算された分のうち、集計元に反映済みのものを二重に数えないために使う
+        """
+        self._loader = loader
+        self._find_loaded = find_loaded
+        self._reconcile_interval = reconcile_interval
+        self._totals: Dict[str, int] = {}
+        self._loaded_at: Optional[float] = None
+        # 次に突き合わせる時刻（ロードに失敗した場合は LOAD_RETRY_SECONDS から倍にして待つ）
+        self._next_reconcile_at = 0.0
+        self._failures = 0
+        # 突き合わせ中に加算された分を取りこぼさないための記録（時刻, 月キー, トークン数, note_id）
+        self._recent_additions: List[Tuple[float, str, int, Optional[str]]] = []
+        self._lock = threading.Lock()
+        # loader と find_loaded の組を1度に1つだけ実行する
+        self._reconcile_lock = threading.RLock()
+        self._reconciling = False
+
+    def get(self, key: Optional[str] = None) -> int:
+        """
+        指定月のトークン使用量を取得
+
+        初回のみ集計元から同期的にロードし、以降は保持している値を返す。
+        突き合わせ間隔を過ぎている場合はバックグラウンドで再集計する。
+        ロードに失敗した場合は待ち時間を置いてから再度試す（失敗中は保持している値を返す）
+
+        Args:
+            key: 月キー（省略時は今月）
+
+        Returns:
+            int: トークン使用量
+        """
+        key = key or month_key()
+
+        if self._loaded_at is None:
+            # 同時に来たリクエストは最初のロードを待ち、失敗した場合は待ち時間が過ぎるまで再ロードしない
+            with self._reconcile_lock:
+                if self._loaded_at is None and time.time() >= self._next_reconcile_at:
+                    self.reconcile()
+        elif time.time() >= self._next_reconcile_at:
+            self._reconcile_in_background()
+
+        with self._lock:
+            return self._totals.get(key, 0)
+
+    def add(self, created_at: str, tokens: int, note_id: Optional[str] = None):
+        """
+        トークン使用量を加算
+
+        Args:
+            created_at: ログの作成日時（ISO形式）
+            tokens: トークン数
+            note_id: ログのnote_id（突き合わせで集計元に反映済みかを確認するのに使う）
+        """
+        key = month_key(created_at)
+        with self._lock:
+            self._totals[key] = self._totals.get(key, 0) + tokens
+            self._recent_additions.append((time.time(), key, tokens, note_id))
+
+    def reconcile(self):
+        """集計元から再集計して保持値を置き換える"""
+        with self._reconcile_lock:
+            started_at = time.time()
+            checked_ids: Set[str] = set()
+            loaded_ids: Set[str] = set()
+            try:
+                totals = dict(self._loader())
+                while True:
+                    with self._lock:
+                        # ロード開始後に加算された分は集計元に未反映の可能性があるため上乗せする
+                        # （集計元に反映済みと確認できた分は二重に数えない）
+                        self._recent_additions = [
+                            addition for addition in self._recent_additions if addition[0] >= started_at
+                        ]
+                        unchecked = self._unchecked_note_ids(checked_ids)
+                        if not unchecked:
+                            for _, key, tokens, note_id in self._recent_additions:
+                                if note_id is None or note_id not in loaded_ids:
+                                    totals[key] = totals.get(key, 0) + tokens
+                            self._totals = totals
+                            self._loaded_at = started_at
+                            self._next_reconcile_at = started_at + self._reconcile_interval
+                            self._failures = 0
+                            return
+                    # 確認中に加算された分は次の周回で確認する
+                    loaded_ids |= set(self._find_loaded(unchecked))
+                    checked_ids |= set(unchecked)
+            except Exception as e:
+                self._record_failure()
+                print(f"⚠️  トークン集計の突き合わせエラー: {e}")
+
+    def _unchecked_note_ids(self, checked_ids: Set[str]) -> List[str]:
+        """集計元に反映済みかをまだ確認していないnote_id（find_loaded が無い場合は確認しない）"""
+        if self._find_loaded is None:
+            return []
+        return [
+            note_id for _, _, _, note_id in self._recent_additions
+            if note_id is not None and note_id not in checked_ids
+        ]
+
+    def _record_failure(self):
+        """ロードの失敗を記録し、次に試す時刻を遅らせる"""
+        with self._lock:
+            self._failures += 1
+            delay = min(
+                LOAD_RETRY_SECONDS * 2 ** (self._failures - 1),
+                max(self._reconcile_interval, LOAD_RETRY_SECONDS)
+            )
+            self._next_reconcile_at = time.time() + delay
+
+    def _reconcile_in_background(self):
+        """バックグラウンドスレッドで突き合わせ（多重起動しない）"""
+        with self._lock:
+            if self._reconciling:
+                return
+            self._reconciling = True
+
+        def run():
+            try:
+                self.reconcile()
+            finally:
+                with self._lock:
+                    self._reconciling = False
+
+        threading.Thread(target=run, name='token-counter-reconcile', daemon=True).start()
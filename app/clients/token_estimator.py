@@ -0,0 +1,332 @@
+"""
+トークン使用量の推定
+生成ログの total_tokens から length_class / article_type / モデルごとの分布を学習し、
+月次上限の予約に使う推定値を返す。分布は P² アルゴリズムによる逐次分位点推定で保持するため、
+ログの件数によらずメモリ・計算量は一定で、ログが追加されるたびに差分だけを取り込む
+"""
+import math
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import get_config
+from app.clients.llm_prompts import AGENT1_SYSTEM_PROMPT, build_agent1_user_prompt
+from app.clients.log_store import get_log_store
+
+config = get_config()
+
+# 学習データが足りない場合の推定値（length_class ごと）
+DEFAULT_ESTIMATES = {
+    'short': 1500,
+    'middle': 3000,
+    'long': 5000
+}
+DEFAULT_ESTIMATE = 3000
+
+# プロンプトのトークン数の概算（日本語などの非ASCII文字は1文字≒1トークン、ASCIIは4文字≒1トークン）
+ASCII_CHARS_PER_TOKEN = 4
+
+
+class P2Quantile:
+    """
+    P² アルゴリズムによる分位点の逐次推定
+
+    5つのマーカー（最小値・p/2・p・(1+p)/2・最大値の位置）だけを保持し、
+    観測値を受け取るたびにマーカーの高さを放物線補間で調整する
+    """
+
+    def __init__(self, p: float):
+        """
+        初期化
+
+        Args:
+            p: 推定する分位点（0〜1）
+        """
+        self.p = p
+        self.count = 0
+        self._heights: List[float] = []
+        self._positions = [0, 1, 2, 3, 4]
+        self._desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self._increments = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, x: float):
+        """
+        観測値を追加
+
+        Args:
+            x: 観測値
+        """
+        self.count += 1
+        q = self._heights
+
+        # 最初の5件はそのまま保持してマーカーの初期値にする
+        if self.count <= 5:
+            q.append(x)
+            q.sort()
+            return
+
+        if x < q[0]:
+            q[0] = x
+            k = 0
+        elif x >= q[4]:
+            q[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= q[k + 1]:
+                k += 1
+
+        n = self._positions
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self._desired[i] += self._increments[i]
+
+        # 中間のマーカーが目標位置から1以上ずれたら高さを補正して1つ動かす
+        for i in range(1, 4):
+            d = self._desired[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or (d <= -1 and n[i - 1] - n[i] < -1):
+                step = 1 if d > 0 else -1
+                height = self._parabolic(i, step)
+                if not q[i - 1] < height < q[i + 1]:
+                    height = q[i] + step * (q[i + step] - q[i]) / (n[i + step] - n[i])
+                q[i] = height
+                n[i] += step
+
+    def _parabolic(self, i: int, d: int) -> float:
+        """区分放物線（P²）補間によるマーカーの高さ"""
+        q = self._heights
+        n = self._positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i])
+            + (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1])
+        )
+
+    def value(self) -> Optional[float]:
+        """
+        現在の分位点の推定値
+
+        Returns:
+            Optional[float]: 推定値（観測値が無い場合はNone）
+        """
+        if self.count == 0:
+            return None
+        if self.count <= 5:
+            # マーカーが揃うまでは保持している観測値から直接求める
+            index = min(len(self._heights) - 1, max(0, math.ceil(self.p * len(self._heights)) - 1))
+            return self._heights[index]
+        return self._heights[2]
+
+
+def count_prompt_tokens(text: str) -> int:
+    """
+    プロンプトのトークン数を概算
+
+    Args:
+        text: プロンプト
+
+    Returns:
+        int: 推定トークン数
+    """
+    ascii_chars = sum(1 for c in text if c.isascii())
+    return (len(text) - ascii_chars) + math.ceil(ascii_chars / ASCII_CHARS_PER_TOKEN)
+
+
+def count_request_prompt_tokens(payload: dict) -> int:
+    """
+    リクエストに対して送るAgent1のプロンプト（システム＋ユーザー）のトークン数を概算
+
+    Args:
+        payload: Agent1用ペイロード（topic, audience, goal, etc.）
+
+    Returns:
+        int: 推定トークン数
+    """
+    return count_prompt_tokens(AGENT1_SYSTEM_PROMPT) + count_prompt_tokens(build_agent1_user_prompt(payload))
+
+
+class _GenerationSketch:
+    """1つのキーの生成トークン数（total_tokens − Agent1のプロンプト）の分布"""
+
+    def __init__(self, quantile: float):
+        self.median = P2Quantile(0.5)
+        self.upper = P2Quantile(quantile)
+
+    def add(self, tokens: int):
+        self.median.add(tokens)
+        self.upper.add(tokens)
+
+    @property
+    def count(self) -> int:
+        return self.upper.count
+
+
+class TokenEstimator:
+    """ログから学習するトークン使用量の推定（スレッドセーフ）"""
+
+    def __init__(
+        self,
+        loader: Callable[[Optional[Tuple[str, str]]], List[Dict]],
+        quantile: float,
+        min_samples: int,
+        refresh_interval: float
+    ):
+        """
+        初期化
+
+        Args:
+            loader: 指定した (created_at, note_id) より新しいログを古い順に返す関数
+                    （NoteLogStore.list_token_samples）
+            quantile: 推定に使う分位点（大きいほど予約が保守的になる）
+            min_samples: 学習結果を使うのに必要な件数（足りないキーはより粗いキー、既定値の順に使う）
+            refresh_interval: ログを取り込む間隔（秒）
+        """
+        self._loader = loader
+        self._quantile = quantile
+        self._min_samples = min_samples
+        self._refresh_interval = refresh_interval
+        self._sketches: Dict[tuple, _GenerationSketch] = {}
+        self._cursor: Optional[Tuple[str, str]] = None
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def estimate(self, payload: dict, model: Optional[str] = None) -> Dict:
+        """
+        リクエストのトークン使用量を推定
+
+        Agent1のプロンプトは実際に送る内容から数え、生成分（出力・Agent2の入出力）は
+        学習した分布の分位点を使う
+
+        Args:
+            payload: Agent1用ペイロード（topic, audience, goal, article_type, length_class, etc.）
+            model: Agent1のモデル（省略時は LLM_MODEL_AGENT1）
+
+        Returns:
+            Dict: estimated_tokens（推定トークン数）, prompt_tokens（Agent1のプロンプト）,
+                  source（推定に使ったキー、学習データが無い場合は "default"）, samples（そのキーの件数）
+        """
+        if self._refreshed_at is None or time.time() - self._refreshed_at >= self._refresh_interval:
+            self.refresh()
+
+        length_class = payload.get('length_class', 'middle')
+        article_type = payload.get('article_type', 'education')
+        prompt_tokens = count_request_prompt_tokens(payload)
+
+        with self._lock:
+            for key in self._keys(length_class, article_type, model or config.LLM_MODEL_AGENT1):
+                sketch = self._sketches.get(key)
+                if sketch is not None and sketch.count >= self._min_samples:
+                    return {
+                        'estimated_tokens': prompt_tokens + math.ceil(sketch.upper.value()),
+                        'prompt_tokens': prompt_tokens,
+                        'source': '/'.join(key),
+                        'samples': sketch.count
+                    }
+
+        default = DEFAULT_ESTIMATES.get(length_class, DEFAULT_ESTIMATE)
+        return {
+            'estimated_tokens': max(default, prompt_tokens),
+            'prompt_tokens': prompt_tokens,
+            'source': 'default',
+            'samples': 0
+        }
+
+    def refresh(self) -> int:
+        """
+        前回以降に保存されたログを取り込む（他のワーカーが保存した分も含む）
+
+        Returns:
+            int: 取り込んだ件数（他のスレッドが取り込み中の場合は0）
+        """
+        if not self._refresh_lock.acquire(blocking=False):
+            return 0
+        try:
+            added = 0
+            while True:
+                rows = self._loader(self._cursor)
+                for row in rows:
+                    self.record(row)
+                added += len(rows)
+                if not rows:
+                    break
+                self._cursor = (rows[-1]['created_at'], rows[-1]['note_id'])
+            self._refreshed_at = time.time()
+            return added
+        finally:
+            self._refresh_lock.release()
+
+    def record(self, row: Dict):
+        """
+        1件のログを分布に追加
+
+        Args:
+            row: ログ（topic, audience, goal, article_type, length_class, intensity_level, total_tokens, model）
+        """
+        total_tokens = row.get('total_tokens') or 0
+        if total_tokens <= 0:
+            return
+        generation_tokens = max(0, total_tokens - count_request_prompt_tokens(row))
+        model = row.get('model') or config.LLM_MODEL_AGENT1
+
+        with self._lock:
+            for key in self._keys(row.get('length_class') or 'middle', row.get('article_type') or 'education', model):
+                sketch = self._sketches.get(key)
+                if sketch is None:
+                    sketch = self._sketches[key] = _GenerationSketch(self._quantile)
+                sketch.add(generation_tokens)
+
+    @staticmethod
+    def _keys(length_class: str, article_type: str, model: str) -> List[tuple]:
+        """細かい順の集計キー"""
+        return [(length_class, article_type, model), (length_class, article_type), (length_class,)]
+
+    def get_stats(self) -> Dict:
+        """
+        学習状況（容量見積もり用に中央値と上側分位点を返す）
+
+        Returns:
+            Dict: quantile, min_samples, keys（キーごとの samples, p50_generation_tokens, upper_generation_tokens）
+        """
+        with self._lock:
+            keys = {
+                '/'.join(key): {
+                    'samples': sketch.count,
+                    'p50_generation_tokens': round(sketch.median.value()),
+                    'upper_generation_tokens': round(sketch.upper.value())
+                }
+                for key, sketch in sorted(self._sketches.items())
+            }
+        return {'quantile': self._quantile, 'min_samples': self._min_samples, 'keys': keys}
+
+
+# シングルトンインスタンス
+_token_estimator_instance: Optional[TokenEstimator] = None
+_token_estimator_lock = threading.Lock()
+
+
+def get_token_estimator() -> TokenEstimator:
+    """トークン推定のシングルトンインスタンスを取得"""
+    global _token_estimator_instance
+    if _token_estimator_instance is None:
+        with _token_estimator_lock:
+            if _token_estimator_instance is None:
+                _token_estimator_instance = TokenEstimator(
+                    loader=get_log_store().list_token_samples,
+                    quantile=config.TOKEN_ESTIMATE_QUANTILE,
+                    min_samples=config.TOKEN_ESTIMATE_MIN_SAMPLES,
+                    refresh_interval=config.TOKEN_ESTIMATE_REFRESH_SECONDS
+                )
+    return _token_estimator_instance
+
+
+def get_token_estimator_stats() -> Optional[dict]:
+    """
+    トークン推定の学習状況を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: TokenEstimator.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _token_estimator_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
@@ -0,0 +1,271 @@
+"""
+トークン予約台帳
+月次トークン上限の判定をワーカープロセス間で共有するため、予約（推定値）と確定済みの使用量をSQLiteに保持する。
+予約・確定・解放はそれぞれ1トランザクションで行い、同時に届いたリクエストが揃って上限を超えることを防ぐ
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional
+from app.config import get_config
+from app.clients.process_utils import is_process_alive
+from app.clients.token_counter import month_key
+
+config = get_config()
+
+
+class TokenLedger:
+    """SQLiteベースのトークン予約台帳"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        初期化
+
+        Args:
+            path: SQLiteファイルのパス（省略時は TOKEN_LEDGER_PATH）
+        """
+        self.path = path or config.TOKEN_LEDGER_PATH
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._initialize_schema()
+
+    @contextmanager
+    def _connect(self):
+        """コネクションを開き、書き込みロックを取得してからコミットして閉じる"""
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            # 判定と書き込みの間に他のワーカーが割り込まないよう、最初に書き込みロックを取る
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+        finally:
+            conn.close()
+
+    def _initialize_schema(self):
+        """テーブルの作成"""
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_reservations (
+                    reservation_id TEXT PRIMARY KEY,
+                    month TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    owner_pid INTEGER,
+                    expires_at REAL NOT NULL,
+                    api_key TEXT
+                )
+            ''')
+            columns = [row[1] for row in conn.execute('PRAGMA table_info(token_reservations)').fetchall()]
+            if 'api_key' not in columns:
+                # APIキーごとの上限を追加する前に作成された台帳
+                conn.execute('ALTER TABLE token_reservations ADD COLUMN api_key TEXT')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_token_reservations_month ON token_reservations (month)')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS token_usage (
+                    month TEXT PRIMARY KEY,
+                    tokens INTEGER NOT NULL
+                )
+            ''')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS api_key_usage (
+                    month TEXT NOT NULL,
+                    api_key TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    PRIMARY KEY (month, api_key)
+                )
+            ''')
+            conn.commit()
+        finally:
+            conn.close()
+
+    def reserve(self, tokens: int, limit: int, current_usage: int = 0,
+                api_key: Optional[str] = None, key_limit: int = 0) -> Dict:
+        """
+        上限に収まる場合のみトークンを予約
+
+        Args:
+            tokens: 予約するトークン数（推定値）
+            limit: 月次上限
+            current_usage: 呼び出し元が把握している今月の使用量（台帳の値より大きければそちらを使う）
+            api_key: リクエスト元のAPIキー名（キーごとの使用量に計上する）
+            key_limit: APIキーごとの月次上限（0の場合は判定しない）
+
+        Returns:
+            Dict: reserved（予約できたか）, reservation_id（予約できた場合）,
+                  current_usage（確定済み）, reserved_tokens（他の予約の合計）,
+                  limited_by（予約できなかった場合に超過した上限: monthly / api_key）。
+                  api_key 指定時は key_usage, key_reserved_tokens も含む
+        """
+        month = month_key()
+        with self._connect() as conn:
+            self._expire(conn)
+            usage = self._sync_usage(conn, month, current_usage)
+            reserved = self._reserved(conn, month)
+
+            result = {'reserved': False, 'reservation_id': None, 'current_usage': usage, 'reserved_tokens': reserved}
+            if api_key is not None:
+                key_status = self._key_status(conn, month, api_key)
+                result.update(key_usage=key_status['current_usage'], key_reserved_tokens=key_status['reserved_tokens'])
+                if key_limit and key_status['current_usage'] + key_status['reserved_tokens'] + tokens > key_limit:
+                    result['limited_by'] = 'api_key'
+                    return result
+            if usage + reserved + tokens > limit:
+                result['limited_by'] = 'monthly'
+                return result
+
+            reservation_id = uuid.uuid4().hex
+            conn.execute(
+                'INSERT INTO token_reservations (reservation_id, month, tokens, owner_pid, expires_at, api_key) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (reservation_id, month, tokens, os.getpid(), time.time() + config.TOKEN_RESERVATION_TTL_SECONDS,
+                 api_key)
+            )
+            result.update(reserved=True, reservation_id=reservation_id)
+            return result
+
+    def commit(self, reservation_id: Optional[str], tokens: int):
+        """
+        予約を実際の使用量で確定
+
+        Args:
+            reservation_id: 予約ID（予約できなかった場合はNone、使用量の加算のみ行う）
+            tokens: 実際に使用したトークン数
+        """
+        month = month_key()
+        api_key = None
+        with self._connect() as conn:
+            if reservation_id is not None:
+                row = conn.execute(
+                    'SELECT month, api_key FROM token_reservations WHERE reservation_id = ?', (reservation_id,)
+                ).fetchone()
+                if row is not None:
+                    month = row['month']
+                    api_key = row['api_key']
+                    conn.execute('DELETE FROM token_reservations WHERE reservation_id = ?', (reservation_id,))
+            conn.execute(
+                'INSERT INTO token_usage (month, tokens) VALUES (?, ?) '
+                'ON CONFLICT(month) DO UPDATE SET tokens = tokens + excluded.tokens',
+                (month, tokens)
+            )
+            if api_key is not None:
+                conn.execute(
+                    'INSERT INTO api_key_usage (month, api_key, tokens) VALUES (?, ?, ?) '
+                    'ON CONFLICT(month, api_key) DO UPDATE SET tokens = tokens + excluded.tokens',
+                    (month, api_key, tokens)
+                )
+
+    def release(self, reservation_id: Optional[str]):
+        """
+        予約を解放（生成に失敗した場合）
+
+        Args:
+            reservation_id: 予約ID
+        """
+        if reservation_id is None:
+            return
+        with self._connect() as conn:
+            conn.execute('DELETE FROM token_reservations WHERE reservation_id = ?', (reservation_id,))
+
+    def get_status(self, current_usage: int = 0) -> Dict:
+        """
+        今月の確定済み使用量と予約中のトークン数
+
+        Args:
+            current_usage: 呼び出し元が把握している今月の使用量
+
+        Returns:
+            Dict: current_usage, reserved_tokens, reservations（予約数）
+        """
+        month = month_key()
+        with self._connect() as conn:
+            self._expire(conn)
+            usage = self._sync_usage(conn, month, current_usage)
+            row = conn.execute(
+                'SELECT COUNT(*) AS count, COALESCE(SUM(tokens), 0) AS tokens '
+                'FROM token_reservations WHERE month = ?',
+                (month,)
+            ).fetchone()
+        return {'current_usage': usage, 'reserved_tokens': row['tokens'], 'reservations': row['count']}
+
+    def get_key_status(self, api_key: str) -> Dict:
+        """
+        APIキーの今月の確定済み使用量と予約中のトークン数
+
+        Args:
+            api_key: APIキー名
+
+        Returns:
+            Dict: current_usage, reserved_tokens
+        """
+        with self._connect() as conn:
+            self._expire(conn)
+            return self._key_status(conn, month_key(), api_key)
+
+    @staticmethod
+    def _key_status(conn, month: str, api_key: str) -> Dict:
+        """APIキーの確定済み使用量と予約中のトークン数"""
+        usage = conn.execute(
+            'SELECT tokens FROM api_key_usage WHERE month = ? AND api_key = ?', (month, api_key)
+        ).fetchone()
+        reserved = conn.execute(
+            'SELECT COALESCE(SUM(tokens), 0) FROM token_reservations WHERE month = ? AND api_key = ?',
+            (month, api_key)
+        ).fetchone()[0]
+        return {'current_usage': usage['tokens'] if usage is not None else 0, 'reserved_tokens': reserved}
+
+    @staticmethod
+    def _sync_usage(conn, month: str, current_usage: int) -> int:
+        """台帳の使用量を呼び出し元の値以上に揃えて返す（ログ集計が先に進んでいる場合に追従する）"""
+        row = conn.execute('SELECT tokens FROM token_usage WHERE month = ?', (month,)).fetchone()
+        usage = row['tokens'] if row is not None else 0
+        if current_usage > usage:
+            usage = current_usage
+            conn.execute(
+                'INSERT INTO token_usage (month, tokens) VALUES (?, ?) '
+                'ON CONFLICT(month) DO UPDATE SET tokens = excluded.tokens',
+                (month, usage)
+            )
+        return usage
+
+    @staticmethod
+    def _reserved(conn, month: str) -> int:
+        """予約中のトークン数の合計"""
+        return conn.execute(
+            'SELECT COALESCE(SUM(tokens), 0) FROM token_reservations WHERE month = ?', (month,)
+        ).fetchone()[0]
+
+    @staticmethod
+    def _expire(conn):
+        """期限切れ・担当ワーカーが終了した予約を削除"""
+        conn.execute('DELETE FROM token_reservations WHERE expires_at < ?', (time.time(),))
+        owners = conn.execute(
+            'SELECT DISTINCT owner_pid FROM token_reservations WHERE owner_pid IS NOT ?', (os.getpid(),)
+        ).fetchall()
+        for row in owners:
+            if not is_process_alive(row['owner_pid']):
+                conn.execute('DELETE FROM token_reservations WHERE owner_pid = ?', (row['owner_pid'],))
+
+
+# シングルトンインスタンス
+_token_ledger_instance: Optional[TokenLedger] = None
+_token_ledger_lock = threading.Lock()
+
+
+def get_token_ledger() -> TokenLedger:
+    """トークン予約台帳のシングルトンインスタンスを取得"""
+    global _token_ledger_instance
+    if _token_ledger_instance is None:
+        with _token_ledger_lock:
+            if _token_ledger_instance is None:
+                _token_ledger_instance = TokenLedger()
+    return _token_ledger_instance
@@ -24,6 +24,57 @@ class Config:
     LLM_MODEL_AGENT2 = os.getenv('LLM_MODEL_AGENT2', 'claude-3-5-sonnet-20241022')
     LLM_AGENT1_MAX_TOKENS = int(os.getenv('LLM_AGENT1_MAX_TOKENS', 6000))
     LLM_AGENT2_MAX_TOKENS = int(os.getenv('LLM_AGENT2_MAX_TOKENS', 4000))
+    # max_tokens で出力が途切れた場合に続きを生成する回数の上限（0で無効）
+    LLM_MAX_CONTINUATIONS = int(os.getenv('LLM_MAX_CONTINUATIONS', 2))
+    # Agent2（文体調整）の実行方法
+    # auto: 機械的な書き換え後も違反が残る場合のみ呼ぶ / sections: 違反のある部分だけを並列に調整する
+    # always: 常に記事全体を調整する / skip: 呼ばない
+    AGENT2_MODE = os.getenv('AGENT2_MODE', 'auto')
+    AGENT2_PART_CONCURRENCY = int(os.getenv('AGENT2_PART_CONCURRENCY', 4))  # sections の同時呼び出し数
+
+    # 長い記事（length_class=long）の分割生成（構成を作成してからセクションごとに並列生成する）
+    AGENT1_FANOUT_LONG = os.getenv('AGENT1_FANOUT_LONG', 'false').lower() == 'true'
+    AGENT1_FANOUT_CONCURRENCY = int(os.getenv('AGENT1_FANOUT_CONCURRENCY', 5))
+    LLM_AGENT1_OUTLINE_MAX_TOKENS = int(os.getenv('LLM_AGENT1_OUTLINE_MAX_TOKENS', 2000))
+    LLM_AGENT1_SECTION_MAX_TOKENS = int(os.getenv('LLM_AGENT1_SECTION_MAX_TOKENS', 3000))
+
+    # LLM HTTPコネクションプール設定（ワーカープロセスごと）
+    LLM_HTTP_MAX_CONNECTIONS = int(os.getenv('LLM_HTTP_MAX_CONNECTIONS', 20))
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS', 10))
+    LLM_HTTP_KEEPALIVE_EXPIRY = float(os.getenv('LLM_HTTP_KEEPALIVE_EXPIRY', 60.0))
+    LLM_HTTP_CONNECT_TIMEOUT = float(os.getenv('LLM_HTTP_CONNECT_TIMEOUT', 5.0))
+    LLM_HTTP_READ_TIMEOUT = float(os.getenv('LLM_HTTP_READ_TIMEOUT', 120.0))
+
+    # Anthropicプロンプトキャッシュ（システムプロンプトをキャッシュ対象にする）
+    LLM_PROMPT_CACHING = os.getenv('LLM_PROMPT_CACHING', 'true').lower() == 'true'
+
+    # LLM呼び出しの再試行設定
+    LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 4))
+    LLM_RETRY_BASE_SECONDS = float(os.getenv('LLM_RETRY_BASE_SECONDS', 1.0))
+    LLM_RETRY_MAX_SECONDS = float(os.getenv('LLM_RETRY_MAX_SECONDS', 20.0))
+    # 1リクエスト（Agent1〜Agent2）全体の処理時間上限（gunicornの --timeout より短くする）
+    LLM_REQUEST_DEADLINE_SECONDS = float(os.getenv('LLM_REQUEST_DEADLINE_SECONDS', 110.0))
+
+    # フェイルオーバー先のLLM（未設定の場合はフェイルオーバーしない）
+    LLM_FALLBACK_PROVIDER = os.getenv('LLM_FALLBACK_PROVIDER', '')  # claude / openai
+    LLM_FALLBACK_API_KEY = os.getenv('LLM_FALLBACK_API_KEY')
+    LLM_FALLBACK_MODEL_AGENT1 = os.getenv('LLM_FALLBACK_MODEL_AGENT1', '')
+    LLM_FALLBACK_MODEL_AGENT2 = os.getenv('LLM_FALLBACK_MODEL_AGENT2', '')
+
+    # サーキットブレーカー設定（プロバイダ・モデルごと）
+    LLM_CIRCUIT_WINDOW_SECONDS = float(os.getenv('LLM_CIRCUIT_WINDOW_SECONDS', 60.0))  # エラー率・レイテンシの集計期間
+    LLM_CIRCUIT_MIN_REQUESTS = int(os.getenv('LLM_CIRCUIT_MIN_REQUESTS', 5))  # 判定に必要な最小リクエスト数
+    LLM_CIRCUIT_FAILURE_RATE = float(os.getenv('LLM_CIRCUIT_FAILURE_RATE', 0.5))  # この割合以上の失敗で遮断
+    LLM_CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv('LLM_CIRCUIT_SLOW_CALL_SECONDS', 60.0))  # これより遅い応答は失敗扱い
+    LLM_CIRCUIT_OPEN_SECONDS = float(os.getenv('LLM_CIRCUIT_OPEN_SECONDS', 30.0))  # 遮断後、試行を再開するまでの秒数
+
+    # Agent1のヘッジリクエスト（最初のトークンが遅い場合に同じリクエストをもう1本送り、先に終わった方を使う）
+    LLM_HEDGE_AGENT1 = os.getenv('LLM_HEDGE_AGENT1', 'false').lower() == 'true'
+    LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 0.9))  # 最初のトークンまでの時間のこの分位点を待ってから送る
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_DEFAULT_DELAY_SECONDS', 10.0))  # 計測値が少ない間の待ち時間
+    LLM_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('LLM_HEDGE_MIN_DELAY_SECONDS', 2.0))
+    LLM_HEDGE_MODEL_AGENT1 = os.getenv('LLM_HEDGE_MODEL_AGENT1', '')  # 未設定の場合は同じモデルを別コネクションで呼ぶ
+    LLM_HEDGE_BUDGET_RATIO = float(os.getenv('LLM_HEDGE_BUDGET_RATIO', 0.05))  # 月次トークン上限のうちヘッジに使える割合
 
     # Google Sheets設定
     GOOGLE_SHEETS_SPREADSHEET_ID = os.getenv('GOOGLE_SHEETS_SPREADSHEET_ID')
@@ -31,10 +82,65 @@ class Config:
     GOOGLE_APPLICATION_CREDENTIALS = os.getenv('GOOGLE_APPLICATION_CREDENTIALS', 'credentials.json')
     GOOGLE_APPLICATION_CREDENTIALS_JSON = os.getenv('GOOGLE_APPLICATION_CREDENTIALS_JSON')  # Base64エンコードされたJSON
 
+    # Google Sheets 書き込みキュー（write-behind）設定
+    GSHEET_WRITE_BEHIND = os.getenv('GSHEET_WRITE_BEHIND', 'true').lower() == 'true'
+    GSHEET_WRITE_BATCH_SIZE = int(os.getenv('GSHEET_WRITE_BATCH_SIZE', 20))
+    GSHEET_WRITE_FLUSH_SECONDS = float(os.getenv('GSHEET_WRITE_FLUSH_SECONDS', 2.0))
+    GSHEET_WRITE_MAX_RETRIES = int(os.getenv('GSHEET_WRITE_MAX_RETRIES', 5))
+
+    # 月次トークン集計をシートと突き合わせる間隔（秒）
+    TOKEN_COUNTER_RECONCILE_SECONDS = int(os.getenv('TOKEN_COUNTER_RECONCILE_SECONDS', 300))
+
+    # ローカルデータ（SQLite等）の保存先
+    LOCAL_DATA_DIR = os.getenv('LOCAL_DATA_DIR', 'data')
+
+    # ローカルログストア（Note_LogsのSQLiteミラー）
+    LOG_STORE_PATH = os.getenv('LOG_STORE_PATH', os.path.join(LOCAL_DATA_DIR, 'note_logs.sqlite3'))
+
+    # トークン予約台帳（月次上限の判定をワーカープロセス間で共有する）
+    TOKEN_LEDGER_PATH = os.getenv('TOKEN_LEDGER_PATH', os.path.join(LOCAL_DATA_DIR, 'token_ledger.sqlite3'))
+    TOKEN_RESERVATION_TTL_SECONDS = int(os.getenv('TOKEN_RESERVATION_TTL_SECONDS', 900))  # 確定・解放されない予約の有効期限
+
+    # トークン使用量の推定（生成ログの total_tokens から学習する）
+    TOKEN_ESTIMATE_QUANTILE = float(os.getenv('TOKEN_ESTIMATE_QUANTILE', 0.9))  # 予約に使う分位点
+    TOKEN_ESTIMATE_MIN_SAMPLES = int(os.getenv('TOKEN_ESTIMATE_MIN_SAMPLES', 10))  # 学習結果を使うのに必要な件数
+    TOKEN_ESTIMATE_REFRESH_SECONDS = int(os.getenv('TOKEN_ESTIMATE_REFRESH_SECONDS', 30))  # 他のワーカーのログを取り込む間隔
+
+    # 非同期ジョブ設定
+    JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', os.path.join(LOCAL_DATA_DIR, 'jobs.sqlite3'))
+    JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', 2))  # ワーカープロセスごとの同時実行数
+    JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 20))  # ワーカープロセスごとの受付上限（実行中を含む）
+    JOB_ASYNC_LLM = os.getenv('JOB_ASYNC_LLM', 'true').lower() == 'true'  # ジョブをasyncioのイベントループで実行する
+    # /api/v1/notes/generate をasyncioのイベントループで実行する（ヘッジ有効時・cache: "reuse" はスレッド版）
+    GENERATE_ASYNC_LLM = os.getenv('GENERATE_ASYNC_LLM', 'true').lower() == 'true'
+
+    # 生成パイプラインの受付制御（ワーカープロセスごと。UI > API > ジョブ の優先度で待ち行列から実行する）
+    ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 4))  # 同時実行数（0の場合は制限しない）
+    ADMISSION_MAX_QUEUE = int(os.getenv('ADMISSION_MAX_QUEUE', 16))  # 待ち行列の上限（満杯時は低優先度から打ち切る）
+    ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv('ADMISSION_QUEUE_TIMEOUT_SECONDS', 60))
+
+    # 一括生成（/api/v1/notes/batch）
+    BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 20))  # 1リクエストで受け付ける件数の上限
+    BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', 3))  # 1バッチ内の同時生成数（実行枠の制限も受ける）
+    BATCH_SYNC_MAX_ITEMS = int(os.getenv('BATCH_SYNC_MAX_ITEMS', 3))  # NDJSONを指定しない場合の件数の上限
+
+    # 生成結果キャッシュ（cache: "reuse" 指定時に同一リクエストの結果を再利用）
+    RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', os.path.join(LOCAL_DATA_DIR, 'result_cache.sqlite3'))
+    RESULT_CACHE_TTL_SECONDS = int(os.getenv('RESULT_CACHE_TTL_SECONDS', 86400))
+    RESULT_CACHE_MAX_ENTRIES = int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 500))
+
     # アプリケーション設定
     ADMIN_API_KEY = os.getenv('ADMIN_API_KEY', 'change_me')
     MONTHLY_TOKEN_LIMIT = int(os.getenv('MONTHLY_TOKEN_LIMIT', 300000))
 
+    # APIキー認証（/api/v1/notes/* に X-API-Key ヘッダーを要求し、キーごとに頻度・月次トークンを制限する）
+    API_AUTH_ENABLED = os.getenv('API_AUTH_ENABLED', 'false').lower() == 'true'
+    API_KEYS = os.getenv('API_KEYS', '')  # 名前=キー[:毎分リクエスト数:月次トークン上限] のカンマ区切り
+    API_KEY_RATE_PER_MINUTE = float(os.getenv('API_KEY_RATE_PER_MINUTE', 10))
+    API_KEY_BURST = int(os.getenv('API_KEY_BURST', 5))
+    API_KEY_MONTHLY_TOKEN_LIMIT = int(os.getenv('API_KEY_MONTHLY_TOKEN_LIMIT', 100000))  # 0の場合はキーごとの上限なし
+    API_RATE_LIMIT_PATH = os.getenv('API_RATE_LIMIT_PATH', os.path.join(LOCAL_DATA_DIR, 'api_rate_limit.sqlite3'))
+
     # バージョン
     VERSION = '1.0.0'
 
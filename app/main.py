@@ -33,6 +33,14 @@ def create_app():
     app.register_blueprint(notes_bp)
     app.register_blueprint(ui_bp)
 
+    # CLIコマンド
+    @app.cli.command('backfill-logs')
+    def backfill_logs():
+        """Google SheetsのNote_Logsをローカルログストアに取り込む"""
+        from app.clients.gsheet_client import get_gsheet_client
+        from app.clients.log_store import get_log_store
+        get_log_store().backfill_from_sheet(get_gsheet_client())
+
     # アプリケーション起動ログ
     @app.before_request
     def log_request_info():
@@ -62,6 +70,10 @@ if __name__ == '__main__':
     print('📋 API エンドポイント:')
     print(f'  - GET  http://localhost:{config.PORT}/api/v1/health')
     print(f'  - POST http://localhost:{config.PORT}/api/v1/notes/generate')
+    print(f'  - POST http://localhost:{config.PORT}/api/v1/notes/generate/stream')
+    print(f'  - POST http://localhost:{config.PORT}/api/v1/notes/batch')
+    print(f'  - POST http://localhost:{config.PORT}/api/v1/notes/jobs')
+    print(f'  - GET  http://localhost:{config.PORT}/api/v1/notes/jobs/<job_id>')
     print(f'  - GET  http://localhost:{config.PORT}/api/v1/notes')
     print()
     print('🖥️  Web UI:')
@@ -8,11 +8,12 @@ from flask import jsonify
 class APIError(Exception):
     """API基底エラークラス"""
 
-    def __init__(self, code, message, details=None, status_code=400):
+    def __init__(self, code, message, details=None, status_code=400, retry_after=None):
         self.code = code
         self.message = message
         self.details = details or {}
         self.status_code = status_code
+        self.retry_after = retry_after  # 秒数（指定時はRetry-Afterヘッダーを付与）
         super().__init__(self.message)
 
     def to_dict(self):
@@ -29,6 +30,8 @@ class APIError(Exception):
         """Flaskレスポンスに変換"""
         response = jsonify(self.to_dict())
         response.status_code = self.status_code
+        if self.retry_after is not None:
+            response.headers['Retry-After'] = str(int(self.retry_after))
         return response
 
 
@@ -47,12 +50,13 @@ class ValidationError(APIError):
 class TokenLimitExceededError(APIError):
     """トークン上限超過エラー"""
 
-    def __init__(self, message='月次トークン上限を超過しています', details=None):
+    def __init__(self, message='月次トークン上限を超過しています', details=None, retry_after=None):
         super().__init__(
             code='TOKEN_LIMIT_EXCEEDED',
             message=message,
             details=details,
-            status_code=429
+            status_code=429,
+            retry_after=retry_after
         )
 
 
@@ -68,6 +72,70 @@ class UnauthorizedError(APIError):
         )
 
 
+class NotFoundError(APIError):
+    """リソース未検出エラー"""
+
+    def __init__(self, message='指定されたリソースが見つかりません', details=None):
+        super().__init__(
+            code='NOT_FOUND',
+            message=message,
+            details=details,
+            status_code=404
+        )
+
+
+class ServiceBusyError(APIError):
+    """受付上限超過エラー（混雑時）"""
+
+    def __init__(self, message='現在混雑しています。しばらくしてから再度お試しください', details=None,
+                 retry_after=None):
+        super().__init__(
+            code='SERVICE_BUSY',
+            message=message,
+            details=details,
+            status_code=503,
+            retry_after=retry_after
+        )
+
+
+class LLMUnavailableError(APIError):
+    """LLMプロバイダ利用不可エラー（再試行しても応答が得られない）"""
+
+    def __init__(self, message='LLMサービスが混雑しています。しばらくしてから再度お試しください', details=None,
+                 retry_after=None):
+        super().__init__(
+            code='LLM_UNAVAILABLE',
+            message=message,
+            details=details,
+            status_code=503,
+            retry_after=retry_after
+        )
+
+
+class LLMResponseError(APIError):
+    """LLMの応答が記事として扱えないエラー（拒否・本文なしの応答など。再試行しても同じ結果になりうる）"""
+
+    def __init__(self, message='LLMから記事の本文が返されませんでした', details=None):
+        super().__init__(
+            code='LLM_INVALID_RESPONSE',
+            message=message,
+            details=details,
+            status_code=502
+        )
+
+
+class DeadlineExceededError(APIError):
+    """処理時間上限超過エラー"""
+
+    def __init__(self, message='記事生成が制限時間内に完了しませんでした', details=None):
+        super().__init__(
+            code='DEADLINE_EXCEEDED',
+            message=message,
+            details=details,
+            status_code=504
+        )
+
+
 class InternalError(APIError):
     """内部エラー"""
 
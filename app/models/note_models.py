@@ -2,6 +2,7 @@
 データモデル定義
 note記事生成のリクエスト・レスポンスモデル
 """
+import secrets
 from dataclasses import dataclass, asdict
 from typing import List, Dict, Optional
 from datetime import datetime
@@ -17,6 +18,8 @@ class GenerateNoteRequest:
     length_class: str  # short / middle / long
     temperature: float  # 0.0〜2.0
     intensity_level: int  # 1〜10
+    cache: str = 'bypass'  # reuse（同一内容の生成結果を再利用）/ bypass
+    api_key: Optional[str] = None  # リクエスト元のAPIキー名（キーごとのトークン使用量の計上先）
 
     def validate(self):
         """バリデーション"""
@@ -44,6 +47,11 @@ class GenerateNoteRequest:
         if self.length_class not in valid_length_classes:
             errors.append(f'length_class は {", ".join(valid_length_classes)} のいずれかを指定してください')
 
+        # キャッシュ指定チェック
+        valid_cache_modes = ['reuse', 'bypass']
+        if self.cache not in valid_cache_modes:
+            errors.append(f'cache は {", ".join(valid_cache_modes)} のいずれかを指定してください')
+
         return errors
 
 
@@ -63,6 +71,9 @@ class TokenUsage:
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    cache_creation_input_tokens: int = 0  # プロンプトキャッシュ書き込み分（prompt_tokensの内数）
+    cache_read_input_tokens: int = 0  # プロンプトキャッシュ読み込み分（prompt_tokensの内数）
+    hedge_tokens: int = 0  # ヘッジリクエストで打ち切った呼び出しの推定トークン数（total_tokensの内数）
 
     def to_dict(self):
         return asdict(self)
@@ -145,6 +156,11 @@ class NoteLogEntry:
 
 
 def generate_note_id():
-    """ユニークなnote_idを生成"""
+    """
+    ユニークなnote_idを生成
+
+    時刻（ミリ秒）の後にランダムな接尾辞を付ける（同じミリ秒に別のワーカープロセスや
+    別のインスタンスで生成しても重複させず、ログの上書きを防ぐため）
+    """
     now = datetime.now()
-    return f"note_{now.strftime('%Y%m%d_%H%M%S')}_{now.microsecond // 1000:03d}"
+    return f"note_{now.strftime('%Y%m%d_%H%M%S')}_{now.microsecond // 1000:03d}_{secrets.token_hex(4)}"
@@ -2,8 +2,9 @@
 ヘルスチェックAPI
 アプリケーションの稼働状況を確認するエンドポイント
 """
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from app.config import get_config
+from app.models.errors import APIError
 
 # Blueprintの作成
 health_bp = Blueprint('health', __name__)
@@ -23,3 +24,49 @@ def health_check():
         'status': 'ok',
         'version': config.VERSION
     }), 200
+
+
+@health_bp.route('/api/v1/metrics', methods=['GET'])
+def metrics():
+    """
+    稼働メトリクス
+
+    API_AUTH_ENABLED 有効時は管理用APIキー（ADMIN_API_KEY）が必要。
+    未作成のクライアント・サービスは作成せず null を返す（ジョブの引き継ぎなどを起動しない）
+
+    Returns:
+        JSON: LLMコネクションプールなどの利用状況
+    """
+    from app.clients.llm_client_registry import get_llm_client_registry_stats
+    from app.clients.llm_router import get_llm_router_stats
+    from app.clients.llm_hedge import get_hedge_stats
+    from app.clients.llm_async import get_llm_event_loop_stats
+    from app.clients.gsheet_client import get_gsheet_header_status
+    from app.clients.gsheet_writer import get_gsheet_writer_stats
+    from app.clients.result_cache import get_result_cache_stats
+    from app.clients.token_estimator import get_token_estimator_stats
+    from app.services.job_service import get_job_service_stats
+    from app.services.api_key_service import get_api_key_service, get_api_key_service_stats
+    from app.services.admission_controller import get_admission_controller_stats
+
+    try:
+        get_api_key_service().authenticate_admin(request.headers)
+    except APIError as e:
+        return e.to_response()
+
+    body = {
+        'llm_clients': get_llm_client_registry_stats(),
+        'llm_router': get_llm_router_stats(),
+        'llm_hedge': get_hedge_stats(),
+        'llm_event_loop': get_llm_event_loop_stats(),
+        'gsheet_header': get_gsheet_header_status(),
+        'gsheet_writer': get_gsheet_writer_stats(),
+        'jobs': get_job_service_stats(),
+        'result_cache': get_result_cache_stats(),
+        'token_estimator': get_token_estimator_stats(),
+        'admission': get_admission_controller_stats()
+    }
+    # キー名・キーごとの使用量は管理用APIキーで認証した場合のみ返す
+    if config.API_AUTH_ENABLED:
+        body['api_keys'] = get_api_key_service_stats()
+    return jsonify(body), 200
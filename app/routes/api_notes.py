@@ -2,15 +2,53 @@
 Note API
 記事生成・履歴取得のエンドポイント
 """
-from flask import Blueprint, request, jsonify
-from app.services.note_service import NoteService
-from app.models.errors import ValidationError, TokenLimitExceededError
+import json
+from flask import Blueprint, Response, g, request, jsonify, stream_with_context
+from app.config import get_config
+from app.clients.llm_async import get_llm_event_loop
+from app.services.note_service import get_note_service
+from app.services.job_service import get_job_service
+from app.services.batch_service import get_batch_service
+from app.services.history_service import HistoryService
+from app.services.api_key_service import get_api_key_service
+from app.models.errors import APIError, ValidationError, TokenLimitExceededError
+
+config = get_config()
 
 # Blueprintの作成
 notes_bp = Blueprint('notes', __name__)
 
-# サービスのインスタンス化
-note_service = NoteService()
+@notes_bp.before_request
+def authenticate_api_key():
+    """
+    APIキー認証（API_AUTH_ENABLED 有効時）
+
+    生成リクエスト（POST）はキーごとの月次トークン上限・リクエスト頻度も判定し、
+    超過時はGoogle Sheetsを参照せずに429を返す（一括生成は件数分をリクエスト頻度に数える）
+    """
+    try:
+        service = get_api_key_service()
+        g.api_key = service.authenticate(request.headers)
+        if request.method == 'POST':
+            service.admit(g.api_key, cost=_request_cost())
+    except APIError as e:
+        return e.to_response()
+
+
+def _request_cost() -> int:
+    """リクエスト頻度の上限に数える回数（一括生成は items の件数、それ以外は1）"""
+    if request.endpoint != 'notes.generate_note_batch':
+        return 1
+    request_data = request.get_json(silent=True)
+    items = request_data.get('items') if isinstance(request_data, dict) else None
+    return max(1, len(items)) if isinstance(items, list) else 1
+
+
+def _attach_api_key(request_data: dict) -> dict:
+    """認証したAPIキー名をリクエストに設定（トークン使用量の計上先。本文の指定は使わない）"""
+    api_key = g.get('api_key')
+    request_data['api_key'] = api_key.name if api_key is not None else None
+    return request_data
 
 
 @notes_bp.route('/api/v1/notes/generate', methods=['POST'])
@@ -43,7 +81,7 @@ def generate_note():
             )
 
         # 記事生成
-        response = note_service.generate_note(request_data)
+        response = _generate(_attach_api_key(request_data))
 
         # レスポンス返却
         return jsonify(response.to_dict()), 200
@@ -52,6 +90,9 @@ def generate_note():
         return e.to_response()
     except TokenLimitExceededError as e:
         return e.to_response()
+    except APIError as e:
+        # LLM利用不可・実行枠の待ち行列が満杯（503）・処理時間上限超過（504）など
+        return e.to_response()
     except Exception as e:
         # 予期しないエラー
         from app.models.errors import InternalError
@@ -62,36 +103,244 @@ def generate_note():
         return error.to_response()
 
 
+def _generate(request_data: dict):
+    """
+    記事を生成
+
+    GENERATE_ASYNC_LLM 有効時はLLM呼び出し用イベントループで非同期クライアントを使って生成し、完了を待つ。
+    asyncio版が行わないAgent1のヘッジ・同一リクエストの待ち合わせ（cache: "reuse"）が必要な場合はスレッド版で生成する
+
+    Args:
+        request_data: リクエストデータ
+
+    Returns:
+        GenerateNoteResponse: 生成結果
+    """
+    if config.GENERATE_ASYNC_LLM and not config.LLM_HEDGE_AGENT1 and request_data.get('cache') != 'reuse':
+        return get_llm_event_loop().run(get_note_service().agenerate_note(request_data))
+    return get_note_service().generate_note(request_data)
+
+
+@notes_bp.route('/api/v1/notes/generate/stream', methods=['POST'])
+def generate_note_stream():
+    """
+    記事生成エンドポイント（Server-Sent Events）
+
+    Request Body:
+        /api/v1/notes/generate と同じ
+
+    Returns:
+        text/event-stream: 進捗イベント（validated, agent1_started, agent1_delta,
+            agent1_done, agent2_started, agent2_delta, agent2_done, agent2_skipped, saved）と
+            最終結果の result イベント（/api/v1/notes/generate のレスポンスと同じ内容）
+    """
+    try:
+        request_data = request.get_json()
+
+        if not request_data:
+            raise ValidationError(
+                message='リクエストボディが必要です',
+                details={}
+            )
+
+        # バリデーション・トークンチェックはストリーム開始前に行い、通常のエラーレスポンスを返す
+        events = get_note_service().generate_note_stream(_attach_api_key(request_data))
+
+    except ValidationError as e:
+        return e.to_response()
+    except TokenLimitExceededError as e:
+        return e.to_response()
+    except APIError as e:
+        # 実行枠の待ち行列が満杯（503 + Retry-After）など
+        return e.to_response()
+    except Exception as e:
+        from app.models.errors import InternalError
+        error = InternalError(
+            message='予期しないエラーが発生しました',
+            details={'error': str(e)}
+        )
+        return error.to_response()
+
+    def event_stream():
+        for event, data in events:
+            yield _format_sse(event, data)
+
+    return Response(
+        stream_with_context(event_stream()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+def _format_sse(event: str, data: dict) -> str:
+    """
+    Server-Sent Eventsの1イベント分の文字列を生成
+
+    Args:
+        event: イベント名
+        data: イベントデータ
+
+    Returns:
+        str: SSE形式の文字列
+    """
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@notes_bp.route('/api/v1/notes/batch', methods=['POST'])
+def generate_note_batch():
+    """
+    記事一括生成エンドポイント
+
+    全件のバリデーションとバッチ全体のトークン予約を生成前に行い、生成ログはまとめて保存する
+
+    Request Body:
+        {
+            "items": [/api/v1/notes/generate と同じリクエスト, ...]
+        }
+
+    Query Parameters:
+        stream: true の場合（または Accept: application/x-ndjson）、完了した順に1件ずつ返す
+
+    Returns:
+        JSON: items（リクエストの順の結果）と summary
+        application/x-ndjson: 1行1件の結果（type: "item"）と最終行の集計（type: "summary"）
+    """
+    try:
+        request_data = request.get_json()
+
+        if not request_data:
+            raise ValidationError(
+                message='リクエストボディが必要です',
+                details={}
+            )
+
+        batch_service = get_batch_service()
+        batch = batch_service.prepare(_attach_api_key(request_data))
+
+        if not _wants_ndjson():
+            return jsonify(batch_service.generate_batch(batch)), 200
+
+        # 予約はストリーム開始前に行い、上限超過は通常のエラーレスポンスで返す
+        results = batch_service.stream(batch)
+
+    except APIError as e:
+        return e.to_response()
+    except Exception as e:
+        from app.models.errors import InternalError
+        error = InternalError(
+            message='予期しないエラーが発生しました',
+            details={'error': str(e)}
+        )
+        return error.to_response()
+
+    def ndjson_stream():
+        items = []
+        for item in results:
+            items.append(item)
+            yield json.dumps(dict(item, type='item'), ensure_ascii=False) + '\n'
+        yield json.dumps(dict(batch_service.summarize(items), type='summary'), ensure_ascii=False) + '\n'
+
+    return Response(
+        stream_with_context(ndjson_stream()),
+        mimetype='application/x-ndjson',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+
+def _wants_ndjson() -> bool:
+    """一括生成の結果をNDJSONで逐次返すか"""
+    if request.args.get('stream', '').lower() == 'true':
+        return True
+    return request.accept_mimetypes.best == 'application/x-ndjson'
+
+
+@notes_bp.route('/api/v1/notes/jobs', methods=['POST'])
+def create_note_job():
+    """
+    記事生成ジョブ登録エンドポイント
+
+    生成はバックグラウンドで実行し、ジョブIDを即座に返す
+
+    Request Body:
+        /api/v1/notes/generate と同じ
+
+    Returns:
+        JSON: 登録したジョブ（202 Accepted、Locationヘッダーにジョブ取得URL）
+    """
+    try:
+        request_data = request.get_json()
+
+        if not request_data:
+            raise ValidationError(
+                message='リクエストボディが必要です',
+                details={}
+            )
+
+        job = get_job_service().submit(_attach_api_key(request_data))
+
+        status_url = f"/api/v1/notes/jobs/{job['job_id']}"
+        body = dict(job, status_url=status_url)
+        return jsonify(body), 202, {'Location': status_url}
+
+    except APIError as e:
+        return e.to_response()
+    except Exception as e:
+        from app.models.errors import InternalError
+        error = InternalError(
+            message='予期しないエラーが発生しました',
+            details={'error': str(e)}
+        )
+        return error.to_response()
+
+
+@notes_bp.route('/api/v1/notes/jobs/<job_id>', methods=['GET'])
+def get_note_job(job_id):
+    """
+    記事生成ジョブ取得エンドポイント
+
+    Returns:
+        JSON: ジョブのステータス・現在の処理段階・生成結果
+    """
+    try:
+        job = get_job_service().get_job(job_id)
+        return jsonify(job), 200
+
+    except APIError as e:
+        return e.to_response()
+
+
 @notes_bp.route('/api/v1/notes', methods=['GET'])
 def list_notes():
     """
     記事履歴一覧取得エンドポイント
 
+    Query Parameters:
+        limit: 取得件数（1〜100、既定20）
+        cursor: 前回レスポンスの next_cursor
+        article_type: 記事タイプで絞り込み
+        length_class: 長さクラスで絞り込み
+        from / to: 作成日時の範囲（ISO形式）
+        fields: 取得する列（カンマ区切り）
+
     Returns:
-        JSON: 記事履歴
-    """
-    # TODO: Google Sheets から履歴を取得する実装
-    # v1ではダミーデータを返す
-
-    dummy_data = {
-        'items': [
-            {
-                'note_id': 'note_20251115_0001',
-                'title': 'サンプル記事1',
-                'created_at': '2025-11-15T12:34:56Z',
-                'article_type': 'education',
-                'intensity_level': 7,
-                'total_tokens': 3000
-            },
-            {
-                'note_id': 'note_20251115_0002',
-                'title': 'サンプル記事2',
-                'created_at': '2025-11-15T13:45:12Z',
-                'article_type': 'story',
-                'intensity_level': 5,
-                'total_tokens': 2500
-            }
-        ]
-    }
-
-    return jsonify(dummy_data), 200
+        JSON: 記事履歴（items）と次ページのカーソル（next_cursor）
+    """
+    try:
+        result = HistoryService().list_notes(request.args.to_dict())
+        return jsonify(result), 200
+
+    except APIError as e:
+        return e.to_response()
+    except Exception as e:
+        from app.models.errors import InternalError
+        error = InternalError(
+            message='予期しないエラーが発生しました',
+            details={'error': str(e)}
+        )
+        return error.to_response()
@@ -3,11 +3,11 @@ UI ページルーティング
 記事生成フォームと履歴表示
 """
 from flask import Blueprint, render_template, request, redirect, url_for, flash
-from app.services.note_service import NoteService
+from app.services.note_service import get_note_service
+from app.services.admission_controller import PRIORITY_UI
 from app.models.errors import ValidationError, TokenLimitExceededError
 
 ui_bp = Blueprint('ui', __name__)
-note_service = NoteService()
 
 
 @ui_bp.route('/ui/notes/new', methods=['GET'])
@@ -28,11 +28,14 @@ def notes_create():
             'article_type': request.form.get('article_type', 'education'),
             'length_class': request.form.get('length_class', 'middle'),
             'temperature': float(request.form.get('temperature', 0.7)),
-            'intensity_level': int(request.form.get('intensity_level', 5))
+            'intensity_level': int(request.form.get('intensity_level', 5)),
+            # フォームの二重送信で同じ記事を再生成しないよう、同一内容の結果を再利用する
+            # （「同じ内容でも新しく生成する」を選んだ場合は再利用しない）
+            'cache': 'bypass' if request.form.get('regenerate') else 'reuse'
         }
 
         # 記事生成
-        response = note_service.generate_note(request_data)
+        response = get_note_service().generate_note(request_data, priority=PRIORITY_UI)
 
         # 成功時は結果表示ページへ
         return render_template('notes_result.html', result=response)
@@ -55,10 +58,14 @@ def notes_create():
 def notes_index():
     """記事履歴一覧"""
     try:
-        # Google Sheetsから最新20件取得
-        from app.clients.gsheet_client import get_gsheet_client
-        gsheet_client = get_gsheet_client()
-        logs = gsheet_client.get_recent_logs(limit=20)
+        # ローカルログストアから最新20件取得（未取り込みの場合はGoogle Sheetsから取得）
+        from app.clients.log_store import get_log_store
+        log_store = get_log_store()
+        if log_store.count() > 0:
+            logs = log_store.get_recent_logs(limit=20)
+        else:
+            from app.clients.gsheet_client import get_gsheet_client
+            logs = get_gsheet_client().get_recent_logs(limit=20)
 
         return render_template('notes_index.html', logs=logs)
 
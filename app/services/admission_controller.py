@@ -0,0 +1,260 @@
+"""
+生成パイプラインの受付制御
+ワーカープロセス内で同時に実行するLLMパイプライン数を制限し、超過分は優先度付きの待ち行列で待たせる。
+待ち行列が満杯の場合は、より優先度の低い待機を打ち切るか、新しいリクエストを即座に拒否する（Retry-After付き）
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from app.config import get_config
+from app.models.errors import ServiceBusyError
+from app.clients.token_estimator import P2Quantile
+
+config = get_config()
+
+# 優先度（値が小さいほど先に実行し、待ち行列が満杯の場合は大きい方から打ち切る）
+PRIORITY_UI = 'ui'
+PRIORITY_API = 'api'
+PRIORITY_BATCH = 'batch'
+PRIORITIES = {PRIORITY_UI: 0, PRIORITY_API: 1, PRIORITY_BATCH: 2}
+
+# パイプラインの平均所要時間（Retry-Afterの見積もり用）の初期値と平滑化係数
+INITIAL_PIPELINE_SECONDS = 30.0
+PIPELINE_SECONDS_SMOOTHING = 0.2
+
+
+class _Waiter:
+    """待ち行列の1件"""
+
+    __slots__ = ('priority', 'rank', 'seq', 'event', 'status', 'enqueued_at')
+
+    def __init__(self, priority: str, seq: int):
+        self.priority = priority
+        self.rank = PRIORITIES[priority]
+        self.seq = seq
+        self.event = threading.Event()
+        self.status = 'waiting'  # waiting / granted / shed
+        self.enqueued_at = time.monotonic()
+
+
+class AdmissionController:
+    """同時実行数の制限と優先度付き待ち行列（スレッドセーフ）"""
+
+    def __init__(self, max_in_flight: int, max_queue: int, queue_timeout: float):
+        """
+        初期化
+
+        Args:
+            max_in_flight: 同時に実行するパイプライン数の上限（0の場合は制限しない）
+            max_queue: 待ち行列の上限
+            queue_timeout: 待ち行列で待つ最大秒数
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._in_flight = 0
+        self._queue: List[_Waiter] = []
+        self._seq = 0
+        self._pipeline_seconds = INITIAL_PIPELINE_SECONDS
+        self._counts = {
+            outcome: {priority: 0 for priority in PRIORITIES}
+            for outcome in ('admitted', 'rejected', 'shed', 'timed_out')
+        }
+        self._wait_count = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._wait_p90 = P2Quantile(0.9)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def slot(self, priority: str = PRIORITY_API, timeout: Optional[float] = None):
+        """
+        実行枠を確保してパイプラインを実行する
+
+        Args:
+            priority: ui / api / batch
+            timeout: 待ち行列で待つ最大秒数（queue_timeout より短い場合のみ有効）
+
+        Raises:
+            ServiceBusyError: 待ち行列が満杯、待機を打ち切られた、または待ち時間の上限を超えた
+        """
+        self.acquire(priority, timeout)
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started_at)
+
+    def acquire(self, priority: str = PRIORITY_API, timeout: Optional[float] = None) -> float:
+        """
+        実行枠を確保（空きが無い場合は待ち行列で待つ）
+
+        確保した枠は必ず release で返すこと
+
+        Args:
+            priority: ui / api / batch
+            timeout: 待ち行列で待つ最大秒数（queue_timeout より短い場合のみ有効。リクエストのデッドラインの残りなど）
+
+        Returns:
+            float: 待ち時間（秒）
+
+        Raises:
+            ServiceBusyError: 待ち行列が満杯、待機を打ち切られた、または待ち時間の上限を超えた
+        """
+        with self._lock:
+            if self.max_in_flight <= 0 or (self._in_flight < self.max_in_flight and not self._queue):
+                self._in_flight += 1
+                self._record_admitted(priority, 0.0)
+                return 0.0
+
+            if len(self._queue) >= self.max_queue:
+                victim = self._lowest_waiter()
+                if victim is None or victim.rank <= PRIORITIES[priority]:
+                    self._counts['rejected'][priority] += 1
+                    raise self._busy('queue_full')
+                # より優先度の低い待機を打ち切って入れ替える
+                self._queue.remove(victim)
+                victim.status = 'shed'
+                victim.event.set()
+                self._counts['shed'][victim.priority] += 1
+
+            self._seq += 1
+            waiter = _Waiter(priority, self._seq)
+            self._queue.append(waiter)
+
+        waiter.event.wait(self.queue_timeout if timeout is None else max(0.0, min(self.queue_timeout, timeout)))
+
+        with self._lock:
+            wait_seconds = time.monotonic() - waiter.enqueued_at
+            if waiter.status == 'granted':
+                self._record_admitted(priority, wait_seconds)
+                return wait_seconds
+            if waiter.status == 'shed':
+                raise self._busy('shed')
+            self._queue.remove(waiter)
+            self._counts['timed_out'][priority] += 1
+            raise self._busy('queue_timeout')
+
+    def release(self, pipeline_seconds: Optional[float] = None):
+        """
+        実行枠を返す（待ち行列があれば最も優先度の高い待機に引き継ぐ）
+
+        Args:
+            pipeline_seconds: パイプラインの所要時間（Retry-Afterの見積もりに使う）
+        """
+        with self._lock:
+            if pipeline_seconds is not None:
+                self._pipeline_seconds += PIPELINE_SECONDS_SMOOTHING * (pipeline_seconds - self._pipeline_seconds)
+
+            if self._queue:
+                waiter = min(self._queue, key=lambda w: (w.rank, w.seq))
+                self._queue.remove(waiter)
+                waiter.status = 'granted'
+                waiter.event.set()
+            else:
+                self._in_flight = max(0, self._in_flight - 1)
+
+    def check(self, priority: str = PRIORITY_API):
+        """
+        待たずに拒否されるリクエストかを判定（ストリーミングの応答開始前の確認用、枠は確保しない）
+
+        Args:
+            priority: ui / api / batch
+
+        Raises:
+            ServiceBusyError: 待ち行列が満杯で、打ち切れる低優先度の待機も無い
+        """
+        with self._lock:
+            if self.max_in_flight <= 0 or self._in_flight < self.max_in_flight or len(self._queue) < self.max_queue:
+                return
+            victim = self._lowest_waiter()
+            if victim is None or victim.rank <= PRIORITIES[priority]:
+                self._counts['rejected'][priority] += 1
+                raise self._busy('queue_full')
+
+    def _lowest_waiter(self) -> Optional[_Waiter]:
+        """打ち切り候補（最も優先度が低く、最も新しい待機）"""
+        if not self._queue:
+            return None
+        return max(self._queue, key=lambda w: (w.rank, w.seq))
+
+    def _record_admitted(self, priority: str, wait_seconds: float):
+        self._counts['admitted'][priority] += 1
+        self._wait_count += 1
+        self._wait_total += wait_seconds
+        self._wait_max = max(self._wait_max, wait_seconds)
+        self._wait_p90.add(wait_seconds)
+
+    def _busy(self, reason: str) -> ServiceBusyError:
+        """混雑エラー（Retry-Afterは待ち行列が捌けるまでの見積もり）"""
+        slots = max(1, self.max_in_flight)
+        retry_after = self._pipeline_seconds * (len(self._queue) + 1) / slots
+        return ServiceBusyError(
+            details={
+                'reason': reason,
+                'in_flight': self._in_flight,
+                'queue_depth': len(self._queue),
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue
+            },
+            retry_after=min(300, max(1, round(retry_after)))
+        )
+
+    def get_stats(self) -> Dict:
+        """
+        統計を取得
+
+        Returns:
+            Dict: in_flight, queue_depth（優先度ごと）, admitted / rejected / shed / timed_out（優先度ごと）,
+                  wait_seconds（avg / p90 / max）, pipeline_seconds（平均所要時間の推定）
+        """
+        with self._lock:
+            queue_depth = {priority: 0 for priority in PRIORITIES}
+            for waiter in self._queue:
+                queue_depth[waiter.priority] += 1
+            return {
+                'max_in_flight': self.max_in_flight,
+                'max_queue': self.max_queue,
+                'in_flight': self._in_flight,
+                'queue_depth': queue_depth,
+                **{outcome: dict(counts) for outcome, counts in self._counts.items()},
+                'wait_seconds': {
+                    'avg': round(self._wait_total / self._wait_count, 3) if self._wait_count else 0.0,
+                    'p90': round(self._wait_p90.value() or 0.0, 3),
+                    'max': round(self._wait_max, 3)
+                },
+                'pipeline_seconds': round(self._pipeline_seconds, 3)
+            }
+
+
+# シングルトンインスタンス
+_admission_controller_instance: Optional[AdmissionController] = None
+_admission_controller_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    """受付制御のシングルトンインスタンスを取得"""
+    global _admission_controller_instance
+    if _admission_controller_instance is None:
+        with _admission_controller_lock:
+            if _admission_controller_instance is None:
+                _admission_controller_instance = AdmissionController(
+                    max_in_flight=config.ADMISSION_MAX_IN_FLIGHT,
+                    max_queue=config.ADMISSION_MAX_QUEUE,
+                    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT_SECONDS
+                )
+    return _admission_controller_instance
+
+
+def get_admission_controller_stats() -> Optional[dict]:
+    """
+    受付制御の統計を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: AdmissionController.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _admission_controller_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
@@ -0,0 +1,295 @@
+"""
+APIキーサービス
+/api/v1/notes/* のAPIキー認証と、キーごとのリクエスト頻度・月次トークン上限の判定
+（判定はローカルのSQLiteのみで行い、Google Sheetsは参照しない）
+"""
+import hmac
+import math
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, Optional
+from app.config import get_config
+from app.models.errors import UnauthorizedError, TokenLimitExceededError
+from app.clients.rate_limiter import get_rate_limiter
+from app.clients.token_counter import month_key
+from app.clients.token_ledger import get_token_ledger
+
+config = get_config()
+
+# 既定値のままのADMIN_API_KEYは受け付けない
+DEFAULT_ADMIN_API_KEY = 'change_me'
+
+
+@dataclass
+class ApiKey:
+    """APIキーと制限値"""
+    name: str
+    secret: str
+    rate_per_minute: float
+    burst: int
+    monthly_token_limit: int  # 0の場合はキーごとの上限なし
+    unlimited: bool = False  # ADMIN_API_KEY（頻度・キーごとの上限を適用しない）
+
+
+def parse_api_keys(value: str) -> Dict[str, ApiKey]:
+    """
+    API_KEYS の設定を解析
+
+    Args:
+        value: 名前=キー[:毎分リクエスト数:月次トークン上限] のカンマ区切り
+
+    Returns:
+        Dict[str, ApiKey]: キー名 → APIキー（書式が正しくないエントリは警告して無視する）
+    """
+    api_keys = {}
+    for entry in value.split(','):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            name, spec = entry.split('=', 1)
+            parts = spec.split(':')
+            api_key = ApiKey(
+                name=name.strip(),
+                secret=parts[0].strip(),
+                rate_per_minute=float(parts[1]) if len(parts) > 1 and parts[1] else config.API_KEY_RATE_PER_MINUTE,
+                burst=config.API_KEY_BURST,
+                monthly_token_limit=int(parts[2]) if len(parts) > 2 and parts[2] else config.API_KEY_MONTHLY_TOKEN_LIMIT
+            )
+        except ValueError:
+            print(f"⚠️  API_KEYS の書式が正しくないエントリを無視します: {entry.split('=', 1)[0]}")
+            continue
+        if not api_key.name or not api_key.secret:
+            print(f"⚠️  API_KEYS の書式が正しくないエントリを無視します: {api_key.name}")
+            continue
+        api_keys[api_key.name] = api_key
+    return api_keys
+
+
+class ApiKeyService:
+    """APIキー認証・キーごとの制限"""
+
+    def __init__(self):
+        """初期化"""
+        self.enabled = config.API_AUTH_ENABLED
+        self.api_keys = parse_api_keys(config.API_KEYS)
+        if config.ADMIN_API_KEY and config.ADMIN_API_KEY != DEFAULT_ADMIN_API_KEY:
+            self.api_keys['admin'] = ApiKey(
+                name='admin', secret=config.ADMIN_API_KEY, rate_per_minute=0, burst=0,
+                monthly_token_limit=0, unlimited=True
+            )
+        self.rate_limiter = get_rate_limiter()
+        self.token_ledger = get_token_ledger()
+        # 今月の上限に達したキー（キー名 → 月キー）。以降のリクエストは台帳も参照せずに拒否する
+        self._exhausted: Dict[str, str] = {}
+        self._rejections = {'unauthorized': 0, 'rate_limited': 0, 'quota_exceeded': 0}
+        self._lock = threading.Lock()
+
+    def authenticate(self, headers) -> Optional[ApiKey]:
+        """
+        リクエストヘッダーのAPIキーを検証
+
+        Args:
+            headers: リクエストヘッダー（X-API-Key または Authorization: Bearer）
+
+        Returns:
+            Optional[ApiKey]: APIキー（認証が無効な場合はNone）
+
+        Raises:
+            UnauthorizedError: キーが無い、または一致しない
+        """
+        if not self.enabled:
+            return None
+
+        secret = headers.get('X-API-Key', '')
+        authorization = headers.get('Authorization', '')
+        if not secret and authorization.startswith('Bearer '):
+            secret = authorization[len('Bearer '):].strip()
+
+        if secret:
+            for api_key in self.api_keys.values():
+                if hmac.compare_digest(secret.encode(), api_key.secret.encode()):
+                    return api_key
+
+        self._count_rejection('unauthorized')
+        raise UnauthorizedError(
+            message='APIキーが必要です' if not secret else 'APIキーが正しくありません',
+            details={'header': 'X-API-Key'}
+        )
+
+    def authenticate_admin(self, headers) -> Optional[ApiKey]:
+        """
+        管理用APIキー（ADMIN_API_KEY）を検証
+
+        Args:
+            headers: リクエストヘッダー（X-API-Key または Authorization: Bearer）
+
+        Returns:
+            Optional[ApiKey]: 管理用APIキー（認証が無効な場合はNone）
+
+        Raises:
+            UnauthorizedError: 管理用APIキーではない
+        """
+        api_key = self.authenticate(headers)
+        if api_key is not None and not api_key.unlimited:
+            self._count_rejection('unauthorized')
+            raise UnauthorizedError(message='管理用APIキーが必要です', details={'header': 'X-API-Key'})
+        return api_key
+
+    def admit(self, api_key: Optional[ApiKey], cost: int = 1):
+        """
+        生成リクエストを受け付けるか判定（キーごとの月次トークン上限・リクエスト頻度）
+
+        Args:
+            api_key: authenticate で得たAPIキー
+            cost: リクエスト頻度の上限に数える回数（一括生成は件数分）
+
+        Raises:
+            TokenLimitExceededError: 月次トークン上限に達している、またはリクエスト頻度の上限を超えた
+        """
+        if api_key is None or api_key.unlimited:
+            return
+
+        if api_key.monthly_token_limit:
+            if self._exhausted.get(api_key.name) == month_key():
+                self._count_rejection('quota_exceeded')
+                raise self.quota_exceeded(api_key.name, 0)
+            status = self._get_key_status(api_key.name)
+            if status['current_usage'] + status['reserved_tokens'] >= api_key.monthly_token_limit:
+                if status['current_usage'] >= api_key.monthly_token_limit:
+                    # 確定済みの分だけで上限に達している場合は今月中は台帳を参照しない
+                    with self._lock:
+                        self._exhausted[api_key.name] = month_key()
+                self._count_rejection('quota_exceeded')
+                raise self.quota_exceeded(api_key.name, 0, status['current_usage'], status['reserved_tokens'])
+
+        try:
+            wait = self.rate_limiter.acquire(api_key.name, api_key.rate_per_minute / 60, api_key.burst, cost)
+        except Exception as e:
+            # 制限の記録先が利用できない場合は警告のみ
+            print(f"⚠️  リクエスト頻度の判定エラー: {e}")
+            return
+
+        if wait > 0:
+            self._count_rejection('rate_limited')
+            raise TokenLimitExceededError(
+                message='APIキーのリクエスト頻度の上限を超えました',
+                details={
+                    'api_key': api_key.name,
+                    'rate_per_minute': api_key.rate_per_minute,
+                    'burst': api_key.burst
+                },
+                retry_after=max(1, math.ceil(min(wait, 3600)))
+            )
+
+    def get_key_limit(self, name: Optional[str]) -> int:
+        """
+        APIキーの月次トークン上限
+
+        Args:
+            name: APIキー名
+
+        Returns:
+            int: 月次トークン上限（上限なし・未登録のキーの場合は0）
+        """
+        api_key = self.api_keys.get(name) if name else None
+        if api_key is None or api_key.unlimited:
+            return 0
+        return api_key.monthly_token_limit
+
+    def quota_exceeded(self, name: str, estimated_tokens: int, current_usage: int = None,
+                       reserved_tokens: int = None) -> TokenLimitExceededError:
+        """
+        キーごとの月次トークン上限超過エラーを生成
+
+        Args:
+            name: APIキー名
+            estimated_tokens: 今回使用予定のトークン数
+            current_usage: キーの今月の確定済み使用量
+            reserved_tokens: キーの予約中のトークン数
+
+        Returns:
+            TokenLimitExceededError: 上限超過エラー（Retry-Afterは翌月までの秒数）
+        """
+        limit = self.get_key_limit(name)
+        details = {'api_key': name, 'monthly_limit': limit, 'estimated_tokens': estimated_tokens}
+        if current_usage is not None:
+            details.update(
+                current_usage=current_usage,
+                reserved_tokens=reserved_tokens,
+                remaining=limit - current_usage - reserved_tokens
+            )
+        return TokenLimitExceededError(
+            message='APIキーの月次トークン上限を超過します',
+            details=details,
+            retry_after=self._seconds_until_next_month()
+        )
+
+    @staticmethod
+    def _seconds_until_next_month() -> int:
+        """翌月1日までの秒数"""
+        now = datetime.now()
+        next_month = datetime(now.year + now.month // 12, now.month % 12 + 1, 1)
+        return max(1, math.ceil((next_month - now).total_seconds()))
+
+    def _get_key_status(self, name: str) -> Dict:
+        """キーの使用量（台帳を参照できない場合は0として扱う）"""
+        try:
+            return self.token_ledger.get_key_status(name)
+        except Exception as e:
+            print(f"⚠️  APIキーの使用量の取得エラー: {e}")
+            return {'current_usage': 0, 'reserved_tokens': 0}
+
+    def _count_rejection(self, reason: str):
+        with self._lock:
+            self._rejections[reason] += 1
+
+    def get_stats(self) -> Dict:
+        """
+        統計を取得
+
+        Returns:
+            Dict: enabled, keys（キーごとの制限値と今月の使用量）, rejections（拒否理由ごとの件数）
+        """
+        keys = {}
+        for api_key in self.api_keys.values():
+            status = self._get_key_status(api_key.name)
+            keys[api_key.name] = {
+                'rate_per_minute': None if api_key.unlimited else api_key.rate_per_minute,
+                'burst': None if api_key.unlimited else api_key.burst,
+                'monthly_token_limit': self.get_key_limit(api_key.name),
+                'current_usage': status['current_usage'],
+                'reserved_tokens': status['reserved_tokens']
+            }
+        with self._lock:
+            rejections = dict(self._rejections)
+        return {'enabled': self.enabled, 'keys': keys, 'rejections': rejections}
+
+
+# シングルトンインスタンス
+_api_key_service_instance: Optional[ApiKeyService] = None
+_api_key_service_lock = threading.Lock()
+
+
+def get_api_key_service() -> ApiKeyService:
+    """APIキーサービスのシングルトンインスタンスを取得"""
+    global _api_key_service_instance
+    if _api_key_service_instance is None:
+        with _api_key_service_lock:
+            if _api_key_service_instance is None:
+                _api_key_service_instance = ApiKeyService()
+    return _api_key_service_instance
+
+
+def get_api_key_service_stats() -> Optional[dict]:
+    """
+    APIキーごとの制限値・使用量を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: ApiKeyService.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _api_key_service_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
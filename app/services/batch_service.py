@@ -0,0 +1,238 @@
+"""
+一括生成サービス
+複数の記事生成リクエストをまとめて受け付け、バリデーションとトークン予約を1回で行ってから
+同時実行数を制限して生成し、ログはまとめて保存する
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from app.config import get_config
+from app.models.note_models import GenerateNoteRequest, GenerateNoteResponse
+from app.models.errors import APIError, ValidationError, DeadlineExceededError, InternalError
+from app.clients.llm_retry import Deadline
+from app.services.admission_controller import PRIORITY_BATCH
+from app.services.note_service import NoteService, get_note_service
+
+config = get_config()
+
+
+class PreparedBatch:
+    """バリデーション済みのバッチ"""
+
+    def __init__(self, requests: List[GenerateNoteRequest], estimates: List[int]):
+        self.requests = requests
+        self.estimates = estimates
+
+    @property
+    def estimated_tokens(self) -> int:
+        return sum(self.estimates)
+
+
+class BatchService:
+    """一括生成サービス"""
+
+    def __init__(self, note_service: Optional[NoteService] = None):
+        """
+        初期化
+
+        Args:
+            note_service: 生成に使うNoteService（省略時は共有のインスタンス）
+        """
+        self.note_service = note_service or get_note_service()
+        self.max_items = config.BATCH_MAX_ITEMS
+        self.sync_max_items = config.BATCH_SYNC_MAX_ITEMS
+        self.max_concurrency = config.BATCH_MAX_CONCURRENCY
+
+    def prepare(self, request_data: dict) -> PreparedBatch:
+        """
+        全件のバリデーションとトークン数の推定
+
+        Args:
+            request_data: {"items": [記事生成リクエスト, ...], "api_key": APIキー名（ルートで設定）}
+
+        Returns:
+            PreparedBatch: generate_batch / stream に渡すバッチ
+
+        Raises:
+            ValidationError: items が不正、またはいずれかのリクエストが不正（errors にインデックスごとの内容）
+        """
+        items = request_data.get('items')
+        if not isinstance(items, list) or not items:
+            raise ValidationError(message='items に1件以上のリクエストを指定してください', details={})
+        if len(items) > self.max_items:
+            raise ValidationError(
+                message=f'items は{self.max_items}件以内で指定してください',
+                details={'max_items': self.max_items, 'items': len(items)}
+            )
+
+        requests = []
+        errors = {}
+        for index, item in enumerate(items):
+            if not isinstance(item, dict):
+                errors[str(index)] = ['リクエストはオブジェクトで指定してください']
+                continue
+            try:
+                requests.append(self.note_service.validate_request(dict(item, api_key=request_data.get('api_key'))))
+            except ValidationError as e:
+                errors[str(index)] = e.details.get('errors', [e.message])
+            except (TypeError, ValueError) as e:
+                errors[str(index)] = [str(e)]
+        if errors:
+            raise ValidationError(message='リクエストのバリデーションに失敗しました', details={'errors': errors})
+
+        return PreparedBatch(requests, [self.note_service.estimate_tokens(request) for request in requests])
+
+    def generate_batch(self, batch: PreparedBatch) -> Dict:
+        """
+        バッチを生成して全件の結果を返す
+
+        1つのHTTPリクエスト内で完了させるため、件数は BATCH_SYNC_MAX_ITEMS まで、
+        全体の処理時間は LLM_REQUEST_DEADLINE_SECONDS までとする（超えた項目はエラー）
+
+        Args:
+            batch: prepare の戻り値
+
+        Returns:
+            Dict: items（リクエストの順の結果）, summary
+
+        Raises:
+            ValidationError: 件数が BATCH_SYNC_MAX_ITEMS を超える
+            TokenLimitExceededError: バッチ全体でトークン上限を超過
+        """
+        if len(batch.requests) > self.sync_max_items:
+            raise ValidationError(
+                message=f'{self.sync_max_items}件を超える一括生成は ?stream=true（NDJSON）で指定してください',
+                details={'sync_max_items': self.sync_max_items, 'items': len(batch.requests)}
+            )
+
+        results = self.stream(batch, Deadline(config.LLM_REQUEST_DEADLINE_SECONDS))
+        items = sorted(results, key=lambda item: item['index'])
+        return {'items': items, 'summary': self.summarize(items)}
+
+    def stream(self, batch: PreparedBatch, deadline: Optional[Deadline] = None) -> Iterator[Dict]:
+        """
+        バッチ全体の推定トークン数を予約し、完了した順に結果を返すイテレータを返す
+
+        予約はこの呼び出しの時点で行い、イテレータの終了時（途中で閉じられた・破棄された場合を含む）に
+        生成できた分で確定するか解放する
+
+        Args:
+            batch: prepare の戻り値
+            deadline: バッチ全体の処理時間上限（省略時は項目ごとの LLM_REQUEST_DEADLINE_SECONDS のみ）
+
+        Returns:
+            Iterator[Dict]: {"index": int, "status": "SUCCESS", "result": dict}
+                または {"index": int, "status": "ERROR", "error": dict}（APIError.to_dict()["error"] と同じ形式）
+
+        Raises:
+            TokenLimitExceededError: バッチ全体でトークン上限を超過
+        """
+        results = self._run(batch, deadline)
+        next(results)
+        return results
+
+    def _run(self, batch: PreparedBatch, deadline: Optional[Deadline]) -> Iterator[Dict]:
+        """
+        予約してから生成する（最初の next() で予約して None を返す。stream が読み捨てる）
+
+        途中でイテレーションを止めた場合（ストリームの切断など）は未着手の生成を取り消し、
+        完了分のみ確定・保存する
+        """
+        token_service = self.note_service.token_service
+        # トークン上限はバッチ全体で1回だけ判定・予約する
+        reservation_id = token_service.reserve_tokens(batch.estimated_tokens, batch.requests[0].api_key)
+        generated: List[Tuple[GenerateNoteRequest, GenerateNoteResponse]] = []
+        total_tokens = 0
+        executor = None
+        try:
+            yield None
+
+            executor = ThreadPoolExecutor(
+                max_workers=min(self.max_concurrency, len(batch.requests)),
+                thread_name_prefix='note-batch'
+            )
+            futures = {
+                executor.submit(self._generate_item, request, estimate, deadline): index
+                for index, (request, estimate) in enumerate(zip(batch.requests, batch.estimates))
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                try:
+                    response, cached = future.result()
+                except Exception as e:
+                    yield {'index': index, 'status': 'ERROR', 'error': self._to_error(e)}
+                    continue
+
+                if not cached:
+                    generated.append((batch.requests[index], response))
+                    total_tokens += response.metadata['token_usage']['total_tokens']
+                yield {'index': index, 'status': 'SUCCESS', 'result': response.to_dict()}
+        finally:
+            if executor is not None:
+                executor.shutdown(wait=True, cancel_futures=True)
+            # 予約はバッチ全体で1件のため、生成できた分の合計で確定する
+            if generated:
+                token_service.commit_tokens(reservation_id, total_tokens)
+            else:
+                token_service.release_tokens(reservation_id)
+            self.note_service.save_logs(generated)
+
+    @staticmethod
+    def summarize(items: List[Dict]) -> Dict:
+        """
+        結果の集計
+
+        Args:
+            items: stream の結果
+
+        Returns:
+            Dict: total, succeeded, failed, total_tokens
+        """
+        succeeded = [item for item in items if item['status'] == 'SUCCESS']
+        return {
+            'total': len(items),
+            'succeeded': len(succeeded),
+            'failed': len(items) - len(succeeded),
+            'total_tokens': sum(
+                item['result']['metadata']['token_usage']['total_tokens']
+                for item in succeeded if item['result']['metadata'].get('cache') != 'hit'
+            )
+        }
+
+    def _generate_item(self, request: GenerateNoteRequest, estimated_tokens: int,
+                       batch_deadline: Optional[Deadline]) -> Tuple[GenerateNoteResponse, bool]:
+        """
+        1件を生成（処理時間上限は項目ごとの上限とバッチ全体の残りの短い方）
+
+        Returns:
+            Tuple[GenerateNoteResponse, bool]: (生成結果, キャッシュを使ったか)
+        """
+        seconds = config.LLM_REQUEST_DEADLINE_SECONDS
+        if batch_deadline is not None:
+            if batch_deadline.expired():
+                raise DeadlineExceededError(details={'reason': 'batch_deadline'})
+            seconds = min(seconds, batch_deadline.remaining())
+        return self.note_service.generate_reserved(request, estimated_tokens, PRIORITY_BATCH, Deadline(seconds))
+
+    @staticmethod
+    def _to_error(error: Exception) -> Dict:
+        """1件分のエラーをレスポンス形式に変換"""
+        if not isinstance(error, APIError):
+            print(f"❌ 一括生成エラー: {error}")
+            error = InternalError(message='記事生成中にエラーが発生しました', details={'error': str(error)})
+        return error.to_dict()['error']
+
+
+# シングルトンインスタンス
+_batch_service_instance: Optional[BatchService] = None
+_batch_service_lock = threading.Lock()
+
+
+def get_batch_service() -> BatchService:
+    """一括生成サービスのシングルトンインスタンスを取得"""
+    global _batch_service_instance
+    if _batch_service_instance is None:
+        with _batch_service_lock:
+            if _batch_service_instance is None:
+                _batch_service_instance = BatchService()
+    return _batch_service_instance
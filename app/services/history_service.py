@@ -0,0 +1,140 @@
+"""
+履歴サービス
+生成履歴の一覧取得（カーソルページング・絞り込み・列指定）を担当
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+from app.models.errors import ValidationError
+from app.clients.log_store import get_log_store, LIST_COLUMNS
+
+# 列指定が無い場合に返す列
+DEFAULT_FIELDS = [
+    'note_id',
+    'title',
+    'created_at',
+    'article_type',
+    'length_class',
+    'intensity_level',
+    'total_tokens'
+]
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+class HistoryService:
+    """生成履歴サービス"""
+
+    def __init__(self):
+        """初期化"""
+        self.log_store = get_log_store()
+
+    def list_notes(self, params: dict) -> dict:
+        """
+        生成履歴を新しい順に取得
+
+        Args:
+            params: クエリパラメータ
+                - limit: 取得件数（1〜100、既定20）
+                - cursor: 前回レスポンスの next_cursor
+                - article_type / length_class: 絞り込み
+                - from / to: created_at の範囲（ISO形式、from以上・to未満）
+                - fields: 取得する列（カンマ区切り）
+
+        Returns:
+            dict: items（履歴）と next_cursor（次ページが無い場合はNone）
+
+        Raises:
+            ValidationError: パラメータ不正
+        """
+        errors = []
+
+        limit = self._parse_limit(params.get('limit'), errors)
+        after = self._decode_cursor(params.get('cursor'), errors)
+        created_from = self._parse_datetime(params.get('from'), 'from', errors)
+        created_to = self._parse_datetime(params.get('to'), 'to', errors)
+
+        fields = DEFAULT_FIELDS
+        if params.get('fields'):
+            fields = [field.strip() for field in params['fields'].split(',') if field.strip()]
+            unknown = [field for field in fields if field not in LIST_COLUMNS]
+            if unknown:
+                errors.append(
+                    f'fields は {", ".join(LIST_COLUMNS)} から指定してください（不明: {", ".join(unknown)}）'
+                )
+
+        if errors:
+            raise ValidationError(
+                message='クエリパラメータが不正です',
+                details={'errors': errors}
+            )
+
+        # 1件多く取得して次ページの有無を判定する
+        rows = self.log_store.list_logs(
+            fields=fields,
+            limit=limit + 1,
+            after=after,
+            article_type=params.get('article_type') or None,
+            length_class=params.get('length_class') or None,
+            created_from=created_from,
+            created_to=created_to
+        )
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        next_cursor = None
+        if has_more and rows:
+            next_cursor = self._encode_cursor(rows[-1]['created_at'], rows[-1]['note_id'])
+
+        items = [{field: row[field] for field in fields} for row in rows]
+        return {
+            'items': items,
+            'next_cursor': next_cursor
+        }
+
+    @staticmethod
+    def _parse_limit(value, errors: list) -> int:
+        """取得件数のパース"""
+        if value in (None, ''):
+            return DEFAULT_LIMIT
+        try:
+            limit = int(value)
+        except (TypeError, ValueError):
+            errors.append(f'limit は1〜{MAX_LIMIT}の整数で指定してください')
+            return DEFAULT_LIMIT
+        if not (1 <= limit <= MAX_LIMIT):
+            errors.append(f'limit は1〜{MAX_LIMIT}の整数で指定してください')
+        return limit
+
+    @staticmethod
+    def _parse_datetime(value, name: str, errors: list) -> Optional[str]:
+        """日時パラメータの検証（ISO形式）"""
+        if not value:
+            return None
+        try:
+            datetime.fromisoformat(value)
+        except ValueError:
+            errors.append(f'{name} はISO形式の日時で指定してください')
+            return None
+        return value
+
+    @staticmethod
+    def _encode_cursor(created_at: str, note_id: str) -> str:
+        """ページングカーソルの生成"""
+        raw = json.dumps([created_at, note_id], ensure_ascii=False).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    @staticmethod
+    def _decode_cursor(cursor, errors: list) -> Optional[tuple]:
+        """ページングカーソルの解析"""
+        if not cursor:
+            return None
+        try:
+            created_at, note_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return str(created_at), str(note_id)
+        except (ValueError, TypeError, UnicodeError):
+            errors.append('cursor が不正です')
+            return None
@@ -0,0 +1,230 @@
+"""
+ジョブサービス
+記事生成をバックグラウンドで実行し、ジョブとして状態を管理する
+"""
+import asyncio
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app.config import get_config
+from app.models.errors import APIError, InternalError, NotFoundError, ServiceBusyError
+from app.clients.job_store import (
+    get_job_store,
+    JOB_STATUS_RUNNING,
+    JOB_STATUS_SUCCEEDED,
+    JOB_STATUS_FAILED
+)
+from app.clients.llm_async import get_llm_event_loop
+from app.services.note_service import NoteService, get_note_service
+from app.services.admission_controller import PRIORITY_BATCH
+
+config = get_config()
+
+
+class JobService:
+    """非同期記事生成ジョブサービス"""
+
+    def __init__(self, note_service: Optional[NoteService] = None):
+        """初期化"""
+        self.note_service = note_service or get_note_service()
+        self.job_store = get_job_store()
+        self.max_workers = config.JOB_MAX_WORKERS
+        self.max_pending = config.JOB_MAX_PENDING
+        # 有効な場合、ジョブはスレッドを占有せずLLM呼び出し用イベントループ上で実行する（同時実行数は max_pending まで）。
+        # asyncio版はAgent1のヘッジを行わないため、ヘッジ有効時はスレッドプールで実行する
+        self.async_llm = config.JOB_ASYNC_LLM and not config.LLM_HEDGE_AGENT1
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            thread_name_prefix='note-job'
+        )
+        self._lock = threading.Lock()
+        self._active_job_ids = set()
+
+        # 前回のワーカーが処理しきれなかったジョブを引き継ぐ
+        self._recover_orphaned_jobs()
+
+    def submit(self, request_data: dict) -> Dict:
+        """
+        記事生成ジョブを登録
+
+        Args:
+            request_data: リクエストデータ
+
+        Returns:
+            Dict: 登録したジョブ
+
+        Raises:
+            ValidationError: バリデーションエラー
+            TokenLimitExceededError: トークン上限超過
+            ServiceBusyError: 受付上限超過
+        """
+        # バリデーション・トークンチェックは受付時に行い、即座にエラーを返す
+        self.note_service.preflight(request_data)
+
+        job_id = f"job_{uuid.uuid4().hex}"
+
+        with self._lock:
+            if len(self._active_job_ids) >= self.max_pending:
+                raise ServiceBusyError(
+                    details={'max_pending': self.max_pending},
+                    retry_after=30
+                )
+            self._active_job_ids.add(job_id)
+
+        try:
+            job = self.job_store.create(job_id, request_data, os.getpid())
+            self._dispatch(job_id, request_data)
+        except Exception:
+            with self._lock:
+                self._active_job_ids.discard(job_id)
+            raise
+
+        return self._to_public(job)
+
+    def get_job(self, job_id: str) -> Dict:
+        """
+        ジョブの状態を取得
+
+        Args:
+            job_id: ジョブID
+
+        Returns:
+            Dict: ジョブ
+
+        Raises:
+            NotFoundError: ジョブが存在しない
+        """
+        job = self.job_store.get(job_id)
+        if job is None:
+            raise NotFoundError(
+                message='指定されたジョブが見つかりません',
+                details={'job_id': job_id}
+            )
+        return self._to_public(job)
+
+    def get_stats(self) -> dict:
+        """
+        ジョブ実行状況の統計を取得
+
+        Returns:
+            dict: 統計情報
+        """
+        with self._lock:
+            active = len(self._active_job_ids)
+        return {
+            'active_jobs': active,
+            'max_workers': self.max_workers,
+            'max_pending': self.max_pending,
+            'async_llm': self.async_llm
+        }
+
+    def _dispatch(self, job_id: str, request_data: dict):
+        """ジョブをスレッドプールまたはLLM呼び出し用イベントループに投入する"""
+        if self.async_llm:
+            get_llm_event_loop().submit(self._run_job_async(job_id, request_data))
+        else:
+            self._executor.submit(self._run_job, job_id, request_data)
+
+    def _run_job(self, job_id: str, request_data: dict):
+        """ジョブを実行し、結果をストアに保存する"""
+        try:
+            self.job_store.update(job_id, status=JOB_STATUS_RUNNING)
+            response = self.note_service.generate_note(
+                request_data,
+                on_stage=lambda stage: self.job_store.update(job_id, stage=stage),
+                priority=PRIORITY_BATCH
+            )
+            self.job_store.update(job_id, status=JOB_STATUS_SUCCEEDED, result=response.to_dict())
+        except Exception as e:
+            self._fail_job(job_id, e)
+        finally:
+            with self._lock:
+                self._active_job_ids.discard(job_id)
+
+    async def _run_job_async(self, job_id: str, request_data: dict):
+        """ジョブをイベントループ上で実行し、結果をストアに保存する（SQLiteへの保存は別スレッドで行う）"""
+        try:
+            await asyncio.to_thread(self.job_store.update, job_id, status=JOB_STATUS_RUNNING)
+            response = await self.note_service.agenerate_note(
+                request_data,
+                # agenerate_note は通知先を別スレッドで呼ぶ
+                on_stage=lambda stage: self.job_store.update(job_id, stage=stage),
+                priority=PRIORITY_BATCH
+            )
+            await asyncio.to_thread(
+                self.job_store.update, job_id, status=JOB_STATUS_SUCCEEDED, result=response.to_dict()
+            )
+        except Exception as e:
+            await asyncio.to_thread(self._fail_job, job_id, e)
+        finally:
+            with self._lock:
+                self._active_job_ids.discard(job_id)
+
+    def _fail_job(self, job_id: str, error: Exception):
+        """ジョブを失敗として保存する"""
+        if not isinstance(error, APIError):
+            print(f"❌ ジョブ実行エラー ({job_id}): {error}")
+            error = InternalError(
+                message='記事生成中にエラーが発生しました',
+                details={'error': str(error)}
+            )
+        self.job_store.update(job_id, status=JOB_STATUS_FAILED, error=error.to_dict())
+
+    def _recover_orphaned_jobs(self):
+        """担当ワーカーが終了した未完了ジョブを引き取って再実行する"""
+        try:
+            with self._lock:
+                active_job_ids = set(self._active_job_ids)
+            jobs = self.job_store.claim_orphaned(os.getpid(), active_job_ids)
+        except Exception as e:
+            print(f"⚠️  未完了ジョブの引き継ぎエラー: {e}")
+            return
+
+        for job in jobs:
+            print(f"🔁 未完了ジョブを再実行します: {job['job_id']}")
+            with self._lock:
+                self._active_job_ids.add(job['job_id'])
+            self._dispatch(job['job_id'], job['request'])
+
+    @staticmethod
+    def _to_public(job: Dict) -> Dict:
+        """APIレスポンス用のジョブ表現に変換"""
+        return {
+            'job_id': job['job_id'],
+            'status': job['status'],
+            'stage': job['stage'],
+            'result': job['result'],
+            'error': job['error'],
+            'created_at': job['created_at'],
+            'updated_at': job['updated_at']
+        }
+
+
+# シングルトンインスタンス
+_job_service_instance: Optional[JobService] = None
+_job_service_lock = threading.Lock()
+
+
+def get_job_service() -> JobService:
+    """ジョブサービスのシングルトンインスタンスを取得"""
+    global _job_service_instance
+    if _job_service_instance is None:
+        with _job_service_lock:
+            if _job_service_instance is None:
+                _job_service_instance = JobService()
+    return _job_service_instance
+
+
+def get_job_service_stats() -> Optional[dict]:
+    """
+    ジョブの統計を取得（未作成の場合は作成しない）
+
+    Returns:
+        Optional[dict]: JobService.get_stats() の内容（未作成の場合はNone）
+    """
+    instance = _job_service_instance
+    if instance is None:
+        return None
+    return instance.get_stats()
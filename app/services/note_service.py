@@ -2,8 +2,13 @@
 Note生成サービス
 記事生成のビジネスロジックを担当
 """
+import asyncio
 import json
+import threading
+import time
 from datetime import datetime
+from typing import List, Optional, Tuple
+from app.config import get_config
 from app.models.note_models import (
     GenerateNoteRequest,
     GenerateNoteResponse,
@@ -12,10 +17,20 @@ from app.models.note_models import (
     NoteLogEntry,
     generate_note_id
 )
-from app.models.errors import ValidationError, InternalError
-from app.clients import llm_client
+from app.models.errors import APIError, ValidationError, TokenLimitExceededError, InternalError
+from app.clients import llm_async, llm_client, llm_retry
 from app.clients.gsheet_client import get_gsheet_client
+from app.clients.gsheet_writer import get_gsheet_writer
+from app.clients.log_store import get_log_store
+from app.clients.result_cache import get_result_cache, build_cache_key
+from app.clients.token_estimator import get_token_estimator, DEFAULT_ESTIMATES, DEFAULT_ESTIMATE
 from app.services.token_service import TokenService
+from app.services import style_checker
+from app.services.admission_controller import get_admission_controller, PRIORITY_API
+
+config = get_config()
+
+AGENT2_MODES = ['auto', 'sections', 'always', 'skip']
 
 
 class NoteService:
@@ -24,62 +39,47 @@ class NoteService:
     def __init__(self):
         """初期化"""
         self.gsheet_client = get_gsheet_client()
+        self.gsheet_writer = get_gsheet_writer()
+        self.log_store = get_log_store()
+        self.result_cache = get_result_cache()
+        self.token_estimator = get_token_estimator()
         self.token_service = TokenService()
+        self.admission = get_admission_controller()
 
-    def generate_note(self, request_data: dict) -> GenerateNoteResponse:
+    def generate_note(self, request_data: dict, on_stage=None, priority: str = PRIORITY_API) -> GenerateNoteResponse:
         """
         note記事を生成
 
+        リクエストで cache: "reuse" が指定された場合は、同一内容の生成結果があれば再利用し、
+        同時に実行中の同一リクエストがあればその結果を待って返す
+
         Args:
             request_data: リクエストデータ
+            on_stage: 処理段階の通知先（stage名を受け取るcallable、省略可）
+            priority: 実行枠の待ち行列での優先度（ui / api / batch）
 
         Returns:
             GenerateNoteResponse: 生成結果
 
         Raises:
             ValidationError: バリデーションエラー
+            TokenLimitExceededError: トークン上限超過
+            LLMUnavailableError: 再試行してもLLMの応答が得られない
+            DeadlineExceededError: 処理時間上限超過
+            ServiceBusyError: 実行枠の待ち行列が満杯、または待ち時間の上限超過
             InternalError: 内部エラー
         """
         try:
-            # 1. リクエストのバリデーション
-            request = self._validate_request(request_data)
+            # 1. バリデーション
+            request = self.validate_request(request_data)
 
-            # 2. トークン制限チェック（推定値）
-            estimated_tokens = self._estimate_tokens(request)
-            self.token_service.check_token_limit(estimated_tokens)
+            if request.cache == 'reuse':
+                return self._generate_with_cache(request, on_stage, priority)
 
-            # 3. note_idの生成
-            note_id = generate_note_id()
+            return self._run_pipeline(request, on_stage, priority)
 
-            # 4. Agent1でドラフト生成
-            agent1_payload = {
-                'topic': request.topic,
-                'audience': request.audience,
-                'goal': request.goal,
-                'article_type': request.article_type,
-                'length_class': request.length_class,
-                'temperature': request.temperature,
-                'intensity_level': request.intensity_level
-            }
-
-            agent1_result = llm_client.call_agent1(agent1_payload)
-
-            # 5. Agent2で文体調整
-            agent2_result = llm_client.call_agent2(agent1_result)
-
-            # 6. レスポンスの構築
-            response = self._build_response(
-                note_id=note_id,
-                request=request,
-                result=agent2_result
-            )
-
-            # 7. Google Sheetsに保存
-            self._save_to_gsheet(request, response)
-
-            return response
-
-        except ValidationError:
+        except APIError:
+            # バリデーション・トークン上限・LLM利用不可などはそのまま返す
             raise
         except Exception as e:
             # 詳細なエラーログを出力
@@ -95,7 +95,640 @@ class NoteService:
                 details={'error': str(e), 'traceback': error_trace}
             )
 
-    def _validate_request(self, request_data: dict) -> GenerateNoteRequest:
+    def _run_pipeline(self, request: GenerateNoteRequest, on_stage=None,
+                      priority: str = PRIORITY_API) -> GenerateNoteResponse:
+        """
+        トークン制限チェックから保存までの生成処理
+
+        Args:
+            request: バリデーション済みリクエスト
+            on_stage: 処理段階の通知先
+            priority: 実行枠の待ち行列での優先度
+
+        Returns:
+            GenerateNoteResponse: 生成結果
+        """
+        # 処理時間上限は実行枠の待ち時間も含めて数える
+        deadline = llm_retry.Deadline(config.LLM_REQUEST_DEADLINE_SECONDS)
+
+        # 2. トークン制限チェック（推定値を予約し、生成後に実際の使用量で確定する）
+        estimated_tokens = self.estimate_tokens(request)
+        reservation_id = self.token_service.reserve_tokens(estimated_tokens, request.api_key)
+        try:
+            # LLMパイプラインの同時実行数を制限する（空きが無い場合は優先度順に待つ）
+            with self.admission.slot(priority, timeout=deadline.remaining()):
+                response = self._generate(request, estimated_tokens, on_stage, deadline.remaining())
+        except Exception:
+            self.token_service.release_tokens(reservation_id)
+            raise
+        self.token_service.commit_tokens(reservation_id, response.metadata['token_usage']['total_tokens'])
+
+        # 7. Google Sheetsに保存
+        self._save_log(request, response)
+        self._notify_stage(on_stage, 'saved')
+
+        return response
+
+    def generate_reserved(self, request: GenerateNoteRequest, estimated_tokens: int, priority: str = PRIORITY_API,
+                          deadline: Optional[llm_retry.Deadline] = None) -> Tuple[GenerateNoteResponse, bool]:
+        """
+        トークンを予約済みのリクエストを生成（予約の確定・ログの保存は呼び出し元で行う）
+
+        cache: "reuse" の場合はキャッシュ済みの結果を優先し、生成した結果はキャッシュに保存する
+
+        Args:
+            request: validate_request の戻り値
+            estimated_tokens: 推定トークン数（ヘッジ可否の判定に使う）
+            priority: 実行枠の待ち行列での優先度
+            deadline: 実行枠の待機と生成で共有する処理時間上限（省略時は LLM_REQUEST_DEADLINE_SECONDS）
+
+        Returns:
+            Tuple[GenerateNoteResponse, bool]: (生成結果, キャッシュを使ったか)
+
+        Raises:
+            LLMUnavailableError: 再試行してもLLMの応答が得られない
+            DeadlineExceededError: 処理時間上限超過
+            ServiceBusyError: 実行枠の待ち行列が満杯、または待ち時間の上限超過
+        """
+        cache_key = build_cache_key(request) if request.cache == 'reuse' else None
+        if cache_key is not None:
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return cached, True
+
+        if deadline is None:
+            deadline = llm_retry.Deadline(config.LLM_REQUEST_DEADLINE_SECONDS)
+        with self.admission.slot(priority, timeout=deadline.remaining()):
+            response = self._generate(request, estimated_tokens, deadline_seconds=deadline.remaining())
+
+        if cache_key is not None:
+            try:
+                self.result_cache.put(cache_key, response.to_dict())
+            except Exception as e:
+                print(f"⚠️  生成結果キャッシュの保存エラー: {e}")
+        return response, False
+
+    def _generate(self, request: GenerateNoteRequest, estimated_tokens: int, on_stage=None,
+                  deadline_seconds: Optional[float] = None) -> GenerateNoteResponse:
+        """
+        Agent1・Agent2による生成とレスポンスの構築
+
+        Args:
+            request: バリデーション済みリクエスト
+            estimated_tokens: 推定トークン数
+            on_stage: 処理段階の通知先
+            deadline_seconds: Agent1・Agent2で共有する処理時間上限（秒、省略時は LLM_REQUEST_DEADLINE_SECONDS）
+
+        Returns:
+            GenerateNoteResponse: 生成結果
+        """
+        self._notify_stage(on_stage, 'validated')
+
+        # 3. note_idの生成
+        note_id = generate_note_id()
+
+        # ヘッジリクエストは予算に余裕がある場合のみ（1本分を生成中だけ予約する）
+        # Agent1・Agent2の再試行は1つのデッドラインを共有する
+        with self.token_service.hedge_reservation(estimated_tokens, request.api_key) as hedge, \
+                llm_retry.request_scope(deadline_seconds) as retry_scope:
+            # 4. Agent1でドラフト生成
+            agent1_payload = self._build_agent1_payload(request)
+
+            self._notify_stage(on_stage, 'agent1_started')
+            if self._use_fanout(request):
+                # 長い記事は構成を作成してからセクションごとに並列生成する
+                agent1_result = llm_client.call_agent1_fanout(agent1_payload)
+            else:
+                agent1_result = llm_client.call_agent1(agent1_payload, hedge=hedge)
+            self._notify_stage(on_stage, 'agent1_done')
+
+            # 5. 禁止事項の機械的な書き換え（違反が残る場合のみAgent2で文体調整）
+            cleaned, style_check, targets = self._prepare_agent2(agent1_result)
+            if style_check['agent2'] != 'skipped':
+                self._notify_stage(on_stage, 'agent2_started')
+                agent2_result = self._run_agent2(cleaned, style_check, targets)
+                self._notify_stage(on_stage, 'agent2_done')
+            else:
+                agent2_result = cleaned
+                self._notify_stage(on_stage, 'agent2_skipped')
+
+        # 6. レスポンスの構築
+        response = self._build_response(
+            note_id=note_id,
+            request=request,
+            result=agent2_result,
+            retry_stats=retry_scope.to_metadata(),
+            hedge_stats=retry_scope.hedge,
+            style_check=style_check
+        )
+
+        return response
+
+    async def agenerate_note(self, request_data: dict, on_stage=None,
+                             priority: str = PRIORITY_API) -> GenerateNoteResponse:
+        """
+        note記事を生成（asyncio版、LLM呼び出し用イベントループ上で実行する）
+
+        LLM呼び出しは非同期クライアントで行い、トークン制限チェックとログ保存は別スレッドで行う。
+        Agent1のヘッジと同一リクエストの待ち合わせ（single-flight）は行わない
+
+        Args:
+            request_data: リクエストデータ
+            on_stage: 処理段階の通知先（イベントループを止めないよう別スレッドで呼ばれる）
+            priority: 実行枠の待ち行列での優先度（ui / api / batch）
+
+        Returns:
+            GenerateNoteResponse: 生成結果
+
+        Raises:
+            generate_note と同じ
+        """
+        try:
+            request = self.validate_request(request_data)
+
+            # 生成結果キャッシュ（SQLite）はイベントループを止めないよう別スレッドで参照・保存する
+            cache_key = build_cache_key(request) if request.cache == 'reuse' else None
+            if cache_key is not None:
+                cached = await asyncio.to_thread(self._get_cached_response, cache_key)
+                if cached is not None:
+                    await self._anotify_stage(on_stage, 'cache_hit')
+                    return cached
+
+            response = await self._run_pipeline_async(request, on_stage, priority)
+
+            if cache_key is not None:
+                try:
+                    await asyncio.to_thread(self.result_cache.put, cache_key, response.to_dict())
+                except Exception as e:
+                    print(f"⚠️  生成結果キャッシュの保存エラー: {e}")
+            return response
+
+        except APIError:
+            raise
+        except Exception as e:
+            import traceback
+            error_trace = traceback.format_exc()
+            print(f"❌ 記事生成エラー（async）: {e}\n{error_trace}")
+
+            raise InternalError(
+                message='記事生成中にエラーが発生しました',
+                details={'error': str(e), 'traceback': error_trace}
+            )
+
+    async def _run_pipeline_async(self, request: GenerateNoteRequest, on_stage=None,
+                                  priority: str = PRIORITY_API) -> GenerateNoteResponse:
+        """
+        トークン制限チェックから保存までの生成処理（asyncio版）
+
+        Args:
+            request: バリデーション済みリクエスト
+            on_stage: 処理段階の通知先
+            priority: 実行枠の待ち行列での優先度
+
+        Returns:
+            GenerateNoteResponse: 生成結果
+        """
+        # 処理時間上限は実行枠の待ち時間も含めて数える
+        deadline = llm_retry.Deadline(config.LLM_REQUEST_DEADLINE_SECONDS)
+
+        # 推定（ログの再読み込みを含む）と台帳（SQLite）の参照はイベントループを止めないよう別スレッドで実行
+        reservation_id = await asyncio.to_thread(
+            lambda: self.token_service.reserve_tokens(self.estimate_tokens(request), request.api_key)
+        )
+        try:
+            await self._acquire_slot_async(priority, deadline.remaining())
+            started_at = time.monotonic()
+            try:
+                response = await self._generate_async(request, on_stage, deadline.remaining())
+            finally:
+                self.admission.release(time.monotonic() - started_at)
+        except BaseException:
+            # キャンセルされた場合も予約を解放する（再度キャンセルされても解放は別スレッドで完了する）
+            await asyncio.to_thread(self.token_service.release_tokens, reservation_id)
+            raise
+        await asyncio.to_thread(
+            self.token_service.commit_tokens, reservation_id, response.metadata['token_usage']['total_tokens']
+        )
+
+        await asyncio.to_thread(self._save_log, request, response)
+        await self._anotify_stage(on_stage, 'saved')
+
+        return response
+
+    async def _anotify_stage(self, on_stage, stage: str):
+        """処理段階を通知（asyncio版。通知先はジョブの保存などでブロックするため別スレッドで呼ぶ）"""
+        if on_stage is None:
+            return
+        await asyncio.to_thread(self._notify_stage, on_stage, stage)
+
+    async def _acquire_slot_async(self, priority: str, timeout: Optional[float] = None):
+        """
+        実行枠を確保（待ち行列での待機はイベントループを止めないよう別スレッドで行う）
+
+        Args:
+            priority: 実行枠の待ち行列での優先度
+            timeout: 待ち行列で待つ最大秒数
+
+        Raises:
+            ServiceBusyError: 待ち行列が満杯、または待ち時間の上限超過
+        """
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self.admission.acquire, priority, timeout))
+        try:
+            await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            # 待機中にキャンセルされた場合は、後から確保できた枠をそのまま返す
+            def release_if_acquired(future):
+                if not future.cancelled() and future.exception() is None:
+                    self.admission.release()
+
+            acquiring.add_done_callback(release_if_acquired)
+            raise
+
+    async def _generate_async(self, request: GenerateNoteRequest, on_stage=None,
+                              deadline_seconds: Optional[float] = None) -> GenerateNoteResponse:
+        """
+        Agent1・Agent2による生成とレスポンスの構築（asyncio版）
+
+        Args:
+            request: バリデーション済みリクエスト
+            on_stage: 処理段階の通知先
+            deadline_seconds: Agent1・Agent2で共有する処理時間上限（秒、省略時は LLM_REQUEST_DEADLINE_SECONDS）
+
+        Returns:
+            GenerateNoteResponse: 生成結果
+        """
+        await self._anotify_stage(on_stage, 'validated')
+
+        note_id = generate_note_id()
+
+        with llm_retry.request_scope(deadline_seconds) as retry_scope:
+            agent1_payload = self._build_agent1_payload(request)
+
+            await self._anotify_stage(on_stage, 'agent1_started')
+            if self._use_fanout(request):
+                agent1_result = await llm_async.acall_agent1_fanout(agent1_payload)
+            else:
+                agent1_result = await llm_async.acall_agent1(agent1_payload)
+            await self._anotify_stage(on_stage, 'agent1_done')
+
+            cleaned, style_check, targets = self._prepare_agent2(agent1_result)
+            if style_check['agent2'] == 'sections':
+                await self._anotify_stage(on_stage, 'agent2_started')
+                agent2_result, _ = style_checker.clean_article(
+                    await llm_async.acall_agent2_parts(cleaned, targets)
+                )
+                await self._anotify_stage(on_stage, 'agent2_done')
+            elif style_check['agent2'] == 'called':
+                await self._anotify_stage(on_stage, 'agent2_started')
+                agent2_result = await llm_async.acall_agent2(cleaned)
+                await self._anotify_stage(on_stage, 'agent2_done')
+            else:
+                agent2_result = cleaned
+                await self._anotify_stage(on_stage, 'agent2_skipped')
+
+        response = self._build_response(
+            note_id=note_id,
+            request=request,
+            result=agent2_result,
+            retry_stats=retry_scope.to_metadata(),
+            style_check=style_check
+        )
+
+        return response
+
+    def _generate_with_cache(self, request: GenerateNoteRequest, on_stage=None,
+                             priority: str = PRIORITY_API) -> GenerateNoteResponse:
+        """
+        生成結果キャッシュを使って生成（cache: "reuse"）
+
+        Args:
+            request: バリデーション済みリクエスト
+            on_stage: 処理段階の通知先
+            priority: 実行枠の待ち行列での優先度
+
+        Returns:
+            GenerateNoteResponse: 生成結果（キャッシュ利用時は metadata.cache が "hit"）
+        """
+        cache_key = build_cache_key(request)
+
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            self._notify_stage(on_stage, 'cache_hit')
+            return cached
+
+        def run():
+            # 待機中に他のワーカープロセスが保存している場合もあるため再確認する
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return cached
+
+            response = self._run_pipeline(request, on_stage, priority)
+            try:
+                self.result_cache.put(cache_key, response.to_dict())
+            except Exception as e:
+                print(f"⚠️  生成結果キャッシュの保存エラー: {e}")
+            return response
+
+        return self.result_cache.single_flight.do(cache_key, run)
+
+    def _get_cached_response(self, cache_key: str):
+        """
+        キャッシュ済みの生成結果を取得
+
+        Args:
+            cache_key: キャッシュキー
+
+        Returns:
+            Optional[GenerateNoteResponse]: 生成結果（無い場合はNone）
+        """
+        try:
+            cached = self.result_cache.get(cache_key)
+        except Exception as e:
+            print(f"⚠️  生成結果キャッシュの読み込みエラー: {e}")
+            return None
+        if cached is None:
+            return None
+
+        return GenerateNoteResponse(
+            status=cached['status'],
+            note_id=cached['note_id'],
+            title=cached['title'],
+            lead=cached['lead'],
+            sections=[NoteSection(**section) for section in cached['sections']],
+            cta=cached['cta'],
+            metadata=dict(cached['metadata'], cache='hit')
+        )
+
+    def generate_note_stream(self, request_data: dict, priority: str = PRIORITY_API):
+        """
+        note記事をストリーミングで生成
+
+        バリデーション・トークン制限チェック・実行枠の待ち行列が満杯でないかの確認は呼び出し時点で同期的に行い、
+        実行枠の待機とLLM呼び出し以降の進捗はジェネレータのイベントとして返す
+
+        Args:
+            request_data: リクエストデータ
+            priority: 実行枠の待ち行列での優先度（ui / api / batch）
+
+        Returns:
+            Iterator[tuple[str, dict]]: (イベント名, データ) のジェネレータ
+                - validated / queued（実行枠の待機前） / agent1_started / agent1_delta / agent1_field / agent1_section / agent1_done
+                - agent2_started / agent2_delta / agent2_field / agent2_section / agent2_done
+                  （または agent2_skipped） / saved
+                - result: GenerateNoteResponse.to_dict() と同じ内容
+                - error: エラー内容（APIError.to_dict() と同じ形式）
+
+        Raises:
+            ValidationError: バリデーションエラー
+            TokenLimitExceededError: トークン上限超過
+            ServiceBusyError: 実行枠の待ち行列が満杯
+        """
+        request = self.validate_request(request_data)
+        self.admission.check(priority)
+
+        # トークンの予約までをここで実行する（上限超過はストリーム開始前に送出される）。
+        # 予約後はジェネレータが開始済みのため、イテレーションされずに閉じられた・破棄された場合も finally で解放される
+        events = self._generate_note_events(request, priority)
+        next(events)
+        return events
+
+    def preflight(self, request_data: dict) -> GenerateNoteRequest:
+        """
+        生成前チェック（バリデーション＋トークン制限チェック）
+
+        Args:
+            request_data: リクエストデータ
+
+        Returns:
+            GenerateNoteRequest: バリデーション済みリクエスト
+
+        Raises:
+            ValidationError: バリデーションエラー
+            TokenLimitExceededError: トークン上限超過
+        """
+        request = self.validate_request(request_data)
+
+        estimated_tokens = self.estimate_tokens(request)
+        self.token_service.check_token_limit(estimated_tokens, request.api_key)
+
+        return request
+
+    @staticmethod
+    def _notify_stage(on_stage, stage: str):
+        """処理段階を通知（通知先の失敗は生成処理に影響させない）"""
+        if on_stage is None:
+            return
+        try:
+            on_stage(stage)
+        except Exception as e:
+            print(f"⚠️  処理段階の通知エラー: {e}")
+
+    @staticmethod
+    def _stream_event(agent: str, event: dict):
+        """
+        LLMのストリームイベントをSSEのイベントに変換
+
+        Args:
+            agent: agent1 / agent2
+            event: delta / field / section イベント
+
+        Returns:
+            tuple[str, dict]: (イベント名, データ)
+        """
+        data = {key: value for key, value in event.items() if key != 'type'}
+        return f"{agent}_{event['type']}", data
+
+    def _generate_note_events(self, request: GenerateNoteRequest, priority: str = PRIORITY_API):
+        """
+        ストリーミング生成のイベントを順に返す
+
+        最初の next() でトークンを予約して None を返す（generate_note_stream が読み捨てる）。
+        以降はストリームの終了時（失敗・切断・破棄を含む）に予約を確定または解放する
+
+        Args:
+            request: バリデーション済みリクエスト
+            priority: 実行枠の待ち行列での優先度
+
+        Yields:
+            tuple[str, dict]: (イベント名, データ)
+
+        Raises:
+            TokenLimitExceededError: トークン上限超過（最初の next() で送出）
+        """
+        # 処理時間上限は実行枠の待ち時間も含めて数える
+        deadline = llm_retry.Deadline(config.LLM_REQUEST_DEADLINE_SECONDS)
+        reservation_id = self.token_service.reserve_tokens(self.estimate_tokens(request), request.api_key)
+        committed = False
+        started_at = None
+        note_id = generate_note_id()
+
+        try:
+            yield None
+
+            yield 'validated', {'note_id': note_id}
+
+            # 実行枠の待機中も接続が無応答にならないよう、待つ前に通知する
+            yield 'queued', {'queue_depth': sum(self.admission.get_stats()['queue_depth'].values())}
+            self.admission.acquire(priority, deadline.remaining())
+            started_at = time.monotonic()
+
+            with llm_retry.request_scope(deadline.remaining()) as retry_scope:
+                # Agent1でドラフト生成
+                yield 'agent1_started', {}
+                agent1_result = None
+                for event in llm_client.stream_agent1(self._build_agent1_payload(request)):
+                    if event['type'] == 'result':
+                        agent1_result = event['result']
+                    else:
+                        yield self._stream_event('agent1', event)
+                yield 'agent1_done', {'token_usage': agent1_result.get('token_usage', {})}
+
+                # 禁止事項の機械的な書き換え（違反が残る場合のみAgent2で文体調整）
+                cleaned, style_check, targets = self._prepare_agent2(agent1_result)
+                if style_check['agent2'] == 'called':
+                    yield 'agent2_started', {}
+                    agent2_result = None
+                    for event in llm_client.stream_agent2(cleaned):
+                        if event['type'] == 'result':
+                            agent2_result = event['result']
+                        else:
+                            yield self._stream_event('agent2', event)
+                    yield 'agent2_done', {'token_usage': agent2_result.get('token_usage', {})}
+                elif style_check['agent2'] == 'sections':
+                    # 部分調整は短い呼び出しを並列に行うため途中テキストは返さない
+                    yield 'agent2_started', {'parts': list(targets)}
+                    agent2_result = self._run_agent2(cleaned, style_check, targets)
+                    yield 'agent2_done', {'token_usage': agent2_result.get('token_usage', {})}
+                else:
+                    agent2_result = cleaned
+                    yield 'agent2_skipped', {'style_check': style_check}
+
+            response = self._build_response(
+                note_id=note_id,
+                request=request,
+                result=agent2_result,
+                retry_stats=retry_scope.to_metadata(),
+                style_check=style_check
+            )
+            self.token_service.commit_tokens(reservation_id, response.metadata['token_usage']['total_tokens'])
+            committed = True
+
+            self._save_log(request, response)
+            yield 'saved', {'note_id': note_id}
+
+            yield 'result', response.to_dict()
+
+        except Exception as e:
+            # ヘッダー送信後のためHTTPステータスは返せない。errorイベントで通知する
+            print(f"❌ ストリーミング記事生成エラー: {e}")
+            if isinstance(e, APIError):
+                error = e
+            else:
+                error = InternalError(
+                    message='記事生成中にエラーが発生しました',
+                    details={'error': str(e)}
+                )
+            yield 'error', error.to_dict()
+        finally:
+            if started_at is not None:
+                self.admission.release(time.monotonic() - started_at)
+            if not committed:
+                self.token_service.release_tokens(reservation_id)
+
+    @staticmethod
+    def _use_fanout(request: GenerateNoteRequest) -> bool:
+        """Agent1を分割生成するか（AGENT1_FANOUT_LONG が有効で length_class が long の場合）"""
+        return config.AGENT1_FANOUT_LONG and request.length_class == 'long'
+
+    def _prepare_agent2(self, agent1_result: dict):
+        """
+        Agent1の出力を機械的に書き換え、Agent2を呼ぶか判定
+
+        Args:
+            agent1_result: Agent1の出力
+
+        Returns:
+            tuple[dict, dict, dict]: (書き換え後の記事, metadata.style_check の内容,
+                                      部分調整の対象 → 違反箇所の抜粋)
+                style_check.agent2 は called（記事全体）/ sections（部分調整）/ skipped
+        """
+        cleaned, fixes = style_checker.clean_article(agent1_result)
+        violations = style_checker.find_violations(cleaned)
+
+        mode = config.AGENT2_MODE
+        if mode not in AGENT2_MODES:
+            print(f"⚠️  AGENT2_MODE が不正です（{mode}）。auto として扱います")
+            mode = 'auto'
+
+        if mode == 'always':
+            agent2 = 'called'
+        elif mode == 'skip' or not violations:
+            agent2 = 'skipped'
+        elif mode == 'sections':
+            agent2 = 'sections'
+        else:
+            agent2 = 'called'
+
+        # 違反のある部分（セクションは見出しと本文をまとめて1つ）ごとに抜粋をまとめる
+        targets = {}
+        for violation in violations:
+            key = violation.field
+            if violation.section_index is not None:
+                key = f'sections.{violation.section_index}'
+            targets.setdefault(key, []).append(violation.excerpt)
+
+        style_check = {
+            'mode': mode,
+            'local_fixes': fixes,
+            'violations': len(violations),
+            'rules': sorted({violation.rule for violation in violations}),
+            'agent2': agent2
+        }
+        if agent2 == 'sections':
+            style_check['refined_parts'] = list(targets)
+        return cleaned, style_check, targets
+
+    def _run_agent2(self, cleaned: dict, style_check: dict, targets: dict) -> dict:
+        """
+        Agent2で文体調整（記事全体、または違反のある部分のみ）
+
+        Args:
+            cleaned: 機械的に書き換えた記事
+            style_check: _prepare_agent2 の判定結果
+            targets: 部分調整の対象 → 違反箇所の抜粋
+
+        Returns:
+            dict: 調整後の記事
+        """
+        if style_check['agent2'] == 'sections':
+            refined = llm_client.call_agent2_parts(cleaned, targets)
+            # LLMが装飾記号などを戻した場合に備えて再度書き換える
+            refined, _ = style_checker.clean_article(refined)
+            return refined
+
+        return llm_client.call_agent2(cleaned)
+
+    def _build_agent1_payload(self, request: GenerateNoteRequest) -> dict:
+        """
+        Agent1に渡すペイロードを構築
+
+        Args:
+            request: リクエスト
+
+        Returns:
+            dict: Agent1用ペイロード
+        """
+        return {
+            'topic': request.topic,
+            'audience': request.audience,
+            'goal': request.goal,
+            'article_type': request.article_type,
+            'length_class': request.length_class,
+            'temperature': request.temperature,
+            'intensity_level': request.intensity_level
+        }
+
+    def validate_request(self, request_data: dict) -> GenerateNoteRequest:
         """
         リクエストのバリデーション
 
@@ -116,7 +749,9 @@ class NoteService:
             article_type=request_data.get('article_type', 'education'),
             length_class=request_data.get('length_class', 'middle'),
             temperature=float(request_data.get('temperature', 0.7)),
-            intensity_level=int(request_data.get('intensity_level', 5))
+            intensity_level=int(request_data.get('intensity_level', 5)),
+            cache=request_data.get('cache', 'bypass'),
+            api_key=request_data.get('api_key')
         )
 
         # バリデーション実行
@@ -134,7 +769,10 @@ class NoteService:
         self,
         note_id: str,
         request: GenerateNoteRequest,
-        result: dict
+        result: dict,
+        retry_stats: dict = None,
+        hedge_stats: dict = None,
+        style_check: dict = None
     ) -> GenerateNoteResponse:
         """
         レスポンスの構築
@@ -143,6 +781,9 @@ class NoteService:
             note_id: 生成されたnote_id
             request: リクエスト
             result: LLM生成結果
+            retry_stats: LLM呼び出しの再試行状況（RetryScope.to_metadata()）
+            hedge_stats: Agent1のヘッジリクエストの統計（ヘッジした場合のみ）
+            style_check: 禁止事項の書き換え・チェック結果
 
         Returns:
             GenerateNoteResponse: レスポンス
@@ -150,8 +791,8 @@ class NoteService:
         # セクションの変換
         sections = [
             NoteSection(
-                heading=section['heading'],
-                body=section['body']
+                heading=section.get('heading', ''),
+                body=section.get('body', '')
             )
             for section in result.get('sections', [])
         ]
@@ -161,7 +802,10 @@ class NoteService:
         token_usage = TokenUsage(
             prompt_tokens=token_usage_data.get('prompt_tokens', 0),
             completion_tokens=token_usage_data.get('completion_tokens', 0),
-            total_tokens=token_usage_data.get('total_tokens', 0)
+            total_tokens=token_usage_data.get('total_tokens', 0),
+            cache_creation_input_tokens=token_usage_data.get('cache_creation_input_tokens', 0),
+            cache_read_input_tokens=token_usage_data.get('cache_read_input_tokens', 0),
+            hedge_tokens=token_usage_data.get('hedge_tokens', 0)
         )
 
         # メタデータ
@@ -175,6 +819,12 @@ class NoteService:
             'intensity_level_used': request.intensity_level,
             'token_usage': token_usage.to_dict()
         }
+        if retry_stats is not None:
+            metadata['llm_retry'] = retry_stats
+        if hedge_stats is not None:
+            metadata['hedge'] = hedge_stats
+        if style_check is not None:
+            metadata['style_check'] = style_check
 
         # レスポンス構築
         response = GenerateNoteResponse(
@@ -189,52 +839,116 @@ class NoteService:
 
         return response
 
-    def _estimate_tokens(self, request: GenerateNoteRequest) -> int:
+    def estimate_tokens(self, request: GenerateNoteRequest) -> int:
         """
         トークン使用量の推定
 
+        Agent1のプロンプトは実際に送る内容から数え、生成分は過去のログから学習した分布の分位点を使う
+
         Args:
             request: リクエスト
 
         Returns:
             int: 推定トークン数
         """
-        # 簡易推定：length_classに基づく
-        estimates = {
-            'short': 1500,
-            'middle': 3000,
-            'long': 5000
-        }
-        return estimates.get(request.length_class, 3000)
+        try:
+            return self.token_estimator.estimate(self._build_agent1_payload(request))['estimated_tokens']
+        except Exception as e:
+            # ログを参照できない場合は length_class ごとの既定値
+            print(f"⚠️  トークン推定エラー: {e}")
+            return DEFAULT_ESTIMATES.get(request.length_class, DEFAULT_ESTIMATE)
 
-    def _save_to_gsheet(self, request: GenerateNoteRequest, response: GenerateNoteResponse):
+    def _save_log(self, request: GenerateNoteRequest, response: GenerateNoteResponse):
         """
-        Google Sheetsに保存
+        生成ログを保存
+
+        ローカルログストアに同期的に保存し、Google Sheetsへはバックグラウンドの書き込みキューで書き出す
 
         Args:
             request: リクエスト
             response: レスポンス
         """
+        self.save_logs([(request, response)])
+
+    def save_logs(self, generated: List[Tuple[GenerateNoteRequest, GenerateNoteResponse]]):
+        """
+        生成ログをまとめて保存
+
+        ローカルログストアには1トランザクションで保存し、Google Sheetsへは書き込みキュー
+        （write-behind無効時は1回のAPI呼び出し）でまとめて書き出す
+
+        Args:
+            generated: (リクエスト, レスポンス) のリスト
+        """
+        if not generated:
+            return
+
         try:
             # NoteLogEntry作成
-            log_entry = NoteLogEntry(
-                note_id=response.note_id,
-                topic=request.topic,
-                audience=request.audience,
-                goal=request.goal,
-                article_type=request.article_type,
-                length_class=request.length_class,
-                temperature=request.temperature,
-                intensity_level=request.intensity_level,
-                title=response.title,
-                raw_json=json.dumps(response.to_dict(), ensure_ascii=False),
-                total_tokens=response.metadata['token_usage']['total_tokens'],
-                created_at=datetime.now().isoformat()
-            )
-
-            # Google Sheetsに保存
-            self.gsheet_client.append_row(log_entry)
+            created_at = datetime.now().isoformat()
+            log_entries = [
+                NoteLogEntry(
+                    note_id=response.note_id,
+                    topic=request.topic,
+                    audience=request.audience,
+                    goal=request.goal,
+                    article_type=request.article_type,
+                    length_class=request.length_class,
+                    temperature=request.temperature,
+                    intensity_level=request.intensity_level,
+                    title=response.title,
+                    raw_json=json.dumps(response.to_dict(), ensure_ascii=False),
+                    total_tokens=response.metadata['token_usage']['total_tokens'],
+                    created_at=created_at
+                )
+                for request, response in generated
+            ]
+
+            # ローカルログストアに保存（履歴・トークン集計の参照元）
+            try:
+                self.log_store.insert_many(log_entries)
+            except Exception as e:
+                print(f"⚠️  ローカルログ保存エラー: {e}")
+
+            # 保存したログ（と他のワーカーが保存したログ）をトークン推定に取り込む
+            try:
+                self.token_estimator.refresh()
+            except Exception as e:
+                print(f"⚠️  トークン推定の更新エラー: {e}")
+
+            # ヘッジで打ち切った分を今月のヘッジ予算に計上
+            self.token_service.record_hedge_tokens(sum(
+                response.metadata['token_usage'].get('hedge_tokens', 0) for _, response in generated
+            ))
+
+            # Google Sheetsに保存（write-behind有効時はキューに積んで即座に戻る）
+            if config.GSHEET_WRITE_BEHIND:
+                for log_entry in log_entries:
+                    self.gsheet_writer.enqueue(log_entry)
+            elif len(log_entries) == 1:
+                self.gsheet_client.append_row(log_entries[0])
+            elif self.gsheet_client.append_rows(log_entries):
+                # append_rows は月次トークン集計に反映しないため、ここで加算する
+                for log_entry in log_entries:
+                    self.gsheet_client.token_counter.add(
+                        log_entry.created_at, int(log_entry.total_tokens or 0), log_entry.note_id
+                    )
 
         except Exception as e:
             # 保存エラーは警告のみ（処理は続行）
             print(f"⚠️  Google Sheets保存エラー: {e}")
+
+
+# シングルトンインスタンス
+_note_service_instance: Optional[NoteService] = None
+_note_service_lock = threading.Lock()
+
+
+def get_note_service() -> NoteService:
+    """記事生成サービスのシングルトンインスタンスを取得（初回利用時に生成し、ローカルストアを開く）"""
+    global _note_service_instance
+    if _note_service_instance is None:
+        with _note_service_lock:
+            if _note_service_instance is None:
+                _note_service_instance = NoteService()
+    return _note_service_instance
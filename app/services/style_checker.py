@@ -0,0 +1,164 @@
+"""
+文体チェック
+Agent1の出力に対して禁止事項（文字装飾・二人称・AI的表現）の機械的な書き換えと違反検出を行う。
+書き換えで解消できない違反が残った場合のみAgent2（LLM）で調整する
+"""
+import re
+from dataclasses import dataclass, asdict
+from typing import List, Optional, Tuple
+
+# 機械的に書き換える規則（上から順に適用）
+_CLEANUP_RULES = [
+    # 区切り線
+    (re.compile(r'^[ \t]*(?:-{3,}|_{3,}|\*{3,})[ \t]*$', re.MULTILINE), ''),
+    # ハイフン・アスタリスクのリスト記号
+    (re.compile(r'^([ \t]*)[-*][ \t]+', re.MULTILINE), r'\1'),
+    # Markdownの見出し記号（行頭の # の後に空白があるもののみ。#マーケティング などのハッシュタグは残す）
+    (re.compile(r'^[ \t]*#{1,6}[ \t]+', re.MULTILINE), ''),
+    # 強調記号（*、**、_、__ で囲んだもの。中身は残す。英数字に挟まれた _ は単語の一部として残す）
+    (re.compile(r'(\*{1,3})(?=\S)(.+?)(?<=\S)\1'), r'\2'),
+    (re.compile(r'(?<![A-Za-z0-9_])(_{1,3})(?=\S)(.+?)(?<=\S)\1(?![A-Za-z0-9_])'), r'\2'),
+    # 対になっていない強調記号
+    (re.compile(r'\*{2,}'), ''),
+    # 装飾括弧・強調のダブルクォーテーション（中身は残す）
+    (re.compile(r'[【】『』“”"]'), ''),
+    # 装飾のコロン
+    (re.compile(r'：'), '、'),
+    # AI的表現（文法を崩さずに置き換えられるもののみ）
+    (re.compile(r'ではないでしょうか'), 'ではないですか'),
+    (re.compile(r'じゃないでしょうか'), 'じゃないですか'),
+    (re.compile(r'(?:いかが|どう)でしょうか'), 'どうですか'),
+    (re.compile(r'していきましょう|しましょう'), 'してください'),
+    # 二人称
+    (re.compile(r'あなたの'), '自分の'),
+    (re.compile(r'あなたなら'), '誰でも'),
+    (re.compile(r'あなたも'), '誰もが'),
+    (re.compile(r'あなた[はが]、?'), ''),
+    # 書き換えで生じた空行の連続
+    (re.compile(r'\n{3,}'), '\n\n'),
+]
+
+# 書き換え後に残っていればAgent2で調整する違反
+_VIOLATION_RULES = [
+    ('decoration', re.compile(r'[*【】『』“”"]|^[ \t]*(?:-|#{1,6}[ \t])', re.MULTILINE)),
+    ('second_person', re.compile(r'あなた')),
+    ('ai_expression', re.compile(r'でしょう|ましょう')),
+    ('explanatory_ending', re.compile(r'ということです')),
+]
+
+HEADING_MARKER = '■'
+
+# 違反箇所として返す前後の文字数
+_EXCERPT_CHARS = 15
+
+
+@dataclass
+class StyleViolation:
+    """禁止事項の違反箇所"""
+    field: str  # title / lead / heading / body / cta
+    rule: str  # decoration / second_person / ai_expression / explanatory_ending / heading_marker
+    excerpt: str
+    section_index: Optional[int] = None  # heading / body の場合のセクション番号
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def clean_text(text: str) -> Tuple[str, int]:
+    """
+    禁止事項を機械的に書き換える
+
+    Args:
+        text: 対象の文字列
+
+    Returns:
+        Tuple[str, int]: (書き換え後の文字列, 書き換えた箇所の数)
+    """
+    if not text:
+        return text, 0
+
+    fixes = 0
+    for pattern, replacement in _CLEANUP_RULES:
+        text, count = pattern.subn(replacement, text)
+        fixes += count
+    return text.strip(), fixes
+
+
+def clean_heading(heading: str) -> Tuple[str, int]:
+    """
+    見出しを書き換える（■で始まるようにする）
+
+    Args:
+        heading: 見出し
+
+    Returns:
+        Tuple[str, int]: (書き換え後の見出し, 書き換えた箇所の数)
+    """
+    heading, fixes = clean_text(heading)
+    if heading and not heading.startswith(HEADING_MARKER):
+        heading = HEADING_MARKER + heading
+        fixes += 1
+    return heading, fixes
+
+
+def clean_article(article: dict) -> Tuple[dict, int]:
+    """
+    記事全体（title / lead / sections / cta）を機械的に書き換える
+
+    Args:
+        article: Agent1の出力（token_usageなど他のキーはそのまま残す）
+
+    Returns:
+        Tuple[dict, int]: (書き換え後の記事, 書き換えた箇所の数)
+    """
+    cleaned = dict(article)
+    fixes = 0
+
+    for field in ('title', 'lead', 'cta'):
+        if isinstance(article.get(field), str):
+            cleaned[field], count = clean_text(article[field])
+            fixes += count
+
+    sections = []
+    for section in article.get('sections', []):
+        section = dict(section)
+        section['heading'], heading_fixes = clean_heading(section.get('heading', ''))
+        section['body'], body_fixes = clean_text(section.get('body', ''))
+        fixes += heading_fixes + body_fixes
+        sections.append(section)
+    if 'sections' in article:
+        cleaned['sections'] = sections
+
+    return cleaned, fixes
+
+
+def find_violations(article: dict) -> List[StyleViolation]:
+    """
+    書き換え後も残っている禁止事項を検出
+
+    Args:
+        article: 記事（title / lead / sections / cta）
+
+    Returns:
+        List[StyleViolation]: 違反箇所（無ければ空）
+    """
+    violations = []
+
+    def check(field: str, text: str, section_index: Optional[int] = None):
+        for rule, pattern in _VIOLATION_RULES:
+            for match in pattern.finditer(text or ''):
+                start = max(0, match.start() - _EXCERPT_CHARS)
+                excerpt = text[start:match.end() + _EXCERPT_CHARS]
+                violations.append(StyleViolation(field, rule, excerpt, section_index))
+
+    check('title', article.get('title', ''))
+    check('lead', article.get('lead', ''))
+    for index, section in enumerate(article.get('sections', [])):
+        heading = section.get('heading', '')
+        if not heading.startswith(HEADING_MARKER):
+            violations.append(StyleViolation('heading', 'heading_marker', heading, index))
+        check('heading', heading, index)
+        check('body', section.get('body', ''), index)
+    check('cta', article.get('cta', ''))
+
+    return violations
@@ -2,9 +2,15 @@
 トークン制限サービス
 月次トークン使用量の管理
 """
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
 from app.config import get_config
 from app.models.errors import TokenLimitExceededError
 from app.clients.gsheet_client import get_gsheet_client
+from app.clients.log_store import get_log_store
+from app.clients.token_ledger import get_token_ledger
+from app.services.api_key_service import get_api_key_service
 
 config = get_config()
 
@@ -16,13 +22,17 @@ class TokenService:
         """初期化"""
         self.monthly_limit = config.MONTHLY_TOKEN_LIMIT
         self.gsheet_client = get_gsheet_client()
+        self.log_store = get_log_store()
+        self.token_ledger = get_token_ledger()
+        self.api_key_service = get_api_key_service()
 
-    def check_token_limit(self, estimated_tokens: int) -> bool:
+    def check_token_limit(self, estimated_tokens: int, api_key: Optional[str] = None) -> bool:
         """
-        トークン上限をチェック
+        トークン上限をチェック（予約はしない。他のリクエストの予約中のトークンも使用量に含める）
 
         Args:
             estimated_tokens: 今回使用予定のトークン数
+            api_key: リクエスト元のAPIキー名（キーごとの月次上限もチェックする）
 
         Returns:
             bool: 上限内かどうか
@@ -31,24 +41,20 @@ class TokenService:
             TokenLimitExceededError: 上限超過
         """
         try:
-            # 今月の総使用量を取得
-            current_usage = self.gsheet_client.get_total_tokens_this_month()
+            # キーごとの上限はローカルの台帳のみで判定する
+            key_limit = self.api_key_service.get_key_limit(api_key)
+            if key_limit:
+                key_status = self.token_ledger.get_key_status(api_key)
+                if key_status['current_usage'] + key_status['reserved_tokens'] + estimated_tokens > key_limit:
+                    raise self.api_key_service.quota_exceeded(
+                        api_key, estimated_tokens, key_status['current_usage'], key_status['reserved_tokens']
+                    )
 
-            # 新規使用後の総量を計算
-            projected_usage = current_usage + estimated_tokens
-
-            # 上限チェック
-            if projected_usage > self.monthly_limit:
-                raise TokenLimitExceededError(
-                    message=f'月次トークン上限を超過します',
-                    details={
-                        'monthly_limit': self.monthly_limit,
-                        'current_usage': current_usage,
-                        'estimated_tokens': estimated_tokens,
-                        'projected_usage': projected_usage,
-                        'remaining': self.monthly_limit - current_usage
-                    }
-                )
+            # 今月の総使用量と予約中のトークン数を取得
+            status = self.token_ledger.get_status(self.gsheet_client.get_total_tokens_this_month())
+
+            if status['current_usage'] + status['reserved_tokens'] + estimated_tokens > self.monthly_limit:
+                raise self._limit_exceeded(estimated_tokens, status['current_usage'], status['reserved_tokens'])
 
             return True
 
@@ -60,6 +66,164 @@ class TokenService:
             print("⚠️  トークン制限チェックをスキップします")
             return True
 
+    def reserve_tokens(self, estimated_tokens: int, api_key: Optional[str] = None) -> Optional[str]:
+        """
+        推定トークン数を予約（同時に届いたリクエストも含めて上限に収まる場合のみ）
+
+        生成後は commit_tokens で実際の使用量を確定し、失敗した場合は release_tokens で解放する
+
+        Args:
+            estimated_tokens: 今回使用予定のトークン数
+            api_key: リクエスト元のAPIキー名（キーごとの使用量に計上し、キーごとの月次上限も判定する）
+
+        Returns:
+            Optional[str]: 予約ID（台帳を利用できない場合はNone）
+
+        Raises:
+            TokenLimitExceededError: 上限超過
+        """
+        try:
+            result = self.token_ledger.reserve(
+                estimated_tokens,
+                self.monthly_limit,
+                self.gsheet_client.get_total_tokens_this_month(),
+                api_key=api_key,
+                key_limit=self.api_key_service.get_key_limit(api_key)
+            )
+        except Exception as e:
+            # 台帳が利用できない場合は警告のみ（check_token_limit と同じ扱い）
+            print(f"⚠️  トークン予約エラー: {e}")
+            print("⚠️  トークン制限チェックをスキップします")
+            return None
+
+        if not result['reserved']:
+            if result.get('limited_by') == 'api_key':
+                raise self.api_key_service.quota_exceeded(
+                    api_key, estimated_tokens, result['key_usage'], result['key_reserved_tokens']
+                )
+            raise self._limit_exceeded(estimated_tokens, result['current_usage'], result['reserved_tokens'])
+        return result['reservation_id']
+
+    def commit_tokens(self, reservation_id: Optional[str], actual_tokens: int):
+        """
+        予約を実際の使用量で確定
+
+        Args:
+            reservation_id: reserve_tokens の予約ID
+            actual_tokens: 実際に使用したトークン数（total_tokens）
+        """
+        try:
+            self.token_ledger.commit(reservation_id, actual_tokens)
+        except Exception as e:
+            print(f"⚠️  トークン使用量の確定エラー: {e}")
+
+    def release_tokens(self, reservation_id: Optional[str]):
+        """
+        予約を解放
+
+        Args:
+            reservation_id: reserve_tokens の予約ID
+        """
+        try:
+            self.token_ledger.release(reservation_id)
+        except Exception as e:
+            print(f"⚠️  トークン予約の解放エラー: {e}")
+
+    def _limit_exceeded(self, estimated_tokens: int, current_usage: int, reserved_tokens: int) -> TokenLimitExceededError:
+        """上限超過エラーを生成"""
+        projected_usage = current_usage + reserved_tokens + estimated_tokens
+        return TokenLimitExceededError(
+            message=f'月次トークン上限を超過します',
+            details={
+                'monthly_limit': self.monthly_limit,
+                'current_usage': current_usage,
+                'reserved_tokens': reserved_tokens,
+                'estimated_tokens': estimated_tokens,
+                'projected_usage': projected_usage,
+                'remaining': self.monthly_limit - current_usage - reserved_tokens
+            }
+        )
+
+    @contextmanager
+    def hedge_reservation(self, estimated_tokens: int, api_key: Optional[str] = None):
+        """
+        Agent1のヘッジリクエスト1本分のトークンを予約し、ヘッジしてよいかを返す
+
+        今月のヘッジ消費が上限の LLM_HEDGE_BUDGET_RATIO 以内で、他のリクエストの予約中のトークンと
+        本体の予約に加えてもう1本分を予約できる場合（月次上限・キーごとの上限とも）のみ許可する。
+        ヘッジ分の実際の使用量は本体の予約の確定時に total_tokens に含めて計上するため、予約は抜ける時に解放する
+
+        Args:
+            estimated_tokens: 今回使用予定のトークン数
+            api_key: リクエスト元のAPIキー名
+
+        Yields:
+            bool: ヘッジしてよいか
+        """
+        reservation_id = self._reserve_hedge(estimated_tokens, api_key)
+        try:
+            yield reservation_id is not None
+        finally:
+            if reservation_id is not None:
+                self.release_tokens(reservation_id)
+
+    def _reserve_hedge(self, estimated_tokens: int, api_key: Optional[str]) -> Optional[str]:
+        """ヘッジ1本分を予約（許可しない場合はNone）"""
+        if not config.LLM_HEDGE_AGENT1:
+            return None
+
+        try:
+            hedge_usage = self.log_store.get_counter(self._hedge_counter_key())
+            if hedge_usage + estimated_tokens > self.monthly_limit * config.LLM_HEDGE_BUDGET_RATIO:
+                return None
+
+            result = self.token_ledger.reserve(
+                estimated_tokens,
+                self.monthly_limit,
+                self.gsheet_client.get_total_tokens_this_month(),
+                api_key=api_key,
+                key_limit=self.api_key_service.get_key_limit(api_key)
+            )
+
+        except Exception as e:
+            # 使用量が確認できない場合は追加の消費をしない
+            print(f"⚠️  ヘッジ可否の判定エラー: {e}")
+            return None
+
+        return result['reservation_id'] if result['reserved'] else None
+
+    def record_hedge_tokens(self, tokens: int):
+        """
+        ヘッジリクエストで打ち切った呼び出しのトークン数を今月の集計に加算
+
+        Args:
+            tokens: 推定トークン数
+        """
+        if tokens <= 0:
+            return
+        try:
+            self.log_store.add_to_counter(self._hedge_counter_key(), tokens)
+        except Exception as e:
+            print(f"⚠️  ヘッジトークンの集計エラー: {e}")
+
+    def get_hedge_usage(self) -> int:
+        """
+        今月のヘッジリクエストによる追加トークン数
+
+        Returns:
+            int: 推定トークン数
+        """
+        try:
+            return self.log_store.get_counter(self._hedge_counter_key())
+        except Exception as e:
+            print(f"⚠️  ヘッジトークンの取得エラー: {e}")
+            return 0
+
+    @staticmethod
+    def _hedge_counter_key() -> str:
+        """今月のヘッジトークン集計のキー"""
+        return f"hedge_tokens:{datetime.now().strftime('%Y-%m')}"
+
     def get_usage_stats(self) -> dict:
         """
         使用量統計を取得
@@ -74,7 +238,9 @@ class TokenService:
                 'monthly_limit': self.monthly_limit,
                 'current_usage': current_usage,
                 'remaining': self.monthly_limit - current_usage,
-                'usage_percentage': (current_usage / self.monthly_limit * 100) if self.monthly_limit > 0 else 0
+                'usage_percentage': (current_usage / self.monthly_limit * 100) if self.monthly_limit > 0 else 0,
+                'reserved_tokens': self.token_ledger.get_status(current_usage)['reserved_tokens'],
+                'hedge_tokens': self.get_hedge_usage()
             }
 
         except Exception as e:
@@ -0,0 +1,54 @@
+"""
+Shared pytest fixtures
+"""
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def reset_singletons():
+    """Reset module-level singletons so each test builds its own (mocked) clients"""
+    from app.clients import (
+        gsheet_client, gsheet_writer, llm_async, llm_client_registry, llm_hedge, llm_router, job_store, log_store,
+        rate_limiter, result_cache, token_estimator, token_ledger
+    )
+    from app.services import admission_controller, api_key_service, batch_service, job_service, note_service
+
+    def reset():
+        if llm_async._llm_event_loop_instance is not None:
+            llm_async._llm_event_loop_instance.close()
+            llm_async._llm_event_loop_instance = None
+        gsheet_client._gsheet_client_instance = None
+        gsheet_writer._gsheet_writer_instance = None
+        llm_client_registry._registry_instance = None
+        llm_router._llm_router_instance = None
+        llm_hedge._first_token_tracker_instance = None
+        job_store._job_store_instance = None
+        log_store._log_store_instance = None
+        rate_limiter._rate_limiter_instance = None
+        result_cache._result_cache_instance = None
+        token_estimator._token_estimator_instance = None
+        token_ledger._token_ledger_instance = None
+        admission_controller._admission_controller_instance = None
+        api_key_service._api_key_service_instance = None
+        job_service._job_service_instance = None
+        note_service._note_service_instance = None
+        batch_service._batch_service_instance = None
+
+    reset()
+    yield
+    reset()
+
+
+@pytest.fixture(autouse=True)
+def local_data_dir(tmp_path, monkeypatch):
+    """Point local SQLite stores at a per-test temporary directory"""
+    from app.config import get_config
+
+    config = get_config()
+    monkeypatch.setattr(config, 'LOCAL_DATA_DIR', str(tmp_path))
+    monkeypatch.setattr(config, 'JOB_STORE_PATH', str(tmp_path / 'jobs.sqlite3'))
+    monkeypatch.setattr(config, 'LOG_STORE_PATH', str(tmp_path / 'note_logs.sqlite3'))
+    monkeypatch.setattr(config, 'RESULT_CACHE_PATH', str(tmp_path / 'result_cache.sqlite3'))
+    monkeypatch.setattr(config, 'TOKEN_LEDGER_PATH', str(tmp_path / 'token_ledger.sqlite3'))
+    monkeypatch.setattr(config, 'API_RATE_LIMIT_PATH', str(tmp_path / 'api_rate_limit.sqlite3'))
+    return tmp_path
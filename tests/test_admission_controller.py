@@ -0,0 +1,179 @@
+"""
+Test suite for the generation admission controller
+"""
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from app.models.errors import ServiceBusyError
+from app.services.admission_controller import AdmissionController
+from app.services.note_service import NoteService
+
+
+def _wait_until(predicate, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return
+        time.sleep(0.005)
+    pytest.fail('condition not reached')
+
+
+def _queue_in_background(controller, priority, results):
+    """Start a thread that waits for a slot and records the outcome"""
+    def run():
+        try:
+            controller.acquire(priority)
+            results.append(priority)
+        except ServiceBusyError as e:
+            results.append((priority, e.details['reason']))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+class TestAdmissionController:
+    """Tests for AdmissionController class"""
+
+    def test_admits_up_to_max_in_flight(self):
+        """Test requests run immediately while slots are free"""
+        controller = AdmissionController(max_in_flight=2, max_queue=0, queue_timeout=1)
+
+        controller.acquire('api')
+        controller.acquire('api')
+        with pytest.raises(ServiceBusyError) as exc_info:
+            controller.acquire('api')
+
+        assert exc_info.value.details['reason'] == 'queue_full'
+        assert exc_info.value.retry_after >= 1
+        stats = controller.get_stats()
+        assert stats['in_flight'] == 2
+        assert stats['admitted']['api'] == 2
+        assert stats['rejected']['api'] == 1
+
+    def test_released_slot_goes_to_highest_priority(self):
+        """Test waiting UI requests are served before API and batch requests"""
+        controller = AdmissionController(max_in_flight=1, max_queue=3, queue_timeout=5)
+        controller.acquire('api')
+        results = []
+
+        threads = []
+        for priority in ['batch', 'api', 'ui']:
+            threads.append(_queue_in_background(controller, priority, results))
+            _wait_until(lambda: sum(controller.get_stats()['queue_depth'].values()) == len(threads))
+
+        for _ in range(3):
+            controller.release()
+            _wait_until(lambda: len(results) == 3 - sum(controller.get_stats()['queue_depth'].values()))
+        for thread in threads:
+            thread.join()
+
+        assert results == ['ui', 'api', 'batch']
+        assert controller.get_stats()['wait_seconds']['max'] > 0
+
+    def test_full_queue_sheds_lower_priority(self):
+        """Test a higher-priority request displaces the newest lowest-priority waiter"""
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5)
+        controller.acquire('api')
+        results = []
+        batch = _queue_in_background(controller, 'batch', results)
+        _wait_until(lambda: controller.get_stats()['queue_depth']['batch'] == 1)
+
+        ui = _queue_in_background(controller, 'ui', results)
+        batch.join()
+
+        assert results == [('batch', 'shed')]
+        # 同じ優先度以下の待機しか無い場合は新しいリクエストを拒否する
+        with pytest.raises(ServiceBusyError):
+            controller.acquire('api')
+
+        controller.release()
+        ui.join()
+        assert results[-1] == 'ui'
+        assert controller.get_stats()['shed']['batch'] == 1
+
+    def test_queue_timeout(self):
+        """Test a waiter gives up after the queue timeout"""
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0.05)
+        controller.acquire('api')
+
+        with pytest.raises(ServiceBusyError) as exc_info:
+            controller.acquire('api')
+
+        assert exc_info.value.details['reason'] == 'queue_timeout'
+        stats = controller.get_stats()
+        assert stats['timed_out']['api'] == 1
+        assert sum(stats['queue_depth'].values()) == 0
+
+    def test_timeout_shorter_than_queue_timeout(self):
+        """Test a caller can wait less than the queue timeout (the rest of its deadline)"""
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=60)
+        controller.acquire('api')
+
+        started_at = time.monotonic()
+        with pytest.raises(ServiceBusyError) as exc_info:
+            controller.acquire('api', timeout=0.05)
+
+        assert exc_info.value.details['reason'] == 'queue_timeout'
+        assert time.monotonic() - started_at < 1
+
+    def test_unlimited_when_disabled(self):
+        """Test max_in_flight=0 disables the limit"""
+        controller = AdmissionController(max_in_flight=0, max_queue=0, queue_timeout=0)
+
+        with controller.slot('batch'):
+            with controller.slot('batch'):
+                assert controller.get_stats()['in_flight'] == 2
+
+        assert controller.get_stats()['in_flight'] == 0
+
+
+class TestNoteServiceAdmission:
+    """Tests for admission control in NoteService"""
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_busy_releases_reservation(self, mock_gsheet_class, mock_get_writer):
+        """Test a rejected request releases its token reservation and never calls the LLM"""
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        service = NoteService()
+        service.admission = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+        service.admission.acquire('api')
+        service._generate = MagicMock()
+
+        with pytest.raises(ServiceBusyError):
+            service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        service._generate.assert_not_called()
+        assert service.token_service.token_ledger.get_status()['reservations'] == 0
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_stream_rejected_before_streaming(self, mock_gsheet_class, mock_get_writer):
+        """Test a full queue is reported as an error response rather than an SSE event"""
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        service = NoteService()
+        service.admission = AdmissionController(max_in_flight=1, max_queue=0, queue_timeout=1)
+        service.admission.acquire('api')
+
+        with pytest.raises(ServiceBusyError):
+            service.generate_note_stream({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_queue_wait_counts_against_deadline(self, mock_gsheet_class, mock_get_writer, monkeypatch):
+        """Test the LLM deadline passed to generation excludes the time spent waiting for a slot"""
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        monkeypatch.setattr('app.services.note_service.config.LLM_REQUEST_DEADLINE_SECONDS', 10.0)
+        service = NoteService()
+        service.admission = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=60)
+        service.admission.acquire('api')
+        threading.Timer(0.3, service.admission.release).start()
+        service._generate = MagicMock(side_effect=RuntimeError('stop'))
+
+        with pytest.raises(Exception):
+            service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        deadline_seconds = service._generate.call_args[0][3]
+        assert 9.0 < deadline_seconds <= 9.75
@@ -40,3 +40,29 @@ def test_health_endpoint_has_correct_structure(client):
     version = data['version']
     assert isinstance(version, str)
     assert len(version.split('.')) == 3
+
+
+def test_metrics_does_not_create_services(client):
+    """Test the metrics endpoint reports unused services as null instead of starting them"""
+    from app.services import job_service
+
+    response = client.get('/api/v1/metrics')
+
+    assert response.status_code == 200
+    assert response.json['jobs'] is None
+    assert 'api_keys' not in response.json
+    assert job_service._job_service_instance is None
+
+
+def test_metrics_requires_admin_key_when_auth_enabled(client, monkeypatch):
+    """Test only the admin key can read metrics (including per-key usage)"""
+    monkeypatch.setattr('app.services.api_key_service.config.API_AUTH_ENABLED', True)
+    monkeypatch.setattr('app.services.api_key_service.config.API_KEYS', 'blog=secret-blog')
+    monkeypatch.setattr('app.services.api_key_service.config.ADMIN_API_KEY', 'secret-admin')
+
+    assert client.get('/api/v1/metrics').status_code == 401
+    assert client.get('/api/v1/metrics', headers={'X-API-Key': 'secret-blog'}).status_code == 401
+
+    response = client.get('/api/v1/metrics', headers={'X-API-Key': 'secret-admin'})
+    assert response.status_code == 200
+    assert set(response.json['api_keys']['keys']) == {'blog', 'admin'}
@@ -0,0 +1,233 @@
+"""
+Test suite for API-key authentication, rate limits and per-key token quotas
+"""
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.main import create_app
+from app.clients.rate_limiter import TokenBucketLimiter
+from app.clients.token_ledger import get_token_ledger
+from app.models.errors import UnauthorizedError, TokenLimitExceededError
+from app.services.api_key_service import ApiKeyService, parse_api_keys
+from app.services.token_service import TokenService
+
+
+@pytest.fixture
+def auth_config(monkeypatch):
+    """Enable authentication with two keys"""
+    monkeypatch.setattr('app.services.api_key_service.config.API_AUTH_ENABLED', True)
+    monkeypatch.setattr('app.services.api_key_service.config.API_KEYS', 'blog=secret-blog,script=secret-script:2:5000')
+    monkeypatch.setattr('app.services.api_key_service.config.API_KEY_RATE_PER_MINUTE', 60)
+    monkeypatch.setattr('app.services.api_key_service.config.API_KEY_BURST', 2)
+    monkeypatch.setattr('app.services.api_key_service.config.API_KEY_MONTHLY_TOKEN_LIMIT', 10000)
+    monkeypatch.setattr('app.services.api_key_service.config.ADMIN_API_KEY', 'secret-admin')
+
+
+@pytest.fixture
+def client(auth_config):
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+PAYLOAD = {'topic': 'AI副業', 'audience': '会社員', 'goal': '始め方を知る'}
+
+
+class TestParseApiKeys:
+    """Tests for parse_api_keys"""
+
+    def test_defaults_and_overrides(self, auth_config):
+        """Test per-key values override the defaults and malformed entries are skipped"""
+        keys = parse_api_keys('blog=secret-blog, script=secret-script:2:5000, broken, bad=key:x')
+
+        assert set(keys) == {'blog', 'script'}
+        assert (keys['blog'].rate_per_minute, keys['blog'].monthly_token_limit) == (60, 10000)
+        assert (keys['script'].rate_per_minute, keys['script'].monthly_token_limit) == (2, 5000)
+
+
+class TestApiKeyService:
+    """Tests for ApiKeyService class"""
+
+    def test_disabled_accepts_everything(self):
+        """Test no key is required when authentication is disabled"""
+        assert ApiKeyService().authenticate({}) is None
+
+    def test_authenticate(self, auth_config):
+        """Test X-API-Key and Bearer headers are accepted and unknown keys rejected"""
+        service = ApiKeyService()
+
+        assert service.authenticate({'X-API-Key': 'secret-blog'}).name == 'blog'
+        assert service.authenticate({'Authorization': 'Bearer secret-script'}).name == 'script'
+        assert service.authenticate({'X-API-Key': 'secret-admin'}).unlimited is True
+        with pytest.raises(UnauthorizedError):
+            service.authenticate({'X-API-Key': 'wrong'})
+        with pytest.raises(UnauthorizedError):
+            service.authenticate({})
+        assert service.get_stats()['rejections']['unauthorized'] == 2
+
+    def test_default_admin_key_is_not_accepted(self, auth_config, monkeypatch):
+        """Test the placeholder ADMIN_API_KEY cannot be used"""
+        monkeypatch.setattr('app.services.api_key_service.config.ADMIN_API_KEY', 'change_me')
+
+        with pytest.raises(UnauthorizedError):
+            ApiKeyService().authenticate({'X-API-Key': 'change_me'})
+
+    def test_rate_limit(self, auth_config):
+        """Test requests beyond the burst are rejected with a Retry-After"""
+        service = ApiKeyService()
+        api_key = service.api_keys['blog']
+
+        service.admit(api_key)
+        service.admit(api_key)
+        with pytest.raises(TokenLimitExceededError) as exc_info:
+            service.admit(api_key)
+
+        assert exc_info.value.retry_after == 1
+        assert exc_info.value.details['api_key'] == 'blog'
+        # 他のキー・管理用キーには影響しない
+        service.admit(service.api_keys['script'])
+        for _ in range(5):
+            service.admit(service.api_keys['admin'])
+
+    def test_exhausted_quota_is_rejected_without_ledger(self, auth_config):
+        """Test a key past its monthly quota is rejected, then served from memory"""
+        service = ApiKeyService()
+        ledger = get_token_ledger()
+        reservation = ledger.reserve(5000, limit=10 ** 9, api_key='script', key_limit=5000)
+        ledger.commit(reservation['reservation_id'], 5200)
+
+        with pytest.raises(TokenLimitExceededError) as exc_info:
+            service.admit(service.api_keys['script'])
+        assert exc_info.value.details['current_usage'] == 5200
+
+        service.token_ledger = MagicMock()
+        with pytest.raises(TokenLimitExceededError):
+            service.admit(service.api_keys['script'])
+        service.token_ledger.get_key_status.assert_not_called()
+
+
+class TestTokenBucketLimiter:
+    """Tests for TokenBucketLimiter class"""
+
+    def test_refills_over_time(self, local_data_dir):
+        """Test the bucket refills according to the elapsed time"""
+        limiter = TokenBucketLimiter(str(local_data_dir / 'buckets.sqlite3'))
+
+        with patch('app.clients.rate_limiter.time.time', return_value=1000.0):
+            assert limiter.acquire('k', rate_per_second=0.5, burst=1) == 0
+            assert limiter.acquire('k', rate_per_second=0.5, burst=1) == pytest.approx(2.0)
+        with patch('app.clients.rate_limiter.time.time', return_value=1002.0):
+            assert limiter.acquire('k', rate_per_second=0.5, burst=1) == 0
+
+    def test_cost(self, local_data_dir):
+        """Test a request can take several tokens, and one larger than the burst leaves a debt"""
+        limiter = TokenBucketLimiter(str(local_data_dir / 'buckets.sqlite3'))
+
+        with patch('app.clients.rate_limiter.time.time', return_value=1000.0):
+            assert limiter.acquire('k', rate_per_second=1, burst=3, cost=2) == 0
+            assert limiter.acquire('k', rate_per_second=1, burst=3, cost=2) == pytest.approx(1.0)
+        with patch('app.clients.rate_limiter.time.time', return_value=1002.0):
+            assert limiter.acquire('k', rate_per_second=1, burst=3, cost=10) == 0
+        with patch('app.clients.rate_limiter.time.time', return_value=1005.0):
+            # 超過分（7回分）が補充されるまでは受け付けない
+            assert limiter.acquire('k', rate_per_second=1, burst=3) == pytest.approx(5.0)
+
+    def test_shared_between_instances(self, local_data_dir):
+        """Test concurrent limiters on the same file (as separate workers would) share one bucket"""
+        path = str(local_data_dir / 'buckets.sqlite3')
+        TokenBucketLimiter(path)
+        barrier = threading.Barrier(10)
+        results = []
+
+        def acquire():
+            limiter = TokenBucketLimiter(path)
+            barrier.wait()
+            results.append(limiter.acquire('k', rate_per_second=0.001, burst=3))
+
+        threads = [threading.Thread(target=acquire) for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(0) == 3
+
+
+class TestKeyQuotaReservation:
+    """Tests for per-key quotas in TokenService"""
+
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_reservation_counts_against_key_quota(self, mock_gsheet_class, auth_config):
+        """Test reservations and committed usage are tracked per key"""
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        service = TokenService()
+
+        first = service.reserve_tokens(3000, api_key='script')
+        with pytest.raises(TokenLimitExceededError) as exc_info:
+            service.reserve_tokens(3000, api_key='script')
+        assert exc_info.value.message == 'APIキーの月次トークン上限を超過します'
+        assert exc_info.value.details['reserved_tokens'] == 3000
+
+        # 他のキーは別枠
+        service.reserve_tokens(3000, api_key='blog')
+
+        service.commit_tokens(first, 1000)
+        assert service.token_ledger.get_key_status('script') == {'current_usage': 1000, 'reserved_tokens': 0}
+        service.check_token_limit(3000, api_key='script')
+
+
+class TestNotesApiAuthentication:
+    """Tests for authentication on /api/v1/notes/*"""
+
+    def test_missing_key_returns_401(self, client):
+        """Test requests without a key are rejected"""
+        response = client.get('/api/v1/notes')
+
+        assert response.status_code == 401
+        assert response.json['error']['code'] == 'UNAUTHORIZED'
+
+    @patch('app.services.note_service.NoteService.agenerate_note')
+    def test_generation_is_attributed_to_the_key(self, mock_generate, client):
+        """Test the authenticated key name replaces any api_key in the body"""
+        mock_generate.return_value = MagicMock(to_dict=MagicMock(return_value={'note_id': 'N'}))
+
+        response = client.post(
+            '/api/v1/notes/generate',
+            json=dict(PAYLOAD, api_key='admin'),
+            headers={'X-API-Key': 'secret-blog'}
+        )
+
+        assert response.status_code == 200
+        assert mock_generate.call_args[0][0]['api_key'] == 'blog'
+
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.services.note_service.NoteService.agenerate_note')
+    def test_rate_limited_generation_returns_429(self, mock_generate, mock_gsheet_class, client):
+        """Test over-limit requests get a 429 with Retry-After and never reach Sheets"""
+        mock_generate.return_value = MagicMock(to_dict=MagicMock(return_value={'note_id': 'N'}))
+
+        statuses = [
+            client.post('/api/v1/notes/generate', json=PAYLOAD, headers={'X-API-Key': 'secret-blog'})
+            for _ in range(3)
+        ]
+
+        assert [response.status_code for response in statuses] == [200, 200, 429]
+        assert statuses[2].headers['Retry-After'] == '1'
+        assert statuses[2].json['error']['code'] == 'TOKEN_LIMIT_EXCEEDED'
+        assert mock_generate.call_count == 2
+        mock_gsheet_class.return_value.get_total_tokens_this_month.assert_not_called()
+
+    @patch('app.routes.api_notes.get_batch_service')
+    def test_batch_counts_each_item(self, mock_get_batch_service, client):
+        """Test a batch uses one rate-limit token per item"""
+        mock_batch_service = mock_get_batch_service.return_value
+        mock_batch_service.generate_batch.return_value = {'items': [], 'summary': {}}
+
+        response = client.post(
+            '/api/v1/notes/batch', json={'items': [PAYLOAD, PAYLOAD]}, headers={'X-API-Key': 'secret-blog'}
+        )
+        assert response.status_code == 200
+
+        response = client.post('/api/v1/notes/generate', json=PAYLOAD, headers={'X-API-Key': 'secret-blog'})
+        assert response.status_code == 429
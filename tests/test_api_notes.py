@@ -63,7 +63,7 @@ def mock_note_response():
 class TestNotesGenerate:
     """Tests for POST /api/v1/notes/generate endpoint"""
 
-    @patch('app.services.note_service.NoteService.generate_note')
+    @patch('app.services.note_service.NoteService.agenerate_note')
     def test_generate_note_success(self, mock_generate, client, valid_request_payload, mock_note_response):
         """Test successful note generation"""
         from app.models.note_models import GenerateNoteResponse, NoteSection
@@ -95,6 +95,38 @@ class TestNotesGenerate:
         assert response.json['title'] == 'テストタイトル'
         assert len(response.json['sections']) == 3
     
+    @patch('app.services.note_service.NoteService.generate_note')
+    @patch('app.services.note_service.NoteService.agenerate_note')
+    def test_generate_note_runs_on_event_loop(self, mock_agenerate, mock_generate, client, valid_request_payload):
+        """Test /generate awaits the async pipeline on the LLM event loop by default"""
+        import threading
+        threads = []
+
+        async def agenerate_note(request_data):
+            threads.append(threading.current_thread().name)
+            return MagicMock(to_dict=MagicMock(return_value={'note_id': 'N'}))
+
+        mock_agenerate.side_effect = agenerate_note
+
+        response = client.post('/api/v1/notes/generate', json=valid_request_payload)
+
+        assert response.status_code == 200
+        assert threads == ['llm-event-loop']
+        mock_generate.assert_not_called()
+
+    @patch('app.services.note_service.NoteService.generate_note')
+    @patch('app.services.note_service.NoteService.agenerate_note')
+    def test_generate_note_reuse_uses_blocking_path(self, mock_agenerate, mock_generate, client,
+                                                    valid_request_payload):
+        """Test cache: reuse keeps the blocking path, which waits on identical in-flight requests"""
+        mock_generate.return_value = MagicMock(to_dict=MagicMock(return_value={'note_id': 'N'}))
+
+        response = client.post('/api/v1/notes/generate', json=dict(valid_request_payload, cache='reuse'))
+
+        assert response.status_code == 200
+        mock_generate.assert_called_once()
+        mock_agenerate.assert_not_called()
+
     def test_generate_note_missing_required_field(self, client):
         """Test validation error for missing required field"""
         invalid_payload = {
@@ -168,14 +200,173 @@ class TestNotesGenerate:
         assert response.status_code == 400
         assert 'error' in response.json
 
+    @patch('app.services.note_service.NoteService.agenerate_note')
+    def test_generate_note_llm_unavailable(self, mock_generate, client, valid_request_payload):
+        """Test exhausted LLM retries return 503 with Retry-After"""
+        from app.models.errors import LLMUnavailableError
+        mock_generate.side_effect = LLMUnavailableError(retry_after=30)
+
+        response = client.post('/api/v1/notes/generate', json=valid_request_payload)
+
+        assert response.status_code == 503
+        assert response.json['error']['code'] == 'LLM_UNAVAILABLE'
+        assert response.headers['Retry-After'] == '30'
+
+    @patch('app.clients.llm_client.call_agent1')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_generate_note_token_limit_is_not_internal_error(self, mock_gsheet_class, mock_agent1,
+                                                             client, valid_request_payload):
+        """Test the monthly token limit reaches the client as 429, not wrapped in a 500 INTERNAL_ERROR"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 298000
+        mock_gsheet_class.return_value = mock_client
+        response = client.post('/api/v1/notes/generate', json=valid_request_payload)
+
+        assert response.status_code == 429
+        assert response.json['error']['code'] == 'TOKEN_LIMIT_EXCEEDED'
+        mock_agent1.assert_not_called()
+
+
+class TestNotesGenerateStream:
+    """Tests for POST /api/v1/notes/generate/stream endpoint"""
+
+    @patch('app.services.note_service.NoteService.generate_note_stream')
+    def test_generate_note_stream_success(self, mock_stream, client, valid_request_payload):
+        """Test SSE response carries stage events and the final result"""
+        mock_stream.return_value = iter([
+            ('validated', {'note_id': 'TEST123456'}),
+            ('agent1_started', {}),
+            ('agent1_done', {'token_usage': {'total_tokens': 3000}}),
+            ('agent2_delta', {'text': 'テスト'}),
+            ('saved', {'note_id': 'TEST123456'}),
+            ('result', {'status': 'SUCCESS', 'note_id': 'TEST123456'})
+        ])
+
+        response = client.post(
+            '/api/v1/notes/generate/stream',
+            json=valid_request_payload,
+            content_type='application/json'
+        )
+
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        body = response.get_data(as_text=True)
+        events = [line[len('event: '):] for line in body.splitlines() if line.startswith('event: ')]
+        assert events == ['validated', 'agent1_started', 'agent1_done', 'agent2_delta', 'saved', 'result']
+        assert 'data: {"status": "SUCCESS", "note_id": "TEST123456"}' in body
+
+    def test_generate_note_stream_validation_error(self, client, valid_request_payload):
+        """Test validation errors are returned before the stream starts"""
+        invalid_payload = valid_request_payload.copy()
+        invalid_payload['temperature'] = 3.0
+
+        response = client.post(
+            '/api/v1/notes/generate/stream',
+            json=invalid_payload,
+            content_type='application/json'
+        )
+
+        assert response.status_code == 400
+        assert 'error' in response.json
+
+
+class TestNoteJobs:
+    """Tests for /api/v1/notes/jobs endpoints"""
+
+    @patch('app.routes.api_notes.get_job_service')
+    def test_create_job_returns_202(self, mock_get_job_service, client, valid_request_payload):
+        """Test job creation returns 202 with a status URL"""
+        mock_get_job_service.return_value.submit.return_value = {
+            'job_id': 'job_abc',
+            'status': 'queued',
+            'stage': None,
+            'result': None,
+            'error': None,
+            'created_at': '2025-01-01T00:00:00',
+            'updated_at': '2025-01-01T00:00:00'
+        }
+
+        response = client.post('/api/v1/notes/jobs', json=valid_request_payload)
+
+        assert response.status_code == 202
+        assert response.json['job_id'] == 'job_abc'
+        assert response.json['status_url'] == '/api/v1/notes/jobs/job_abc'
+        assert response.headers['Location'].endswith('/api/v1/notes/jobs/job_abc')
+
+    @patch('app.routes.api_notes.get_job_service')
+    def test_create_job_busy_returns_retry_after(self, mock_get_job_service, client, valid_request_payload):
+        """Test a full job queue returns 503 with Retry-After"""
+        from app.models.errors import ServiceBusyError
+        mock_get_job_service.return_value.submit.side_effect = ServiceBusyError(retry_after=30)
+
+        response = client.post('/api/v1/notes/jobs', json=valid_request_payload)
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '30'
+
+    def test_create_job_validation_error(self, client, valid_request_payload):
+        """Test invalid payloads are rejected synchronously"""
+        invalid_payload = valid_request_payload.copy()
+        invalid_payload['intensity_level'] = 15
+
+        response = client.post('/api/v1/notes/jobs', json=invalid_payload)
+
+        assert response.status_code == 400
+
+    def test_get_job_not_found(self, client):
+        """Test unknown job id returns 404"""
+        response = client.get('/api/v1/notes/jobs/job_missing')
+
+        assert response.status_code == 404
+        assert response.json['error']['code'] == 'NOT_FOUND'
+
 
 class TestNotesIndex:
     """Tests for GET /api/v1/notes endpoint"""
 
-    def test_get_notes_returns_dummy_data(self, client):
-        """Test notes endpoint returns dummy data (current implementation)"""
+    def test_get_notes_returns_items(self, client):
+        """Test notes endpoint returns a list of items"""
         response = client.get('/api/v1/notes')
 
         assert response.status_code == 200
         assert 'items' in response.json
         assert isinstance(response.json['items'], list)
+
+    def test_get_notes_paginates_with_cursor(self, client):
+        """Test notes endpoint returns pages with an opaque cursor"""
+        from app.clients.log_store import get_log_store
+        from app.models.note_models import NoteLogEntry
+
+        get_log_store().insert_many([
+            NoteLogEntry(
+                note_id=f'note_{i}', topic='topic', audience='audience', goal='goal',
+                article_type='education', length_class='middle', temperature=0.7,
+                intensity_level=5, title=f'title {i}', raw_json='{}', total_tokens=100,
+                created_at=f'2025-01-0{i}T00:00:00'
+            )
+            for i in range(1, 4)
+        ])
+
+        first = client.get('/api/v1/notes?limit=2').json
+        second = client.get(f"/api/v1/notes?limit=2&cursor={first['next_cursor']}").json
+
+        assert [item['note_id'] for item in first['items']] == ['note_3', 'note_2']
+        assert 'raw_json' not in first['items'][0]
+        assert [item['note_id'] for item in second['items']] == ['note_1']
+        assert second['next_cursor'] is None
+
+    def test_get_notes_field_projection(self, client):
+        """Test fields parameter limits the returned columns"""
+        response = client.get('/api/v1/notes?fields=note_id,title')
+
+        assert response.status_code == 200
+        assert response.json['items'] == []
+
+    def test_get_notes_rejects_invalid_params(self, client):
+        """Test invalid limit, cursor and fields return 400"""
+        for query in ('limit=0', 'limit=abc', 'cursor=%%%', 'fields=raw_json', 'from=yesterday'):
+            response = client.get(f'/api/v1/notes?{query}')
+
+            assert response.status_code == 400
+            assert response.json['error']['code'] == 'VALIDATION_ERROR'
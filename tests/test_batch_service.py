@@ -0,0 +1,229 @@
+"""
+Test suite for batch generation
+"""
+import json
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.main import create_app
+from app.clients.llm_retry import Deadline
+from app.models.errors import ValidationError, TokenLimitExceededError, LLMUnavailableError
+from app.models.note_models import GenerateNoteResponse
+from app.services.batch_service import BatchService
+from app.services.note_service import NoteService
+
+
+def _item(topic):
+    return {'topic': topic, 'audience': '会社員', 'goal': '始め方を知る'}
+
+
+def _fake_generate(total_tokens=100, fail_topics=()):
+    """Return a stand-in for NoteService._generate that records peak concurrency"""
+    state = {'running': 0, 'peak': 0}
+    lock = threading.Lock()
+
+    def generate(request, estimated_tokens, on_stage=None, deadline_seconds=None):
+        with lock:
+            state['running'] += 1
+            state['peak'] = max(state['peak'], state['running'])
+        try:
+            if request.topic in fail_topics:
+                raise LLMUnavailableError(details={'topic': request.topic})
+            return GenerateNoteResponse(
+                status='SUCCESS',
+                note_id=f'note_{request.topic}',
+                title=request.topic,
+                lead='リード',
+                sections=[],
+                cta='CTA',
+                metadata={'token_usage': {'total_tokens': total_tokens}}
+            )
+        finally:
+            with lock:
+                state['running'] -= 1
+
+    generate.state = state
+    return generate
+
+
+@pytest.fixture
+def note_service():
+    with patch('app.clients.gsheet_client.GoogleSheetsClient') as mock_gsheet_class, \
+            patch('app.services.note_service.get_gsheet_writer'):
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        service = NoteService()
+        service.save_logs = MagicMock()
+        yield service
+
+
+class TestBatchService:
+    """Tests for BatchService class"""
+
+    def test_validation_errors_are_reported_by_index(self, note_service):
+        """Test one invalid item rejects the whole batch before anything is generated"""
+        note_service._generate = MagicMock()
+        service = BatchService(note_service)
+
+        with pytest.raises(ValidationError) as exc_info:
+            service.prepare({'items': [_item('AI副業'), {'topic': ''}, 'x']})
+
+        assert set(exc_info.value.details['errors']) == {'1', '2'}
+        note_service._generate.assert_not_called()
+        assert note_service.token_service.token_ledger.get_status()['reservations'] == 0
+
+    def test_item_count_limits(self, note_service, monkeypatch):
+        """Test empty and oversized batches are rejected"""
+        monkeypatch.setattr('app.services.batch_service.config.BATCH_MAX_ITEMS', 2)
+        service = BatchService(note_service)
+
+        with pytest.raises(ValidationError):
+            service.prepare({'items': []})
+        with pytest.raises(ValidationError) as exc_info:
+            service.prepare({'items': [_item('a'), _item('b'), _item('c')]})
+        assert exc_info.value.details['max_items'] == 2
+
+    def test_whole_batch_is_reserved_once(self, note_service, monkeypatch):
+        """Test the token limit is checked against the sum of all items"""
+        service = BatchService(note_service)
+        estimated = note_service.estimate_tokens(note_service.validate_request(_item('a')))
+        monkeypatch.setattr(note_service.token_service, 'monthly_limit', estimated * 2)
+
+        with pytest.raises(TokenLimitExceededError) as exc_info:
+            service.stream(service.prepare({'items': [_item('a'), _item('b'), _item('c')]}))
+        assert exc_info.value.details['estimated_tokens'] == estimated * 3
+
+        batch = service.prepare({'items': [_item('a'), _item('b')]})
+        results = service.stream(batch)
+        status = note_service.token_service.token_ledger.get_status()
+        assert (status['reservations'], status['reserved_tokens']) == (1, batch.estimated_tokens)
+        results.close()
+
+    def test_generates_with_bounded_concurrency_and_saves_once(self, note_service, monkeypatch):
+        """Test results keep request order, failures are per item and logs are saved in one call"""
+        monkeypatch.setattr('app.services.batch_service.config.BATCH_MAX_CONCURRENCY', 2)
+        note_service._generate = _fake_generate(fail_topics={'b'})
+        service = BatchService(note_service)
+
+        items = sorted(service.stream(service.prepare({'items': [_item(t) for t in 'abcde']})),
+                       key=lambda item: item['index'])
+
+        assert [item['index'] for item in items] == [0, 1, 2, 3, 4]
+        assert items[1]['status'] == 'ERROR'
+        assert items[1]['error']['code'] == 'LLM_UNAVAILABLE'
+        assert items[0]['result']['note_id'] == 'note_a'
+        assert service.summarize(items) == {'total': 5, 'succeeded': 4, 'failed': 1, 'total_tokens': 400}
+        assert note_service._generate.state['peak'] <= 2
+
+        note_service.save_logs.assert_called_once()
+        saved = note_service.save_logs.call_args[0][0]
+        assert sorted(response.note_id for _, response in saved) == ['note_a', 'note_c', 'note_d', 'note_e']
+        # 予約は実際の使用量で確定される
+        status = note_service.token_service.token_ledger.get_status()
+        assert (status['reservations'], status['current_usage']) == (0, 400)
+
+    def test_all_failed_releases_reservation(self, note_service):
+        """Test a batch with no successful item releases its reservation"""
+        note_service._generate = _fake_generate(fail_topics={'a', 'b'})
+        service = BatchService(note_service)
+
+        result = service.generate_batch(service.prepare({'items': [_item('a'), _item('b')]}))
+
+        assert result['summary']['failed'] == 2
+        status = note_service.token_service.token_ledger.get_status()
+        assert (status['reservations'], status['current_usage']) == (0, 0)
+
+    def test_synchronous_batch_size_is_capped(self, note_service, monkeypatch):
+        """Test large batches must be streamed and are rejected before reserving"""
+        monkeypatch.setattr('app.services.batch_service.config.BATCH_SYNC_MAX_ITEMS', 2)
+        note_service._generate = MagicMock()
+        service = BatchService(note_service)
+
+        with pytest.raises(ValidationError) as exc_info:
+            service.generate_batch(service.prepare({'items': [_item('a'), _item('b'), _item('c')]}))
+
+        assert exc_info.value.details['sync_max_items'] == 2
+        note_service._generate.assert_not_called()
+        assert note_service.token_service.token_ledger.get_status()['reservations'] == 0
+
+    def test_unconsumed_stream_releases_reservation(self, note_service):
+        """Test a stream dropped before iteration releases its reservation without generating"""
+        note_service._generate = MagicMock()
+        service = BatchService(note_service)
+        ledger = note_service.token_service.token_ledger
+
+        results = service.stream(service.prepare({'items': [_item('a')]}))
+        assert ledger.get_status()['reservations'] == 1
+        del results
+
+        assert ledger.get_status()['reservations'] == 0
+        note_service._generate.assert_not_called()
+
+    def test_items_after_batch_deadline_fail(self, note_service):
+        """Test items not started before the batch deadline are reported as DEADLINE_EXCEEDED"""
+        note_service._generate = MagicMock()
+        service = BatchService(note_service)
+
+        items = list(service.stream(service.prepare({'items': [_item('a'), _item('b')]}), Deadline(0)))
+
+        assert [item['error']['code'] for item in items] == ['DEADLINE_EXCEEDED', 'DEADLINE_EXCEEDED']
+        note_service._generate.assert_not_called()
+
+
+class TestSaveLogs:
+    """Tests for batched log saving in NoteService"""
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_single_sheets_append(self, mock_gsheet_class, mock_get_writer, monkeypatch):
+        """Test several logs are written with one append_rows call when write-behind is off"""
+        monkeypatch.setattr('app.services.note_service.config.GSHEET_WRITE_BEHIND', False)
+        service = NoteService()
+        generate = _fake_generate()
+        pairs = []
+        for topic in ['a', 'b', 'c']:
+            request = service.validate_request(_item(topic))
+            pairs.append((request, generate(request, 0)))
+
+        service.save_logs(pairs)
+
+        mock_gsheet_class.return_value.append_rows.assert_called_once()
+        assert len(mock_gsheet_class.return_value.append_rows.call_args[0][0]) == 3
+        mock_gsheet_class.return_value.append_row.assert_not_called()
+
+
+class TestBatchApi:
+    """Tests for /api/v1/notes/batch"""
+
+    @pytest.fixture
+    def client(self, note_service, monkeypatch):
+        note_service._generate = _fake_generate()
+        monkeypatch.setattr('app.services.batch_service._batch_service_instance', BatchService(note_service))
+        app = create_app()
+        app.config['TESTING'] = True
+        with app.test_client() as client:
+            yield client
+
+    def test_json_response(self, client):
+        """Test the default response contains every item in request order"""
+        response = client.post('/api/v1/notes/batch', json={'items': [_item('a'), _item('b')]})
+
+        assert response.status_code == 200
+        assert [item['result']['title'] for item in response.json['items']] == ['a', 'b']
+        assert response.json['summary']['succeeded'] == 2
+
+    def test_ndjson_stream(self, client):
+        """Test ?stream=true returns one line per item followed by a summary line"""
+        response = client.post('/api/v1/notes/batch?stream=true', json={'items': [_item('a'), _item('b')]})
+
+        assert response.mimetype == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+        assert [line['type'] for line in lines] == ['item', 'item', 'summary']
+        assert sorted(line['index'] for line in lines[:2]) == [0, 1]
+        assert lines[-1]['total'] == 2
+
+    def test_validation_error_before_streaming(self, client):
+        """Test an invalid item is reported as a normal 400 response even when streaming"""
+        response = client.post('/api/v1/notes/batch?stream=true', json={'items': [_item('a'), {}]})
+
+        assert response.status_code == 400
+        assert response.json['error']['code'] == 'VALIDATION_ERROR'
@@ -0,0 +1,227 @@
+"""
+Test suite for Google Sheets Client
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients.gsheet_client import GoogleSheetsClient
+from app.clients.token_counter import month_key
+from app.models.note_models import NoteLogEntry
+
+
+@pytest.fixture
+def sheets_service():
+    """Mock Google Sheets API service"""
+    service = MagicMock()
+    with patch('app.clients.gsheet_client.build', return_value=service), \
+            patch.object(GoogleSheetsClient, '_get_credentials', return_value=MagicMock()):
+        yield service
+
+
+def _log_entry(total_tokens=500, created_at=None):
+    from datetime import datetime
+    return NoteLogEntry(
+        note_id='note_test',
+        topic='topic',
+        audience='audience',
+        goal='goal',
+        article_type='education',
+        length_class='middle',
+        temperature=0.7,
+        intensity_level=5,
+        title='title',
+        raw_json='{}',
+        total_tokens=total_tokens,
+        created_at=created_at or datetime.now().isoformat()
+    )
+
+
+class TestMonthlyTokenTotals:
+    """Tests for the incremental monthly token total"""
+
+    def test_seed_backfills_local_store_once(self, sheets_service):
+        """Test the first total backfills the local store and later reconciles stay local"""
+        this_month = month_key()
+        header = NoteLogEntry.get_header_row()
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {
+            'values': [
+                header,
+                ['note_1', 't', 'a', 'g', 'education', 'middle', '0.7', '5', 'title', '{}', '1000',
+                 f'{this_month}-01T00:00:00'],
+                ['note_2', 't', 'a', 'g', 'story', 'short', '0.7', '5', 'title', '{}', '2000',
+                 f'{this_month}-02T00:00:00'],
+                ['note_3', 't', 'a', 'g', 'story', 'short', '0.7', '5', 'title', '{}', '9999',
+                 '2000-01-01T00:00:00'],
+                ['note_4', 't', 'a', 'g', 'story', 'short', '0.7', '5', 'title', '{}', 'invalid',
+                 f'{this_month}-03T00:00:00']
+            ]
+        }
+
+        client = GoogleSheetsClient()
+
+        assert client.get_total_tokens_this_month() == 3000
+        assert values_api.get.call_count == 1
+
+        client.token_counter.reconcile()
+
+        assert client.get_total_tokens_this_month() == 3000
+        assert values_api.get.call_count == 1
+
+    def test_append_row_updates_total_without_rescan(self, sheets_service):
+        """Test append_row increments the counter in-process"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [['header']]}
+
+        client = GoogleSheetsClient()
+        assert client.get_total_tokens_this_month() == 0
+        get_calls = values_api.get.call_count
+
+        client.append_row(_log_entry(total_tokens=500))
+
+        assert client.get_total_tokens_this_month() == 500
+        # append_row内のヘッダー確認以外にシート全体の再取得は発生しない
+        ranges = [call[1]['range'] for call in values_api.get.call_args_list[get_calls:]]
+        assert 'Note_Logs!A:L' not in ranges
+
+
+class TestAppendRows:
+    """Tests for batched appends"""
+
+    def test_append_rows_single_api_call(self, sheets_service):
+        """Test multiple entries are appended with one values.append call"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [['note_id']]}
+
+        client = GoogleSheetsClient()
+        assert client.append_rows([_log_entry(), _log_entry()]) is True
+
+        values_api.append.assert_called_once()
+        assert len(values_api.append.call_args[1]['body']['values']) == 2
+
+    def test_append_rows_without_service(self, sheets_service):
+        """Test append_rows reports failure when Sheets is unavailable"""
+        client = GoogleSheetsClient()
+        client.service = None
+
+        assert client.append_rows([_log_entry()]) is False
+
+
+class TestHeaderVerification:
+    """Tests for cached header-row verification"""
+
+    def test_header_checked_once_per_process(self, sheets_service):
+        """Test the header GET happens only on the first write"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [NoteLogEntry.get_header_row()]}
+
+        client = GoogleSheetsClient()
+        client.append_row(_log_entry())
+        client.append_row(_log_entry())
+        client.append_rows([_log_entry()])
+
+        header_gets = [c for c in values_api.get.call_args_list if c[1]['range'] == 'Note_Logs!A1:L1']
+        assert len(header_gets) == 1
+        assert client.get_header_status() == {'verified': True, 'drift': []}
+
+    def test_missing_header_is_created(self, sheets_service):
+        """Test an empty sheet gets the header row"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {}
+
+        client = GoogleSheetsClient()
+        client.append_row(_log_entry())
+
+        values_api.update.assert_called_once()
+        assert values_api.update.call_args[1]['body']['values'] == [NoteLogEntry.get_header_row()]
+
+    def test_column_drift_is_flagged(self, sheets_service):
+        """Test a header that differs from NoteLogEntry is reported as drift"""
+        header = NoteLogEntry.get_header_row()
+        header[10], header[11] = header[11], header[10]
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [header]}
+
+        client = GoogleSheetsClient()
+        client.append_row(_log_entry())
+
+        drift = client.get_header_status()['drift']
+        assert [d['column'] for d in drift] == ['K', 'L']
+        assert drift[0] == {'column': 'K', 'expected': 'total_tokens', 'actual': 'created_at'}
+
+    def test_layout_error_triggers_recheck(self, sheets_service):
+        """Test a 400 from Sheets invalidates the cached header check"""
+        from googleapiclient.errors import HttpError
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [NoteLogEntry.get_header_row()]}
+
+        client = GoogleSheetsClient()
+        client.append_row(_log_entry())
+        assert client.get_header_status()['verified'] is True
+
+        values_api.append.return_value.execute.side_effect = HttpError(MagicMock(status=400), b'Unable to parse range')
+        assert client.append_row(_log_entry()) is False
+
+        assert client.get_header_status()['verified'] is False
+
+
+class TestRecentLogs:
+    """Tests for tail-only, column-projected history reads"""
+
+    def test_reads_only_tail_rows_without_raw_json(self, sheets_service):
+        """Test get_recent_logs requests A:I and K:L for the last rows only"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        # A列: ヘッダー + 100行
+        values_api.get.return_value.execute.return_value = {'values': [['note_id']] + [[f'note_{i}'] for i in range(100)]}
+        values_api.batchGet.return_value.execute.return_value = {
+            'valueRanges': [
+                {'values': [
+                    ['note_98', 'topic', 'a', 'g', 'story', 'short', '0.7', '5', 'title 98'],
+                    ['note_99', 'topic', 'a', 'g', 'education', 'middle', '0.7', '7', 'title 99']
+                ]},
+                {'values': [['1000', '2025-01-01T00:00:00'], ['2000', '2025-01-02T00:00:00']]}
+            ]
+        }
+
+        client = GoogleSheetsClient()
+        logs = client.get_recent_logs(limit=2)
+
+        assert values_api.get.call_args[1]['range'] == 'Note_Logs!A:A'
+        assert values_api.batchGet.call_args[1]['ranges'] == ['Note_Logs!A100:I', 'Note_Logs!K100:L']
+        assert [log['note_id'] for log in logs] == ['note_99', 'note_98']
+        assert logs[0] == {
+            'note_id': 'note_99',
+            'topic': 'topic',
+            'title': 'title 99',
+            'created_at': '2025-01-02T00:00:00',
+            'article_type': 'education',
+            'intensity_level': 7,
+            'total_tokens': 2000
+        }
+
+    def test_last_row_from_append_skips_row_count(self, sheets_service):
+        """Test the last row recorded from an append avoids re-reading column A"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [NoteLogEntry.get_header_row()]}
+        values_api.append.return_value.execute.return_value = {'updates': {'updatedRange': 'Note_Logs!A41:L42'}}
+        values_api.batchGet.return_value.execute.return_value = {
+            'valueRanges': [{'values': [['note_41'], ['note_42']]}, {'values': []}]
+        }
+
+        client = GoogleSheetsClient()
+        client.append_rows([_log_entry(), _log_entry()])
+        logs = client.get_recent_logs(limit=2)
+
+        ranges = [c[1]['range'] for c in values_api.get.call_args_list]
+        assert 'Note_Logs!A:A' not in ranges
+        assert values_api.batchGet.call_args[1]['ranges'] == ['Note_Logs!A41:I', 'Note_Logs!K41:L']
+        assert [log['note_id'] for log in logs] == ['note_42', 'note_41']
+
+    def test_empty_sheet(self, sheets_service):
+        """Test a sheet with only the header returns no logs"""
+        values_api = sheets_service.spreadsheets.return_value.values.return_value
+        values_api.get.return_value.execute.return_value = {'values': [['note_id']]}
+
+        client = GoogleSheetsClient()
+
+        assert client.get_recent_logs() == []
+        values_api.batchGet.assert_not_called()
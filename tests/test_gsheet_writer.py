@@ -0,0 +1,215 @@
+"""
+Test suite for Google Sheets write-behind logger
+"""
+import json
+import os
+import threading
+import time
+import pytest
+from dataclasses import asdict
+from unittest.mock import MagicMock, patch
+from app.clients.gsheet_writer import GSheetWriteBehindLogger
+from app.models.note_models import NoteLogEntry
+
+
+def _log_entry(note_id='note_test', total_tokens=100):
+    return NoteLogEntry(
+        note_id=note_id,
+        topic='topic',
+        audience='audience',
+        goal='goal',
+        article_type='education',
+        length_class='middle',
+        temperature=0.7,
+        intensity_level=5,
+        title='タイトル',
+        raw_json='{}',
+        total_tokens=total_tokens,
+        created_at='2025-01-01T00:00:00'
+    )
+
+
+def _wait_until(predicate, timeout=5):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+class TestGSheetWriteBehindLogger:
+    """Tests for GSheetWriteBehindLogger class"""
+
+    def test_enqueue_returns_immediately_and_batches(self, local_data_dir):
+        """Test queued rows are written together in one append"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=3, flush_interval=1.0, max_retries=0,
+            spool_path=str(local_data_dir / 'spool.jsonl')
+        )
+
+        for i in range(3):
+            writer.enqueue(_log_entry(note_id=f'note_{i}'))
+
+        _wait_until(lambda: writer.get_stats()['written'] == 3)
+        gsheet_client.append_rows.assert_called_once()
+        assert [e.note_id for e in gsheet_client.append_rows.call_args[0][0]] == ['note_0', 'note_1', 'note_2']
+        # トークン集計は書き込みを待たずに反映
+        assert gsheet_client.token_counter.add.call_count == 3
+
+    def test_flushes_on_time_trigger(self, local_data_dir):
+        """Test a partial batch is flushed after the flush interval"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=100, flush_interval=0.05, max_retries=0,
+            spool_path=str(local_data_dir / 'spool.jsonl')
+        )
+
+        writer.enqueue(_log_entry())
+
+        _wait_until(lambda: writer.get_stats()['written'] == 1)
+
+    @patch('app.clients.gsheet_writer.time.sleep')
+    def test_retries_then_spills_to_file(self, mock_sleep, local_data_dir):
+        """Test rows are retried with backoff and spilled when Sheets stays down"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = False
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=1, flush_interval=0, max_retries=2, spool_path=str(spool_path)
+        )
+
+        writer._write_batch([_log_entry()], max_retries=2)
+
+        assert gsheet_client.append_rows.call_count == 3
+        assert mock_sleep.call_count == 2
+        assert writer.get_stats()['spilled'] == 1
+        assert '"note_id": "note_test"' in spool_path.read_text(encoding='utf-8')
+
+    def test_spilled_rows_are_replayed_after_recovery(self, local_data_dir):
+        """Test spooled rows are written back once Sheets is reachable"""
+        gsheet_client = MagicMock()
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=10, flush_interval=0, max_retries=0, spool_path=str(spool_path)
+        )
+
+        gsheet_client.append_rows.return_value = False
+        writer._write_batch([_log_entry(note_id='note_spilled')], max_retries=0)
+
+        gsheet_client.append_rows.return_value = True
+        writer._write_batch([_log_entry(note_id='note_new')], max_retries=0)
+
+        written = [e.note_id for call in gsheet_client.append_rows.call_args_list[1:] for e in call[0][0]]
+        assert written == ['note_new', 'note_spilled']
+        assert writer.get_stats()['replayed'] == 1
+        assert not spool_path.exists()
+
+    def test_flush_writes_remaining_rows(self, local_data_dir):
+        """Test flush() drains the queue synchronously"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=10, flush_interval=0, max_retries=0,
+            spool_path=str(local_data_dir / 'spool.jsonl')
+        )
+        writer._queue.put(_log_entry())
+
+        writer.flush()
+
+        gsheet_client.append_rows.assert_called_once()
+
+    def test_flush_spools_batch_still_being_written(self, local_data_dir):
+        """Test flush() spools a batch the worker drained but has not finished writing"""
+        gsheet_client = MagicMock()
+        release = threading.Event()
+        gsheet_client.append_rows.side_effect = lambda rows: release.wait(5) and False
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=1, flush_interval=0, max_retries=0, spool_path=str(spool_path)
+        )
+        writer.enqueue(_log_entry(note_id='note_in_flight'))
+        _wait_until(lambda: gsheet_client.append_rows.called)
+
+        writer.flush()
+
+        lines = [json.loads(line) for line in spool_path.read_text(encoding='utf-8').splitlines()]
+        assert [line['note_id'] for line in lines] == ['note_in_flight']
+
+        # 書き込みスレッドの書き込みが後から失敗しても、二重に退避しない
+        release.set()
+        _wait_until(lambda: writer._in_flight is None)
+        assert len(spool_path.read_text(encoding='utf-8').splitlines()) == 1
+
+    def test_flush_spools_batch_being_collected(self, local_data_dir):
+        """Test flush() spools rows the worker is still collecting and spools later rows directly"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=10, flush_interval=5.0, max_retries=0, spool_path=str(spool_path)
+        )
+        writer.enqueue(_log_entry(note_id='note_collecting'))
+        _wait_until(lambda: writer._queue.qsize() == 0)
+
+        writer.flush()
+        writer.enqueue(_log_entry(note_id='note_after_exit'))
+        _wait_until(lambda: writer.get_stats()['spilled'] == 2)
+
+        lines = [json.loads(line) for line in spool_path.read_text(encoding='utf-8').splitlines()]
+        assert [line['note_id'] for line in lines] == ['note_collecting', 'note_after_exit']
+        gsheet_client.append_rows.assert_not_called()
+
+    def test_replay_error_does_not_spill_written_batch(self, local_data_dir):
+        """Test a failing replay after a successful append does not spool the batch again"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=10, flush_interval=0, max_retries=0, spool_path=str(spool_path)
+        )
+        writer._replay_spool = MagicMock(side_effect=OSError('disk error'))
+
+        writer._write_batch([_log_entry()], max_retries=0)
+
+        assert writer.get_stats()['written'] == 1
+        assert writer.get_stats()['spilled'] == 0
+        assert not spool_path.exists()
+
+    def test_rows_are_not_queued_without_sheets(self, local_data_dir):
+        """Test rows are not retried or spooled when Google Sheets is not configured"""
+        gsheet_client = MagicMock()
+        gsheet_client.service = None
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=1, flush_interval=0, max_retries=0,
+            spool_path=str(local_data_dir / 'spool.jsonl')
+        )
+
+        writer.enqueue(_log_entry())
+
+        assert writer.get_stats()['skipped'] == 1
+        assert writer.get_stats()['queued'] == 0
+        gsheet_client.token_counter.add.assert_called_once()
+        gsheet_client.append_rows.assert_not_called()
+
+    def test_interrupted_replay_files_are_picked_up(self, local_data_dir):
+        """Test replay files left by a dead worker are written back, and a live worker's are left alone"""
+        gsheet_client = MagicMock()
+        gsheet_client.append_rows.return_value = True
+        spool_path = local_data_dir / 'spool.jsonl'
+        writer = GSheetWriteBehindLogger(
+            gsheet_client, batch_size=10, flush_interval=0, max_retries=0, spool_path=str(spool_path)
+        )
+        dead_pid = 2 ** 22 + 1
+        orphan = local_data_dir / f'spool.jsonl.{dead_pid}.1.replay'
+        orphan.write_text(json.dumps(asdict(_log_entry(note_id='note_orphan'))) + '\n', encoding='utf-8')
+        in_progress = local_data_dir / f'spool.jsonl.{os.getppid()}.1.replay'
+        in_progress.write_text(json.dumps(asdict(_log_entry(note_id='note_other'))) + '\n', encoding='utf-8')
+
+        writer._write_batch([_log_entry(note_id='note_new')], max_retries=0)
+
+        written = [e.note_id for call in gsheet_client.append_rows.call_args_list for e in call[0][0]]
+        assert written == ['note_new', 'note_orphan']
+        assert not orphan.exists()
+        assert in_progress.exists()
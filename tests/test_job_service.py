@@ -0,0 +1,150 @@
+"""
+Test suite for Job Service and Job Store
+"""
+import os
+import threading
+import pytest
+from unittest.mock import MagicMock
+from app.clients.job_store import JobStore, JOB_STATUS_QUEUED, JOB_STATUS_RUNNING
+from app.models.errors import ValidationError, NotFoundError, ServiceBusyError, TokenLimitExceededError
+from app.models.note_models import GenerateNoteResponse
+from app.services.job_service import JobService
+
+
+def _response():
+    return GenerateNoteResponse(
+        status='SUCCESS',
+        note_id='note_test',
+        title='タイトル',
+        lead='リード',
+        sections=[],
+        cta='CTA',
+        metadata={'token_usage': {'total_tokens': 100}}
+    )
+
+
+def _threaded_job_service(note_service):
+    """JobService that runs jobs on the thread pool (the event loop path is tested in test_llm_async)"""
+    job_service = JobService(note_service=note_service)
+    job_service.async_llm = False
+    return job_service
+
+
+def _wait_for(job_service, job_id, status, timeout=5):
+    import time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_service.get_job(job_id)
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    pytest.fail(f'job did not reach {status}')
+
+
+class TestJobStore:
+    """Tests for JobStore class"""
+
+    def test_create_and_get(self, local_data_dir):
+        """Test a job round-trips through SQLite"""
+        store = JobStore(str(local_data_dir / 'jobs.sqlite3'))
+        store.create('job_1', {'topic': 'テスト'}, owner_pid=os.getpid())
+
+        job = store.get('job_1')
+        assert job['status'] == JOB_STATUS_QUEUED
+        assert job['request'] == {'topic': 'テスト'}
+        assert job['result'] is None
+
+    def test_jobs_survive_new_store_instance(self, local_data_dir):
+        """Test jobs persist across store instances (worker restart)"""
+        path = str(local_data_dir / 'jobs.sqlite3')
+        JobStore(path).create('job_1', {'topic': 'test'}, owner_pid=os.getpid())
+
+        assert JobStore(path).get('job_1')['job_id'] == 'job_1'
+
+    def test_claim_orphaned_jobs_from_dead_worker(self, local_data_dir):
+        """Test unfinished jobs of a dead worker are claimed once"""
+        store = JobStore(str(local_data_dir / 'jobs.sqlite3'))
+        dead_pid = 2 ** 22 + 1
+        store.create('job_1', {'topic': 'test'}, owner_pid=dead_pid)
+        store.update('job_1', status=JOB_STATUS_RUNNING, stage='agent1_started')
+
+        claimed = store.claim_orphaned(os.getpid(), set())
+
+        assert [job['job_id'] for job in claimed] == ['job_1']
+        assert claimed[0]['status'] == JOB_STATUS_QUEUED
+        assert claimed[0]['stage'] is None
+        # 2回目は引き取られない（担当者が生存しているため）
+        assert store.claim_orphaned(os.getpid(), {'job_1'}) == []
+
+
+class TestJobService:
+    """Tests for JobService class"""
+
+    def test_submit_runs_job_in_background(self):
+        """Test a submitted job completes and stores the response"""
+        note_service = MagicMock()
+
+        def generate_note(request_data, on_stage=None, priority=None):
+            on_stage('agent1_started')
+            return _response()
+
+        note_service.generate_note.side_effect = generate_note
+        job_service = _threaded_job_service(note_service)
+
+        job = job_service.submit({'topic': 'test'})
+        assert job['status'] == JOB_STATUS_QUEUED
+
+        done = _wait_for(job_service, job['job_id'], 'succeeded')
+        assert done['result']['note_id'] == 'note_test'
+        assert done['stage'] == 'agent1_started'
+        note_service.preflight.assert_called_once_with({'topic': 'test'})
+
+    def test_submit_validation_error_is_synchronous(self):
+        """Test validation errors are raised before a job is created"""
+        note_service = MagicMock()
+        note_service.preflight.side_effect = ValidationError('invalid')
+        job_service = JobService(note_service=note_service)
+
+        with pytest.raises(ValidationError):
+            job_service.submit({'topic': ''})
+
+        note_service.generate_note.assert_not_called()
+
+    def test_failed_job_records_error(self):
+        """Test API errors raised by the pipeline are stored on the job"""
+        note_service = MagicMock()
+        note_service.generate_note.side_effect = TokenLimitExceededError()
+        job_service = _threaded_job_service(note_service)
+
+        job = job_service.submit({'topic': 'test'})
+
+        failed = _wait_for(job_service, job['job_id'], 'failed')
+        assert failed['error']['error']['code'] == 'TOKEN_LIMIT_EXCEEDED'
+
+    def test_submit_rejects_when_full(self, monkeypatch):
+        """Test submissions beyond max_pending are rejected"""
+        release = threading.Event()
+        note_service = MagicMock()
+        note_service.generate_note.side_effect = (
+            lambda request_data, on_stage=None, priority=None: (release.wait(5), _response())[1]
+        )
+        job_service = _threaded_job_service(note_service)
+        job_service.max_pending = 1
+
+        first = job_service.submit({'topic': 'test'})
+        _wait_for(job_service, first['job_id'], JOB_STATUS_RUNNING)
+        with pytest.raises(ServiceBusyError) as exc_info:
+            job_service.submit({'topic': 'test'})
+
+        assert exc_info.value.retry_after == 30
+        # 1件目は実行中のまま（失敗して枠が空いたのではない）
+        assert job_service.get_job(first['job_id'])['status'] == JOB_STATUS_RUNNING
+        release.set()
+        _wait_for(job_service, first['job_id'], 'succeeded')
+
+    def test_get_job_not_found(self):
+        """Test unknown job id raises NotFoundError"""
+        job_service = JobService(note_service=MagicMock())
+
+        with pytest.raises(NotFoundError):
+            job_service.get_job('job_missing')
@@ -0,0 +1,111 @@
+"""
+Test suite for the incremental JSON extractor
+"""
+import json
+import pytest
+from app.clients.json_stream import StreamingJSONExtractor
+from app.clients.llm_client import extract_json_from_response
+
+
+ARTICLE = {
+    'title': 'タイトル',
+    'lead': 'リード "引用" \\ 記号',
+    'sections': [
+        {'heading': '■見出し1', 'body': '本文1'},
+        {'heading': '■見出し2', 'body': '本文2'}
+    ],
+    'cta': 'CTA',
+    'score': 10
+}
+
+
+def _feed_in_chunks(extractor, content, size):
+    events = []
+    for i in range(0, len(content), size):
+        events.extend(extractor.feed(content[i:i + size]))
+    return events
+
+
+class TestStreamingJSONExtractor:
+    """Tests for StreamingJSONExtractor class"""
+
+    @pytest.mark.parametrize('size', [1, 7, 1000])
+    def test_events_in_order_regardless_of_chunking(self, size):
+        """Test values are emitted once each as they complete"""
+        content = json.dumps(ARTICLE, ensure_ascii=False, indent=2)
+        extractor = StreamingJSONExtractor()
+
+        events = _feed_in_chunks(extractor, content, size)
+
+        assert [(e['type'], e['key']) for e in events] == [
+            ('field', 'title'), ('field', 'lead'),
+            ('item', 'sections'), ('item', 'sections'), ('field', 'sections'),
+            ('field', 'cta'), ('field', 'score')
+        ]
+        assert events[1]['value'] == ARTICLE['lead']
+        assert events[3] == {'type': 'item', 'key': 'sections', 'index': 1, 'value': ARTICLE['sections'][1]}
+        assert extractor.complete
+        assert extractor.finish() == ARTICLE
+        assert extractor.repaired is False
+
+    def test_section_is_emitted_before_the_rest_arrives(self):
+        """Test a section is available as soon as its closing brace is received"""
+        content = json.dumps(ARTICLE, ensure_ascii=False)
+        cut = content.index('{"heading": "■見出し2"')
+        extractor = StreamingJSONExtractor()
+
+        events = extractor.feed(content[:cut])
+
+        assert events[-1]['value'] == ARTICLE['sections'][0]
+        assert not extractor.complete
+
+    def test_feed_does_not_rejoin_received_text(self):
+        """Test chunks are only joined when a value completes, not on every feed"""
+        extractor = StreamingJSONExtractor()
+        extractor.feed('{"title": "T", "body": "')
+
+        for _ in range(1000):
+            assert extractor.feed('あ') == []
+
+        # 値の途中では受け取ったテキストを連結し直さない
+        assert len(extractor._chunks) > 1000
+        events = extractor.feed('"}')
+        assert events == [{'type': 'field', 'key': 'body', 'value': 'あ' * 1000}]
+        assert extractor.finish() == {'title': 'T', 'body': 'あ' * 1000}
+
+    def test_code_fence_and_trailing_prose(self):
+        """Test surrounding prose and code fences are skipped"""
+        content = '以下が記事です。\n```json\n' + json.dumps(ARTICLE, ensure_ascii=False) + '\n```\n補足: {不要}'
+
+        assert extract_json_from_response(content) == ARTICLE
+
+    def test_truncated_in_final_section_body(self):
+        """Test an unclosed final section keeps the text received so far"""
+        content = '{"title": "T", "sections": [{"heading": "■A", "body": "本文1"}, {"heading": "■B", "body": "途中まで'
+        extractor = StreamingJSONExtractor()
+        extractor.feed(content)
+
+        result = extractor.finish()
+
+        assert result['sections'][1] == {'heading': '■B', 'body': '途中まで'}
+        assert extractor.repaired is True
+
+    @pytest.mark.parametrize('tail', ['{"heading": "■B", "bo', '{"heading": "■B",', '{"heading": "■B", "body": '])
+    def test_truncated_between_values(self, tail):
+        """Test truncation inside a key or before a value falls back to the last complete value"""
+        content = '{"title": "T", "sections": [{"heading": "■A", "body": "本文1"}, ' + tail
+
+        result = extract_json_from_response(content)
+
+        assert result == {'title': 'T', 'sections': [{'heading': '■A', 'body': '本文1'}, {'heading': '■B'}]}
+
+    def test_truncated_after_escape(self):
+        """Test a dangling backslash is dropped before closing the string"""
+        assert extract_json_from_response('{"title": "T", "lead": "改行\\') == {'title': 'T', 'lead': '改行'}
+
+    def test_no_json(self):
+        """Test content without an object raises ValueError"""
+        with pytest.raises(ValueError) as exc_info:
+            extract_json_from_response('This is not JSON at all')
+
+        assert 'JSONを抽出できませんでした' in str(exc_info.value)
@@ -0,0 +1,300 @@
+"""
+Test suite for the asyncio LLM client path
+"""
+import asyncio
+import json
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients import llm_async, llm_retry
+from app.clients.llm_async import get_llm_event_loop, get_llm_event_loop_stats
+from app.clients.llm_router import LLMRouter
+from app.models.errors import LLMUnavailableError
+from app.models.note_models import GenerateNoteResponse
+from app.services.job_service import JobService
+from app.services.note_service import NoteService
+
+
+def _api_response(content: dict, total_tokens=150):
+    return {
+        'content': json.dumps(content, ensure_ascii=False),
+        'token_usage': {'prompt_tokens': 100, 'completion_tokens': total_tokens - 100, 'total_tokens': total_tokens}
+    }
+
+
+class TestLLMEventLoop:
+    """Tests for LLMEventLoop class"""
+
+    def test_run_coroutine_on_loop_thread(self):
+        """Test coroutines run on the dedicated loop thread"""
+        async def thread_name():
+            return threading.current_thread().name
+
+        assert get_llm_event_loop().run(thread_name(), timeout=5) == 'llm-event-loop'
+
+    def test_many_calls_in_flight_on_one_thread(self):
+        """Test dozens of calls wait concurrently without a thread each"""
+        loop = get_llm_event_loop()
+        started = threading.Semaphore(0)
+        release = asyncio.Event()
+
+        async def call():
+            started.release()
+            await release.wait()
+            return 'ok'
+
+        futures = [loop.submit(call()) for _ in range(50)]
+        for _ in range(50):
+            assert started.acquire(timeout=5)
+        assert loop.get_stats()['in_flight'] == 50
+
+        loop._loop.call_soon_threadsafe(release.set)
+        assert [future.result(5) for future in futures] == ['ok'] * 50
+
+    def test_stats_do_not_start_loop(self):
+        """Test the metrics helper does not create the loop"""
+        assert get_llm_event_loop_stats() == {'running': False}
+        assert llm_async._llm_event_loop_instance is None
+
+    def test_retry_scope_is_propagated(self):
+        """Test the caller's retry scope is visible inside the loop"""
+        async def attempts():
+            llm_retry.current_scope().attempts += 1
+            return llm_retry.current_scope()
+
+        with llm_retry.request_scope() as scope:
+            assert get_llm_event_loop().run(attempts(), timeout=5) is scope
+
+        assert scope.attempts == 1
+
+
+class TestAsyncAgents:
+    """Tests for acall_agent1 / acall_agent2_parts / acall_agent1_fanout"""
+
+    @patch('app.clients.llm_async.config')
+    @patch('app.clients.llm_async._acall_llm_api')
+    def test_acall_agent1(self, mock_api, mock_config):
+        """Test Agent1 result is parsed and carries token usage"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+
+        async def api(provider, **kwargs):
+            return _api_response({'title': 'T', 'sections': []})
+
+        mock_api.side_effect = api
+
+        result = get_llm_event_loop().run(llm_async.acall_agent1({'topic': 'AI副業'}), timeout=5)
+
+        assert result['title'] == 'T'
+        assert result['token_usage']['total_tokens'] == 150
+        assert mock_api.call_args.kwargs['max_tokens'] == 8000
+
+    @patch('app.clients.llm_async.config')
+    @patch('app.clients.llm_async._acall_llm_api')
+    def test_acall_agent1_fanout_runs_sections_concurrently(self, mock_api, mock_config):
+        """Test section calls are awaited together and merged in outline order"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_AGENT1_OUTLINE_MAX_TOKENS = 2000
+        mock_config.LLM_AGENT1_SECTION_MAX_TOKENS = 3000
+        mock_config.AGENT1_FANOUT_CONCURRENCY = 5
+        outline = {'title': 'T', 'lead': 'L', 'sections': [{'heading': 'A'}, {'heading': 'B'}]}
+        in_flight = {'now': 0, 'max': 0}
+
+        async def api(provider, **kwargs):
+            if kwargs['max_tokens'] == 2000:
+                return _api_response(outline)
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            await asyncio.sleep(0.05)
+            in_flight['now'] -= 1
+            if 'CTAのみ' in kwargs['user_prompt']:
+                return _api_response({'cta': 'C'})
+            body = 'A本文' if 'セクション1の' in kwargs['user_prompt'] else 'B本文'
+            return _api_response({'body': body})
+
+        mock_api.side_effect = api
+
+        result = get_llm_event_loop().run(llm_async.acall_agent1_fanout({'topic': 'AI副業'}), timeout=5)
+
+        # セクション2本とCTAが同時に実行される
+        assert in_flight['max'] == 3
+        assert [section['body'] for section in result['sections']] == ['A本文', 'B本文']
+        assert result['cta'] == 'C'
+        assert result['token_usage']['total_tokens'] == 600
+
+    @patch('app.clients.llm_async.config')
+    @patch('app.clients.llm_async._acall_llm_api')
+    def test_acall_agent2_parts_is_bounded(self, mock_api, mock_config):
+        """Test part calls never exceed AGENT2_PART_CONCURRENCY at once"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_MODEL_AGENT2 = 'claude-3-5-haiku-20241022'
+        mock_config.LLM_AGENT2_MAX_TOKENS = 4000
+        mock_config.AGENT2_PART_CONCURRENCY = 2
+        in_flight = {'now': 0, 'max': 0}
+
+        async def api(provider, **kwargs):
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            await asyncio.sleep(0.02)
+            in_flight['now'] -= 1
+            return _api_response({'heading': 'H', 'body': '本文'})
+
+        mock_api.side_effect = api
+        article = {
+            'title': 'T', 'lead': 'L', 'cta': 'C',
+            'sections': [{'heading': f'H{i}', 'body': 'b'} for i in range(5)]
+        }
+        targets = {f'sections.{i}': ['b'] for i in range(5)}
+
+        result = get_llm_event_loop().run(llm_async.acall_agent2_parts(article, targets), timeout=5)
+
+        assert in_flight['max'] == 2
+        assert mock_api.call_count == 5
+        assert [section['body'] for section in result['sections']] == ['本文'] * 5
+
+
+class TestRouterAcall:
+    """Tests for LLMRouter.acall"""
+
+    @patch('app.clients.llm_router.config')
+    def test_failover_on_server_error(self, mock_config):
+        """Test the fallback provider is used when the primary fails"""
+        mock_config.LLM_FALLBACK_PROVIDER = 'openai'
+        mock_config.LLM_FALLBACK_API_KEY = 'sk-fallback'
+        mock_config.LLM_FALLBACK_MODEL_AGENT1 = 'gpt-4o'
+        mock_config.LLM_FALLBACK_MODEL_AGENT2 = ''
+        mock_config.LLM_CIRCUIT_WINDOW_SECONDS = 60
+        mock_config.LLM_CIRCUIT_MIN_REQUESTS = 5
+        mock_config.LLM_CIRCUIT_FAILURE_RATE = 0.5
+        mock_config.LLM_CIRCUIT_SLOW_CALL_SECONDS = 60
+        mock_config.LLM_CIRCUIT_OPEN_SECONDS = 30
+        router = LLMRouter()
+        calls = []
+
+        async def fn(provider, model, api_key):
+            calls.append(provider)
+            if provider == 'claude':
+                raise LLMUnavailableError()
+            return {'provider': provider}
+
+        result = asyncio.run(router.acall('agent1', ('claude', 'claude-3-5-sonnet-20241022'), fn))
+
+        assert result == {'provider': 'openai'}
+        assert calls == ['claude', 'openai']
+
+
+class TestAsyncGenerateNote:
+    """Tests for NoteService.agenerate_note and async jobs"""
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'always')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_async.acall_agent2')
+    @patch('app.clients.llm_async.acall_agent1')
+    def test_agenerate_note(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test the async pipeline produces the same response as the blocking one"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        token_usage = {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+
+        async def agent1(payload):
+            return {'title': 'T', 'lead': 'L', 'sections': [{'heading': '■H', 'body': 'B'}], 'cta': 'C',
+                    'token_usage': token_usage}
+
+        async def agent2(payload):
+            return dict(payload, title='T2')
+
+        mock_agent1.side_effect = agent1
+        mock_agent2.side_effect = agent2
+        stages = []
+        threads = set()
+
+        def on_stage(stage):
+            stages.append(stage)
+            threads.add(threading.current_thread().name)
+
+        result = get_llm_event_loop().run(
+            NoteService().agenerate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'}, on_stage),
+            timeout=5
+        )
+
+        assert result.title == 'T2'
+        assert result.metadata['token_usage']['total_tokens'] == 300
+        assert stages[:3] == ['validated', 'agent1_started', 'agent1_done']
+        # 通知先（ジョブの保存など）はイベントループのスレッドで呼ばない
+        assert 'llm-event-loop' not in threads
+        mock_get_writer.return_value.enqueue.assert_called_once()
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_async.acall_agent1')
+    def test_agenerate_note_keeps_sqlite_off_the_loop(self, mock_agent1, mock_gsheet_class, mock_get_writer):
+        """Test the estimate, the ledger and the result cache are not touched on the event loop thread"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+
+        async def agent1(payload):
+            return {'title': 'T', 'lead': 'L', 'sections': [{'heading': '■H', 'body': 'B'}], 'cta': 'C',
+                    'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}}
+
+        mock_agent1.side_effect = agent1
+        threads = {}
+
+        def recording(name, return_value=None):
+            def record(*args, **kwargs):
+                threads[name] = threading.current_thread().name
+                return return_value
+            return record
+
+        service = NoteService()
+        service.estimate_tokens = recording('estimate', 3000)
+        service.result_cache = MagicMock()
+        service.result_cache.get.side_effect = recording('cache_get')
+        service.result_cache.put.side_effect = recording('cache_put')
+
+        get_llm_event_loop().run(
+            service.agenerate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g', 'cache': 'reuse'}),
+            timeout=5
+        )
+
+        assert set(threads) == {'estimate', 'cache_get', 'cache_put'}
+        assert 'llm-event-loop' not in threads.values()
+
+    def test_job_runs_on_event_loop(self):
+        """Test jobs are awaited on the event loop when JOB_ASYNC_LLM is enabled"""
+        note_service = MagicMock()
+
+        async def agenerate_note(request_data, on_stage=None, priority=None):
+            # NoteService.agenerate_note と同じく通知先は別スレッドで呼ぶ
+            await asyncio.to_thread(on_stage, 'agent1_started')
+            return GenerateNoteResponse(
+                status='SUCCESS', note_id='note_async', title='T', lead='L', sections=[], cta='C',
+                metadata={'token_usage': {'total_tokens': 100}}
+            )
+
+        note_service.agenerate_note.side_effect = agenerate_note
+        job_service = JobService(note_service=note_service)
+        job_service.async_llm = True
+        threads = []
+        update = job_service.job_store.update
+
+        def recording_update(*args, **kwargs):
+            threads.append(threading.current_thread().name)
+            return update(*args, **kwargs)
+
+        job_service.job_store.update = recording_update
+
+        job = job_service.submit({'topic': 'test'})
+
+        from tests.test_job_service import _wait_for
+        done = _wait_for(job_service, job['job_id'], 'succeeded')
+        assert done['result']['note_id'] == 'note_async'
+        assert done['stage'] == 'agent1_started'
+        note_service.generate_note.assert_not_called()
+        # ジョブの状態の保存（SQLite）はイベントループのスレッドで行わない
+        assert len(threads) == 3
+        assert 'llm-event-loop' not in threads
@@ -3,12 +3,22 @@ Test suite for LLM Client
 """
 import pytest
 import json
+import threading
 from unittest.mock import patch, MagicMock
 from app.clients.llm_client import (
     call_agent1,
     call_agent2,
-    _extract_json_from_response
+    call_agent2_parts,
+    call_agent1_fanout,
+    stream_agent1,
+    _call_claude_api,
+    _call_openai_api,
+    merge_token_usage,
+    extract_json_from_response,
+    _stitch_continuation
 )
+from app.clients import llm_retry
+from app.models.errors import LLMResponseError
 
 
 class TestExtractJsonFromResponse:
@@ -17,7 +27,7 @@ class TestExtractJsonFromResponse:
     def test_extract_plain_json(self):
         """Test extracting plain JSON"""
         content = '{"title": "test", "lead": "test lead"}'
-        result = _extract_json_from_response(content)
+        result = extract_json_from_response(content)
         
         assert result['title'] == 'test'
         assert result['lead'] == 'test lead'
@@ -32,7 +42,7 @@ class TestExtractJsonFromResponse:
 }
 ```
 '''
-        result = _extract_json_from_response(content)
+        result = extract_json_from_response(content)
         
         assert result['title'] == 'test'
         assert result['lead'] == 'test lead'
@@ -45,7 +55,7 @@ class TestExtractJsonFromResponse:
   "lead": "test lead"
 }
 ```'''
-        result = _extract_json_from_response(content)
+        result = extract_json_from_response(content)
         
         assert result['title'] == 'test'
         assert result['lead'] == 'test lead'
@@ -53,7 +63,7 @@ class TestExtractJsonFromResponse:
     def test_extract_json_from_text_with_json(self):
         """Test extracting JSON embedded in text"""
         content = 'Here is your article: {"title": "test", "lead": "test lead"} Hope this helps!'
-        result = _extract_json_from_response(content)
+        result = extract_json_from_response(content)
         
         assert result['title'] == 'test'
         assert result['lead'] == 'test lead'
@@ -63,7 +73,7 @@ class TestExtractJsonFromResponse:
         content = 'This is not JSON at all'
         
         with pytest.raises(ValueError) as exc_info:
-            _extract_json_from_response(content)
+            extract_json_from_response(content)
         
         assert 'JSONを抽出できませんでした' in str(exc_info.value)
 
@@ -258,3 +268,334 @@ class TestCallAgent2:
         
         # Agent2のトークン使用量のみ
         assert result['token_usage']['total_tokens'] == 2000
+
+
+
+class TestCallAgent2Parts:
+    """Tests for section-level Agent2 refinement"""
+
+    @patch('app.clients.llm_client._call_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_only_violating_parts_are_sent(self, mock_config, mock_claude_api):
+        """Test only the targeted parts are rewritten and merged back in order"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_AGENT2_MAX_TOKENS = 4000
+        mock_config.LLM_MODEL_AGENT2 = 'claude-3-5-sonnet-20241022'
+        mock_config.AGENT2_PART_CONCURRENCY = 4
+
+        def fake_api(**kwargs):
+            part = json.loads(kwargs['user_prompt'].split('\n\n')[1])
+            rewritten = {key: value.replace('あなた', '誰も') for key, value in part.items()}
+            return {
+                'content': json.dumps(rewritten, ensure_ascii=False),
+                'token_usage': {'prompt_tokens': 50, 'completion_tokens': 20, 'total_tokens': 70}
+            }
+        mock_claude_api.side_effect = fake_api
+
+        article = {
+            'title': 'タイトル',
+            'lead': 'あなたが主役です。',
+            'sections': [
+                {'heading': '■見出し1', 'body': '本文1です。'},
+                {'heading': '■見出し2', 'body': 'あなたが変わる。'}
+            ],
+            'cta': 'CTA',
+            'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+        }
+
+        result = call_agent2_parts(article, {'lead': ['あなたが'], 'sections.1': ['あなたが']})
+
+        assert mock_claude_api.call_count == 2
+        assert result['lead'] == '誰もが主役です。'
+        assert result['sections'][0] == {'heading': '■見出し1', 'body': '本文1です。'}
+        assert result['sections'][1] == {'heading': '■見出し2', 'body': '誰もが変わる。'}
+        assert result['title'] == 'タイトル'
+        assert result['token_usage']['total_tokens'] == 440
+        # 元の記事は変更しない
+        assert article['lead'] == 'あなたが主役です。'
+
+        # 出力上限は記事全体ではなく部分の長さで決まる
+        assert all(call[1]['max_tokens'] < 4000 for call in mock_claude_api.call_args_list)
+
+
+
+class TestCallAgent1Fanout:
+    """Tests for outline-then-fanout Agent1 generation"""
+
+    @patch('app.clients.llm_client._call_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_sections_are_generated_concurrently_and_in_order(self, mock_config, mock_claude_api):
+        """Test section bodies and the CTA are generated in parallel after the outline"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_AGENT1_OUTLINE_MAX_TOKENS = 2000
+        mock_config.LLM_AGENT1_SECTION_MAX_TOKENS = 3000
+        mock_config.AGENT1_FANOUT_CONCURRENCY = 5
+
+        outline = {
+            'title': 'タイトル',
+            'lead': 'リード',
+            'sections': [{'heading': f'■見出し{i}', 'points': f'要点{i}'} for i in range(1, 4)]
+        }
+        usage = {'prompt_tokens': 10, 'completion_tokens': 20, 'total_tokens': 30}
+        # 3セクション＋CTAが同時に呼ばれないと揃わない
+        barrier = threading.Barrier(4, timeout=5)
+
+        def fake_api(**kwargs):
+            prompt = kwargs['user_prompt']
+            if '構成のみを作成' in prompt:
+                return {'content': json.dumps(outline, ensure_ascii=False), 'token_usage': usage}
+            barrier.wait()
+            if 'CTAのみ' in prompt:
+                return {'content': json.dumps({'cta': 'CTA'}), 'token_usage': usage}
+            index = prompt.split('セクション', 1)[1][0]
+            return {'content': json.dumps({'body': f'本文{index}'}, ensure_ascii=False), 'token_usage': usage}
+        mock_claude_api.side_effect = fake_api
+
+        result = call_agent1_fanout({'topic': 'AI副業', 'length_class': 'long', 'temperature': 0.7})
+
+        assert result['title'] == 'タイトル'
+        assert [section['heading'] for section in result['sections']] == ['■見出し1', '■見出し2', '■見出し3']
+        assert [section['body'] for section in result['sections']] == ['本文1', '本文2', '本文3']
+        assert result['cta'] == 'CTA'
+        assert result['token_usage']['total_tokens'] == 150
+        assert mock_claude_api.call_args_list[0][1]['max_tokens'] == 2000
+
+
+class TestPromptCaching:
+    """Tests for Anthropic prompt caching"""
+
+    @staticmethod
+    def _mock_claude_response():
+        response = MagicMock()
+        response.content = [MagicMock(text='{"title": "test"}')]
+        response.usage = MagicMock(
+            input_tokens=100,
+            output_tokens=200,
+            cache_creation_input_tokens=0,
+            cache_read_input_tokens=3000
+        )
+        return response
+
+    @patch('app.clients.llm_client.get_llm_client_registry')
+    def test_system_prompt_marked_cacheable(self, mock_get_registry):
+        """Test system prompt is sent as a cache_control block"""
+        client = MagicMock()
+        client.messages.create.return_value = self._mock_claude_response()
+        mock_get_registry.return_value.lease.return_value.__enter__.return_value = client
+
+        result = _call_claude_api('system', 'user', max_tokens=100, cache_system_prompt=True)
+
+        system = client.messages.create.call_args[1]['system']
+        assert system[0]['text'] == 'system'
+        assert system[0]['cache_control'] == {'type': 'ephemeral'}
+
+        # キャッシュ読み込み分はprompt_tokensに含め、内訳として別項目で返す
+        assert result['token_usage']['prompt_tokens'] == 3100
+        assert result['token_usage']['cache_read_input_tokens'] == 3000
+        assert result['token_usage']['cache_creation_input_tokens'] == 0
+        assert result['token_usage']['total_tokens'] == 3300
+
+    @patch('app.clients.llm_client.get_llm_client_registry')
+    def test_caching_disabled_sends_plain_system(self, mock_get_registry):
+        """Test system prompt is sent as plain text when caching is disabled"""
+        client = MagicMock()
+        client.messages.create.return_value = self._mock_claude_response()
+        mock_get_registry.return_value.lease.return_value.__enter__.return_value = client
+
+        _call_claude_api('system', 'user', max_tokens=100, cache_system_prompt=False)
+
+        assert client.messages.create.call_args[1]['system'] == 'system'
+
+    def test_merge_token_usage_includes_cache_fields(self):
+        """Test cache token fields are summed across agents"""
+        merged = merge_token_usage(
+            {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15, 'cache_read_input_tokens': 8},
+            {'prompt_tokens': 20, 'completion_tokens': 5, 'total_tokens': 25, 'cache_read_input_tokens': 16,
+             'cache_creation_input_tokens': 4}
+        )
+
+        assert merged['total_tokens'] == 40
+        assert merged['cache_read_input_tokens'] == 24
+        assert merged['cache_creation_input_tokens'] == 4
+
+
+class TestCallOpenAIApi:
+    """Tests for _call_openai_api"""
+
+    @patch('app.clients.llm_client.get_llm_client_registry')
+    def test_missing_content_raises_llm_response_error(self, mock_get_registry):
+        """Test a reply without message content (e.g. a refusal) raises a clear error without retrying"""
+        choice = MagicMock(finish_reason='stop')
+        choice.message.content = None
+        choice.message.refusal = 'I cannot help with that.'
+        client = MagicMock()
+        client.chat.completions.create.return_value = MagicMock(choices=[choice])
+        mock_get_registry.return_value.lease.return_value.__enter__.return_value = client
+
+        with pytest.raises(LLMResponseError) as exc_info:
+            _call_openai_api('system', 'user', max_tokens=100)
+
+        assert exc_info.value.status_code == 502
+        assert exc_info.value.details['refusal'] == 'I cannot help with that.'
+        client.chat.completions.create.assert_called_once()
+        # プロバイダ障害ではないため、再試行・フェイルオーバーの対象にしない
+        assert llm_retry.classify_error(exc_info.value) == (False, None)
+
+
+class TestStreamAgent1:
+    """Tests for Agent1 streaming"""
+
+    @patch('app.clients.llm_client._stream_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_stream_agent1_yields_deltas_then_result(self, mock_config, mock_stream_claude):
+        """Test deltas are forwarded and the final JSON is parsed"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+
+        content = json.dumps({'title': 'テスト', 'lead': 'リード', 'sections': [], 'cta': 'CTA'})
+        mock_stream_claude.return_value = iter([
+            {'type': 'delta', 'text': content[:10]},
+            {'type': 'delta', 'text': content[10:]},
+            {'type': 'done', 'content': content,
+             'token_usage': {'prompt_tokens': 10, 'completion_tokens': 20, 'total_tokens': 30}}
+        ])
+
+        events = list(stream_agent1({'topic': 'test', 'temperature': 0.5}))
+
+        assert [e['type'] for e in events] == ['delta', 'delta', 'field', 'field', 'field', 'result']
+        assert ''.join(e['text'] for e in events[:2]) == content
+        # 確定した値は途中で返す
+        assert [(e['key'], e['value']) for e in events[2:5]] == [('title', 'テスト'), ('lead', 'リード'), ('cta', 'CTA')]
+        assert events[-1]['result']['title'] == 'テスト'
+        assert events[-1]['result']['token_usage']['total_tokens'] == 30
+        assert mock_stream_claude.call_args[1]['temperature'] == 0.5
+
+    @patch('app.clients.llm_client.config')
+    def test_stream_agent1_unsupported_provider(self, mock_config):
+        """Test streaming with unsupported provider"""
+        mock_config.LLM_PROVIDER = 'invalid_provider'
+
+        with pytest.raises(ValueError) as exc_info:
+            list(stream_agent1({'topic': 'test'}))
+
+        assert 'Unsupported LLM provider' in str(exc_info.value)
+
+
+class TestContinuation:
+    """Tests for continuing output truncated at max_tokens"""
+
+    ARTICLE = json.dumps({
+        'title': 'タイトル', 'lead': 'リード',
+        'sections': [{'heading': '■見出し1', 'body': '本文1'}, {'heading': '■見出し2', 'body': '本文2'}],
+        'cta': 'CTA'
+    }, ensure_ascii=False)
+
+    @staticmethod
+    def _usage(prompt_tokens, completion_tokens):
+        return {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+
+    @patch('app.clients.llm_client._call_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_truncated_output_is_continued(self, mock_config, mock_claude_api):
+        """Test a max_tokens stop is continued from the partial output and stitched before parsing"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_MAX_CONTINUATIONS = 2
+        cut = self.ARTICLE.index('本文2')
+        mock_claude_api.side_effect = [
+            {'content': self.ARTICLE[:cut] + ' ', 'token_usage': self._usage(1000, 8000), 'truncated': True},
+            {'content': self.ARTICLE[cut:], 'token_usage': self._usage(9000, 50), 'truncated': False}
+        ]
+
+        with llm_retry.request_scope() as scope:
+            result = call_agent1({'topic': 'AI副業'})
+
+        assert result['sections'][1]['body'] == '本文2'
+        assert result['cta'] == 'CTA'
+        # 続きの呼び出しには途中出力（末尾の空白を除く）を渡す
+        assert mock_claude_api.call_args_list[0][1]['partial_output'] is None
+        assert mock_claude_api.call_args_list[1][1]['partial_output'] == self.ARTICLE[:cut]
+        assert result['token_usage']['total_tokens'] == 18050
+        assert result['token_usage']['continuation_tokens'] == 9050
+        assert scope.continuations == 1
+
+    @patch('app.clients.llm_client._call_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_continuations_are_limited(self, mock_config, mock_claude_api):
+        """Test continuation stops at LLM_MAX_CONTINUATIONS and the partial JSON is repaired"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_MAX_CONTINUATIONS = 1
+        cut = self.ARTICLE.index('本文2')
+        mock_claude_api.side_effect = [
+            {'content': self.ARTICLE[:cut], 'token_usage': self._usage(1000, 8000), 'truncated': True},
+            {'content': '本文', 'token_usage': self._usage(9000, 8000), 'truncated': True}
+        ]
+
+        result = call_agent1({'topic': 'AI副業'})
+
+        assert mock_claude_api.call_count == 2
+        assert result['sections'][1]['body'] == '本文'
+
+    def test_stitch_removes_repeated_overlap(self):
+        """Test a continuation that repeats the end of the partial output is de-duplicated"""
+        response = {'content': '{"body": "最初の文章です。次の文章', 'token_usage': self._usage(10, 10)}
+        continuation = {'content': '最初の文章です。次の文章の続きです。"}', 'token_usage': self._usage(20, 5)}
+
+        stitched = _stitch_continuation(response, continuation)
+
+        assert stitched['content'] == '{"body": "最初の文章です。次の文章の続きです。"}'
+        assert stitched['truncated'] is False
+
+    @patch('app.clients.llm_client.get_llm_client_registry')
+    def test_claude_prefills_partial_output(self, mock_get_registry):
+        """Test Claude receives the partial output as an assistant turn and stop_reason is reported"""
+        response = MagicMock()
+        response.content = [MagicMock(text='続き"}')]
+        response.stop_reason = 'max_tokens'
+        response.usage = MagicMock(input_tokens=10, output_tokens=5, cache_creation_input_tokens=0,
+                                   cache_read_input_tokens=0)
+        client = MagicMock()
+        client.messages.create.return_value = response
+        mock_get_registry.return_value.lease.return_value.__enter__.return_value = client
+
+        result = _call_claude_api('system', 'user', max_tokens=100, partial_output='{"body": "途中')
+
+        messages = client.messages.create.call_args[1]['messages']
+        assert messages[-1] == {'role': 'assistant', 'content': '{"body": "途中'}
+        assert result['truncated'] is True
+
+    @patch('app.clients.llm_client._call_claude_api')
+    @patch('app.clients.llm_client._stream_claude_api')
+    @patch('app.clients.llm_client.config')
+    def test_stream_continuation_is_emitted_as_delta(self, mock_config, mock_stream_claude, mock_claude_api):
+        """Test a truncated stream is continued and the rest is sent as one delta"""
+        mock_config.LLM_PROVIDER = 'claude'
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_MAX_CONTINUATIONS = 2
+        cut = self.ARTICLE.index('本文2')
+        mock_stream_claude.return_value = iter([
+            {'type': 'delta', 'text': self.ARTICLE[:cut]},
+            {'type': 'done', 'content': self.ARTICLE[:cut], 'token_usage': self._usage(1000, 8000),
+             'truncated': True}
+        ])
+        mock_claude_api.return_value = {
+            'content': self.ARTICLE[cut:], 'token_usage': self._usage(9000, 50), 'truncated': False
+        }
+
+        events = list(stream_agent1({'topic': 'AI副業'}))
+
+        deltas = [e['text'] for e in events if e['type'] == 'delta']
+        assert ''.join(deltas) == self.ARTICLE
+        assert [e['index'] for e in events if e['type'] == 'section'] == [0, 1]
+        assert events[-1]['result']['cta'] == 'CTA'
+        assert events[-1]['result']['token_usage']['continuation_tokens'] == 9050
@@ -0,0 +1,86 @@
+"""
+Test suite for LLM client registry
+"""
+import threading
+import pytest
+from unittest.mock import patch
+from app.clients.llm_client_registry import LLMClientRegistry, get_llm_client_registry
+
+
+class TestLLMClientRegistry:
+    """Tests for LLMClientRegistry class"""
+
+    def test_same_client_is_reused(self):
+        """Test a provider/key pair is built once and reused"""
+        registry = LLMClientRegistry()
+
+        first = registry.get_client('claude', 'key-a')
+        second = registry.get_client('claude', 'key-a')
+
+        assert first is second
+        registry.close()
+
+    def test_clients_are_separated_by_provider_and_key(self):
+        """Test different providers and keys get their own clients"""
+        registry = LLMClientRegistry()
+
+        claude_a = registry.get_client('claude', 'key-a')
+        claude_b = registry.get_client('claude', 'key-b')
+        openai_a = registry.get_client('openai', 'key-a')
+
+        assert claude_a is not claude_b
+        assert claude_a is not openai_a
+        assert len(registry.get_stats()['clients']) == 3
+        registry.close()
+
+    def test_unsupported_provider(self):
+        """Test unsupported provider raises ValueError"""
+        registry = LLMClientRegistry()
+
+        with pytest.raises(ValueError) as exc_info:
+            registry.get_client('invalid_provider', 'key-a')
+
+        assert 'Unsupported LLM provider' in str(exc_info.value)
+
+    def test_concurrent_get_client_builds_once(self):
+        """Test concurrent callers share a single client"""
+        registry = LLMClientRegistry()
+        results = []
+
+        def worker():
+            results.append(registry.get_client('claude', 'key-a'))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert all(client is results[0] for client in results)
+        assert len(registry.get_stats()['clients']) == 1
+        registry.close()
+
+    def test_lease_tracks_usage(self):
+        """Test lease() counts total and in-flight requests"""
+        registry = LLMClientRegistry()
+
+        with registry.lease('claude', 'key-a'):
+            stats = registry.get_stats()['clients'][0]
+            assert stats['in_flight'] == 1
+            assert stats['total_requests'] == 1
+
+        stats = registry.get_stats()['clients'][0]
+        assert stats['in_flight'] == 0
+        assert stats['total_requests'] == 1
+        registry.close()
+
+    def test_singleton(self):
+        """Test get_llm_client_registry returns a shared instance"""
+        assert get_llm_client_registry() is get_llm_client_registry()
+
+    @patch('app.clients.llm_client_registry.atexit.register')
+    def test_singleton_is_closed_at_exit(self, mock_register):
+        """Test the shared registry closes its connection pools on shutdown"""
+        registry = get_llm_client_registry()
+
+        mock_register.assert_called_once_with(registry.close)
@@ -0,0 +1,332 @@
+"""
+Test suite for hedged Agent1 requests
+"""
+import json
+import threading
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients import llm_hedge, llm_retry
+from app.clients.llm_hedge import LatencyTracker, run_hedged, hedge_delay, MIN_SAMPLES
+from app.clients.llm_client import call_agent1
+from app.models.errors import LLMUnavailableError, DeadlineExceededError
+from app.services.token_service import TokenService
+
+
+def _done(content='{}', prompt_tokens=100, completion_tokens=50):
+    return {
+        'type': 'done',
+        'content': content,
+        'token_usage': {
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'total_tokens': prompt_tokens + completion_tokens
+        }
+    }
+
+
+def _fast_stream(content='{}'):
+    def open_stream():
+        yield {'type': 'delta', 'text': 'a'}
+        yield _done(content)
+    return open_stream
+
+
+def _stalled_stream(release: threading.Event, closed: threading.Event):
+    """Yields one delta only after `release` is set and records when it is closed"""
+    def open_stream():
+        try:
+            release.wait(5)
+            yield {'type': 'delta', 'text': 'late'}
+            yield _done('"late"')
+        finally:
+            closed.set()
+    return open_stream
+
+
+def _wait_for(predicate, timeout=2):
+    deadline = time.time() + timeout
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+    assert predicate()
+
+
+class TestLatencyTracker:
+    """Tests for LatencyTracker class"""
+
+    def test_percentile_requires_min_samples(self):
+        """Test no percentile is reported until enough samples are recorded"""
+        tracker = LatencyTracker()
+        for _ in range(MIN_SAMPLES - 1):
+            tracker.record(1.0)
+
+        assert tracker.percentile(0.9) is None
+
+    def test_percentile(self):
+        """Test the percentile is taken from the recorded samples"""
+        tracker = LatencyTracker()
+        for i in range(1, 101):
+            tracker.record(float(i))
+
+        assert tracker.percentile(0.9) == 90.0
+        assert tracker.percentile(0.5) == 51.0
+
+    @patch('app.clients.llm_hedge.config')
+    def test_hedge_delay(self, mock_config):
+        """Test the default delay is used until enough samples exist, with a lower bound"""
+        mock_config.LLM_HEDGE_PERCENTILE = 0.9
+        mock_config.LLM_HEDGE_DEFAULT_DELAY_SECONDS = 10.0
+        mock_config.LLM_HEDGE_MIN_DELAY_SECONDS = 2.0
+        tracker = LatencyTracker()
+
+        assert hedge_delay(tracker) == 10.0
+
+        for _ in range(MIN_SAMPLES):
+            tracker.record(0.5)
+
+        # 計測値が下限より小さい場合は下限を使う
+        assert hedge_delay(tracker) == 2.0
+
+
+class TestRunHedged:
+    """Tests for run_hedged"""
+
+    def test_fast_primary_is_not_hedged(self):
+        """Test no second request is sent when the first token arrives in time"""
+        open_hedge = MagicMock()
+        tracker = LatencyTracker()
+
+        done, stats = run_hedged(_fast_stream('"primary"'), open_hedge, delay=5.0, tracker=tracker)
+
+        assert done['content'] == '"primary"'
+        assert stats == {'hedged': False, 'winner': 'primary', 'delay_seconds': 5.0, 'extra_tokens': 0}
+        open_hedge.assert_not_called()
+        assert tracker.count() == 1
+
+    def test_slow_primary_is_hedged_and_cancelled(self):
+        """Test a slow first request is raced by a second one and cancelled when it loses"""
+        release = threading.Event()
+        closed = threading.Event()
+
+        tracker = LatencyTracker()
+
+        done, stats = run_hedged(_stalled_stream(release, closed), _fast_stream('"hedge"'), delay=0.05,
+                                 tracker=tracker)
+
+        assert done['content'] == '"hedge"'
+        # 最初のトークンが届く前に打ち切った方は計測値に含めない
+        assert tracker.count() == 1
+        assert stats['hedged'] is True
+        assert stats['winner'] == 'hedge'
+        # 打ち切った方は入力トークン分を消費したものとして推定する
+        assert stats['extra_tokens'] == 100
+
+        # 打ち切った方は次のイベントでストリームを閉じる
+        release.set()
+        assert closed.wait(2)
+
+    def test_loser_response_is_closed_by_the_winner(self):
+        """Test a registered response of the losing stream is closed without waiting for its next event"""
+        closed = threading.Event()
+        response = MagicMock()
+        response.close.side_effect = closed.set
+        errors = []
+
+        def blocked():
+            try:
+                with llm_hedge.cancellable(response):
+                    # 閉じられるまで受信を待ち続ける応答
+                    closed.wait(5)
+                    raise ConnectionError('connection closed')
+                yield  # pragma: no cover
+            except Exception as e:
+                errors.append(e)
+                raise
+
+        done, stats = run_hedged(blocked, _fast_stream('"hedge"'), delay=0.05)
+
+        assert stats['winner'] == 'hedge'
+        assert closed.wait(1)
+        _wait_for(lambda: errors)
+        # 打ち切りによるエラーは再試行・フェイルオーバーの対象にしない
+        assert isinstance(errors[0], llm_hedge.HedgeCancelledError)
+        assert llm_retry.classify_error(errors[0]) == (False, None)
+
+    def test_partial_loser_tokens_are_estimated_from_winner_usage(self):
+        """Test received text of a cancelled stream is converted to tokens with the winner's ratio"""
+        attempt = llm_hedge._Attempt('primary', MagicMock(), threading.Condition())
+        attempt.received_chars = 40
+
+        # 採用した方は100文字で出力50トークン（2文字/トークン）
+        assert llm_hedge._estimate_spent_tokens(attempt, _done('y' * 100)) == 100 + 20
+
+    def test_streams_without_done_event_raise_llm_error(self):
+        """Test streams that end without a done event raise an LLM error instead of a TypeError"""
+        def incomplete():
+            yield {'type': 'delta', 'text': 'a'}
+
+        with pytest.raises(LLMUnavailableError) as exc_info:
+            run_hedged(incomplete, MagicMock(), delay=5.0)
+
+        assert exc_info.value.details['reason'] == 'stream_incomplete'
+
+    def test_hedge_error_is_raised_when_primary_has_none(self):
+        """Test the hedge's error is raised when the primary ended without one"""
+        release = threading.Event()
+
+        def incomplete():
+            release.wait(5)
+            return
+            yield  # pragma: no cover
+
+        def failing():
+            try:
+                raise ConnectionError('hedge failed')
+            finally:
+                release.set()
+            yield  # pragma: no cover
+
+        with pytest.raises(ConnectionError):
+            run_hedged(incomplete, failing, delay=0.05)
+
+    def test_wait_is_bounded_by_the_request_deadline(self):
+        """Test streams that never finish are cancelled when the request deadline passes"""
+        closed = [threading.Event(), threading.Event()]
+        responses = [MagicMock(), MagicMock()]
+        for response, event in zip(responses, closed):
+            response.close.side_effect = event.set
+
+        def blocked(response, event):
+            def open_stream():
+                with llm_hedge.cancellable(response):
+                    event.wait(5)
+                    raise ConnectionError('connection closed')
+                yield  # pragma: no cover
+            return open_stream
+
+        started = time.monotonic()
+        with llm_retry.request_scope(0.3):
+            with pytest.raises(DeadlineExceededError) as exc_info:
+                run_hedged(blocked(responses[0], closed[0]), blocked(responses[1], closed[1]), delay=0.05)
+
+        assert time.monotonic() - started < 2
+        assert exc_info.value.details['reason'] == 'hedge'
+        # 両方のストリームを打ち切る
+        assert all(event.wait(1) for event in closed)
+
+    def test_primary_error_before_delay_is_raised(self):
+        """Test an early failure of the first request is raised without hedging"""
+        def failing():
+            raise ValueError('bad request')
+            yield  # pragma: no cover
+
+        open_hedge = MagicMock()
+
+        with pytest.raises(ValueError):
+            run_hedged(failing, open_hedge, delay=5.0)
+
+        open_hedge.assert_not_called()
+
+
+class TestCallAgent1Hedged:
+    """Tests for call_agent1(hedge=True)"""
+
+    @patch('app.clients.llm_hedge.run_hedged')
+    @patch('app.clients.llm_client.config')
+    def test_hedge_tokens_are_reported(self, mock_config, mock_run_hedged):
+        """Test the discarded request's tokens are added to token_usage and the scope"""
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_HEDGE_MODEL_AGENT1 = ''
+        stats = {'hedged': True, 'winner': 'hedge', 'delay_seconds': 2.0, 'extra_tokens': 120}
+        mock_run_hedged.return_value = (_done(json.dumps({'title': 'T'})), stats)
+
+        with llm_retry.request_scope() as scope:
+            result = call_agent1({'topic': 'AI副業'}, hedge=True)
+
+        assert result['title'] == 'T'
+        assert result['token_usage']['hedge_tokens'] == 120
+        assert result['token_usage']['total_tokens'] == 270
+        assert scope.hedge == stats
+
+    @patch('app.clients.llm_client._call_routed')
+    @patch('app.clients.llm_hedge.run_hedged')
+    @patch('app.clients.llm_client.config')
+    def test_truncated_winner_is_not_continued_again(self, mock_config, mock_run_hedged, mock_call_routed):
+        """Test the hedged result is not continued a second time outside the stream"""
+        mock_config.LLM_AGENT1_MAX_TOKENS = 8000
+        mock_config.LLM_MODEL_AGENT1 = 'claude-3-5-sonnet-20241022'
+        mock_config.LLM_HEDGE_MODEL_AGENT1 = ''
+        mock_config.LLM_MAX_CONTINUATIONS = 2
+        stats = {'hedged': False, 'winner': 'primary', 'delay_seconds': 2.0, 'extra_tokens': 0}
+        # _stream_llm_api が続きの生成を上限まで行った結果（まだ途切れている）
+        mock_run_hedged.return_value = (dict(_done(json.dumps({'title': 'T'})), truncated=True), stats)
+
+        with llm_retry.request_scope() as scope:
+            call_agent1({'topic': 'AI副業'}, hedge=True)
+
+        mock_call_routed.assert_not_called()
+        assert scope.continuations == 0
+
+
+class TestHedgeBudget:
+    """Tests for TokenService hedge budget"""
+
+    @patch('app.services.token_service.config')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_hedge_reservation_within_budget(self, mock_gsheet_class, mock_config):
+        """Test hedging is allowed only while both budgets have room and reserves one extra request"""
+        mock_config.LLM_HEDGE_AGENT1 = True
+        mock_config.LLM_HEDGE_BUDGET_RATIO = 0.05
+        mock_config.MONTHLY_TOKEN_LIMIT = 300000
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 100000
+        mock_gsheet_class.return_value = mock_client
+
+        service = TokenService()
+        with service.hedge_reservation(3000) as hedge:
+            assert hedge is True
+            assert service.token_ledger.get_status()['reserved_tokens'] == 3000
+        assert service.token_ledger.get_status()['reservations'] == 0
+
+        # ヘッジ予算（上限の5% = 15000）を使い切ると許可しない
+        service.record_hedge_tokens(13000)
+        assert service.get_hedge_usage() == 13000
+        with service.hedge_reservation(3000) as hedge:
+            assert hedge is False
+
+    @patch('app.services.token_service.config')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_hedge_reservation_near_monthly_limit(self, mock_gsheet_class, mock_config):
+        """Test hedging is refused when the extra request would exceed the monthly limit"""
+        mock_config.LLM_HEDGE_AGENT1 = True
+        mock_config.LLM_HEDGE_BUDGET_RATIO = 0.05
+        mock_config.MONTHLY_TOKEN_LIMIT = 300000
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 298000
+        mock_gsheet_class.return_value = mock_client
+
+        with TokenService().hedge_reservation(3000) as hedge:
+            assert hedge is False
+
+    @patch('app.services.token_service.config')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_hedge_reservation_counts_other_reservations(self, mock_gsheet_class, mock_config):
+        """Test tokens reserved by in-flight requests are counted before hedging"""
+        mock_config.LLM_HEDGE_AGENT1 = True
+        mock_config.LLM_HEDGE_BUDGET_RATIO = 0.05
+        mock_config.MONTHLY_TOKEN_LIMIT = 300000
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 250000
+        mock_gsheet_class.return_value = mock_client
+
+        service = TokenService()
+        # 使用量だけなら2本分が収まるが、他のリクエストの予約で上限に達している
+        service.reserve_tokens(48000)
+        with service.hedge_reservation(3000) as hedge:
+            assert hedge is False
+
+    def test_hedge_disabled_by_default(self):
+        """Test hedging is off unless LLM_HEDGE_AGENT1 is enabled"""
+        with TokenService().hedge_reservation(3000) as hedge:
+            assert hedge is False
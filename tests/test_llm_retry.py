@@ -0,0 +1,239 @@
+"""
+Test suite for LLM retry / deadline handling
+"""
+import threading
+import httpx
+import anthropic
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients import llm_retry
+from app.clients.llm_client import _call_claude_api
+from app.models.errors import LLMUnavailableError, DeadlineExceededError
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(status, headers=headers or {}, request=request)
+    return anthropic.APIStatusError('error', response=response, body=None)
+
+
+class TestClassifyError:
+    """Tests for classify_error"""
+
+    def test_overload_is_retryable(self):
+        """Test 429 / 529 are retryable and retry-after is read"""
+        assert llm_retry.classify_error(_status_error(429, {'retry-after': '3'})) == (True, 3.0)
+        assert llm_retry.classify_error(_status_error(529)) == (True, None)
+
+    def test_retry_after_ms_header(self):
+        """Test retry-after-ms takes precedence"""
+        assert llm_retry.classify_error(_status_error(429, {'retry-after-ms': '1500', 'retry-after': '9'})) == (True, 1.5)
+
+    def test_client_errors_are_fatal(self):
+        """Test 400 / 401 and non-API errors are not retried"""
+        assert llm_retry.classify_error(_status_error(400))[0] is False
+        assert llm_retry.classify_error(_status_error(401))[0] is False
+        assert llm_retry.classify_error(ValueError('bad json'))[0] is False
+
+    def test_connection_errors_are_retryable(self):
+        """Test connection errors and timeouts are retried"""
+        request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+
+        assert llm_retry.classify_error(anthropic.APIConnectionError(request=request))[0] is True
+        assert llm_retry.classify_error(httpx.ReadTimeout('timeout'))[0] is True
+
+
+class TestCallWithRetry:
+    """Tests for call_with_retry"""
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_retries_then_succeeds(self, mock_sleep):
+        """Test a transient error is retried and recorded in the scope"""
+        fn = MagicMock(side_effect=[_status_error(529), _status_error(429, {'retry-after': '2'}), 'ok'])
+
+        with llm_retry.request_scope(60) as scope:
+            assert llm_retry.call_with_retry('claude', fn) == 'ok'
+
+        assert fn.call_count == 3
+        # 2回目の待ち時間はretry-afterに従う
+        assert mock_sleep.call_args_list[1][0][0] == 2.0
+        stats = scope.to_metadata()
+        assert stats['attempts'] == 3
+        assert stats['retries'] == 2
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_fatal_error_is_not_retried(self, mock_sleep):
+        """Test a 400 is raised immediately"""
+        fn = MagicMock(side_effect=_status_error(400))
+
+        with pytest.raises(anthropic.APIStatusError):
+            llm_retry.call_with_retry('claude', fn)
+
+        assert fn.call_count == 1
+        mock_sleep.assert_not_called()
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_gives_up_after_max_retries(self, mock_sleep):
+        """Test exhausting retries raises LLMUnavailableError"""
+        fn = MagicMock(side_effect=_status_error(503))
+
+        with patch.object(llm_retry.config, 'LLM_MAX_RETRIES', 2):
+            with pytest.raises(LLMUnavailableError):
+                llm_retry.call_with_retry('claude', fn)
+
+        assert fn.call_count == 3
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_retry_after_beyond_deadline_stops(self, mock_sleep):
+        """Test a retry-after longer than the remaining deadline is surfaced instead of waited"""
+        fn = MagicMock(side_effect=_status_error(429, {'retry-after': '30'}))
+
+        with llm_retry.request_scope(10):
+            with pytest.raises(LLMUnavailableError) as exc_info:
+                llm_retry.call_with_retry('claude', fn)
+
+        assert exc_info.value.retry_after == 30.0
+        mock_sleep.assert_not_called()
+
+    def test_expired_deadline_raises(self):
+        """Test no attempt is made once the shared deadline has passed"""
+        fn = MagicMock()
+
+        with llm_retry.request_scope(0):
+            with pytest.raises(DeadlineExceededError):
+                llm_retry.call_with_retry('claude', fn)
+
+        fn.assert_not_called()
+
+    def test_timeout_capped_by_deadline(self):
+        """Test each attempt's timeout is bounded by the remaining deadline"""
+        fn = MagicMock(return_value='ok')
+
+        with llm_retry.request_scope(5):
+            llm_retry.call_with_retry('claude', fn)
+
+        assert fn.call_args[0][0] <= 5
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_time_slice_limits_retries(self, mock_sleep):
+        """Test a time slice bounds the attempt timeout and gives up with a failover-able error"""
+        fn = MagicMock(side_effect=_status_error(503))
+
+        with llm_retry.request_scope(60):
+            with llm_retry.time_slice(3):
+                with pytest.raises(LLMUnavailableError):
+                    llm_retry.call_with_retry('claude', fn)
+            # 制限を抜けた後はデッドラインの残りを使える
+            assert llm_retry.attempt_timeout(llm_retry.current_scope()) > 50
+
+        assert fn.call_args_list[0][0][0] <= 3
+
+    def test_exhausted_time_slice_is_not_a_deadline_error(self):
+        """Test an exhausted slice raises LLMUnavailableError while the deadline still has time"""
+        fn = MagicMock()
+
+        with llm_retry.request_scope(60), llm_retry.time_slice(0):
+            with pytest.raises(LLMUnavailableError) as exc_info:
+                llm_retry.call_with_retry('claude', fn)
+
+        assert exc_info.value.details['reason'] == 'time_slice'
+        fn.assert_not_called()
+
+
+class TestStreamWithRetry:
+    """Tests for stream_with_retry"""
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_retries_before_first_event(self, mock_sleep):
+        """Test a stream that fails before yielding is reopened"""
+        attempts = []
+
+        def open_stream(timeout):
+            attempts.append(timeout)
+            if len(attempts) == 1:
+                raise _status_error(529)
+            yield {'type': 'delta', 'text': 'a'}
+
+        events = list(llm_retry.stream_with_retry('claude', open_stream))
+
+        assert len(attempts) == 2
+        assert events == [{'type': 'delta', 'text': 'a'}]
+
+    @patch('app.clients.llm_retry.time.sleep')
+    def test_no_retry_after_output(self, mock_sleep):
+        """Test a stream that fails mid-output is not replayed"""
+        def open_stream(timeout):
+            yield {'type': 'delta', 'text': 'a'}
+            raise _status_error(529)
+
+        with pytest.raises(anthropic.APIStatusError):
+            list(llm_retry.stream_with_retry('claude', open_stream))
+
+    def test_trickling_stream_stops_at_deadline(self):
+        """Test a stream that keeps sending events is cut off once the shared deadline passes"""
+        closed = []
+
+        def open_stream(timeout):
+            try:
+                while True:
+                    yield {'type': 'delta', 'text': 'a'}
+            finally:
+                closed.append(True)
+
+        received = []
+        with llm_retry.request_scope(60) as scope:
+            with pytest.raises(DeadlineExceededError):
+                for event in llm_retry.stream_with_retry('claude', open_stream):
+                    received.append(event)
+                    if len(received) == 3:
+                        # 読み取りごとのタイムアウト内でイベントが届き続けたままデッドラインを過ぎる
+                        scope.deadline.expires_at = 0
+
+        assert len(received) == 3
+        assert closed == [True]
+
+
+class TestRetryScope:
+    """Tests for RetryScope counters"""
+
+    def test_counters_are_thread_safe(self):
+        """Test counters updated from parallel calls are not lost"""
+        scope = llm_retry.RetryScope(llm_retry.Deadline(60))
+
+        def work():
+            for _ in range(2000):
+                scope.record_attempt()
+                scope.record_retry(0.5)
+                scope.record_continuation()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = scope.to_metadata()
+        assert (stats['attempts'], stats['retries'], stats['continuations']) == (16000, 16000, 16000)
+        assert stats['retry_wait_seconds'] == 8000.0
+
+
+class TestClaudeApiRetry:
+    """Tests for retries wired into _call_claude_api"""
+
+    @patch('app.clients.llm_retry.time.sleep')
+    @patch('app.clients.llm_client.get_llm_client_registry')
+    def test_overload_is_retried(self, mock_get_registry, mock_sleep):
+        """Test a 529 from messages.create is retried with a per-attempt timeout"""
+        response = MagicMock()
+        response.content = [MagicMock(text='{"title": "test"}')]
+        response.usage = MagicMock(input_tokens=1, output_tokens=2, cache_creation_input_tokens=0,
+                                   cache_read_input_tokens=0)
+        client = MagicMock()
+        client.messages.create.side_effect = [_status_error(529), response]
+        mock_get_registry.return_value.lease.return_value.__enter__.return_value = client
+
+        result = _call_claude_api('system', 'user', max_tokens=100)
+
+        assert result['content'] == '{"title": "test"}'
+        assert client.messages.create.call_count == 2
+        assert 'timeout' in client.messages.create.call_args[1]
@@ -0,0 +1,191 @@
+"""
+Test suite for the LLM provider router / circuit breaker
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients.llm_router import (
+    CircuitBreaker,
+    LLMRouter,
+    CIRCUIT_CLOSED,
+    CIRCUIT_OPEN,
+    CIRCUIT_HALF_OPEN
+)
+from app.clients import llm_retry
+from app.models.errors import LLMUnavailableError
+
+
+def _breaker(**overrides):
+    settings = dict(window_seconds=60, min_requests=3, failure_rate=0.5, slow_call_seconds=10, open_seconds=30)
+    settings.update(overrides)
+    return CircuitBreaker(**settings)
+
+
+def _router():
+    return LLMRouter(
+        fallback_provider='openai',
+        fallback_models={'agent1': 'gpt-4o', 'agent2': 'gpt-4o-mini'},
+        fallback_api_key='sk-fallback'
+    )
+
+
+class TestCircuitBreaker:
+    """Tests for CircuitBreaker class"""
+
+    def test_opens_on_sustained_failures(self):
+        """Test the circuit opens once the failure rate crosses the threshold"""
+        breaker = _breaker()
+        breaker.record_success(1.0)
+        breaker.record_failure(1.0)
+        assert breaker.state == CIRCUIT_CLOSED
+
+        breaker.record_failure(1.0)
+
+        assert breaker.state == CIRCUIT_OPEN
+        assert breaker.allow_request() is False
+
+    def test_slow_calls_count_as_failures(self):
+        """Test calls slower than the threshold are counted as failures"""
+        breaker = _breaker()
+        for _ in range(3):
+            breaker.record_success(11.0)
+
+        assert breaker.state == CIRCUIT_OPEN
+
+    def test_half_open_probe_restores(self):
+        """Test a single probe is allowed after open_seconds and success closes the circuit"""
+        breaker = _breaker(open_seconds=0)
+        for _ in range(3):
+            breaker.record_failure(1.0)
+
+        assert breaker.allow_request() is True
+        assert breaker.state == CIRCUIT_HALF_OPEN
+        # 試行中は他のリクエストを通さない
+        assert breaker.allow_request() is False
+
+        breaker.record_success(1.0)
+
+        assert breaker.state == CIRCUIT_CLOSED
+        assert breaker.allow_request() is True
+
+    def test_half_open_probe_failure_reopens(self):
+        """Test a failed probe re-opens the circuit"""
+        breaker = _breaker(open_seconds=0)
+        for _ in range(3):
+            breaker.record_failure(1.0)
+        breaker.allow_request()
+
+        breaker.record_failure(1.0)
+
+        assert breaker.state == CIRCUIT_OPEN
+
+    def test_stats(self):
+        """Test stats report error rate and latency percentiles"""
+        breaker = _breaker(min_requests=10)
+        breaker.record_success(1.0)
+        breaker.record_success(3.0)
+        breaker.record_failure(2.0)
+
+        stats = breaker.get_stats()
+
+        assert stats['requests'] == 3
+        assert stats['error_rate'] == 0.333
+        assert stats['latency_p50'] == 2.0
+
+
+class TestLLMRouter:
+    """Tests for LLMRouter class"""
+
+    def test_primary_used_when_healthy(self):
+        """Test the primary provider serves requests while healthy"""
+        router = _router()
+        fn = MagicMock(return_value={'content': 'ok'})
+
+        assert router.call('agent1', ('claude', 'claude-model'), fn) == {'content': 'ok'}
+        fn.assert_called_once_with('claude', 'claude-model', None)
+
+    def test_fails_over_on_provider_failure(self):
+        """Test an unavailable primary fails over to the configured fallback model"""
+        router = _router()
+        fn = MagicMock(side_effect=[LLMUnavailableError(), {'content': 'fallback'}])
+
+        result = router.call('agent2', ('claude', 'claude-model'), fn)
+
+        assert result == {'content': 'fallback'}
+        assert fn.call_args_list[1][0] == ('openai', 'gpt-4o-mini', 'sk-fallback')
+        assert router.get_stats()['failovers'] == 1
+
+    def test_primary_gets_a_share_of_the_deadline(self):
+        """Test the primary may only use part of the deadline while a fallback is configured"""
+        router = _router()
+        timeouts = []
+
+        def fn(provider, model, api_key):
+            timeouts.append(llm_retry.attempt_timeout(llm_retry.current_scope()))
+            if provider == 'claude':
+                raise LLMUnavailableError()
+            return {'content': 'fallback'}
+
+        with llm_retry.request_scope(20):
+            assert router.call('agent1', ('claude', 'claude-model'), fn) == {'content': 'fallback'}
+
+        # 1本目は残りを候補数で等分した時間まで、フェイルオーバー先は残り全部を使える
+        assert 9 < timeouts[0] <= 10
+        assert timeouts[1] > 19
+
+    def test_single_candidate_uses_whole_deadline(self):
+        """Test no slice is applied when there is no fallback to switch to"""
+        router = LLMRouter(fallback_provider='', fallback_models={}, fallback_api_key='')
+        fn = MagicMock(side_effect=lambda *args: llm_retry.attempt_timeout(llm_retry.current_scope()))
+
+        with llm_retry.request_scope(20):
+            assert router.call('agent1', ('claude', 'claude-model'), fn) > 19
+
+    def test_open_circuit_skips_primary(self):
+        """Test requests go straight to the fallback while the primary circuit is open"""
+        router = _router()
+        primary = ('claude', 'claude-model')
+        breaker = router._breaker(*primary)
+        for _ in range(5):
+            breaker.record_failure(1.0)
+        fn = MagicMock(return_value={'content': 'fallback'})
+
+        router.call('agent1', primary, fn)
+
+        fn.assert_called_once_with('openai', 'gpt-4o', 'sk-fallback')
+
+    def test_input_errors_do_not_fail_over(self):
+        """Test errors unrelated to provider health are raised without failover"""
+        router = _router()
+        fn = MagicMock(side_effect=ValueError('bad request'))
+
+        with pytest.raises(ValueError):
+            router.call('agent1', ('claude', 'claude-model'), fn)
+
+        fn.assert_called_once()
+
+    def test_all_circuits_open(self):
+        """Test a fast 503 with Retry-After when every candidate is open"""
+        router = LLMRouter(fallback_provider='', fallback_models={}, fallback_api_key=None)
+        primary = ('claude', 'claude-model')
+        for _ in range(5):
+            router._breaker(*primary).record_failure(1.0)
+        fn = MagicMock()
+
+        with pytest.raises(LLMUnavailableError) as exc_info:
+            router.call('agent1', primary, fn)
+
+        fn.assert_not_called()
+        assert exc_info.value.retry_after is not None
+
+    def test_stream_fails_over_before_output(self):
+        """Test streaming fails over only if nothing was emitted"""
+        router = _router()
+
+        def open_stream(provider, model, api_key):
+            if provider == 'claude':
+                raise LLMUnavailableError()
+            yield {'type': 'delta', 'text': model}
+
+        events = list(router.stream('agent1', ('claude', 'claude-model'), open_stream))
+
+        assert events == [{'type': 'delta', 'text': 'gpt-4o'}]
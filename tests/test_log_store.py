@@ -0,0 +1,108 @@
+"""
+Test suite for the local Note_Logs store
+"""
+from unittest.mock import MagicMock
+from app.clients.log_store import NoteLogStore
+from app.models.note_models import NoteLogEntry
+
+
+def _log_entry(note_id, created_at, total_tokens=100, article_type='education'):
+    return NoteLogEntry(
+        note_id=note_id,
+        topic='topic',
+        audience='audience',
+        goal='goal',
+        article_type=article_type,
+        length_class='middle',
+        temperature=0.7,
+        intensity_level=5,
+        title=f'title {note_id}',
+        raw_json='{"large": "body"}',
+        total_tokens=total_tokens,
+        created_at=created_at
+    )
+
+
+class TestNoteLogStore:
+    """Tests for NoteLogStore class"""
+
+    def test_recent_logs_newest_first(self, local_data_dir):
+        """Test recent logs are returned newest first without raw_json"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert(_log_entry('note_1', '2025-01-01T00:00:00'))
+        store.insert(_log_entry('note_2', '2025-01-02T00:00:00'))
+        store.insert(_log_entry('note_3', '2025-01-03T00:00:00'))
+
+        logs = store.get_recent_logs(limit=2)
+
+        assert [log['note_id'] for log in logs] == ['note_3', 'note_2']
+        assert 'raw_json' not in logs[0]
+        assert logs[0]['title'] == 'title note_3'
+
+    def test_monthly_token_totals(self, local_data_dir):
+        """Test token totals are grouped by month"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert_many([
+            _log_entry('note_1', '2025-01-01T00:00:00', total_tokens=100),
+            _log_entry('note_2', '2025-01-31T23:59:59', total_tokens=200),
+            _log_entry('note_3', '2025-02-01T00:00:00', total_tokens=400)
+        ])
+
+        assert store.get_monthly_token_totals() == {'2025-01': 300, '2025-02': 400}
+
+    def test_backfill_keeps_existing_rows(self, local_data_dir):
+        """Test backfill imports sheet rows without overwriting local ones"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert(_log_entry('note_1', '2025-01-01T00:00:00', total_tokens=100))
+        gsheet_client = MagicMock()
+        gsheet_client.get_all_log_entries.return_value = [
+            _log_entry('note_1', '2025-01-01T00:00:00', total_tokens=999),
+            _log_entry('note_2', '2025-01-02T00:00:00', total_tokens=200)
+        ]
+
+        assert store.is_backfilled() is False
+        store.backfill_from_sheet(gsheet_client)
+
+        assert store.is_backfilled() is True
+        assert store.count() == 2
+        assert store.get_monthly_token_totals() == {'2025-01': 300}
+
+    def test_persists_across_instances(self, local_data_dir):
+        """Test rows survive reopening the database"""
+        path = str(local_data_dir / 'logs.sqlite3')
+        NoteLogStore(path).insert(_log_entry('note_1', '2025-01-01T00:00:00'))
+
+        assert NoteLogStore(path).count() == 1
+
+    def test_list_logs_keyset_pagination(self, local_data_dir):
+        """Test list_logs continues after the given (created_at, note_id) key"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert_many([
+            _log_entry('note_1', '2025-01-01T00:00:00'),
+            _log_entry('note_2', '2025-01-02T00:00:00'),
+            _log_entry('note_3', '2025-01-02T00:00:00'),
+            _log_entry('note_4', '2025-01-03T00:00:00')
+        ])
+
+        first = store.list_logs(['note_id'], limit=2)
+        rest = store.list_logs(['note_id'], limit=10, after=(first[-1]['created_at'], first[-1]['note_id']))
+
+        assert [log['note_id'] for log in first] == ['note_4', 'note_3']
+        assert [log['note_id'] for log in rest] == ['note_2', 'note_1']
+
+    def test_list_logs_filters(self, local_data_dir):
+        """Test list_logs filters by article_type and date range"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert_many([
+            _log_entry('note_1', '2025-01-01T00:00:00', article_type='story'),
+            _log_entry('note_2', '2025-01-15T00:00:00', article_type='story'),
+            _log_entry('note_3', '2025-01-20T00:00:00', article_type='education'),
+            _log_entry('note_4', '2025-02-01T00:00:00', article_type='story')
+        ])
+
+        logs = store.list_logs(
+            ['note_id'], limit=10, article_type='story',
+            created_from='2025-01-10', created_to='2025-02-01'
+        )
+
+        assert [log['note_id'] for log in logs] == ['note_2']
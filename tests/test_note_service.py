@@ -5,15 +5,18 @@ import pytest
 from unittest.mock import patch, MagicMock
 from app.services.note_service import NoteService
 from app.models.errors import TokenLimitExceededError, ValidationError
+from app.models.note_models import generate_note_id
 
 
 class TestNoteService:
     """Tests for NoteService class"""
 
+    @patch('app.services.note_service.config.AGENT2_MODE', 'always')
+    @patch('app.services.note_service.get_gsheet_writer')
     @patch('app.clients.gsheet_client.GoogleSheetsClient')
     @patch('app.clients.llm_client.call_agent2')
     @patch('app.clients.llm_client.call_agent1')
-    def test_generate_note_success(self, mock_agent1, mock_agent2, mock_gsheet_class):
+    def test_generate_note_success(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
         """Test successful note generation"""
         # Mock Google Sheets client class
         mock_client = MagicMock()
@@ -83,9 +86,13 @@ class TestNoteService:
         assert result.note_id is not None
         assert result.metadata['topic'] == 'AI副業'
         assert result.metadata['token_usage']['total_tokens'] == 5000
+        assert result.metadata['llm_retry']['retries'] == 0
 
-        # ログ保存が呼ばれた
-        mock_client.append_row.assert_called_once()
+        # ログ保存が書き込みキューに積まれた
+        service.gsheet_writer.enqueue.assert_called_once()
+
+        # ローカルログストアにも保存された
+        assert service.log_store.get_recent_logs(limit=1)[0]['note_id'] == result.note_id
     
     @patch('app.clients.gsheet_client.GoogleSheetsClient')
     @patch('app.clients.llm_client.call_agent1')
@@ -171,3 +178,376 @@ class TestNoteService:
         assert result.metadata['length_class'] == 'middle'
         assert result.metadata['temperature_used'] == 0.7
         assert result.metadata['intensity_level_used'] == 5
+
+    def test_build_response_reports_cache_tokens(self):
+        """Test prompt cache token breakdown is included in token_usage"""
+        service = NoteService()
+        request = service.validate_request({'topic': 'test', 'audience': 'test', 'goal': 'test'})
+
+        response = service._build_response(
+            note_id='TEST',
+            request=request,
+            result={
+                'title': 't',
+                'lead': 'l',
+                'sections': [],
+                'cta': 'c',
+                'token_usage': {
+                    'prompt_tokens': 3100,
+                    'completion_tokens': 200,
+                    'total_tokens': 3300,
+                    'cache_creation_input_tokens': 0,
+                    'cache_read_input_tokens': 3000
+                }
+            }
+        )
+
+        token_usage = response.metadata['token_usage']
+        assert token_usage['cache_read_input_tokens'] == 3000
+        assert token_usage['cache_creation_input_tokens'] == 0
+        assert token_usage['total_tokens'] == 3300
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_generate_note_hedge_within_budget(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test Agent1 is hedged only when TokenService allows it and the extra tokens are recorded"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        token_usage = {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 420, 'hedge_tokens': 120}
+        service = NoteService()
+        ledger = service.token_service.token_ledger
+        reservations = []
+
+        def agent1(payload, hedge=False):
+            reservations.append(ledger.get_status()['reservations'])
+            return {'title': 'A1', 'lead': '', 'sections': [], 'cta': '', 'token_usage': token_usage}
+
+        mock_agent1.side_effect = agent1
+        mock_agent2.return_value = {'title': 'A2', 'lead': '', 'sections': [], 'cta': '', 'token_usage': token_usage}
+
+        with patch('app.services.token_service.config.LLM_HEDGE_AGENT1', True):
+            result = service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        mock_agent1.assert_called_once()
+        assert mock_agent1.call_args[1] == {'hedge': True}
+        assert result.metadata['token_usage']['hedge_tokens'] == 120
+        # 生成中は本体とヘッジ1本分を予約し、終了後はどちらも残らない
+        assert reservations == [2]
+        assert ledger.get_status()['reservations'] == 0
+        # 打ち切った分は今月のヘッジ予算に計上される
+        assert service.token_service.get_hedge_usage() == 120
+
+
+    @patch('app.services.note_service.config.AGENT1_FANOUT_LONG', True)
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent1_fanout')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_long_articles_use_fanout(self, mock_agent1, mock_fanout, mock_gsheet_class, mock_get_writer):
+        """Test long articles are generated section by section when AGENT1_FANOUT_LONG is enabled"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_fanout.return_value = {
+            'title': 'T', 'lead': 'L', 'sections': [{'heading': '■見出し', 'body': '本文です。'}], 'cta': 'C',
+            'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+        }
+
+        service = NoteService()
+        result = service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g', 'length_class': 'long'})
+
+        mock_fanout.assert_called_once()
+        mock_agent1.assert_not_called()
+        assert result.sections[0].body == '本文です。'
+
+
+class TestNoteServiceAgent2Mode:
+    """Tests for skipping Agent2 when local rewrites are enough"""
+
+    @staticmethod
+    def _mock_sheets(mock_gsheet_class):
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+
+    @staticmethod
+    def _agent1_result(body):
+        return {
+            'title': '**タイトル**', 'lead': 'リード', 'sections': [{'heading': '見出し', 'body': body}],
+            'cta': '今すぐ実践しましょう。',
+            'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+        }
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_auto_skips_agent2_when_clean(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test mechanical violations are fixed locally without calling Agent2"""
+        self._mock_sheets(mock_gsheet_class)
+        mock_agent1.return_value = self._agent1_result('【結論】本文です。')
+
+        result = NoteService().generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        mock_agent2.assert_not_called()
+        assert result.title == 'タイトル'
+        assert result.sections[0].heading == '■見出し'
+        assert result.sections[0].body == '結論本文です。'
+        assert result.cta == '今すぐ実践してください。'
+        assert result.metadata['style_check']['agent2'] == 'skipped'
+        assert result.metadata['token_usage']['total_tokens'] == 300
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_auto_calls_agent2_for_residual_violations(self, mock_agent1, mock_agent2, mock_gsheet_class,
+                                                       mock_get_writer):
+        """Test Agent2 receives the locally cleaned article when violations remain"""
+        self._mock_sheets(mock_gsheet_class)
+        mock_agent1.return_value = self._agent1_result('あなたにも必要でしょう。')
+        mock_agent2.return_value = self._agent1_result('誰にでも必要です。')
+
+        result = NoteService().generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        mock_agent2.assert_called_once()
+        sent = mock_agent2.call_args[0][0]
+        assert sent['title'] == 'タイトル'
+        assert result.metadata['style_check']['agent2'] == 'called'
+        assert result.metadata['style_check']['rules'] == ['ai_expression', 'second_person']
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'skip')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_skip_mode_never_calls_agent2(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test AGENT2_MODE=skip returns the cleaned article even with residual violations"""
+        self._mock_sheets(mock_gsheet_class)
+        mock_agent1.return_value = self._agent1_result('あなたにも必要でしょう。')
+
+        result = NoteService().generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        mock_agent2.assert_not_called()
+        assert result.metadata['style_check']['violations'] == 2
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'sections')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2_parts')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_sections_mode_refines_only_violating_parts(self, mock_agent1, mock_agent2, mock_parts,
+                                                        mock_gsheet_class, mock_get_writer):
+        """Test AGENT2_MODE=sections sends only the violating section to Agent2"""
+        self._mock_sheets(mock_gsheet_class)
+        agent1_result = self._agent1_result('あなたにも必要でしょう。')
+        agent1_result['sections'].insert(0, {'heading': '■導入', 'body': '本文です。'})
+        mock_agent1.return_value = agent1_result
+        mock_parts.side_effect = lambda article, targets: dict(
+            article, sections=[article['sections'][0], {'heading': '■見出し', 'body': '**誰にでも**必要です。'}]
+        )
+
+        result = NoteService().generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        mock_agent2.assert_not_called()
+        targets = mock_parts.call_args[0][1]
+        assert list(targets) == ['sections.1']
+        # 部分調整の結果も機械的な書き換えを通す
+        assert result.sections[1].body == '誰にでも必要です。'
+        assert result.metadata['style_check']['agent2'] == 'sections'
+        assert result.metadata['style_check']['refined_parts'] == ['sections.1']
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.stream_agent2')
+    @patch('app.clients.llm_client.stream_agent1')
+    def test_stream_reports_agent2_skipped(self, mock_stream1, mock_stream2, mock_gsheet_class, mock_get_writer):
+        """Test the stream emits agent2_skipped instead of Agent2 events"""
+        self._mock_sheets(mock_gsheet_class)
+        mock_stream1.return_value = iter([{'type': 'result', 'result': self._agent1_result('本文です。')}])
+
+        events = list(NoteService().generate_note_stream({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'}))
+
+        names = [name for name, _ in events]
+        assert names == ['validated', 'queued', 'agent1_started', 'agent1_done', 'agent2_skipped', 'saved', 'result']
+        mock_stream2.assert_not_called()
+
+
+class TestNoteServiceCache:
+    """Tests for cache: "reuse" handling in NoteService.generate_note"""
+
+    @staticmethod
+    def _agent_result(title):
+        return {
+            'title': title, 'lead': 'リード', 'sections': [{'heading': '■見出し', 'body': '本文'}],
+            'cta': 'CTA',
+            'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+        }
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'always')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_reuse_returns_cached_result(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test a repeated reuse request does not call the LLM again"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_agent1.return_value = self._agent_result('Agent1')
+        mock_agent2.return_value = self._agent_result('Agent2')
+        request_data = {'topic': 'AI副業', 'audience': 'a', 'goal': 'g', 'cache': 'reuse'}
+
+        service = NoteService()
+        first = service.generate_note(request_data)
+        second = service.generate_note(dict(request_data, topic=' AI副業 '))
+
+        assert mock_agent1.call_count == 1
+        assert second.note_id == first.note_id
+        assert second.title == 'Agent2'
+        assert second.metadata['cache'] == 'hit'
+        # キャッシュ利用時はログを保存しない
+        service.gsheet_writer.enqueue.assert_called_once()
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent2')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_bypass_is_default(self, mock_agent1, mock_agent2, mock_gsheet_class, mock_get_writer):
+        """Test requests without cache always regenerate"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_agent1.return_value = self._agent_result('Agent1')
+        mock_agent2.return_value = self._agent_result('Agent2')
+        request_data = {'topic': 'AI副業', 'audience': 'a', 'goal': 'g'}
+
+        service = NoteService()
+        service.generate_note(dict(request_data, cache='reuse'))
+        service.generate_note(request_data)
+
+        assert mock_agent1.call_count == 2
+
+    def test_invalid_cache_mode(self):
+        """Test an unknown cache value is a validation error"""
+        service = NoteService()
+
+        with pytest.raises(ValidationError):
+            service.generate_note({'topic': 'test', 'cache': 'always'})
+
+
+class TestNoteServiceStream:
+    """Tests for NoteService.generate_note_stream"""
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'always')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.stream_agent2')
+    @patch('app.clients.llm_client.stream_agent1')
+    def test_generate_note_stream_events(self, mock_stream1, mock_stream2, mock_gsheet_class, mock_get_writer):
+        """Test stream yields stage events in order and a final result"""
+        mock_client = MagicMock()
+        mock_client.service = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+
+        agent1_result = {
+            'title': 'Agent1タイトル', 'lead': 'リード', 'sections': [], 'cta': 'CTA',
+            'token_usage': {'prompt_tokens': 100, 'completion_tokens': 200, 'total_tokens': 300}
+        }
+        agent2_result = {
+            'title': 'Agent2タイトル', 'lead': 'リード', 'sections': [{'heading': '■見出し', 'body': '本文'}],
+            'cta': 'CTA',
+            'token_usage': {'prompt_tokens': 300, 'completion_tokens': 400, 'total_tokens': 700}
+        }
+        mock_stream1.return_value = iter([
+            {'type': 'delta', 'text': '{"title"'},
+            {'type': 'result', 'result': agent1_result}
+        ])
+        mock_stream2.return_value = iter([
+            {'type': 'delta', 'text': '{"title"'},
+            {'type': 'field', 'key': 'title', 'value': 'Agent2タイトル'},
+            {'type': 'section', 'index': 0, 'section': {'heading': '■見出し', 'body': '本文'}},
+            {'type': 'result', 'result': agent2_result}
+        ])
+
+        service = NoteService()
+        events = list(service.generate_note_stream({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'}))
+
+        names = [name for name, _ in events]
+        assert names == [
+            'validated', 'queued', 'agent1_started', 'agent1_delta', 'agent1_done',
+            'agent2_started', 'agent2_delta', 'agent2_field', 'agent2_section', 'agent2_done', 'saved', 'result'
+        ]
+        assert events[7][1] == {'key': 'title', 'value': 'Agent2タイトル'}
+        assert events[8][1] == {'index': 0, 'section': {'heading': '■見出し', 'body': '本文'}}
+        mock_stream2.assert_called_once_with(agent1_result)
+
+        result = events[-1][1]
+        assert result['title'] == 'Agent2タイトル'
+        assert result['note_id'] == events[0][1]['note_id']
+        assert result['metadata']['token_usage']['total_tokens'] == 700
+        service.gsheet_writer.enqueue.assert_called_once()
+
+    def test_generate_note_stream_validation_error(self):
+        """Test validation happens before the generator is returned"""
+        service = NoteService()
+
+        with pytest.raises(ValidationError):
+            service.generate_note_stream({'topic': ''})
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.stream_agent1')
+    def test_generate_note_stream_error_event(self, mock_stream1, mock_gsheet_class, mock_get_writer):
+        """Test LLM failures are reported as an error event"""
+        mock_client = MagicMock()
+        mock_client.service = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_stream1.side_effect = Exception('API Error')
+
+        service = NoteService()
+        events = list(service.generate_note_stream({'topic': 'test', 'audience': 'a', 'goal': 'g'}))
+
+        assert events[-1][0] == 'error'
+        assert events[-1][1]['error']['code'] == 'INTERNAL_ERROR'
+        service.gsheet_writer.enqueue.assert_not_called()
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.stream_agent1')
+    def test_unconsumed_stream_releases_reservation(self, mock_stream1, mock_gsheet_class, mock_get_writer):
+        """Test a stream closed or dropped before its first event releases the token reservation"""
+        mock_gsheet_class.return_value.get_total_tokens_this_month.return_value = 0
+        service = NoteService()
+        ledger = service.token_service.token_ledger
+
+        events = service.generate_note_stream({'topic': 'test', 'audience': 'a', 'goal': 'g'})
+        assert ledger.get_status()['reservations'] == 1
+        events.close()
+        assert ledger.get_status()['reservations'] == 0
+
+        events = service.generate_note_stream({'topic': 'test', 'audience': 'a', 'goal': 'g'})
+        del events
+        assert ledger.get_status()['reservations'] == 0
+        mock_stream1.assert_not_called()
+
+
+class TestGenerateNoteId:
+    """Tests for generate_note_id"""
+
+    @patch('app.models.note_models.datetime')
+    def test_ids_in_the_same_millisecond_are_unique(self, mock_datetime):
+        """Test ids do not collide within one millisecond (including other worker processes)"""
+        from datetime import datetime
+        mock_datetime.now.return_value = datetime(2025, 1, 1, 12, 0, 0, 123000)
+
+        ids = {generate_note_id() for _ in range(1000)}
+
+        assert len(ids) == 1000
+        assert all(note_id.startswith('note_20250101_120000_123_') for note_id in ids)
@@ -0,0 +1,113 @@
+"""
+Test suite for the generation result cache
+"""
+import threading
+import time
+import pytest
+from app.clients.result_cache import ResultCache, SingleFlight, build_cache_key
+from app.models.note_models import GenerateNoteRequest
+
+
+def _request(**overrides):
+    fields = dict(
+        topic='AI副業', audience='初心者', goal='教育', article_type='education',
+        length_class='middle', temperature=0.7, intensity_level=5
+    )
+    fields.update(overrides)
+    return GenerateNoteRequest(**fields)
+
+
+class TestCacheKey:
+    """Tests for build_cache_key"""
+
+    def test_normalizes_whitespace_and_width(self):
+        """Test equivalent requests map to the same key"""
+        assert build_cache_key(_request()) == build_cache_key(_request(topic='  ＡＩ副業 ', cache='reuse'))
+
+    def test_differs_by_content(self):
+        """Test any generation parameter change produces a different key"""
+        base = build_cache_key(_request())
+
+        assert build_cache_key(_request(intensity_level=6)) != base
+        assert build_cache_key(_request(length_class='long')) != base
+
+    def test_differs_by_api_key(self):
+        """Test a result cached for one API key is not served to another"""
+        assert build_cache_key(_request(api_key='blog')) != build_cache_key(_request(api_key='shop'))
+        assert build_cache_key(_request(api_key='blog')) != build_cache_key(_request())
+
+
+class TestResultCache:
+    """Tests for ResultCache class"""
+
+    def test_put_and_get(self, local_data_dir):
+        """Test stored results are returned"""
+        cache = ResultCache(str(local_data_dir / 'cache.sqlite3'), ttl_seconds=60, max_entries=10)
+        cache.put('key', {'title': 'cached'})
+
+        assert cache.get('key') == {'title': 'cached'}
+        assert cache.get('missing') is None
+        assert cache.get_stats()['hits'] == 1
+
+    def test_expired_entries_are_dropped(self, local_data_dir):
+        """Test entries past the TTL are not returned"""
+        cache = ResultCache(str(local_data_dir / 'cache.sqlite3'), ttl_seconds=0, max_entries=10)
+        cache.put('key', {'title': 'cached'})
+
+        assert cache.get('key') is None
+
+    def test_lru_eviction(self, local_data_dir):
+        """Test the least recently used entry is evicted over the limit"""
+        cache = ResultCache(str(local_data_dir / 'cache.sqlite3'), ttl_seconds=60, max_entries=2)
+        cache.put('a', {'n': 1})
+        time.sleep(0.01)
+        cache.put('b', {'n': 2})
+        time.sleep(0.01)
+        cache.get('a')
+        time.sleep(0.01)
+        cache.put('c', {'n': 3})
+
+        assert cache.get('a') == {'n': 1}
+        assert cache.get('b') is None
+        assert cache.get('c') == {'n': 3}
+
+
+class TestSingleFlight:
+    """Tests for SingleFlight class"""
+
+    def test_concurrent_calls_share_one_execution(self):
+        """Test concurrent callers with the same key run the function once"""
+        single_flight = SingleFlight()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        results = []
+        leader = threading.Thread(target=lambda: results.append(single_flight.do('key', work)))
+        leader.start()
+        started.wait(5)
+        followers = [threading.Thread(target=lambda: results.append(single_flight.do('key', work))) for _ in range(3)]
+        for follower in followers:
+            follower.start()
+        # フォロワーが待機に入るまで待つ
+        while single_flight.coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        for thread in [leader] + followers:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert results == ['done'] * 4
+
+    def test_errors_propagate(self):
+        """Test the leader's exception is raised to the caller"""
+        single_flight = SingleFlight()
+
+        with pytest.raises(RuntimeError):
+            single_flight.do('key', lambda: (_ for _ in ()).throw(RuntimeError('boom')))
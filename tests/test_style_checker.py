@@ -0,0 +1,82 @@
+"""
+Test suite for the local style checker
+"""
+import pytest
+from app.services.style_checker import clean_text, clean_heading, clean_article, find_violations
+
+
+class TestCleanText:
+    """Tests for mechanical rewrites"""
+
+    def test_removes_decoration(self):
+        """Test markdown emphasis, lists, dividers and decorative brackets are removed"""
+        text = '## 導入\n**重要**なのは【結論】です。\n- 項目1\n---\n『本』を読む'
+
+        cleaned, fixes = clean_text(text)
+
+        assert cleaned == '導入\n重要なのは結論です。\n項目1\n\n本を読む'
+        assert fixes > 0
+
+    def test_keeps_hashtags(self):
+        """Test hashtags and underscores inside words survive while emphasis is removed"""
+        text = '# 導入\n__大事__なのは継続です。\n#マーケティング #副業 file_name_v2'
+
+        cleaned, _ = clean_text(text)
+
+        assert cleaned == '導入\n大事なのは継続です。\n#マーケティング #副業 file_name_v2'
+        assert find_violations({'title': '', 'lead': cleaned, 'sections': [], 'cta': ''}) == []
+
+    def test_rewrites_fixed_phrases(self):
+        """Test AI-like phrases and second person forms with safe replacements are rewritten"""
+        cleaned, _ = clean_text('あなたの人生を変えましょう。今すぐ実践しましょう。これは近道ではないでしょうか。')
+
+        assert cleaned == '自分の人生を変えましょう。今すぐ実践してください。これは近道ではないですか。'
+
+    def test_clean_text_is_noop_for_clean_text(self):
+        """Test text without violations is returned unchanged"""
+        assert clean_text('成功者は行動する。失敗者は迷う。') == ('成功者は行動する。失敗者は迷う。', 0)
+
+    def test_heading_marker(self):
+        """Test headings always start with the ■ marker"""
+        assert clean_heading('## 問題の本質') == ('■問題の本質', 2)
+        assert clean_heading('■問題の本質') == ('■問題の本質', 0)
+
+
+class TestFindViolations:
+    """Tests for residual violation detection"""
+
+    def test_reports_residual_violations(self):
+        """Test violations that need semantic rewriting are reported with their location"""
+        article, _ = clean_article({
+            'title': 'タイトル',
+            'lead': 'きっと驚くでしょう。',
+            'sections': [
+                {'heading': '■見出し', 'body': '本文です。'},
+                {'heading': '見出し2', 'body': 'あなたにも必要です。'}
+            ],
+            'cta': '始めましょう。',
+            'token_usage': {'total_tokens': 10}
+        })
+
+        violations = find_violations(article)
+
+        located = {(v.field, v.rule, v.section_index) for v in violations}
+        assert located == {
+            ('lead', 'ai_expression', None),
+            ('body', 'second_person', 1),
+            ('cta', 'ai_expression', None)
+        }
+        # 見出しの■は書き換えで補われる
+        assert article['sections'][1]['heading'] == '■見出し2'
+        assert article['token_usage'] == {'total_tokens': 10}
+
+    def test_clean_article_has_no_violations(self):
+        """Test a clean article yields no violations"""
+        article = {
+            'title': 'タイトル',
+            'lead': 'リードです。',
+            'sections': [{'heading': '■見出し', 'body': '本文です。'}],
+            'cta': '今日から始めてください。'
+        }
+
+        assert find_violations(article) == []
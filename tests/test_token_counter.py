@@ -0,0 +1,142 @@
+"""
+Test suite for Monthly Token Counter
+"""
+from unittest.mock import MagicMock, patch
+from app.clients.log_store import NoteLogStore
+from app.clients.token_counter import MonthlyTokenCounter, month_key
+from app.models.note_models import NoteLogEntry
+
+
+def _log_entry(note_id, total_tokens):
+    return NoteLogEntry(
+        note_id=note_id,
+        topic='topic',
+        audience='audience',
+        goal='goal',
+        article_type='education',
+        length_class='middle',
+        temperature=0.7,
+        intensity_level=5,
+        title='タイトル',
+        raw_json='{}',
+        total_tokens=total_tokens,
+        created_at='2025-01-01T00:00:00'
+    )
+
+
+class TestMonthlyTokenCounter:
+    """Tests for MonthlyTokenCounter class"""
+
+    def test_seeds_once_then_serves_from_memory(self):
+        """Test the loader runs only on first access"""
+        loader = MagicMock(return_value={'2025-01': 1000})
+        counter = MonthlyTokenCounter(loader, reconcile_interval=3600)
+
+        assert counter.get('2025-01') == 1000
+        assert counter.get('2025-01') == 1000
+        assert counter.get('2025-02') == 0
+        loader.assert_called_once()
+
+    def test_add_updates_running_total(self):
+        """Test additions are reflected without reloading"""
+        loader = MagicMock(return_value={'2025-01': 1000})
+        counter = MonthlyTokenCounter(loader, reconcile_interval=3600)
+        counter.get('2025-01')
+
+        counter.add('2025-01-15T10:00:00', 500)
+        counter.add('2025-02-01T00:00:00', 300)
+
+        assert counter.get('2025-01') == 1500
+        assert counter.get('2025-02') == 300
+        loader.assert_called_once()
+
+    def test_reconcile_replaces_totals(self):
+        """Test reconcile adopts the source totals"""
+        loader = MagicMock(side_effect=[{'2025-01': 1000}, {'2025-01': 4000}])
+        counter = MonthlyTokenCounter(loader, reconcile_interval=3600)
+        counter.get('2025-01')
+        counter.add('2025-01-15T10:00:00', 500)
+
+        counter.reconcile()
+
+        assert counter.get('2025-01') == 4000
+
+    def test_stale_counter_reconciles_in_background(self):
+        """Test a stale counter returns immediately and refreshes asynchronously"""
+        loader = MagicMock(side_effect=[{'2025-01': 1000}, {'2025-01': 2000}])
+        counter = MonthlyTokenCounter(loader, reconcile_interval=0)
+        counter.reconcile()
+
+        # 古い値を即座に返し、突き合わせは別スレッドで行う
+        assert counter.get('2025-01') in (1000, 2000)
+
+        import time
+        deadline = time.time() + 5
+        while counter.get('2025-01') != 2000 and time.time() < deadline:
+            time.sleep(0.01)
+        assert counter.get('2025-01') == 2000
+
+    def test_loader_error_keeps_previous_totals(self):
+        """Test loader failures do not drop known totals"""
+        loader = MagicMock(side_effect=[{'2025-01': 1000}, Exception('Sheets API Error')])
+        counter = MonthlyTokenCounter(loader, reconcile_interval=3600)
+        counter.get('2025-01')
+
+        counter.reconcile()
+
+        assert counter.get('2025-01') == 1000
+
+    @patch('app.clients.token_counter.time.time')
+    def test_failed_first_load_backs_off(self, mock_time):
+        """Test a failing first load is not retried on every request"""
+        mock_time.return_value = 1000.0
+        loader = MagicMock(side_effect=[Exception('disk error'), Exception('disk error'), {'2025-01': 1000}])
+        counter = MonthlyTokenCounter(loader, reconcile_interval=300)
+
+        assert counter.get('2025-01') == 0
+        assert counter.get('2025-01') == 0
+        assert loader.call_count == 1
+
+        # 待ち時間（5秒）を過ぎたら再度ロードし、続けて失敗した場合は待ち時間を倍にする
+        mock_time.return_value = 1005.0
+        counter.get('2025-01')
+        assert loader.call_count == 2
+        mock_time.return_value = 1014.0
+        counter.get('2025-01')
+        assert loader.call_count == 2
+
+        mock_time.return_value = 1015.0
+        assert counter.get('2025-01') == 1000
+        assert loader.call_count == 3
+
+    def test_addition_during_reconcile_is_not_double_counted(self, local_data_dir):
+        """Test a row that reached the source before the load is not added on top of it again"""
+        store = NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+        store.insert(_log_entry('note_1', 1000))
+        snapshot = {}
+        counter = None
+
+        def loader():
+            totals, snapshot['rowid'] = store.get_monthly_token_snapshot()
+            # 集計の読み込み後に保存された行
+            store.insert(_log_entry('note_3', 300))
+            # 集計に含まれる行の加算が、突き合わせ中に届く
+            counter.add('2025-01-01T00:00:00', 200, 'note_2')
+            counter.add('2025-01-01T00:00:00', 300, 'note_3')
+            return totals
+
+        store.insert(_log_entry('note_2', 200))
+        counter = MonthlyTokenCounter(
+            loader, reconcile_interval=3600,
+            find_loaded=lambda note_ids: store.find_note_ids(note_ids, up_to_rowid=snapshot['rowid'])
+        )
+
+        counter.reconcile()
+
+        # note_2 は集計に含まれるため上乗せせず、note_3 は未反映のため上乗せする
+        assert counter.get('2025-01') == 1500
+
+    def test_month_key(self):
+        """Test month key extraction"""
+        assert month_key('2025-11-15T12:34:56') == '2025-11'
+        assert len(month_key()) == 7
@@ -0,0 +1,167 @@
+"""
+Test suite for the log-driven token estimator
+"""
+import json
+import random
+import pytest
+from unittest.mock import patch
+from app.clients.log_store import NoteLogStore
+from app.clients.token_estimator import P2Quantile, TokenEstimator, count_prompt_tokens, count_request_prompt_tokens
+from app.models.note_models import NoteLogEntry
+
+
+PAYLOAD = {
+    'topic': 'AI副業', 'audience': '会社員', 'goal': '始め方を知る',
+    'article_type': 'education', 'length_class': 'middle', 'intensity_level': 5
+}
+
+
+def _log_entry(note_id, created_at, total_tokens, length_class='middle', model='claude-a', raw_json=None):
+    if raw_json is None:
+        raw_json = json.dumps({'metadata': {'llm_retry': {'routes': [{'agent': 'agent1', 'model': model}]}}})
+    return NoteLogEntry(
+        note_id=note_id,
+        topic=PAYLOAD['topic'],
+        audience=PAYLOAD['audience'],
+        goal=PAYLOAD['goal'],
+        article_type='education',
+        length_class=length_class,
+        temperature=0.7,
+        intensity_level=5,
+        title='title',
+        raw_json=raw_json,
+        total_tokens=total_tokens,
+        created_at=created_at
+    )
+
+
+@pytest.fixture
+def store(local_data_dir):
+    return NoteLogStore(str(local_data_dir / 'logs.sqlite3'))
+
+
+def _estimator(store, min_samples=3):
+    return TokenEstimator(store.list_token_samples, quantile=0.9, min_samples=min_samples, refresh_interval=3600)
+
+
+class TestP2Quantile:
+    """Tests for P2Quantile class"""
+
+    @pytest.mark.parametrize('p', [0.5, 0.9])
+    def test_tracks_true_quantile(self, p):
+        """Test the streaming estimate is close to the exact quantile"""
+        rng = random.Random(42)
+        values = [rng.gauss(3000, 500) for _ in range(5000)]
+        sketch = P2Quantile(p)
+        for value in values:
+            sketch.add(value)
+
+        exact = sorted(values)[int(p * len(values))]
+        assert sketch.count == 5000
+        assert abs(sketch.value() - exact) < 50
+
+    def test_few_observations(self):
+        """Test the estimate before the markers are initialised"""
+        sketch = P2Quantile(0.9)
+        assert sketch.value() is None
+
+        for value in [300, 100, 200]:
+            sketch.add(value)
+
+        assert sketch.value() == 300
+
+
+class TestPromptTokens:
+    """Tests for the pre-flight prompt token count"""
+
+    def test_counts_non_ascii_per_character(self):
+        """Test Japanese characters count one token each and ASCII four characters per token"""
+        assert count_prompt_tokens('記事') == 2
+        assert count_prompt_tokens('abcdefgh') == 2
+        assert count_prompt_tokens('記事abcde') == 4
+
+    def test_request_prompt_grows_with_input(self):
+        """Test the count reflects the actual request content"""
+        longer = dict(PAYLOAD, goal=PAYLOAD['goal'] * 50)
+
+        assert count_request_prompt_tokens(longer) - count_request_prompt_tokens(PAYLOAD) == len(PAYLOAD['goal']) * 49
+
+
+class TestTokenEstimator:
+    """Tests for TokenEstimator class"""
+
+    def test_default_until_enough_samples(self, store):
+        """Test the fixed per-length estimate is used while there are too few logs"""
+        store.insert(_log_entry('note_1', '2025-01-01T00:00:00', 9000))
+        estimator = _estimator(store)
+
+        result = estimator.estimate(PAYLOAD, model='claude-a')
+
+        assert result['source'] == 'default'
+        assert result['estimated_tokens'] == 3000
+
+    def test_learns_from_logs(self, store):
+        """Test the estimate is the prompt plus the learned generation quantile"""
+        for i in range(5):
+            store.insert(_log_entry(f'note_{i}', f'2025-01-0{i + 1}T00:00:00', 8000))
+        estimator = _estimator(store)
+
+        result = estimator.estimate(PAYLOAD, model='claude-a')
+
+        prompt_tokens = count_request_prompt_tokens(PAYLOAD)
+        assert result['source'] == 'middle/education/claude-a'
+        assert result['samples'] == 5
+        assert result['prompt_tokens'] == prompt_tokens
+        assert result['estimated_tokens'] == 8000
+
+    def test_falls_back_to_coarser_key(self, store):
+        """Test a model without enough logs uses the logs of other models for the same length and type"""
+        for i in range(3):
+            store.insert(_log_entry(f'note_{i}', f'2025-01-0{i + 1}T00:00:00', 7000, model='claude-a'))
+
+        result = _estimator(store).estimate(PAYLOAD, model='claude-b')
+
+        assert result['source'] == 'middle/education'
+        assert result['estimated_tokens'] == 7000
+
+    def test_refresh_reads_only_new_rows(self, store):
+        """Test logs saved after the first load are added incrementally"""
+        for i in range(3):
+            store.insert(_log_entry(f'note_{i}', f'2025-01-0{i + 1}T00:00:00', 4000))
+        estimator = _estimator(store)
+
+        assert estimator.refresh() == 3
+        assert estimator.refresh() == 0
+
+        store.insert(_log_entry('note_9', '2025-02-01T00:00:00', 4000))
+        assert estimator.refresh() == 1
+        assert estimator.get_stats()['keys']['middle/education/claude-a']['samples'] == 4
+
+    def test_rows_without_model_or_valid_json(self, store):
+        """Test logs backfilled from the sheet (no routes, or malformed raw_json) are still used"""
+        store.insert(_log_entry('note_1', '2025-01-01T00:00:00', 4000, raw_json='{broken'))
+        store.insert(_log_entry('note_2', '2025-01-02T00:00:00', 4000, raw_json='{}'))
+
+        rows = store.list_token_samples()
+
+        assert [row['model'] for row in rows] == [None, None]
+        estimator = _estimator(store, min_samples=2)
+        assert estimator.estimate(PAYLOAD)['samples'] == 2
+
+
+class TestNoteServiceEstimate:
+    """Tests for NoteService.estimate_tokens"""
+
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_uses_logged_usage(self, mock_gsheet_class):
+        """Test the reservation estimate follows the logged total_tokens"""
+        from app.clients.log_store import get_log_store
+        from app.services.note_service import NoteService
+
+        for i in range(10):
+            get_log_store().insert(_log_entry(f'note_{i}', f'2025-01-{i + 10}T00:00:00', 12000, model=''))
+        service = NoteService()
+
+        request = service.validate_request(dict(PAYLOAD))
+
+        assert service.estimate_tokens(request) == 12000
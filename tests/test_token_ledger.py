@@ -0,0 +1,152 @@
+"""
+Test suite for the token reservation ledger
+"""
+import threading
+import pytest
+from unittest.mock import patch, MagicMock
+from app.clients.token_ledger import TokenLedger
+from app.models.errors import TokenLimitExceededError
+from app.services.note_service import NoteService
+from app.services.token_service import TokenService
+
+
+@pytest.fixture
+def ledger_path(local_data_dir):
+    return str(local_data_dir / 'token_ledger.sqlite3')
+
+
+class TestTokenLedger:
+    """Tests for TokenLedger class"""
+
+    def test_reservations_count_against_limit(self, ledger_path):
+        """Test pending reservations are included in the admission check"""
+        ledger = TokenLedger(ledger_path)
+
+        first = ledger.reserve(600, limit=1000)
+        second = ledger.reserve(600, limit=1000)
+
+        assert first['reserved'] is True
+        assert second['reserved'] is False
+        assert second['reserved_tokens'] == 600
+
+    def test_commit_replaces_reservation_with_actual_usage(self, ledger_path):
+        """Test committing removes the reservation and adds the actual tokens"""
+        ledger = TokenLedger(ledger_path)
+        reservation = ledger.reserve(600, limit=1000)
+
+        ledger.commit(reservation['reservation_id'], 200)
+
+        assert ledger.get_status() == {'current_usage': 200, 'reserved_tokens': 0, 'reservations': 0}
+        assert ledger.reserve(800, limit=1000)['reserved'] is True
+
+    def test_release_frees_reservation(self, ledger_path):
+        """Test releasing a reservation does not record usage"""
+        ledger = TokenLedger(ledger_path)
+        reservation = ledger.reserve(600, limit=1000)
+
+        ledger.release(reservation['reservation_id'])
+
+        assert ledger.get_status() == {'current_usage': 0, 'reserved_tokens': 0, 'reservations': 0}
+
+    def test_caller_usage_is_adopted_when_ahead(self, ledger_path):
+        """Test usage known from the logs is used when it exceeds the ledger's total"""
+        ledger = TokenLedger(ledger_path)
+
+        result = ledger.reserve(100, limit=1000, current_usage=950)
+
+        assert result['reserved'] is False
+        assert result['current_usage'] == 950
+        # 呼び出し元の値が小さくても台帳の値は減らない
+        assert ledger.get_status(current_usage=0)['current_usage'] == 950
+
+    def test_expired_and_orphaned_reservations_are_dropped(self, ledger_path, monkeypatch):
+        """Test reservations past their TTL or owned by a dead worker no longer count"""
+        ledger = TokenLedger(ledger_path)
+        ledger.reserve(500, limit=1000)
+        with ledger._connect() as conn:
+            conn.execute('UPDATE token_reservations SET owner_pid = ?', (2 ** 22 + 1,))
+
+        assert ledger.get_status()['reserved_tokens'] == 0
+
+        monkeypatch.setattr('app.clients.token_ledger.config.TOKEN_RESERVATION_TTL_SECONDS', -1)
+        ledger.reserve(500, limit=1000)
+
+        assert ledger.get_status()['reserved_tokens'] == 0
+
+    def test_concurrent_reservations_do_not_overshoot(self, ledger_path):
+        """Test concurrent reservers sharing the file (as separate workers would) stay within the limit"""
+        TokenLedger(ledger_path)
+        barrier = threading.Barrier(20)
+        results = []
+
+        def reserve():
+            ledger = TokenLedger(ledger_path)
+            barrier.wait()
+            results.append(ledger.reserve(100, limit=1000)['reserved'])
+
+        threads = [threading.Thread(target=reserve) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results.count(True) == 10
+        assert TokenLedger(ledger_path).get_status()['reserved_tokens'] == 1000
+
+
+class TestTokenServiceReservation:
+    """Tests for TokenService reserve/commit/release"""
+
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    def test_reserve_raises_when_limit_would_be_exceeded(self, mock_gsheet_class):
+        """Test a reservation that would exceed the monthly limit raises TokenLimitExceededError"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 290000
+        mock_gsheet_class.return_value = mock_client
+        service = TokenService()
+
+        service.reserve_tokens(6000)
+        with pytest.raises(TokenLimitExceededError) as exc_info:
+            service.reserve_tokens(6000)
+
+        assert '月次トークン上限を超過します' in str(exc_info.value)
+        assert exc_info.value.details['reserved_tokens'] == 6000
+        # 予約中のトークンはチェックのみの判定にも含める
+        with pytest.raises(TokenLimitExceededError):
+            service.check_token_limit(6000)
+
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_failed_generation_releases_reservation(self, mock_agent1, mock_gsheet_class, mock_get_writer):
+        """Test the reservation is released when generation fails"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_agent1.side_effect = ValueError('bad response')
+        service = NoteService()
+
+        with pytest.raises(Exception):
+            service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        assert service.token_service.token_ledger.get_status()['reservations'] == 0
+
+    @patch('app.services.note_service.config.AGENT2_MODE', 'skip')
+    @patch('app.services.note_service.get_gsheet_writer')
+    @patch('app.clients.gsheet_client.GoogleSheetsClient')
+    @patch('app.clients.llm_client.call_agent1')
+    def test_successful_generation_commits_actual_tokens(self, mock_agent1, mock_gsheet_class, mock_get_writer):
+        """Test the actual total_tokens are committed in place of the estimate"""
+        mock_client = MagicMock()
+        mock_client.get_total_tokens_this_month.return_value = 0
+        mock_gsheet_class.return_value = mock_client
+        mock_agent1.return_value = {
+            'title': 'T', 'lead': 'L', 'sections': [], 'cta': 'C',
+            'token_usage': {'prompt_tokens': 1000, 'completion_tokens': 234, 'total_tokens': 1234}
+        }
+        service = NoteService()
+
+        service.generate_note({'topic': 'AI副業', 'audience': 'a', 'goal': 'g'})
+
+        status = service.token_service.token_ledger.get_status()
+        assert status == {'current_usage': 1234, 'reserved_tokens': 0, 'reservations': 0}
@@ -0,0 +1,60 @@
+"""
+Test suite for UI pages
+"""
+import pytest
+from unittest.mock import patch
+from app.main import create_app
+from app.models.note_models import GenerateNoteResponse
+
+
+FORM = {
+    'topic': 'AI副業で月5万円稼ぐ方法',
+    'audience': '副業初心者',
+    'goal': '具体的な稼ぎ方を教える',
+    'article_type': 'education',
+    'length_class': 'middle',
+    'temperature': '0.7',
+    'intensity_level': '5'
+}
+
+
+@pytest.fixture
+def client():
+    """Flask test client"""
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.test_client() as client:
+        yield client
+
+
+def _response():
+    return GenerateNoteResponse(
+        status='SUCCESS', note_id='note_ui', title='タイトル', lead='リード', sections=[], cta='CTA',
+        metadata={'token_usage': {'total_tokens': 100}}
+    )
+
+
+class TestNotesCreate:
+    """Tests for POST /ui/notes/new"""
+
+    @patch('app.routes.ui_pages.get_note_service')
+    def test_form_reuses_identical_result(self, mock_get_note_service, client):
+        """Test the form reuses a cached result by default to absorb double submits"""
+        mock_note_service = mock_get_note_service.return_value
+        mock_note_service.generate_note.return_value = _response()
+
+        response = client.post('/ui/notes/new', data=FORM)
+
+        assert response.status_code == 200
+        assert mock_note_service.generate_note.call_args[0][0]['cache'] == 'reuse'
+
+    @patch('app.routes.ui_pages.get_note_service')
+    def test_regenerate_bypasses_cache(self, mock_get_note_service, client):
+        """Test the regenerate option asks for a fresh article"""
+        mock_note_service = mock_get_note_service.return_value
+        mock_note_service.generate_note.return_value = _response()
+
+        response = client.post('/ui/notes/new', data=dict(FORM, regenerate='1'))
+
+        assert response.status_code == 200
+        assert mock_note_service.generate_note.call_args[0][0]['cache'] == 'bypass'